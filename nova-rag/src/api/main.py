@@ -7,10 +7,11 @@ Provides vector search over documentation for AI code generation.
 Endpoints:
 - POST /rag/query: Search documentation
 - GET /rag/stats: Vector store statistics
-- POST /rag/reload: Reload documentation (admin)
+- POST /rag/reload: Reload documentation, or one source with ?source= (admin)
 - GET /health: Health check
 """
 
+import asyncio
 import logging
 import os
 from contextlib import asynccontextmanager
@@ -25,8 +26,16 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from core.vector_store import VectorStore
-from core.document_loader import DocumentLoader
+from core.corpus_artifact import load_corpus_chunks, load_corpus_artifact, corpus_hash
 from core.code_cache_service import CodeCacheService
+from core.code_index import DEFAULT_BACKEND as CODE_INDEX_BACKEND, open_code_index
+from core.embedding_providers import get_embedding_provider
+from core.embedding_batcher import MicroBatchingProvider
+from core.embedding_scheduler import EmbeddingScheduler, Priority
+from core.code_analysis import shutdown_analysis_executor, warm_analysis_executor
+from core.code_eviction import EVICTION_BATCH, EVICTION_INTERVAL_SECONDS
+from core.executors import run_in_chroma_executor, shutdown_chroma_executor
+from core.segments import SegmentStore, RAG_WORKERS, DEFAULT_SEGMENTS_DIR, SEGMENT_REFRESH_SECONDS
 
 # Setup logging
 logging.basicConfig(
@@ -38,6 +47,9 @@ logger = logging.getLogger(__name__)
 # Global instances
 vector_store: Optional[VectorStore] = None
 code_cache_service: Optional[CodeCacheService] = None
+embedding_scheduler: Optional[EmbeddingScheduler] = None
+segment_store: Optional[SegmentStore] = None  # Multi-worker mode only
+is_writer: bool = True  # False in reader workers (see core.segments)
 store_ready: bool = False
 
 
@@ -48,6 +60,11 @@ class QueryRequest(BaseModel):
     query: str = Field(..., min_length=1, description="Search query")
     top_k: int = Field(5, ge=1, le=20, description="Number of results to return")
     filters: Optional[Dict[str, str]] = Field(None, description="Optional filters (source, topic)")
+    timeout_ms: Optional[int] = Field(None, ge=1, description="Latency budget for the embedding step; lexical ranking is used past it")
+    query_embedding: Optional[List[float]] = Field(None, description="Precomputed query vector (must match the collection's model and dimensions)")
+    embedding_model: Optional[str] = Field(None, description="Model that produced query_embedding (validated if given)")
+    return_embedding: bool = Field(False, description="Include the query embedding in the response")
+    mode: Optional[str] = Field(None, description="'vector', 'hybrid' (vector + BM25 rank fusion) or 'lexical' (BM25 only, no embedding call); default DOCS_SEARCH_MODE (vector)")
 
 
 class QueryResult(BaseModel):
@@ -56,6 +73,7 @@ class QueryResult(BaseModel):
     source: str
     topic: str
     score: float = Field(0.0, description="Similarity score (0-1)")
+    fused_score: Optional[float] = Field(None, description="Rank fusion score, best first (hybrid mode only)")
 
 
 class QueryResponse(BaseModel):
@@ -63,6 +81,10 @@ class QueryResponse(BaseModel):
     results: List[QueryResult]
     query: str
     count: int
+    degraded: bool = Field(False, description="True if results were ranked without embeddings")
+    degraded_reason: Optional[str] = Field(None, description="timeout, circuit_open or error")
+    query_embedding: Optional[List[float]] = Field(None, description="Query vector (only with return_embedding)")
+    embedding_model: Optional[str] = Field(None, description="Model of query_embedding")
 
 
 class StatsResponse(BaseModel):
@@ -71,6 +93,9 @@ class StatsResponse(BaseModel):
     sources: List[str]
     topics: List[str]
     status: str
+    embedding_cache: Optional[Dict[str, Any]] = Field(None, description="Embedding cache stats")
+    embedding_scheduler: Optional[Dict[str, Any]] = Field(None, description="Embedding scheduler stats per priority class")
+    circuit_breaker: Optional[Dict[str, Any]] = Field(None, description="Embedding circuit breaker state")
 
 
 class ReloadResponse(BaseModel):
@@ -91,24 +116,52 @@ class HealthResponse(BaseModel):
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Load vector store and code cache on startup."""
-    global vector_store, code_cache_service, store_ready
+    global vector_store, code_cache_service, embedding_scheduler, segment_store, is_writer, store_ready
 
     logger.info("=" * 60)
     logger.info("🚀 NOVA RAG Service Starting...")
     logger.info("=" * 60)
 
     try:
+        # All provider traffic goes through the priority scheduler
+        # (search > save_code > bulk ingestion); concurrent query
+        # embeddings are coalesced into batches on the interactive lane
+        embedding_scheduler = EmbeddingScheduler(get_embedding_provider())
+        embedding_provider = MicroBatchingProvider(embedding_scheduler.lane(Priority.INTERACTIVE))
+
+        # Multi-worker mode: one writer owns Chroma, the rest serve mmapped segments
+        if RAG_WORKERS > 1:
+            segment_store = SegmentStore(DEFAULT_SEGMENTS_DIR)
+            is_writer = segment_store.try_acquire_writer()
+            logger.info(f"Worker {os.getpid()} is the {'writer' if is_writer else 'reader'} (RAG_WORKERS={RAG_WORKERS})")
+
+        if not is_writer:
+            await _start_reader(embedding_provider)
+            yield
+            await _shutdown()
+            return
+
         # Initialize vector store
         logger.info("Initializing vector store...")
-        vector_store = VectorStore()
+        vector_store = VectorStore(embedding_provider=embedding_provider, segment_store=segment_store)
 
-        # Initialize code cache service (reuse same ChromaDB client)
+        # Initialize code cache service (reuse same ChromaDB client, embedding cache and provider)
         logger.info("Initializing code cache service...")
-        code_cache_service = CodeCacheService(client=vector_store.client)
+        code_cache_service = CodeCacheService(
+            persist_directory=vector_store.persist_directory,
+            client=vector_store.client,
+            embedding_cache=vector_store.embedding_cache,
+            embedding_provider=vector_store.embedding_provider,
+            circuit_breaker=vector_store.circuit_breaker,
+            segment_store=segment_store
+        )
         logger.info("✓ Code cache service initialized")
 
+        # Start the code analysis workers now rather than on the first save
+        _background_tasks.add(asyncio.create_task(run_in_chroma_executor(warm_analysis_executor)))
+
         # Check if already loaded
-        stats = vector_store.get_stats()
+        stats = await run_in_chroma_executor(vector_store.get_stats)
         if stats['total_documents'] > 0:
             logger.info(f"✓ Vector store already loaded with {stats['total_documents']} documents")
             store_ready = True
@@ -120,9 +173,23 @@ async def lifespan(app: FastAPI):
             store_ready = True
 
         # Log code cache stats
-        cache_stats = code_cache_service.get_stats()
+        cache_stats = await run_in_chroma_executor(code_cache_service.get_stats)
         logger.info(f"✓ Code cache: {cache_stats['total_codes']} cached codes")
 
+        # Collections stored at another vector size or HNSW settings than
+        # configured are rebuilt in the background and switched over when ready
+        if vector_store.needs_rebuild or code_cache_service.needs_rebuild:
+            _background_tasks.add(asyncio.create_task(_rebuild_collections()))
+
+        if segment_store is not None:
+            await run_in_chroma_executor(vector_store.publish_segment)
+            await run_in_chroma_executor(code_cache_service.publish_segment, True)
+            _background_tasks.add(asyncio.create_task(_writer_loop()))
+
+        # Size-bounded code cache (see core.code_eviction)
+        if code_cache_service.eviction_enabled:
+            _background_tasks.add(asyncio.create_task(_eviction_loop()))
+
         logger.info("=" * 60)
         logger.info("✅ RAG Service Ready!")
         logger.info("=" * 60)
@@ -133,54 +200,159 @@ async def lifespan(app: FastAPI):
 
     yield  # App runs
 
-    # Shutdown
+    await _shutdown()
+
+
+async def _shutdown():
     logger.info("Shutting down RAG service...")
+    for task in _background_tasks:
+        task.cancel()
+    if vector_store:
+        await vector_store.embedding_provider.aclose()
+        if vector_store.embedding_cache is not None:
+            vector_store.embedding_cache.flush()
+    if segment_store:
+        segment_store.release_writer()
+    shutdown_chroma_executor()
+    shutdown_analysis_executor()
+
+
+async def _rebuild_collections():
+    """Move collections to the configured dimensions and HNSW settings (see core.dimension_migration)."""
+    for service in (vector_store, code_cache_service):
+        if not service.needs_rebuild:
+            continue
+        try:
+            logger.info(
+                f"Rebuilding {service.collection_name} in the background "
+                f"({service.target_dimensions} dims, HNSW {service.hnsw})..."
+            )
+            await run_in_chroma_executor(service.rebuild_collection)
+        except Exception as e:
+            logger.error(f"Rebuild of {service.collection_name} failed: {e}")
+
+
+# === Multi-worker mode (see core.segments) ===
+
+_background_tasks = set()
+
+
+async def _start_reader(embedding_provider):
+    """Serve from the writer's segments; writes go to the spool."""
+    global vector_store, code_cache_service
+
+    metadata = embedding_provider.collection_metadata()
+    vector_store = VectorStore(
+        embedding_provider=embedding_provider,
+        collection=segment_store.collection("docs", metadata)
+    )
+    if CODE_INDEX_BACKEND == "pgvector":
+        # Postgres is shared by every worker: read and write it directly
+        code_collection = await run_in_chroma_executor(
+            open_code_index, "pgvector", None, "cached_code", metadata
+        )
+    else:
+        code_collection = segment_store.collection("code", metadata)
+
+    code_cache_service = CodeCacheService(
+        embedding_cache=vector_store.embedding_cache,
+        embedding_provider=embedding_provider,
+        circuit_breaker=vector_store.circuit_breaker,
+        collection=code_collection
+    )
+    _background_tasks.add(asyncio.create_task(_wait_for_docs_segment()))
+    if code_cache_service.eviction_enabled:
+        _background_tasks.add(asyncio.create_task(_reader_hits_loop()))
+    logger.info("✅ RAG reader worker ready (serving shared segments)")
+
+
+async def _wait_for_docs_segment():
+    """Reader: mark ready once the writer has published the docs."""
+    global store_ready
+    while vector_store.collection.count() == 0:
+        await asyncio.sleep(SEGMENT_REFRESH_SECONDS)
+    store_ready = True
+    logger.info(f"✓ Docs segment mapped ({vector_store.collection.count()} documents)")
+
+
+async def _reader_hits_loop():
+    """Reader: hand code cache hits to the writer, which evicts (see core.code_eviction)."""
+    while True:
+        await asyncio.sleep(EVICTION_INTERVAL_SECONDS)
+        hits = code_cache_service.take_hits()
+        if hits:
+            segment_store.enqueue("code_hits", hits=hits)
+
+
+async def _eviction_loop():
+    """Writer: keep the code cache under its size limits, one batch at a time."""
+    while True:
+        try:
+            # Readers get the deletions with the writer loop's next delta
+            evicted = await run_in_chroma_executor(code_cache_service.evict)
+        except Exception as e:
+            logger.error(f"Code cache eviction failed: {e}")
+            evicted = 0
+        # A full batch means more is over the limits: continue shortly
+        await asyncio.sleep(0.1 if evicted >= EVICTION_BATCH else EVICTION_INTERVAL_SECONDS)
+
+
+async def _writer_loop():
+    """Writer: apply writes queued by readers, then republish changed segments."""
+    while True:
+        await asyncio.sleep(SEGMENT_REFRESH_SECONDS)
+        try:
+            await run_in_chroma_executor(_apply_spooled_writes)
+        except Exception as e:
+            logger.error(f"Failed to apply queued writes: {e}")
+
+
+def _apply_spooled_writes():
+    """Apply queued writes in order (blocking, writer only)."""
+    for entry in segment_store.drain():
+        op = entry.get("op")
+        if op == "save_code":
+            code_cache_service.save_embedded_code(entry["document"], entry["embedding"])
+        elif op == "clear_code":
+            code_cache_service.clear()
+        elif op == "code_hits":
+            code_cache_service.merge_hits(entry["hits"])
+        elif op == "reload_docs" and entry.get("source"):
+            _reload_source_sync(entry["source"])
+        elif op == "reload_docs":
+            vector_store.clear(keep_index=True)
+            _load_documentation_sync()
+        else:
+            logger.warning(f"Ignoring unknown queued write: {op}")
+
+    code_cache_service.publish_segment()
 
 
 # === Helper Functions ===
 
 async def load_documentation():
     """Load all documentation into vector store."""
-    global vector_store
-
     if not vector_store:
         raise RuntimeError("Vector store not initialized")
 
-    loader = DocumentLoader(chunk_size=700, chunk_overlap=100)
-    all_chunks = []
-
-    # Load integration docs
-    logger.info("Loading integration docs...")
-    integration_chunks = loader.load_integration_docs()
-    all_chunks.extend(integration_chunks)
-    logger.info(f"  ✓ Loaded {len(integration_chunks)} chunks from integrations")
-
-    # Load PyMuPDF docs
-    base_dir = Path(__file__).parent.parent.parent
-    pymupdf_path = base_dir / "knowledge" / "official_docs" / "pymupdf_official.md"
-
-    if pymupdf_path.exists():
-        logger.info("Loading PyMuPDF documentation...")
-        pymupdf_chunks = loader.load_markdown_file(
-            file_path=str(pymupdf_path),
-            source="pymupdf",
-            topic="official"
-        )
-        all_chunks.extend(pymupdf_chunks)
-        logger.info(f"  ✓ Loaded {len(pymupdf_chunks)} chunks from PyMuPDF")
-
-    # Load Google Cloud Vision docs
-    google_vision_path = base_dir / "knowledge" / "official_docs" / "google_vision_ocr.md"
-
-    if google_vision_path.exists():
-        logger.info("Loading Google Cloud Vision documentation...")
-        google_vision_chunks = loader.load_markdown_file(
-            file_path=str(google_vision_path),
-            source="google_vision",
-            topic="official"
-        )
-        all_chunks.extend(google_vision_chunks)
-        logger.info(f"  ✓ Loaded {len(google_vision_chunks)} chunks from Google Cloud Vision")
+    # Chunking and bulk ingestion are blocking, keep them off the event loop
+    return await run_in_chroma_executor(_load_documentation_sync)
+
+
+def _load_documentation_sync():
+    """Load documentation into the vector store (blocking)."""
+    all_chunks = load_corpus_chunks()
+
+    # Prefer the prebuilt artifact: bulk load, no provider calls
+    artifact = load_corpus_artifact(
+        vector_store.embedding_provider,
+        expected_hash=corpus_hash(all_chunks)
+    )
+    if artifact is not None:
+        chunks, embeddings = artifact
+        count = vector_store.add_embedded_documents(chunks, embeddings)
+        logger.info(f"  ✓ Loaded {count} documents from corpus artifact")
+        return count
 
     # Add to vector store
     logger.info(f"Adding {len(all_chunks)} total chunks to vector store...")
@@ -190,6 +362,19 @@ async def load_documentation():
     return count
 
 
+async def reload_source(source: str):
+    """Reload one source's documentation into the vector store."""
+    return await run_in_chroma_executor(_reload_source_sync, source)
+
+
+def _reload_source_sync(source: str):
+    """Replace one source's chunks with the current knowledge files (blocking)."""
+    chunks = [chunk for chunk in load_corpus_chunks() if chunk.get('source') == source]
+    count = vector_store.replace_source(source, chunks)
+    logger.info(f"  ✓ Reloaded {count} documents of source '{source}'")
+    return count
+
+
 # === FastAPI App ===
 
 app = FastAPI(
@@ -207,7 +392,7 @@ app.include_router(code_router)
 # === Endpoints ===
 
 @app.get("/health", response_model=HealthResponse)
-def health_check():
+async def health_check():
     """
     Health check endpoint.
 
@@ -215,7 +400,7 @@ def health_check():
     """
     docs_count = 0
     if vector_store:
-        stats = vector_store.get_stats()
+        stats = await run_in_chroma_executor(vector_store.get_stats)
         docs_count = stats['total_documents']
 
     return HealthResponse(
@@ -226,7 +411,7 @@ def health_check():
 
 
 @app.post("/rag/query", response_model=QueryResponse)
-def query_rag(request: QueryRequest):
+async def query_rag(request: QueryRequest):
     """
     Query the vector store for relevant documentation.
 
@@ -259,38 +444,52 @@ def query_rag(request: QueryRequest):
             filter_source = request.filters.get('source')
             filter_topic = request.filters.get('topic')
 
-        results = vector_store.query(
+        result = await vector_store.aquery_detailed(
             query_text=request.query,
             top_k=request.top_k,
             filter_source=filter_source,
-            filter_topic=filter_topic
+            filter_topic=filter_topic,
+            timeout_ms=request.timeout_ms,
+            query_embedding=request.query_embedding,
+            embedding_model=request.embedding_model,
+            mode=request.mode
         )
 
-        # Convert to response format
-        # Convert distance to score: lower distance = higher score
+        # Convert to response format (score: cosine similarity, see core.similarity)
         query_results = [
             QueryResult(
                 text=doc['text'],
                 source=doc['source'],
                 topic=doc['topic'],
-                score=1.0 - min(doc.get('distance', 0.0), 1.0)  # Normalize to 0-1
+                score=doc['score'],
+                fused_score=doc.get('fused_score')
             )
-            for doc in results
+            for doc in result['results']
         ]
 
         return QueryResponse(
             results=query_results,
             query=request.query,
-            count=len(query_results)
+            count=len(query_results),
+            degraded=result['degraded'],
+            degraded_reason=result['degraded_reason'],
+            query_embedding=result['query_embedding'] if request.return_embedding else None,
+            embedding_model=(
+                vector_store.embedding_model_name
+                if request.return_embedding and result['query_embedding'] is not None else None
+            )
         )
 
+    except ValueError as e:
+        # Client-supplied query_embedding does not match the collection, or unknown mode
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
         logger.error(f"Error querying vector store: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/rag/stats", response_model=StatsResponse)
-def get_stats():
+async def get_stats():
     """
     Get vector store statistics.
 
@@ -301,13 +500,16 @@ def get_stats():
         raise HTTPException(status_code=503, detail="Vector store not initialized")
 
     try:
-        stats = vector_store.get_stats()
+        stats = await run_in_chroma_executor(vector_store.get_stats)
 
         return StatsResponse(
             total_documents=stats['total_documents'],
             sources=stats['sources'],
             topics=stats['topics'],
-            status="ready" if store_ready else "loading"
+            status="ready" if store_ready else "loading",
+            embedding_cache=vector_store.embedding_cache.get_stats(),
+            embedding_scheduler=embedding_scheduler.get_stats() if embedding_scheduler else None,
+            circuit_breaker=vector_store.circuit_breaker.get_stats()
         )
 
     except Exception as e:
@@ -316,23 +518,42 @@ def get_stats():
 
 
 @app.post("/rag/reload", response_model=ReloadResponse)
-def reload_docs(background_tasks: BackgroundTasks):
+async def reload_docs(background_tasks: BackgroundTasks, source: Optional[str] = None):
     """
     Reload documentation into vector store.
 
     Admin endpoint to refresh documentation without redeploying.
     Runs in background to avoid blocking.
 
+    Args:
+        source: Reload only this source (e.g. "pymupdf"); the other sources
+                and their in-memory indexes are left untouched
+
     Returns:
         Confirmation message with document count
     """
     if not store_ready or not vector_store:
         raise HTTPException(status_code=503, detail="Vector store not ready")
 
+    if not is_writer:
+        segment_store.enqueue("reload_docs", source=source)
+        return ReloadResponse(
+            message="Documentation reload queued for the writer process",
+            documents_loaded=0
+        )
+
+    if source:
+        background_tasks.add_task(reload_source, source)
+        return ReloadResponse(
+            message=f"Reload of source '{source}' started in background",
+            documents_loaded=0
+        )
+
     try:
-        # Clear existing docs
+        # Clear existing docs (queries keep using the in-memory snapshot
+        # of the old corpus until the reload swaps in the new one)
         logger.info("Clearing vector store...")
-        vector_store.clear()
+        await run_in_chroma_executor(vector_store.clear, keep_index=True)
 
         # Reload in background
         background_tasks.add_task(load_documentation)
@@ -348,7 +569,7 @@ def reload_docs(background_tasks: BackgroundTasks):
 
 
 @app.get("/")
-def root():
+async def root():
     """Root endpoint with service info."""
     return {
         "service": "NOVA RAG",
@@ -27,11 +27,17 @@ class CodeSearchRequest(BaseModel):
     threshold: float = Field(0.85, ge=0.0, le=1.0, description="Minimum similarity score")
     top_k: int = Field(5, ge=1, le=20, description="Maximum results to return")
     available_keys: Optional[List[str]] = Field(None, description="Keys available in current context (for filtering)")
+    key_filter: Optional[str] = Field(None, description="How available_keys filter results: 'off', 'strict' (only code whose required keys are all available) or 'penalty' (lower scores for missing keys); default CODE_CACHE_KEY_FILTER")
     workflow_id: Optional[int] = Field(None, description="Workflow ID to filter results (only return code from same workflow)")
+    timeout_ms: Optional[int] = Field(None, ge=1, description="Latency budget for the embedding step; fingerprint/lexical match is used past it")
+    query_embedding: Optional[List[float]] = Field(None, description="Precomputed query vector (must match the collection's model and dimensions)")
+    embedding_model: Optional[str] = Field(None, description="Model that produced query_embedding (validated if given)")
+    return_embedding: bool = Field(False, description="Include the query embedding in the response")
 
 
 class CodeMatch(BaseModel):
     """Single code match result."""
+    id: Optional[str] = Field(None, description="Cache entry ID")
     code: str = Field(..., description="The Python code")
     score: float = Field(..., description="Similarity score (0-1)")
     node_action: str = Field(..., description="Node action type")
@@ -39,7 +45,7 @@ class CodeMatch(BaseModel):
     input_schema: Dict = Field(..., description="Input data schema")
     insights: List[str] = Field(..., description="Context insights")
     config: Dict = Field(..., description="Configuration flags")
-    metadata: Dict = Field(..., description="Metadata (success_count, created_at, libraries)")
+    metadata: Dict = Field(..., description="Metadata (success_count, created_at, libraries_used, required_keys; for code analyzed at save time also analyzed, optional_keys, result_keys, imports, dynamic_keys)")
 
 
 class CodeSearchResponse(BaseModel):
@@ -48,6 +54,11 @@ class CodeSearchResponse(BaseModel):
     query: str
     count: int
     threshold: float
+    degraded: bool = Field(False, description="True if matches come from fingerprint/lexical match instead of embeddings")
+    degraded_reason: Optional[str] = Field(None, description="timeout, circuit_open or error")
+    exact_match: bool = Field(False, description="True if matches are exact repeats of a saved request (request fingerprint), found without embedding the query")
+    query_embedding: Optional[List[float]] = Field(None, description="Query vector (only with return_embedding)")
+    embedding_model: Optional[str] = Field(None, description="Model of query_embedding")
 
 
 class CodeSaveRequest(BaseModel):
@@ -79,12 +90,14 @@ class CodeStatsResponse(BaseModel):
     total_codes: int
     actions: List[str]
     avg_success_count: float
+    index: Optional[Dict] = None  # Vector index backend details
+    eviction: Optional[Dict] = None  # Size limits and eviction runs (see core.code_eviction)
 
 
 # === Endpoints ===
 
 @router.post("/search", response_model=CodeSearchResponse)
-def search_code(request: CodeSearchRequest):
+async def search_code(request: CodeSearchRequest):
     """
     Search for similar cached code based on semantic similarity.
 
@@ -104,7 +117,7 @@ def search_code(request: CodeSearchRequest):
         }
     """
     # Import from main to access global instance
-    from ..main import code_cache_service
+    from ..main import code_cache_service, run_in_chroma_executor
 
     if not code_cache_service:
         raise HTTPException(
@@ -114,33 +127,49 @@ def search_code(request: CodeSearchRequest):
 
     try:
         # Search cache
-        matches = code_cache_service.search_code(
+        result = await code_cache_service.asearch_code_detailed(
             query=request.query,
             threshold=request.threshold,
             top_k=request.top_k,
             available_keys=request.available_keys,
-            workflow_id=request.workflow_id
+            workflow_id=request.workflow_id,
+            timeout_ms=request.timeout_ms,
+            query_embedding=request.query_embedding,
+            embedding_model=request.embedding_model,
+            key_filter=request.key_filter
         )
 
         # Convert to response format
         code_matches = [
-            CodeMatch(**match) for match in matches
+            CodeMatch(**match) for match in result["matches"]
         ]
 
         return CodeSearchResponse(
             matches=code_matches,
             query=request.query,
             count=len(code_matches),
-            threshold=request.threshold
+            threshold=request.threshold,
+            degraded=result["degraded"],
+            degraded_reason=result["degraded_reason"],
+            exact_match=result["exact_match"],
+            query_embedding=result["query_embedding"] if request.return_embedding else None,
+            embedding_model=(
+                code_cache_service.embedding_model_name
+                if request.return_embedding and result["query_embedding"] is not None else None
+            )
         )
 
+    except ValueError as e:
+        # Client-supplied query_embedding does not match the collection,
+        # or unknown key_filter
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
         logger.error(f"Error searching code cache: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/save", response_model=CodeSaveResponse)
-def save_code(request: CodeSaveRequest):
+async def save_code(request: CodeSaveRequest):
     """
     Save successful code execution to semantic cache.
 
@@ -165,7 +194,7 @@ def save_code(request: CodeSaveRequest):
         }
     """
     # Import from main to access global instance
-    from ..main import code_cache_service
+    from ..main import code_cache_service, run_in_chroma_executor
 
     if not code_cache_service:
         raise HTTPException(
@@ -188,7 +217,7 @@ def save_code(request: CodeSaveRequest):
         }
 
         # Save to cache
-        result = code_cache_service.save_code(document)
+        result = await code_cache_service.asave_code(document)
 
         return CodeSaveResponse(**result)
 
@@ -198,7 +227,7 @@ def save_code(request: CodeSaveRequest):
 
 
 @router.get("/stats", response_model=CodeStatsResponse)
-def get_code_stats():
+async def get_code_stats():
     """
     Get code cache statistics.
 
@@ -206,9 +235,10 @@ def get_code_stats():
         - total_codes: Number of cached code snippets
         - actions: List of unique action types
         - avg_success_count: Average success count per code
+        - index: Vector index backend (chroma / pgvector / ivfpq / binary) and its state
     """
     # Import from main to access global instance
-    from ..main import code_cache_service
+    from ..main import code_cache_service, run_in_chroma_executor
 
     if not code_cache_service:
         raise HTTPException(
@@ -217,7 +247,7 @@ def get_code_stats():
         )
 
     try:
-        stats = code_cache_service.get_stats()
+        stats = await run_in_chroma_executor(code_cache_service.get_stats)
         return CodeStatsResponse(**stats)
 
     except Exception as e:
@@ -226,7 +256,7 @@ def get_code_stats():
 
 
 @router.post("/clear")
-def clear_code_cache():
+async def clear_code_cache():
     """
     Clear all codes from semantic cache (admin operation).
 
@@ -237,7 +267,7 @@ def clear_code_cache():
         Confirmation message with count of deleted codes
     """
     # Import from main to access global instance
-    from ..main import code_cache_service
+    from ..main import code_cache_service, run_in_chroma_executor
 
     if not code_cache_service:
         raise HTTPException(
@@ -247,11 +277,11 @@ def clear_code_cache():
 
     try:
         # Get count before clearing
-        stats = code_cache_service.get_stats()
+        stats = await run_in_chroma_executor(code_cache_service.get_stats)
         count_before = stats['total_codes']
 
         # Clear cache
-        code_cache_service.clear()
+        await run_in_chroma_executor(code_cache_service.clear)
 
         logger.warning(f"Code cache cleared: {count_before} codes deleted")
 
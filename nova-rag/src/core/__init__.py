@@ -1,8 +1,19 @@
 """
 Core services for NOVA RAG.
-"""
 
-from .vector_store import VectorStore
-from .code_cache_service import CodeCacheService
+VectorStore and CodeCacheService are imported on first access, so importing
+a leaf module (e.g. code_analysis in the analysis worker processes) does not
+load Chroma and the rest of the service.
+"""
 
 __all__ = ["VectorStore", "CodeCacheService"]
+
+
+def __getattr__(name):
+    if name == "VectorStore":
+        from .vector_store import VectorStore
+        return VectorStore
+    if name == "CodeCacheService":
+        from .code_cache_service import CodeCacheService
+        return CodeCacheService
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
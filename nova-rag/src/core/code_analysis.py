@@ -0,0 +1,344 @@
+"""
+Code Analysis - Static analysis of cached code at save time.
+
+required_keys and libraries_used used to come from the caller, and key
+extraction on that side is not exact; a wrong list turns a cache hit into
+a failed sandbox run. save_code now parses the submitted code itself
+(ast, no execution) and stores what it finds:
+
+- required_keys: context["key"] reads not preceded by a write of the key
+- optional_keys: context.get("key"), context.pop("key") and "key" in context
+- result_keys: keys the code writes: context["key"] = ..., context.update(...),
+  context.setdefault(...) and the "context_updates" dict it prints
+  (context["key"] += ... reads the key, then writes it; del context["key"]
+  does neither)
+- imports: top-level modules imported (import / from ... import / importlib)
+- dynamic_keys: the code reaches keys the lists above cannot name
+  (context[variable], iterating over context, context.keys(), **context)
+
+Parsing runs in a small pool of worker processes, so large or pathological
+code neither holds the GIL of the API process nor blocks it past a timeout.
+Code that does not parse (or times out) keeps the caller's metadata.
+
+The workers import only this module (the core package loads its services
+lazily), and the service starts them at startup (warm_analysis_executor),
+so the first save does not pay for interpreter start-up. A running task
+cannot be cancelled: after a timeout, or when a worker dies
+(BrokenProcessPool), the pool is replaced and its workers are terminated,
+so one pathological save does not hold a worker for every later one.
+
+Configuration via environment:
+- CODE_ANALYSIS_WORKERS: Worker processes for parsing saved code (default: 2; 0 = in-process)
+- CODE_ANALYSIS_TIMEOUT_MS: Time allowed per analysis before the caller's metadata is kept (default: 2000)
+
+Example:
+    >>> analyze_code("import fitz\\npdf = context['invoice_pdf']\\ncontext['text'] = pdf")
+    {'required_keys': ['invoice_pdf'], 'optional_keys': [], 'result_keys': ['text'], 'imports': ['fitz'], 'dynamic_keys': False}
+"""
+
+import os
+import ast
+import logging
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from typing import Any, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_WORKERS = int(os.getenv("CODE_ANALYSIS_WORKERS", "2"))
+ANALYSIS_TIMEOUT_MS = int(os.getenv("CODE_ANALYSIS_TIMEOUT_MS", "2000"))
+
+# Name the executor binds the workflow context to
+CONTEXT_NAME = "context"
+
+_executor: Optional[ProcessPoolExecutor] = None
+_lock = threading.Lock()
+
+
+class _ContextAccess(ast.NodeVisitor):
+    """Collects context key accesses and imports of one module."""
+
+    def __init__(self):
+        # key -> first line read / written
+        self.reads: Dict[str, int] = {}
+        self.writes: Dict[str, int] = {}
+        self.optional: Set[str] = set()
+        self.results: Set[str] = set()
+        self.imports: Set[str] = set()
+        self.dynamic = False
+
+    @staticmethod
+    def _is_context(node: ast.AST) -> bool:
+        return isinstance(node, ast.Name) and node.id == CONTEXT_NAME
+
+    @staticmethod
+    def _key(node: Optional[ast.AST]) -> Optional[str]:
+        if isinstance(node, ast.Constant) and isinstance(node.value, str):
+            return node.value
+        return None
+
+    def _write(self, key: str, node: ast.AST):
+        self.writes.setdefault(key, node.lineno)
+        self.results.add(key)
+
+    def _write_dict(self, node: ast.AST):
+        if isinstance(node, ast.Dict):
+            for key_node in node.keys:
+                key = self._key(key_node)
+                if key is not None:
+                    self._write(key, node)
+
+    def visit_Subscript(self, node: ast.Subscript):
+        if self._is_context(node.value):
+            key = self._key(node.slice)
+            if key is None:
+                self.dynamic = True
+            elif isinstance(node.ctx, ast.Load):
+                self.reads.setdefault(key, node.lineno)
+            elif isinstance(node.ctx, ast.Store):
+                self._write(key, node)
+        self.generic_visit(node)
+
+    def visit_AugAssign(self, node: ast.AugAssign):
+        # context["total"] += 1 reads the key before storing it
+        target = node.target
+        if isinstance(target, ast.Subscript) and self._is_context(target.value):
+            key = self._key(target.slice)
+            if key is not None:
+                self.reads.setdefault(key, node.lineno)
+        self.generic_visit(node)
+
+    def visit_Call(self, node: ast.Call):
+        func = node.func
+        if isinstance(func, ast.Attribute) and self._is_context(func.value):
+            key = self._key(node.args[0]) if node.args else None
+            if func.attr in ("get", "pop"):
+                if key is None:
+                    self.dynamic = True
+                else:
+                    self.optional.add(key)
+            elif func.attr == "setdefault":
+                if key is None:
+                    self.dynamic = True
+                else:
+                    self._write(key, node)
+            elif func.attr == "update":
+                if node.args:
+                    self._write_dict(node.args[0])
+                for keyword in node.keywords:
+                    if keyword.arg is not None:
+                        self._write(keyword.arg, node)
+            elif func.attr in ("keys", "items", "values", "copy"):
+                self.dynamic = True
+
+        # importlib.import_module("x") / __import__("x")
+        name = func.attr if isinstance(func, ast.Attribute) else getattr(func, "id", None)
+        if name in ("import_module", "__import__") and node.args:
+            module = self._key(node.args[0])
+            if module:
+                self.imports.add(module.split(".")[0])
+
+        for keyword in node.keywords:
+            if keyword.arg is None and self._is_context(keyword.value):
+                self.dynamic = True
+        self.generic_visit(node)
+
+    def visit_Compare(self, node: ast.Compare):
+        # "key" in context
+        for op, right in zip(node.ops, node.comparators):
+            key = self._key(node.left)
+            if isinstance(op, (ast.In, ast.NotIn)) and self._is_context(right) and key is not None:
+                self.optional.add(key)
+        self.generic_visit(node)
+
+    def visit_Dict(self, node: ast.Dict):
+        for key_node, value in zip(node.keys, node.values):
+            if key_node is None and self._is_context(value):
+                # {**context}
+                self.dynamic = True
+            elif self._key(key_node) == "context_updates":
+                self._write_dict(value)
+        self.generic_visit(node)
+
+    def visit_keyword(self, node: ast.keyword):
+        # print(json.dumps(dict(status="success", context_updates={...})))
+        if node.arg == "context_updates":
+            self._write_dict(node.value)
+        self.generic_visit(node)
+
+    def visit_For(self, node: ast.For):
+        if self._is_context(node.iter):
+            self.dynamic = True
+        self.generic_visit(node)
+
+    def visit_comprehension(self, node: ast.comprehension):
+        if self._is_context(node.iter):
+            self.dynamic = True
+        self.generic_visit(node)
+
+    def visit_Import(self, node: ast.Import):
+        for alias in node.names:
+            self.imports.add(alias.name.split(".")[0])
+
+    def visit_ImportFrom(self, node: ast.ImportFrom):
+        if node.level == 0 and node.module:
+            self.imports.add(node.module.split(".")[0])
+
+
+def analyze_code(code: str) -> Dict[str, Any]:
+    """
+    Context keys and imports of a piece of code (see module docstring).
+
+    Args:
+        code: Python source as submitted to save_code
+
+    Returns:
+        Dict with required_keys, optional_keys, result_keys, imports (sorted
+        lists) and dynamic_keys (bool)
+
+    Raises:
+        SyntaxError: If the code does not parse
+        ValueError: If the code contains null bytes
+    """
+    visitor = _ContextAccess()
+    visitor.visit(ast.parse(code))
+
+    # A key the code writes before reading it does not have to be in the context
+    required = {
+        key for key, line in visitor.reads.items()
+        if key not in visitor.writes or line <= visitor.writes[key]
+    }
+    optional = {
+        key for key in visitor.optional
+        if key not in required and key not in visitor.writes
+    }
+    return {
+        "required_keys": sorted(required),
+        "optional_keys": sorted(optional),
+        "result_keys": sorted(visitor.results),
+        "imports": sorted(visitor.imports),
+        "dynamic_keys": visitor.dynamic
+    }
+
+
+def analysis_metadata(analysis: Dict[str, Any]) -> Dict[str, Any]:
+    """Flat (Chroma-compatible) metadata fields for an analysis result."""
+    return {
+        "required_keys": ",".join(analysis["required_keys"]),
+        "optional_keys": ",".join(analysis["optional_keys"]),
+        "result_keys": ",".join(analysis["result_keys"]),
+        "imports": ",".join(analysis["imports"]),
+        "dynamic_keys": analysis["dynamic_keys"],
+        "analyzed": True
+    }
+
+
+def get_analysis_executor() -> Optional[ProcessPoolExecutor]:
+    """Return the shared analysis process pool (None = analyze in-process)."""
+    global _executor
+
+    if ANALYSIS_WORKERS <= 0:
+        return None
+    with _lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=ANALYSIS_WORKERS, mp_context=get_context("spawn"))
+            logger.info(f"Started code analysis pool with {ANALYSIS_WORKERS} processes")
+        return _executor
+
+
+def warm_analysis_executor(timeout_ms: int = 30000):
+    """Start the pool's worker processes now (blocking; called at service startup)."""
+    executor = get_analysis_executor()
+    if executor is None:
+        return
+    futures = [executor.submit(analyze_code, "") for _ in range(ANALYSIS_WORKERS)]
+    for future in futures:
+        analysis_result(future, timeout_ms)
+
+
+def _recycle_executor(executor: Optional[ProcessPoolExecutor], reason: str):
+    """Replace the pool (if still current) and terminate its workers, busy ones included."""
+    global _executor
+
+    with _lock:
+        if executor is None or _executor is not executor:
+            return
+        _executor = None
+    logger.warning(f"Replacing code analysis pool ({reason})")
+    _terminate(executor)
+
+
+def _terminate(executor: ProcessPoolExecutor):
+    processes = list((getattr(executor, "_processes", None) or {}).values())
+    executor.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+
+
+def submit_analysis(code: str) -> Future:
+    """
+    Start analyzing code; the result is read with analysis_result.
+
+    Example:
+        >>> future = submit_analysis(document["code"])
+        >>> embedding = embed(searchable_text)  # overlaps with the analysis
+        >>> analysis = analysis_result(future)
+    """
+    for _ in range(2):
+        executor = get_analysis_executor()
+        if executor is None:
+            break
+        try:
+            future = executor.submit(analyze_code, code)
+            future.analysis_executor = executor
+            return future
+        except BrokenProcessPool as e:
+            # A worker died: start a new pool and submit again
+            _recycle_executor(executor, str(e))
+        except RuntimeError as e:
+            # Pool shut down (service stopping): analyze here
+            logger.warning(f"Code analysis pool unavailable ({e}), analyzing in-process")
+            break
+
+    future: Future = Future()
+    try:
+        future.set_result(analyze_code(code))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def analysis_result(future: Future, timeout_ms: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """
+    Result of submit_analysis, or None if the code did not parse or the
+    analysis failed or took longer than timeout_ms (default ANALYSIS_TIMEOUT_MS).
+    """
+    timeout = (timeout_ms if timeout_ms is not None else ANALYSIS_TIMEOUT_MS) / 1000.0
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeout:
+        if not future.cancel():
+            # Running: only replacing the pool frees its worker
+            _recycle_executor(getattr(future, "analysis_executor", None), "analysis timed out")
+        logger.warning(f"Code analysis took longer than {timeout:.1f}s, keeping caller metadata")
+    except BrokenProcessPool as e:
+        _recycle_executor(getattr(future, "analysis_executor", None), str(e))
+        logger.warning(f"Code analysis worker died ({e}), keeping caller metadata")
+    except (SyntaxError, ValueError) as e:
+        logger.warning(f"Saved code does not parse ({e}), keeping caller metadata")
+    except Exception as e:
+        logger.warning(f"Code analysis failed ({e}), keeping caller metadata")
+    return None
+
+
+def shutdown_analysis_executor():
+    """Stop the analysis process pool (on service shutdown)."""
+    global _executor
+
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        _terminate(executor)
@@ -15,21 +15,51 @@ Schema:
     - metadata: Success count, creation date, libraries used
 """
 
+import copy
 import logging
 import os
-from typing import List, Dict, Optional
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, List, Dict, Optional, Tuple
 from datetime import datetime
 
 try:
     import chromadb
     from chromadb.config import Settings
-    from openai import OpenAI
 except ImportError:
     raise ImportError(
-        "ChromaDB and OpenAI required. "
-        "Install with: pip install chromadb openai"
+        "ChromaDB required. "
+        "Install with: pip install chromadb"
     )
 
+from .code_analysis import analysis_metadata, analysis_result, submit_analysis
+from .code_eviction import (
+    EVICTION_BATCH, MAX_ENTRIES, MAX_PER_WORKFLOW, HitTracker, RetentionTable, plan_evictions
+)
+from .code_index import CodeIndex, DEFAULT_BACKEND as DEFAULT_INDEX_BACKEND, open_code_index, migrate_collection
+from .code_partitions import PARTITIONED, PartitionedCollection, open_collection
+from .embedding_cache import EmbeddingCache, DEFAULT_FILENAME as EMBEDDING_CACHE_FILENAME
+from .dimension_migration import (
+    CODE_EMBEDDING_DIMENSIONS, collection_dimensions, rebuild_collection, recover_dimension_migration
+)
+from .hnsw_tuning import CODE_HNSW, CODE_HNSW_DEFAULTS, collection_hnsw, hnsw_differs, hnsw_metadata, resolve_hnsw
+from .embedding_providers import (
+    EmbeddingProvider, get_embedding_provider, check_collection_provider, validate_query_embedding,
+    resolve_dimensions, reduce_dimensions
+)
+from .embedding_scheduler import Priority
+from .executors import run_in_chroma_executor
+from .fingerprints import EXACT_MATCH_ENABLED, FingerprintIndex, query_fingerprint, request_fingerprint
+from .required_keys import RequiredKeysIndex, penalized_score, resolve_key_filter
+from .resilience import (
+    CircuitBreaker, EmbeddingUnavailable, resolve_timeout,
+    text_fingerprint, tokenize, dice_similarity
+)
+from .segments import SegmentStore, SegmentCollection
+from .similarity import DEFAULT_SPACE, collection_space, to_similarity
+from .single_flight import SingleFlight
+
 logger = logging.getLogger(__name__)
 
 
@@ -64,7 +94,19 @@ class CodeCacheService:
         self,
         persist_directory: Optional[str] = None,
         collection_name: str = "cached_code",
-        client: Optional[chromadb.PersistentClient] = None
+        client: Optional[chromadb.PersistentClient] = None,
+        embedding_cache: Optional[EmbeddingCache] = None,
+        embedding_provider: Optional[EmbeddingProvider] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        collection=None,
+        segment_store: Optional[SegmentStore] = None,
+        index_backend: Optional[str] = None,
+        dimensions: Optional[int] = None,
+        hnsw: Optional[Dict[str, int]] = None,
+        partitioned: Optional[bool] = None,
+        exact_match: Optional[bool] = None,
+        max_entries: Optional[int] = None,
+        max_per_workflow: Optional[int] = None
     ):
         """
         Initialize code cache service.
@@ -73,21 +115,57 @@ class CodeCacheService:
             persist_directory: Where to store ChromaDB (defaults to /knowledge/vector_db)
             collection_name: Name of the collection (default: "cached_code")
             client: Optional existing ChromaDB client to reuse
+            embedding_cache: Optional embedding cache to reuse (e.g. VectorStore's).
+                             Defaults to one stored in persist_directory, or none
+                             when reusing a client without a cache.
+            embedding_provider: Optional embedding provider to reuse.
+                                Defaults to the one selected by EMBEDDING_PROVIDER.
+            circuit_breaker: Optional breaker shared with other embedding users
+            collection: Optional prebuilt collection. A read-only SegmentCollection
+                        (reader workers) makes saves and clears go to the
+                        writer process through the segment spool.
+            segment_store: Writer only - publish the collection as a shared
+                           segment (see publish_segment)
+            index_backend: "chroma", "pgvector", "ivfpq" or "binary" (defaults to CODE_INDEX_BACKEND).
+                           Non-Chroma indexes live under persist_directory/code_index
+                           and import the Chroma collection on first open.
+            dimensions: Stored vector size for new collections (defaults to
+                        CODE_EMBEDDING_DIMENSIONS, 0 = model size). An existing
+                        collection keeps its size until rebuild_collection().
+            hnsw: HNSW settings for a new Chroma collection (defaults to
+                  CODE_HNSW, see hnsw_tuning). When given or set in the
+                  environment, an existing collection built otherwise is rebuilt.
+            partitioned: Store the Chroma backend as one collection per workflow
+                         (defaults to CODE_CACHE_PARTITIONED, see code_partitions)
+            exact_match: Answer exact repeats of a saved request from the
+                         fingerprint map, without embedding the query
+                         (defaults to CODE_CACHE_EXACT_MATCH, see fingerprints)
+            max_entries: Entries kept in the cache, evicted by evict() (defaults
+                         to CODE_CACHE_MAX_ENTRIES, 0 = unbounded; see code_eviction)
+            max_per_workflow: Entries kept per workflow_id (defaults to
+                              CODE_CACHE_MAX_PER_WORKFLOW, 0 = unbounded)
         """
         from pathlib import Path
         import os
 
         # Default persist directory
-        if persist_directory is None and client is None:
+        if persist_directory is None and client is None and collection is None:
             base_dir = Path(__file__).parent.parent.parent.parent
             persist_directory = str(base_dir / "knowledge" / "vector_db")
 
         self.collection_name = collection_name
+        self.index_backend = (index_backend or DEFAULT_INDEX_BACKEND).lower()
+        self.partitioned = PARTITIONED if partitioned is None else partitioned
+        self.index_directory = persist_directory or str(
+            Path(__file__).parent.parent.parent.parent / "knowledge" / "vector_db"
+        )
 
         # Initialize or reuse ChromaDB client
         if client:
             self.client = client
             logger.info(f"Reusing existing ChromaDB client for {collection_name}")
+        elif collection is not None:
+            self.client = None
         else:
             os.makedirs(persist_directory, exist_ok=True)
             self.client = chromadb.PersistentClient(
@@ -99,22 +177,89 @@ class CodeCacheService:
             )
             logger.info(f"Created new ChromaDB client at {persist_directory}")
 
-        # Initialize OpenAI client for embeddings
-        logger.info("Initializing OpenAI client for embeddings...")
-        self.openai_client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-        self.embedding_model_name = "text-embedding-3-small"
-        logger.info(f"Using OpenAI embedding model: {self.embedding_model_name}")
+        # Embedding provider (OpenAI or local CPU model, see EMBEDDING_PROVIDER)
+        if embedding_provider is None:
+            embedding_provider = get_embedding_provider()
+        self.embedding_provider = embedding_provider
+        self.embedding_model_name = embedding_provider.model_name
+        logger.info(f"Using embedding provider: {embedding_provider}")
+        self.target_dimensions = resolve_dimensions(
+            embedding_provider, CODE_EMBEDDING_DIMENSIONS if dimensions is None else dimensions
+        )
+        self.hnsw = resolve_hnsw(hnsw, CODE_HNSW, CODE_HNSW_DEFAULTS)
+        self._hnsw_configured = hnsw is not None or bool(CODE_HNSW)
+
+        # Embedding cache (skips provider calls for already-embedded texts)
+        if embedding_cache is None and persist_directory is not None:
+            embedding_cache = EmbeddingCache(
+                os.path.join(persist_directory, EMBEDDING_CACHE_FILENAME)
+            )
+        self.embedding_cache = embedding_cache
+
+        # Identical concurrent searches share one embedding + query
+        self._search_flight = SingleFlight()
+
+        # Request fingerprint -> cached matches, built on first search
+        self.exact_match = EXACT_MATCH_ENABLED if exact_match is None else exact_match
+        self._fingerprints: Optional[FingerprintIndex] = None
+        # Inverted index over required_keys (see required_keys), built with the map
+        self._required_keys: Optional[RequiredKeysIndex] = None
+
+        # Size limits, enforced by evict() from a background task; hits
+        # and recency decide what goes first
+        self.max_entries = MAX_ENTRIES if max_entries is None else max_entries
+        self.max_per_workflow = MAX_PER_WORKFLOW if max_per_workflow is None else max_per_workflow
+        self._hits = HitTracker()
+        # Fields the retention scores depend on, built with the entry maps
+        self._retention: Optional[RetentionTable] = None
+        self._eviction_stats = {"runs": 0, "evicted_total": 0, "last_evicted": 0, "last_run_at": None}
+
+        # Searches fall back to fingerprint/lexical matching when the
+        # provider is slow or failing
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+
+        # Multi-worker mode: readers queue writes, the writer publishes segments
+        self.segment_store = segment_store
+        self.read_only = isinstance(collection, SegmentCollection)
+        # Changes since the last publish: ids for a delta, or a full export
+        self._segment_dirty = False
+        self._segment_added: List[str] = []
+        self._segment_deleted: List[str] = []
+
+        # Held around writes, and by a collection rebuild while it switches
+        self._write_lock = threading.Lock()
 
         # Get or create collection
-        self.collection = self._initialize_collection()
+        if collection is not None:
+            self.collection = collection
+            check_collection_provider(collection, self.embedding_provider)
+        else:
+            self.collection = self._initialize_collection()
 
     def _initialize_collection(self):
         """
         Initialize or get existing code cache collection.
 
         Returns:
-            ChromaDB collection
+            ChromaDB collection, or a CodeIndex for other backends
         """
+        if self.index_backend != "chroma":
+            return self._initialize_index()
+
+        recover_dimension_migration(self.client, self.collection_name)
+        if self.partitioned:
+            collection = PartitionedCollection(
+                self.client,
+                self.collection_name,
+                metadata={**self._collection_metadata(), **self._chroma_metadata()}
+            )
+            logger.info(
+                f"Loaded partitioned collection: {self.collection_name} "
+                f"({collection.count()} cached codes in {len(collection.partitions)} workflows)"
+            )
+            check_collection_provider(collection, self.embedding_provider)
+            return collection
+
         try:
             collection = self.client.get_collection(name=self.collection_name)
             logger.info(f"Loaded existing collection: {self.collection_name}")
@@ -122,12 +267,64 @@ class CodeCacheService:
         except Exception:
             collection = self.client.create_collection(
                 name=self.collection_name,
-                metadata={"description": "Semantic cache for AI-generated code"}
+                metadata={**self._collection_metadata(), **self._chroma_metadata()}
             )
             logger.info(f"Created new collection: {self.collection_name}")
 
+        # Refuse to mix vectors from different embedding models
+        check_collection_provider(collection, self.embedding_provider)
+
         return collection
 
+    def _collection_metadata(self, dimensions: Optional[int] = None) -> Dict:
+        """Metadata for a new collection: description, provider and vector size."""
+        return {
+            "description": "Semantic cache for AI-generated code",
+            **self.embedding_provider.collection_metadata(),
+            "embedding_dimensions": dimensions or self.target_dimensions or 0
+        }
+
+    def _chroma_metadata(self) -> Dict:
+        """Index settings for a new Chroma collection: cosine space and HNSW parameters."""
+        return {"hnsw:space": DEFAULT_SPACE, **hnsw_metadata(self.hnsw)}
+
+    @property
+    def dimensions(self) -> Optional[int]:
+        """Vector size the current collection stores."""
+        return collection_dimensions(self.collection, self.target_dimensions)
+
+    def _initialize_index(self) -> CodeIndex:
+        """
+        Open the configured non-Chroma index, migrating Chroma entries once.
+
+        The Chroma collection is kept as is after the migration.
+        """
+        index = open_code_index(
+            self.index_backend,
+            os.path.join(self.index_directory, "code_index", self.collection_name),
+            name=self.collection_name,
+            metadata=self._collection_metadata()
+        )
+
+        if not index.metadata.get("migrated_from_chroma") and self.client is not None:
+            try:
+                source = open_collection(self.client, self.collection_name)
+            except Exception:
+                source = None
+
+            if source is not None and source.count() > 0 and index.count() == 0:
+                check_collection_provider(source, self.embedding_provider)
+                logger.info(f"Migrating {source.count()} cached codes from Chroma to {self.index_backend}...")
+                copied = migrate_collection(source, index)
+                logger.info(f"✓ Migrated {copied} cached codes to {self.index_backend}")
+
+            index.modify({**index.metadata, "migrated_from_chroma": True})
+
+        check_collection_provider(index, self.embedding_provider)
+        logger.info(f"Code cache index: {self.index_backend} ({index.count()} cached codes)")
+
+        return index
+
     def save_code(self, document: Dict) -> Dict[str, any]:
         """
         Save successful code execution to semantic cache.
@@ -144,6 +341,11 @@ class CodeCacheService:
                 - workflow_id (int, optional): Workflow ID for isolation
                 - metadata (dict): success_count, created_at, libraries_used
 
+        The code is parsed server-side (see code_analysis) while the query
+        is embedded; the keys found replace the caller's required_keys, the
+        imports its libraries_used, and both are stored with the entry. Code
+        that does not parse keeps the caller's values.
+
         Returns:
             Dict with success status and document ID
 
@@ -165,41 +367,120 @@ class CodeCacheService:
             ... })
         """
         try:
+            # Parse the code in the analysis pool while the text is embedded
+            analysis = None if self.read_only else submit_analysis(document["code"])
+
             # Build searchable text for embedding
             searchable_text = self._build_searchable_text(document)
 
-            # Generate embedding with OpenAI
-            response = self.openai_client.embeddings.create(
-                input=searchable_text,
-                model=self.embedding_model_name
+            # Generate embedding (cached)
+            embedding = self._embed([searchable_text], priority=Priority.SAVE)[0]
+
+            return self._store(document, embedding, analysis)
+
+        except Exception as e:
+            logger.error(f"Failed to save code to cache: {e}")
+            return {
+                "success": False,
+                "error": str(e)
+            }
+
+    async def asave_code(self, document: Dict) -> Dict[str, any]:
+        """
+        Async variant of save_code.
+
+        The embedding call is awaited on the event loop; the Chroma write
+        runs on the dedicated Chroma executor.
+        """
+        try:
+            analysis = None if self.read_only else submit_analysis(document["code"])
+            searchable_text = self._build_searchable_text(document)
+            embedding = (await self._aembed([searchable_text], priority=Priority.SAVE))[0]
+            return await run_in_chroma_executor(self._store, document, embedding, analysis)
+
+        except Exception as e:
+            logger.error(f"Failed to save code to cache: {e}")
+            return {
+                "success": False,
+                "error": str(e)
+            }
+
+    def save_embedded_code(self, document: Dict, embedding: List[float]) -> Dict[str, any]:
+        """
+        Store a document whose embedding was computed elsewhere.
+
+        Used by the writer process to apply saves queued by reader workers.
+        """
+        return self._store(document, embedding)
+
+    def _store(self, document: Dict, embedding: List[float], analysis: Optional[Future] = None) -> Dict[str, any]:
+        """
+        Write an embedded code document to the collection.
+
+        Args:
+            document: Code cache document (see save_code)
+            embedding: Embedding of the document's searchable text
+            analysis: Pending submit_analysis of the code (started here if None)
+
+        Returns:
+            Dict with success status and document ID
+        """
+        embedding = reduce_dimensions([embedding], self.dimensions)[0]
+
+        if self.read_only:
+            # Reader worker: the writer process stores it and republishes the segment
+            self.collection.store.enqueue(
+                "save_code",
+                document=document,
+                embedding=[float(x) for x in embedding]
+            )
+            return {
+                "success": True,
+                "id": None,
+                "message": "Code queued for the semantic cache writer"
+            }
+
+        searchable_text = self._build_searchable_text(document)
+
+        # Keys and imports of the code, parsed server-side; code that does not
+        # parse keeps the required keys and libraries the executor extracted
+        analysis = analysis_result(analysis or submit_analysis(document["code"]))
+        metadata_dict = document.get("metadata", {})
+        required_keys = metadata_dict.get("required_keys", [])
+        libraries_used = analysis["imports"] if analysis else metadata_dict.get("libraries_used", [])
+
+        # Prepare metadata (flatten for ChromaDB)
+        metadata = {
+            "node_action": document.get("node_action", "unknown"),
+            "node_description": document.get("node_description", ""),
+            "success_count": metadata_dict.get("success_count", 1),
+            "created_at": metadata_dict.get("created_at", datetime.now().isoformat()),
+            "libraries_used": ",".join(libraries_used),
+            # Store complex fields as JSON strings
+            "input_schema": str(document.get("input_schema", {})),
+            "insights": ",".join(document.get("insights", [])),
+            "config": str(document.get("config", {})),
+            # Store required keys for validation (not for semantic search)
+            "required_keys": ",".join(required_keys) if required_keys else "",
+            # Workflow isolation - cache is scoped per workflow
+            "workflow_id": document.get("workflow_id") if document.get("workflow_id") is not None else -1,
+            # Embedding-free matching (degraded search)
+            "fingerprint": text_fingerprint(searchable_text),
+            "search_text": searchable_text,
+            # Exact repeats (see fingerprints)
+            "request_fingerprint": request_fingerprint(
+                document.get("ai_description"), document.get("input_schema")
             )
-            embedding = response.data[0].embedding
+        }
+        if analysis is not None:
+            if required_keys and set(required_keys) != set(analysis["required_keys"]):
+                logger.debug(f"  required_keys: caller {sorted(required_keys)}, code {analysis['required_keys']}")
+            metadata.update(analysis_metadata(analysis))
 
+        with self._write_lock:
             # Generate unique ID
             doc_id = f"code_{self.collection.count()}_{datetime.now().timestamp()}"
 
-            # Extract required keys from metadata (passed from executor)
-            # These are the keys that the code ACTUALLY uses (extracted from code analysis)
-            metadata_dict = document.get("metadata", {})
-            required_keys = metadata_dict.get("required_keys", [])
-
-            # Prepare metadata (flatten for ChromaDB)
-            metadata = {
-                "node_action": document.get("node_action", "unknown"),
-                "node_description": document.get("node_description", ""),
-                "success_count": metadata_dict.get("success_count", 1),
-                "created_at": metadata_dict.get("created_at", datetime.now().isoformat()),
-                "libraries_used": ",".join(metadata_dict.get("libraries_used", [])),
-                # Store complex fields as JSON strings
-                "input_schema": str(document.get("input_schema", {})),
-                "insights": ",".join(document.get("insights", [])),
-                "config": str(document.get("config", {})),
-                # Store required keys for validation (not for semantic search)
-                "required_keys": ",".join(required_keys) if required_keys else "",
-                # Workflow isolation - cache is scoped per workflow
-                "workflow_id": document.get("workflow_id") if document.get("workflow_id") is not None else -1
-            }
-
             # Add to collection
             self.collection.add(
                 ids=[doc_id],
@@ -208,21 +489,26 @@ class CodeCacheService:
                 metadatas=[metadata]
             )
 
-            logger.info(f"✓ Saved code to cache: {doc_id} (action: {document.get('node_action')})")
-            logger.debug(f"  AI description: {document.get('ai_description', '')[:80]}...")
+            if self._fingerprints is not None:
+                self._fingerprints.add(
+                    metadata["request_fingerprint"],
+                    metadata["workflow_id"],
+                    self._format_match(document["code"], metadata, 1.0, doc_id),
+                    metadata["created_at"]
+                )
+                self._required_keys.add(metadata["required_keys"], doc_id)
+                self._retention.add(doc_id, metadata)
+            if self.segment_store is not None:
+                self._segment_added.append(doc_id)
 
-            return {
-                "success": True,
-                "id": doc_id,
-                "message": "Code saved to semantic cache"
-            }
+        logger.info(f"✓ Saved code to cache: {doc_id} (action: {document.get('node_action')})")
+        logger.debug(f"  AI description: {document.get('ai_description', '')[:80]}...")
 
-        except Exception as e:
-            logger.error(f"Failed to save code to cache: {e}")
-            return {
-                "success": False,
-                "error": str(e)
-            }
+        return {
+            "success": True,
+            "id": doc_id,
+            "message": "Code saved to semantic cache"
+        }
 
     def search_code(
         self,
@@ -230,17 +516,23 @@ class CodeCacheService:
         threshold: float = 0.85,
         top_k: int = 5,
         available_keys: Optional[List[str]] = None,
-        workflow_id: Optional[int] = None
+        workflow_id: Optional[int] = None,
+        timeout_ms: Optional[int] = None,
+        key_filter: Optional[str] = None
     ) -> List[Dict]:
         """
         Search for similar code in semantic cache.
 
         Args:
             query: Search query (task description + input schema + insights)
-            threshold: Minimum similarity score (0-1, default: 0.85)
-            top_k: Maximum number of results (default: 5)
+            threshold: Minimum similarity score (0-1) to consider a match
+            top_k: Maximum number of results to return
             available_keys: List of keys available in current context (for filtering)
             workflow_id: Workflow ID to filter results (only return code from same workflow)
+            timeout_ms: Latency budget for the embedding step (default: SEARCH_TIMEOUT_MS)
+            key_filter: How available_keys filter results: "off", "strict" (only
+                        code whose required keys are all available) or "penalty"
+                        (lower scores for missing keys); default CODE_CACHE_KEY_FILTER
 
         Returns:
             List of matching code documents with scores, sorted by similarity
@@ -257,100 +549,680 @@ class CodeCacheService:
             ...     print(f"Score: {match['score']}")
             ...     print(f"Code: {match['code'][:100]}...")
         """
-        if self.collection.count() == 0:
-            logger.debug("Code cache is empty, no results")
-            return []
+        return self.search_code_detailed(
+            query, threshold, top_k, available_keys, workflow_id, timeout_ms, key_filter=key_filter
+        )["matches"]
 
-        try:
-            # Generate query embedding with OpenAI
-            response = self.openai_client.embeddings.create(
-                input=query,
-                model=self.embedding_model_name
+    def search_code_detailed(
+        self,
+        query: str,
+        threshold: float = 0.85,
+        top_k: int = 5,
+        available_keys: Optional[List[str]] = None,
+        workflow_id: Optional[int] = None,
+        timeout_ms: Optional[int] = None,
+        query_embedding: Optional[List[float]] = None,
+        embedding_model: Optional[str] = None,
+        key_filter: Optional[str] = None
+    ) -> Dict[str, any]:
+        """
+        search_code, also reporting whether the answer is degraded.
+
+        A query whose request fingerprint (see fingerprints) matches saved
+        entries returns those with score 1.0, before any embedding or index
+        search. When the embedding step misses the latency budget, fails, or
+        the circuit breaker is open, matches come from exact fingerprint and
+        lexical matching instead of vector similarity.
+
+        Args:
+            query_embedding: Precomputed query vector (skips embedding the query);
+                             must match the collection's model and dimensions
+            embedding_model: Model that produced query_embedding (checked if given)
+
+        Returns:
+            Dict with matches, degraded (bool), degraded_reason
+            ("timeout", "circuit_open", "error" or None), exact_match (bool)
+            and query_embedding (the vector searched with, None if degraded
+            or an exact match)
+
+        Raises:
+            ValueError: If query_embedding does not match the collection, or
+                        key_filter is unknown
+        """
+        key_filter = resolve_key_filter(key_filter, available_keys)
+        if query_embedding is not None:
+            query_embedding = validate_query_embedding(
+                self.collection, self.embedding_provider, query_embedding, embedding_model
             )
-            query_embedding = response.data[0].embedding
-
-            # Query collection (fetch more candidates if filtering by keys or workflow)
-            fetch_count = top_k * 3 if (available_keys or workflow_id is not None) else top_k
-
-            # Build where clause for workflow_id filtering
-            where_clause = None
-            if workflow_id is not None:
-                where_clause = {"workflow_id": workflow_id}
-                logger.debug(f"Filtering semantic cache by workflow_id={workflow_id}")
-
-            results = self.collection.query(
-                query_embeddings=[query_embedding],
-                n_results=fetch_count,
-                include=['documents', 'metadatas', 'distances'],
-                where=where_clause
+            keys = self._key_index(key_filter)
+            if self._nothing_to_search(workflow_id, available_keys, key_filter, keys):
+                return self._search_result([], query_embedding=query_embedding)
+            return self._record_hits(self._search_result(
+                self._search_with_embedding(
+                    query_embedding, threshold, top_k, available_keys, workflow_id, key_filter, keys
+                ),
+                query_embedding=query_embedding
+            ))
+
+        exact = self._exact_matches(query, threshold, top_k, available_keys, workflow_id, key_filter)
+        if exact:
+            return self._record_hits(self._search_result(exact, exact_match=True))
+
+        key = self._search_key(query, threshold, top_k, available_keys, workflow_id, timeout_ms, key_filter)
+        result = self._search_flight.do(
+            key,
+            lambda: self._search(query, threshold, top_k, available_keys, workflow_id, timeout_ms, key_filter)
+        )
+        return self._record_hits(copy.deepcopy(result))
+
+    def _search(
+        self,
+        query: str,
+        threshold: float,
+        top_k: int,
+        available_keys: Optional[List[str]],
+        workflow_id: Optional[int],
+        timeout_ms: Optional[int],
+        key_filter: str = "off"
+    ) -> Dict[str, any]:
+        """Embed the query and search (one single-flight leader call)."""
+        keys = self._key_index(key_filter)
+        if self._nothing_to_search(workflow_id, available_keys, key_filter, keys):
+            logger.debug("Nothing cached for this workflow, no results")
+            return self._search_result([])
+
+        try:
+            # Generate query embedding (cached), within the latency budget
+            query_embedding = self.circuit_breaker.call(
+                lambda: self._embed([query])[0],
+                timeout=resolve_timeout(timeout_ms)
             )
+        except EmbeddingUnavailable as e:
+            logger.warning(f"Query embedding unavailable ({e}), using fingerprint/lexical match")
+            matches = self._search_degraded(query, threshold, top_k, workflow_id, available_keys, key_filter, keys)
+            return self._search_result(matches, degraded_reason=e.reason)
 
-            # Format and filter results
-            matches = []
-            available_keys_set = set(available_keys) if available_keys else None
+        try:
+            return self._search_result(self._search_with_embedding(
+                query_embedding, threshold, top_k, available_keys, workflow_id, key_filter, keys
+            ), query_embedding=query_embedding)
 
-            for i in range(len(results['documents'][0])):
-                distance = results['distances'][0][i]
+        except Exception as e:
+            logger.error(f"Error searching code cache: {e}")
+            return self._search_result([])
+
+    async def asearch_code(
+        self,
+        query: str,
+        threshold: float = 0.85,
+        top_k: int = 5,
+        available_keys: Optional[List[str]] = None,
+        workflow_id: Optional[int] = None,
+        timeout_ms: Optional[int] = None,
+        key_filter: Optional[str] = None
+    ) -> List[Dict]:
+        """
+        Async variant of search_code.
 
-                # Convert distance to score (0-1, higher is better)
-                # ChromaDB uses L2 distance, normalize to 0-1 range
-                score = 1.0 - min(distance / 2.0, 1.0)  # Heuristic normalization
+        The embedding call is awaited on the event loop; Chroma work runs
+        on the dedicated Chroma executor.
+        """
+        result = await self.asearch_code_detailed(
+            query, threshold, top_k, available_keys, workflow_id, timeout_ms, key_filter=key_filter
+        )
+        return result["matches"]
 
-                # Apply threshold filter
-                if score < threshold:
-                    continue
+    async def asearch_code_detailed(
+        self,
+        query: str,
+        threshold: float = 0.85,
+        top_k: int = 5,
+        available_keys: Optional[List[str]] = None,
+        workflow_id: Optional[int] = None,
+        timeout_ms: Optional[int] = None,
+        query_embedding: Optional[List[float]] = None,
+        embedding_model: Optional[str] = None,
+        key_filter: Optional[str] = None
+    ) -> Dict[str, any]:
+        """Async variant of search_code_detailed."""
+        key_filter = resolve_key_filter(key_filter, available_keys)
+        if query_embedding is not None:
+            query_embedding = validate_query_embedding(
+                self.collection, self.embedding_provider, query_embedding, embedding_model
+            )
+            keys = await self._akey_index(key_filter)
+            if await run_in_chroma_executor(self._nothing_to_search, workflow_id, available_keys, key_filter, keys):
+                return self._search_result([], query_embedding=query_embedding)
+            matches = await run_in_chroma_executor(
+                self._search_with_embedding,
+                query_embedding, threshold, top_k, available_keys, workflow_id, key_filter, keys
+            )
+            return self._record_hits(self._search_result(matches, query_embedding=query_embedding))
+
+        args = (query, threshold, top_k, available_keys, workflow_id, key_filter)
+        if not self.exact_match or self._entry_maps_current():
+            exact = self._exact_matches(*args)
+        else:
+            # First search (or a new segment): building the maps reads the collection
+            exact = await run_in_chroma_executor(self._exact_matches, *args)
+        if exact:
+            return self._record_hits(self._search_result(exact, exact_match=True))
+
+        key = self._search_key(query, threshold, top_k, available_keys, workflow_id, timeout_ms, key_filter)
+        result = await self._search_flight.ado(
+            key,
+            lambda: self._asearch(query, threshold, top_k, available_keys, workflow_id, timeout_ms, key_filter)
+        )
+        return self._record_hits(copy.deepcopy(result))
+
+    async def _asearch(
+        self,
+        query: str,
+        threshold: float,
+        top_k: int,
+        available_keys: Optional[List[str]],
+        workflow_id: Optional[int],
+        timeout_ms: Optional[int],
+        key_filter: str = "off"
+    ) -> Dict[str, any]:
+        """Async variant of _search."""
+        keys = await self._akey_index(key_filter)
+        if await run_in_chroma_executor(self._nothing_to_search, workflow_id, available_keys, key_filter, keys):
+            logger.debug("Nothing cached for this workflow, no results")
+            return self._search_result([])
 
-                metadata = results['metadatas'][0][i]
-
-                # DON'T filter by required_keys here - let NOVA do the validation
-                # This filter was too strict and rejected valid codes
-                # Reason: required_keys extraction from code is not 100% accurate
-                #         (e.g., dynamic keys, conditional access, etc.)
-                # Let NOVA validate after retrieval with full context knowledge
-
-                # Parse complex fields back from strings
-                import ast
-                try:
-                    input_schema = ast.literal_eval(metadata.get("input_schema", "{}"))
-                except:
-                    input_schema = {}
-
-                try:
-                    config = ast.literal_eval(metadata.get("config", "{}"))
-                except:
-                    config = {}
-
-                insights = metadata.get("insights", "").split(",") if metadata.get("insights") else []
-                libraries = metadata.get("libraries_used", "").split(",") if metadata.get("libraries_used") else []
-                required_keys = metadata.get("required_keys", "").split(",") if metadata.get("required_keys") else []
-
-                matches.append({
-                    "code": results['documents'][0][i],
-                    "score": round(score, 4),
-                    "node_action": metadata.get("node_action", "unknown"),
-                    "node_description": metadata.get("node_description", ""),
-                    "input_schema": input_schema,
-                    "insights": insights,
-                    "config": config,
-                    "metadata": {
-                        "success_count": metadata.get("success_count", 1),
-                        "created_at": metadata.get("created_at", ""),
-                        "libraries_used": libraries,
-                        "required_keys": required_keys  # Return for validation
-                    }
-                })
-
-                # Stop if we have enough matches
-                if len(matches) >= top_k:
-                    break
-
-            logger.info(f"Found {len(matches)} compatible matches above threshold {threshold} (from {fetch_count} candidates)")
-
-            return matches
+        try:
+            query_embedding = await self.circuit_breaker.acall(
+                lambda: self._aembed_one(query),
+                timeout=resolve_timeout(timeout_ms)
+            )
+        except EmbeddingUnavailable as e:
+            logger.warning(f"Query embedding unavailable ({e}), using fingerprint/lexical match")
+            matches = await run_in_chroma_executor(
+                self._search_degraded, query, threshold, top_k, workflow_id, available_keys, key_filter, keys
+            )
+            return self._search_result(matches, degraded_reason=e.reason)
+
+        try:
+            return self._search_result(await run_in_chroma_executor(
+                self._search_with_embedding,
+                query_embedding, threshold, top_k, available_keys, workflow_id, key_filter, keys
+            ), query_embedding=query_embedding)
 
         except Exception as e:
             logger.error(f"Error searching code cache: {e}")
+            return self._search_result([])
+
+    async def _aembed_one(self, text: str) -> List[float]:
+        return (await self._aembed([text]))[0]
+
+    def _is_empty(self, workflow_id: Optional[int]) -> bool:
+        """
+        Nothing to search: no entries for the workflow (or none at all).
+
+        Checked before embedding the query. Partitioned collections, segments
+        and CodeIndex backends count one workflow; a plain Chroma collection
+        only knows its total.
+        """
+        if workflow_id is not None and hasattr(self.collection, "partition_count"):
+            return self.collection.partition_count(workflow_id) == 0
+        return self.collection.count() == 0
+
+    def _nothing_to_search(
+        self,
+        workflow_id: Optional[int],
+        available_keys: Optional[List[str]],
+        key_filter: str,
+        keys: Optional[RequiredKeysIndex] = None
+    ) -> bool:
+        """_is_empty, or (strict key filter) no cached code the available keys can run."""
+        if self._is_empty(workflow_id):
+            return True
+        return key_filter == "strict" and not keys.compatible(available_keys)
+
+    def _follows_changes(self) -> bool:
+        """Other processes write the collection: a segment reader, or a shared backend (pgvector)."""
+        return self.read_only or (isinstance(self.collection, CodeIndex) and self.collection.shared)
+
+    def _entry_maps_current(self) -> bool:
+        """The fingerprint and required_keys maps are built and known to match the collection (no I/O)."""
+        index = self._fingerprints
+        if index is None:
+            return False
+        if self.read_only:
+            return index.version == self.collection.generation
+        # A shared backend's change log is read on every use (_build_entry_maps)
+        return not self._follows_changes()
+
+    def _build_entry_maps(self) -> Tuple[FingerprintIndex, RequiredKeysIndex]:
+        """
+        Fingerprint map and required_keys index of the collection, built on
+        first use from one scan of its metadata (with the retention table
+        evict() scores from).
+
+        The writer keeps them current on every save. When other processes
+        write the collection (reader workers, instances sharing a pgvector
+        table) the maps follow its change feed: the entries added and
+        deleted since the version they were built at are applied, and
+        everything is re-read only when the feed cannot say (a new segment
+        generation, a clear, a pruned change log).
+        """
+        if self._entry_maps_current():
+            return self._fingerprints, self._required_keys
+
+        with self._write_lock:
+            index = self._fingerprints
+            if index is not None and self._follows_changes():
+                changes = self.collection.changes_since(index.version)
+                if changes is not None:
+                    self._apply_changes(index, self._required_keys, self._retention, *changes)
+                    return index, self._required_keys
+
+            # Version first: writes made while reading are applied again on the next sync
+            version = self.collection.change_version() if self._follows_changes() else None
+            index = FingerprintIndex(version)
+            keys = RequiredKeysIndex()
+            retention = RetentionTable()
+            results = self.collection.get(include=['documents', 'metadatas'])
+            for doc_id, code, metadata in zip(results['ids'], results['documents'], results['metadatas']):
+                self._index_entry(index, keys, retention, doc_id, code, metadata)
+            self._fingerprints, self._required_keys, self._retention = index, keys, retention
+            logger.info(f"Fingerprint map: {len(index)} cached codes, {keys.get_stats()['key_sets']} key sets")
+            return index, keys
+
+    def _index_entry(
+        self,
+        index: FingerprintIndex,
+        keys: RequiredKeysIndex,
+        retention: RetentionTable,
+        doc_id: str,
+        code: str,
+        metadata: Dict
+    ):
+        """Add one stored entry to the fingerprint map, required_keys index and retention table."""
+        keys.add(metadata.get("required_keys"), doc_id)
+        retention.add(doc_id, metadata)
+        fingerprint = metadata.get("request_fingerprint")
+        if not fingerprint and metadata.get("search_text"):
+            # Saved before request fingerprints existed
+            fingerprint = query_fingerprint(metadata["search_text"])
+        if fingerprint:
+            index.add(
+                fingerprint,
+                metadata.get("workflow_id", -1),
+                self._format_match(code, metadata, 1.0, doc_id),
+                metadata.get("created_at", "")
+            )
+
+    def _apply_changes(
+        self,
+        index: FingerprintIndex,
+        keys: RequiredKeysIndex,
+        retention: RetentionTable,
+        version: Any,
+        changes: List[Tuple[str, Optional[str]]]
+    ):
+        """Bring the maps to version with the writes of the change feed (write lock held)."""
+        latest: Dict[str, str] = {}
+        for op, doc_id in changes:
+            latest[doc_id] = op
+
+        added = [doc_id for doc_id, op in latest.items() if op == "add"]
+        for doc_id, op in latest.items():
+            if op == "delete":
+                index.remove(doc_id)
+                keys.remove(doc_id)
+                retention.remove(doc_id)
+        if added:
+            results = self.collection.get(ids=added, include=['documents', 'metadatas'])
+            for doc_id, code, metadata in zip(results['ids'], results['documents'], results['metadatas']):
+                self._index_entry(index, keys, retention, doc_id, code, metadata)
+        index.version = version
+        if changes:
+            logger.debug(f"Fingerprint map: {len(added)} added, {len(latest) - len(added)} deleted elsewhere")
+
+    def _key_index(self, key_filter: str) -> Optional[RequiredKeysIndex]:
+        """
+        required_keys index for a search's key filter (None when it is off).
+
+        Resolved once per search and passed to the key checks: with a
+        shared backend each resolution reads the change log (see
+        _build_entry_maps).
+        """
+        if key_filter == "off":
+            return None
+        return self._build_entry_maps()[1]
+
+    async def _akey_index(self, key_filter: str) -> Optional[RequiredKeysIndex]:
+        """Async variant of _key_index (the maps are built on the Chroma executor)."""
+        if key_filter == "off":
+            return None
+        if self._entry_maps_current():
+            return self._required_keys
+        return await run_in_chroma_executor(self._key_index, key_filter)
+
+    def _exact_matches(
+        self,
+        query: str,
+        threshold: float,
+        top_k: int,
+        available_keys: Optional[List[str]],
+        workflow_id: Optional[int],
+        key_filter: str = "off"
+    ) -> List[Dict]:
+        """Saved entries whose request fingerprint equals the query's (score 1.0, newest first)."""
+        if not self.exact_match:
             return []
+        index, keys = self._build_entry_maps()
+        matches = index.lookup(query_fingerprint(query), workflow_id, top_k if key_filter == "off" else len(index))
+        if key_filter != "off":
+            # Apply the key check to every saved match before keeping top_k
+            scored = []
+            for match in matches:
+                required_keys = ",".join(match["metadata"]["required_keys"])
+                score = self._key_score(1.0, required_keys, available_keys, key_filter, keys)
+                if score is not None and score >= threshold:
+                    scored.append((score, match))
+            scored.sort(key=lambda item: item[0], reverse=True)
+            matches = [{**match, "score": round(score, 4)} for score, match in scored]
+        matches = copy.deepcopy(matches[:top_k])
+        if matches:
+            logger.info(f"Exact fingerprint match: {len(matches)} cached codes")
+        return matches
+
+    def _key_score(
+        self,
+        score: float,
+        required_keys: Optional[str],
+        available_keys: Optional[List[str]],
+        key_filter: str,
+        keys: Optional[RequiredKeysIndex] = None
+    ) -> Optional[float]:
+        """
+        Score of a match after the key check (None = filtered out).
+
+        Args:
+            score: Similarity before the key check
+            required_keys: The entry's stored required_keys value ("a,b")
+            available_keys: Keys available in the caller's context
+            key_filter: Resolved key filter mode
+            keys: The search's required_keys index (see _key_index)
+        """
+        if key_filter == "off":
+            return score
+        missing = keys.missing_fraction(required_keys, available_keys)
+        if key_filter == "strict":
+            return score if missing == 0 else None
+        return penalized_score(score, missing)
+
+    def _key_where(
+        self,
+        workflow_id: Optional[int],
+        available_keys: Optional[List[str]],
+        key_filter: str,
+        keys: Optional[RequiredKeysIndex] = None
+    ) -> Optional[Dict]:
+        """Where clause for a workflow, restricted to compatible entries in strict mode."""
+        clauses = []
+        if workflow_id is not None:
+            clauses.append({"workflow_id": workflow_id})
+        if key_filter == "strict":
+            # Entries whose required_keys are all available, so the vector
+            # search never ranks code the caller cannot run
+            clauses.append({"required_keys": {"$in": keys.compatible(available_keys)}})
+        if not clauses:
+            return None
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+    def _record_hits(self, result: Dict[str, any]) -> Dict[str, any]:
+        """Count a search's matches as hits of their entries (see code_eviction)."""
+        self._hits.record(match["id"] for match in result["matches"] if match.get("id"))
+        return result
+
+    @staticmethod
+    def _search_result(
+        matches: List[Dict],
+        degraded_reason: Optional[str] = None,
+        query_embedding: Optional[List[float]] = None,
+        exact_match: bool = False
+    ) -> Dict[str, any]:
+        return {
+            "matches": matches,
+            "degraded": degraded_reason is not None,
+            "degraded_reason": degraded_reason,
+            "exact_match": exact_match,
+            "query_embedding": query_embedding
+        }
+
+    @staticmethod
+    def _search_key(
+        query: str,
+        threshold: float,
+        top_k: int,
+        available_keys: Optional[List[str]],
+        workflow_id: Optional[int],
+        timeout_ms: Optional[int] = None,
+        key_filter: str = "off"
+    ) -> Tuple:
+        """
+        Normalized identity of a search request for single-flight coalescing.
+
+        Surrounding whitespace and available_keys order/duplicates do not
+        change the result, so they do not change the key either.
+        """
+        return (
+            query.strip(),
+            workflow_id,
+            float(threshold),
+            top_k,
+            tuple(sorted(set(available_keys))) if available_keys else None,
+            timeout_ms,
+            key_filter
+        )
+
+    def _search_with_embedding(
+        self,
+        query_embedding: List[float],
+        threshold: float,
+        top_k: int,
+        available_keys: Optional[List[str]],
+        workflow_id: Optional[int],
+        key_filter: str = "off",
+        keys: Optional[RequiredKeysIndex] = None
+    ) -> List[Dict]:
+        """
+        Nearest-neighbour search for an already-embedded query (keys: see _key_index).
+
+        Returns:
+            List of matching code documents with scores, sorted by similarity
+        """
+        # Build where clause for workflow_id (and strict key) filtering,
+        # applied inside the index, so no extra candidates need to be fetched
+        where_clause = self._key_where(workflow_id, available_keys, key_filter, keys)
+        if workflow_id is not None:
+            logger.debug(f"Filtering semantic cache by workflow_id={workflow_id}")
+
+        # Penalties reorder results: rank a wider candidate list
+        n_results = top_k * 2 if key_filter == "penalty" else top_k
+
+        # Our indexes drop entries below the threshold while searching;
+        # Chroma returns top_k and the loop below stops at the first miss
+        pushdown = {}
+        if isinstance(self.collection, (CodeIndex, SegmentCollection)):
+            pushdown["min_similarity"] = threshold
+
+        results = self.collection.query(
+            query_embeddings=[query_embedding],
+            n_results=n_results,
+            include=['documents', 'metadatas', 'distances'],
+            where=where_clause,
+            **pushdown
+        )
+        space = collection_space(self.collection)
+
+        # Format and filter results
+        matches = []
+
+        for i in range(len(results['documents'][0])):
+            # Cosine similarity, exact for every space (see similarity)
+            score = to_similarity(results['distances'][0][i], space)
+
+            # Results are closest first: the rest are below the threshold too
+            if score < threshold:
+                break
+
+            # required_keys extraction from code is not 100% accurate (dynamic
+            # keys, conditional access), so by default NOVA validates after
+            # retrieval; "strict" already searched only compatible entries,
+            # "penalty" lowers the score of code missing keys
+            metadata = results['metadatas'][0][i]
+            if key_filter == "penalty":
+                score = self._key_score(score, metadata.get("required_keys"), available_keys, key_filter, keys)
+                if score < threshold:
+                    continue
+            matches.append(self._format_match(
+                results['documents'][0][i], metadata, score, results['ids'][0][i]
+            ))
+
+        if key_filter == "penalty":
+            matches.sort(key=lambda match: match["score"], reverse=True)
+            matches = matches[:top_k]
+
+        logger.info(f"Found {len(matches)} compatible matches above threshold {threshold}")
+
+        return matches
+
+    def _search_degraded(
+        self,
+        query: str,
+        threshold: float,
+        top_k: int,
+        workflow_id: Optional[int],
+        available_keys: Optional[List[str]] = None,
+        key_filter: str = "off",
+        keys: Optional[RequiredKeysIndex] = None
+    ) -> List[Dict]:
+        """
+        Embedding-free search: exact fingerprint match, then lexical overlap (keys: see _key_index).
+
+        A fingerprint hit scores 1.0; otherwise the score is the Dice
+        overlap between query tokens and the stored searchable text, so
+        the same threshold keeps only near-identical tasks.
+        """
+        results = self.collection.get(
+            where=self._key_where(workflow_id, available_keys, key_filter, keys),
+            include=['documents', 'metadatas']
+        )
+
+        fingerprint = text_fingerprint(query)
+        query_tokens = tokenize(query)
+        scored = []
+
+        for doc_id, code, metadata in zip(results['ids'], results['documents'], results['metadatas']):
+            if metadata.get("fingerprint") == fingerprint:
+                score = 1.0
+            else:
+                # Entries saved before search_text existed: use what metadata has
+                search_text = metadata.get("search_text") or " ".join([
+                    metadata.get("node_description", ""),
+                    metadata.get("input_schema", "")
+                ])
+                score = dice_similarity(query_tokens, tokenize(search_text))
+
+            if key_filter == "penalty":
+                score = self._key_score(score, metadata.get("required_keys"), available_keys, key_filter, keys)
+            if score >= threshold:
+                scored.append((score, doc_id, code, metadata))
+
+        scored.sort(key=lambda item: item[0], reverse=True)
+        matches = [
+            self._format_match(code, metadata, score, doc_id)
+            for score, doc_id, code, metadata in scored[:top_k]
+        ]
+
+        logger.info(f"Degraded search found {len(matches)} matches above threshold {threshold}")
+
+        return matches
+
+    @staticmethod
+    def _format_match(code: str, metadata: Dict, score: float, doc_id: Optional[str] = None) -> Dict:
+        """Build a search match from a stored document and its metadata."""
+        # Parse complex fields back from strings
+        import ast
+        try:
+            input_schema = ast.literal_eval(metadata.get("input_schema", "{}"))
+        except:
+            input_schema = {}
+
+        try:
+            config = ast.literal_eval(metadata.get("config", "{}"))
+        except:
+            config = {}
+
+        insights = metadata.get("insights", "").split(",") if metadata.get("insights") else []
+        libraries = metadata.get("libraries_used", "").split(",") if metadata.get("libraries_used") else []
+        required_keys = metadata.get("required_keys", "").split(",") if metadata.get("required_keys") else []
+
+        # Server-side analysis (see code_analysis); absent for entries saved before it
+        analysis = {}
+        if metadata.get("analyzed"):
+            analysis = {
+                field: metadata[field].split(",") if metadata.get(field) else []
+                for field in ("optional_keys", "result_keys", "imports")
+            }
+            analysis["dynamic_keys"] = bool(metadata.get("dynamic_keys"))
+
+        return {
+            "id": doc_id,
+            "code": code,
+            "score": round(score, 4),
+            "node_action": metadata.get("node_action", "unknown"),
+            "node_description": metadata.get("node_description", ""),
+            "input_schema": input_schema,
+            "insights": insights,
+            "config": config,
+            "metadata": {
+                "success_count": metadata.get("success_count", 1),
+                "created_at": metadata.get("created_at", ""),
+                "libraries_used": libraries,
+                "required_keys": required_keys,  # Return for validation
+                "analyzed": bool(analysis),
+                **analysis
+            }
+        }
+
+    def _embed(self, texts: List[str], priority: Priority = Priority.INTERACTIVE) -> List[List[float]]:
+        """
+        Embed texts, reusing cached vectors when available.
+
+        Args:
+            texts: Texts to embed
+            priority: Scheduler class (search = INTERACTIVE, save_code = SAVE)
+
+        Returns:
+            List of embedding vectors aligned with texts, at the collection's dimensions
+        """
+        provider = self.embedding_provider.for_priority(priority)
+        if self.embedding_cache is None:
+            return reduce_dimensions(provider.embed(texts), self.dimensions)
+
+        return reduce_dimensions(self.embedding_cache.get_or_embed(
+            provider.cache_namespace,
+            texts,
+            provider.embed
+        ), self.dimensions)
+
+    async def _aembed(self, texts: List[str], priority: Priority = Priority.INTERACTIVE) -> List[List[float]]:
+        """Async variant of _embed."""
+        provider = self.embedding_provider.for_priority(priority)
+        if self.embedding_cache is None:
+            return reduce_dimensions(await provider.aembed(texts), self.dimensions)
+
+        return reduce_dimensions(await self.embedding_cache.aget_or_embed(
+            provider.cache_namespace,
+            texts,
+            provider.aembed
+        ), self.dimensions)
 
     def _build_searchable_text(self, document: Dict) -> str:
         """
@@ -387,15 +1259,34 @@ class CodeCacheService:
         Get code cache statistics.
 
         Returns:
-            Dict with stats: total_codes, actions, avg_success_count
+            Dict with stats: total_codes, actions, avg_success_count, index, eviction
         """
         count = self.collection.count()
+        if isinstance(self.collection, CodeIndex):
+            index_stats = self.collection.get_stats()
+        else:
+            index_stats = {"backend": "segment" if self.read_only else "chroma"}
+            if not self.read_only:
+                index_stats["hnsw"] = collection_hnsw(self.collection)
+            if isinstance(self.collection, PartitionedCollection):
+                index_stats.update(self.collection.get_stats())
+        index_stats["dimensions"] = self.dimensions
+        if self._required_keys is not None:
+            index_stats["required_keys"] = self._required_keys.get_stats()
+        eviction_stats = {
+            "max_entries": self.max_entries,
+            "max_per_workflow": self.max_per_workflow,
+            "tracked_entries": len(self._hits),
+            **self._eviction_stats
+        }
 
         if count == 0:
             return {
                 "total_codes": 0,
                 "actions": [],
-                "avg_success_count": 0
+                "avg_success_count": 0,
+                "index": index_stats,
+                "eviction": eviction_stats
             }
 
         # Get all metadata
@@ -411,14 +1302,217 @@ class CodeCacheService:
         return {
             "total_codes": count,
             "actions": sorted(list(actions)),
-            "avg_success_count": round(total_success / count, 2) if count > 0 else 0
+            "avg_success_count": round(total_success / count, 2) if count > 0 else 0,
+            "index": index_stats,
+            "eviction": eviction_stats
         }
 
     def clear(self):
         """
         Clear all cached code (destructive, cannot be undone).
         """
+        if self.read_only:
+            self.collection.store.enqueue("clear_code")
+            return
+
         logger.warning(f"Clearing code cache collection: {self.collection_name}")
-        self.client.delete_collection(self.collection_name)
-        self.collection = self._initialize_collection()
+        if isinstance(self.collection, (CodeIndex, PartitionedCollection)):
+            self.collection.reset()
+        else:
+            dimensions = self.dimensions
+            self.client.delete_collection(self.collection_name)
+            self.collection = self.client.create_collection(
+                name=self.collection_name,
+                metadata={**self._collection_metadata(dimensions), **self._chroma_metadata()}
+            )
+        self._fingerprints = None
+        self._required_keys = None
+        self._retention = None
+        self._hits.clear()
+        self._segment_dirty = True
         logger.info("Code cache cleared and recreated")
+
+    @property
+    def eviction_enabled(self) -> bool:
+        """A global or per-workflow size limit is configured."""
+        return self.max_entries > 0 or self.max_per_workflow > 0
+
+    def evict(self, batch: int = EVICTION_BATCH) -> int:
+        """
+        Delete entries over the size limits, lowest retention score first.
+
+        One incremental step: at most `batch` entries are deleted, so the
+        caller (a background task) repeats it while it returns `batch`.
+        Scores come from the retention table kept with the entry maps (no
+        collection scan), and the victims are removed from those maps;
+        reader workers get the change with the next segment.
+
+        Args:
+            batch: Maximum entries deleted
+
+        Returns:
+            Number of entries deleted
+        """
+        if self.read_only or not self.eviction_enabled:
+            return 0
+
+        # Under the global limit and no quotas: nothing to read
+        if not self.max_per_workflow and self.collection.count() <= self.max_entries:
+            return 0
+
+        self._build_entry_maps()
+        entries = self._retention.scores(self._hits, time.time())
+        victims = plan_evictions(entries, self.max_entries, self.max_per_workflow, limit=batch)
+
+        if victims:
+            ids = [doc_id for doc_id, _ in victims]
+            by_workflow: Dict[int, List[str]] = {}
+            for doc_id, workflow_id in victims:
+                by_workflow.setdefault(workflow_id, []).append(doc_id)
+
+            with self._write_lock:
+                if isinstance(self.collection, PartitionedCollection):
+                    # A workflow_id condition picks the partition
+                    for workflow_id, workflow_ids in by_workflow.items():
+                        self.collection.delete(ids=workflow_ids, where={"workflow_id": workflow_id})
+                else:
+                    self.collection.delete(ids=ids)
+                if self._fingerprints is not None:
+                    for doc_id in ids:
+                        self._fingerprints.remove(doc_id)
+                        self._required_keys.remove(doc_id)
+                        self._retention.remove(doc_id)
+                if self.segment_store is not None:
+                    self._segment_deleted.extend(ids)
+            self._hits.forget(ids)
+            logger.info(
+                f"Evicted {len(victims)} cached codes from {len(by_workflow)} workflows "
+                f"({len(entries) - len(victims)} left)"
+            )
+
+        self._eviction_stats["runs"] += 1
+        self._eviction_stats["evicted_total"] += len(victims)
+        self._eviction_stats["last_evicted"] = len(victims)
+        self._eviction_stats["last_run_at"] = datetime.now().isoformat()
+        return len(victims)
+
+    def take_hits(self) -> Dict[str, List[float]]:
+        """Hits counted since the last call (reader workers queue them for the writer)."""
+        return self._hits.take()
+
+    def merge_hits(self, hits: Dict[str, List[float]]):
+        """Add hits counted by a reader worker (see take_hits)."""
+        self._hits.merge(hits)
+
+    @property
+    def needs_rebuild(self) -> bool:
+        """The Chroma collection stores a different size, is not in cosine space, or was built with other configured HNSW settings."""
+        if self.client is None or isinstance(self.collection, CodeIndex):
+            return False
+        return (
+            self.dimensions != self.target_dimensions
+            or collection_space(self.collection) != DEFAULT_SPACE
+            or (self._hnsw_configured and hnsw_differs(self.collection, self.hnsw))
+        )
+
+    def rebuild_collection(self, dimensions: Optional[int] = None, hnsw: Optional[Dict[str, int]] = None):
+        """
+        Rebuild the Chroma collection at a new vector size and/or HNSW settings and switch to it.
+
+        Blocking; searches and saves keep using the current collection
+        until the switch. See dimension_migration.
+
+        Args:
+            dimensions: Target size (defaults to target_dimensions)
+            hnsw: HNSW settings (defaults to the configured ones)
+
+        Raises:
+            ValueError: For non-Chroma index backends
+        """
+        if isinstance(self.collection, CodeIndex) or self.client is None:
+            raise ValueError("Rebuilding is only supported for the Chroma code index")
+        dimensions = resolve_dimensions(self.embedding_provider, dimensions or self.target_dimensions)
+        hnsw = dict(hnsw or self.hnsw)
+
+        def reembed(documents: List[str], metadatas: List[Dict]) -> List[List[float]]:
+            # Entries saved before search_text existed: use what metadata has
+            texts = [
+                metadata.get("search_text") or " ".join([
+                    metadata.get("node_description", ""),
+                    metadata.get("input_schema", "")
+                ])
+                for metadata in metadatas
+            ]
+            provider = self.embedding_provider.for_priority(Priority.BULK)
+            if self.embedding_cache is None:
+                return provider.embed(texts)
+            return self.embedding_cache.get_or_embed(provider.cache_namespace, texts, provider.embed)
+
+        def switch(collection):
+            self.collection = collection
+            self._segment_dirty = True
+
+        if isinstance(self.collection, PartitionedCollection):
+            # Each partition is its own collection; the manifest (and with it
+            # the dimensions queries are embedded at) switches last
+            partitioned = self.collection
+
+            def switch_partition(name: str):
+                def on_switch(collection):
+                    partitioned.replace(name, collection)
+                    self._segment_dirty = True
+                return on_switch
+
+            for name in list(partitioned.partitions) + [self.collection_name]:
+                rebuild_collection(
+                    self.client, name, dimensions, hnsw=hnsw, space=DEFAULT_SPACE,
+                    reembed=reembed, lock=self._write_lock, on_switch=switch_partition(name)
+                )
+        else:
+            rebuild_collection(
+                self.client,
+                self.collection_name,
+                dimensions,
+                hnsw=hnsw,
+                space=DEFAULT_SPACE,
+                reembed=reembed,
+                lock=self._write_lock,
+                on_switch=switch
+            )
+        self.target_dimensions = dimensions
+        self.hnsw = hnsw
+
+    def publish_segment(self, force: bool = False):
+        """
+        Publish the collection for reader workers if it changed.
+
+        Called periodically by the writer, so a burst of saves is published
+        once. Saves and evictions go out as a delta of the live segment
+        (see SegmentStore.publish_changes); a clear or rebuild, a full export.
+
+        Args:
+            force: Export the whole collection even if nothing changed (writer startup)
+        """
+        if self.segment_store is None:
+            return
+        if isinstance(self.collection, CodeIndex) and self.collection.shared:
+            # Every worker reads the shared index directly
+            return
+
+        with self._write_lock:
+            full = force or self._segment_dirty
+            added, deleted = self._segment_added, self._segment_deleted
+            if not (full or added or deleted):
+                return
+            self._segment_dirty = False
+            self._segment_added, self._segment_deleted = [], []
+
+        try:
+            if full:
+                self.segment_store.publish("code", self.collection)
+            else:
+                self.segment_store.publish_changes("code", self.collection, added, deleted)
+        except Exception:
+            # Readers get everything with the next (full) publish
+            self._segment_dirty = True
+            raise
@@ -0,0 +1,223 @@
+"""
+Code Eviction - Size limits for the code cache.
+
+Every successful execution saves another entry and nothing removed them
+except /code/clear, so the collection, its index and the process memory
+grew for as long as the service ran. With limits configured, a background
+task removes the entries least worth keeping:
+
+- A per-workflow quota first (one busy workflow cannot push the others out),
+  then the global limit
+- Retention score = (1 + uses) * 0.5 ** (idle hours / half-life), where uses
+  are the entry's success_count beyond the first plus search hits since
+  start, and idle time counts from the last hit (or the save, for entries
+  never hit): frequently used code survives, code nobody asked for in a
+  while goes first, and a new entry starts with a full recency term
+- Each run deletes at most EVICTION_BATCH entries, and runs follow each
+  other quickly until the cache is back under its limits, so searches and
+  saves are never blocked behind one long purge
+
+Hits are counted in memory by the worker serving the search; reader
+workers hand theirs to the writer through the write spool. The stored
+fields a score needs (workflow, success_count, created_at) are kept per
+entry in a RetentionTable next to the cache's other entry maps, so a run
+scores entries without reading the collection.
+
+Configuration via environment:
+- CODE_CACHE_MAX_ENTRIES: Entries kept in the whole cache (default: 0 = unbounded)
+- CODE_CACHE_MAX_PER_WORKFLOW: Entries kept per workflow_id (default: 0 = unbounded)
+- CODE_CACHE_EVICTION_INTERVAL: Seconds between eviction runs (default: 60)
+- CODE_CACHE_EVICTION_BATCH: Entries deleted per run at most (default: 500)
+- CODE_CACHE_RECENCY_HALF_LIFE_HOURS: Idle time that halves an entry's score (default: 168)
+
+Example:
+    >>> plan_evictions([("code_1", 5, 2.0), ("code_2", 5, 0.5)], max_entries=1)
+    [('code_2', 5)]
+"""
+
+import os
+import heapq
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+MAX_ENTRIES = int(os.getenv("CODE_CACHE_MAX_ENTRIES", "0"))
+MAX_PER_WORKFLOW = int(os.getenv("CODE_CACHE_MAX_PER_WORKFLOW", "0"))
+EVICTION_INTERVAL_SECONDS = float(os.getenv("CODE_CACHE_EVICTION_INTERVAL", "60"))
+EVICTION_BATCH = int(os.getenv("CODE_CACHE_EVICTION_BATCH", "500"))
+RECENCY_HALF_LIFE_HOURS = float(os.getenv("CODE_CACHE_RECENCY_HALF_LIFE_HOURS", "168"))
+
+
+def _timestamp(value: Any) -> float:
+    """Epoch seconds of a stored created_at (ISO string), 0 if unknown."""
+    try:
+        return datetime.fromisoformat(str(value)).timestamp()
+    except ValueError:
+        return 0.0
+
+
+def retention_score(
+    uses: int,
+    last_used: float,
+    now: float,
+    half_life_hours: float = RECENCY_HALF_LIFE_HOURS
+) -> float:
+    """
+    How much an entry is worth keeping (lowest is evicted first).
+
+    Args:
+        uses: Times the entry was used (success_count - 1 + search hits)
+        last_used: Epoch seconds of the last hit, or of the save
+        now: Current epoch seconds
+        half_life_hours: Idle time that halves the score
+    """
+    idle_hours = max(now - last_used, 0.0) / 3600.0
+    return (1 + max(uses, 0)) * 0.5 ** (idle_hours / half_life_hours)
+
+
+class HitTracker:
+    """
+    Search hits per cached entry, counted in memory.
+
+    Example:
+        >>> tracker = HitTracker()
+        >>> tracker.record(["code_1", "code_2"])
+        >>> tracker.get("code_1")
+        (1, 1763892000.0)
+    """
+
+    def __init__(self):
+        # id -> [hits, last hit (epoch seconds)]
+        self._hits: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._hits)
+
+    def record(self, ids: Iterable[str], now: Optional[float] = None):
+        now = time.time() if now is None else now
+        with self._lock:
+            for doc_id in ids:
+                entry = self._hits.setdefault(doc_id, [0, 0.0])
+                entry[0] += 1
+                entry[1] = max(entry[1], now)
+
+    def merge(self, hits: Dict[str, Sequence[float]]):
+        """Add hits counted elsewhere ({id: [hits, last_hit]}, see take)."""
+        with self._lock:
+            for doc_id, (count, last_hit) in hits.items():
+                entry = self._hits.setdefault(doc_id, [0, 0.0])
+                entry[0] += int(count)
+                entry[1] = max(entry[1], float(last_hit))
+
+    def take(self) -> Dict[str, List[float]]:
+        """Return and reset the hits counted so far (reader workers hand them to the writer)."""
+        with self._lock:
+            hits, self._hits = self._hits, {}
+        return hits
+
+    def get(self, doc_id: str) -> Tuple[int, float]:
+        """(hits, last hit) of an entry, (0, 0.0) if never hit."""
+        with self._lock:
+            count, last_hit = self._hits.get(doc_id, (0, 0.0))
+        return int(count), last_hit
+
+    def forget(self, ids: Iterable[str]):
+        with self._lock:
+            for doc_id in ids:
+                self._hits.pop(doc_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._hits.clear()
+
+
+class RetentionTable:
+    """
+    Stored fields of each entry that its retention score depends on.
+
+    Entries are added and removed as the collection changes (not thread-safe:
+    the code cache mutates it under its write lock).
+
+    Example:
+        >>> table = RetentionTable()
+        >>> table.add("code_1", {"workflow_id": 5, "success_count": 3, "created_at": "2025-11-23T12:00:00"})
+        >>> table.scores(HitTracker(), now=table.get("code_1")[2])
+        [('code_1', 5, 3.0)]
+    """
+
+    def __init__(self):
+        # id -> (workflow_id, success_count, created_at epoch seconds)
+        self._entries: Dict[str, Tuple[Any, int, float]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, doc_id: str, metadata: Dict):
+        self._entries[doc_id] = (
+            metadata.get("workflow_id", -1),
+            int(metadata.get("success_count", 1) or 1),
+            _timestamp(metadata.get("created_at", "")),
+        )
+
+    def get(self, doc_id: str) -> Optional[Tuple[Any, int, float]]:
+        return self._entries.get(doc_id)
+
+    def remove(self, doc_id: str):
+        self._entries.pop(doc_id, None)
+
+    def scores(self, hits: HitTracker, now: float) -> List[Tuple[str, Any, float]]:
+        """(id, workflow_id, retention score) of every entry, for plan_evictions."""
+        scored = []
+        for doc_id, (workflow_id, success_count, created_at) in list(self._entries.items()):
+            count, last_hit = hits.get(doc_id)
+            scored.append((doc_id, workflow_id, retention_score(success_count - 1 + count, max(last_hit, created_at), now)))
+        return scored
+
+
+def plan_evictions(
+    entries: Sequence[Tuple[str, Any, float]],
+    max_entries: int = 0,
+    max_per_workflow: int = 0,
+    limit: Optional[int] = None
+) -> List[Tuple[str, Any]]:
+    """
+    Entries to delete to get under the limits, lowest score first.
+
+    Args:
+        entries: (id, workflow_id, retention score) of every stored entry
+        max_entries: Global limit (0 = none)
+        max_per_workflow: Per-workflow limit (0 = none)
+        limit: Maximum entries returned (one eviction batch)
+
+    Returns:
+        List of (id, workflow_id)
+    """
+    victims: List[Tuple[float, str, Any]] = []
+
+    remaining = entries
+    if max_per_workflow > 0:
+        by_workflow: Dict[Any, List[Tuple[str, Any, float]]] = {}
+        for entry in entries:
+            by_workflow.setdefault(entry[1], []).append(entry)
+        remaining = []
+        for workflow_entries in by_workflow.values():
+            excess = len(workflow_entries) - max_per_workflow
+            if excess > 0:
+                workflow_entries = sorted(workflow_entries, key=lambda entry: entry[2])
+                victims.extend((score, doc_id, workflow) for doc_id, workflow, score in workflow_entries[:excess])
+                workflow_entries = workflow_entries[excess:]
+            remaining.extend(workflow_entries)
+
+    if max_entries > 0 and len(remaining) > max_entries:
+        excess = len(remaining) - max_entries
+        victims.extend(
+            (score, doc_id, workflow)
+            for doc_id, workflow, score in heapq.nsmallest(excess, remaining, key=lambda entry: entry[2])
+        )
+
+    victims.sort(key=lambda victim: victim[0])
+    if limit is not None:
+        victims = victims[:limit]
+    return [(doc_id, workflow) for _, doc_id, workflow in victims]
@@ -0,0 +1,1685 @@
+"""
+Code Index - Pluggable vector index backends for the code cache.
+
+CodeCacheService talks to its index through the part of the Chroma
+collection API it uses (count, add, get, query, modify, metadata), so a
+native Chroma collection is itself a valid backend and other backends are
+drop-in replacements:
+
+- "chroma" (default): Chroma HNSW collection, full float32 vectors in RAM
+- "pgvector": Postgres table with a pgvector HNSW/IVFFlat index
+  (pip install psycopg2-binary). Durable across redeploys, shared by every
+  worker and service instance, and joinable with executions by workflow_id.
+  Writes are logged in a <table>_changes table, so each instance can bring
+  its in-memory maps (fingerprints, required keys) up to date with what
+  the others saved, evicted or cleared (see changes_since).
+- "ivfpq": FAISS inverted file + product quantization (pip install faiss-cpu).
+  Each entry costs pq_m bytes of code plus an 8-byte id in RAM instead of
+  dims * 4 bytes plus graph links. Raw vectors stay in an append-only file
+  on disk (memory-mapped) and are only read to re-rank the few candidates
+  per query exactly, so scores and thresholds keep their meaning.
+- "binary": 1 sign bit per dimension in RAM (32x smaller than float32),
+  shortlisted by Hamming distance and re-ranked exactly against float16
+  vectors memory-mapped from disk. No extra dependencies, no training.
+
+IVF-PQ lifecycle:
+- Below CODE_INDEX_TRAIN_MIN entries, search is exact over the mapped vectors
+- At CODE_INDEX_TRAIN_MIN the coarse quantizer and PQ codebooks are trained
+- Whenever the index has grown CODE_INDEX_RETRAIN_GROWTH times since the last
+  training, a new index is trained in the background and swapped in
+- Existing Chroma entries are migrated on first open (see migrate_collection)
+
+Deletes in the file backends (ivfpq, binary) leave tombstones: the rows
+keep their place in the vector file, are marked deleted and drop out of
+the search structure. The vector file is compacted (live rows renumbered)
+only once deleted rows make up CODE_INDEX_COMPACT_DELETED of it.
+
+Configuration via environment:
+- CODE_INDEX_BACKEND: "chroma" (default), "pgvector", "ivfpq" or "binary"
+- CODE_CACHE_DATABASE_URL: Postgres DSN for pgvector (default: DATABASE_URL)
+- CODE_INDEX_PG_INDEX: pgvector index type, "hnsw" (default) or "ivfflat"
+- CODE_INDEX_PG_EF_SEARCH: HNSW candidate list size per query (default: 100)
+- CODE_INDEX_PG_POOL_SIZE: Max pooled Postgres connections (default: 8)
+- CODE_INDEX_NLIST: Coarse centroids / IVFFlat lists (default: 0 = auto, ~4 * sqrt(entries))
+- CODE_INDEX_NPROBE: Inverted lists scanned per query (default: 16)
+- CODE_INDEX_PQ_M: Sub-quantizers, i.e. bytes per vector (default: 64)
+- CODE_INDEX_TRAIN_MIN: Entries searched exactly before the first training (default: 10000)
+- CODE_INDEX_RETRAIN_GROWTH: Growth factor that triggers retraining (default: 2.0)
+- CODE_INDEX_REFINE: Candidates re-ranked exactly per requested result (default: 4)
+- CODE_INDEX_BINARY_CANDIDATES: Entries shortlisted by Hamming distance per query (default: 256)
+- CODE_INDEX_COMPACT_DELETED: Fraction of deleted rows that triggers compaction (default: 0.25)
+"""
+
+import os
+import json
+import math
+import sqlite3
+import logging
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .segments import flatten_where
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BACKEND = os.getenv("CODE_INDEX_BACKEND", "chroma").lower()
+DEFAULT_NLIST = int(os.getenv("CODE_INDEX_NLIST", "0"))
+DEFAULT_NPROBE = int(os.getenv("CODE_INDEX_NPROBE", "16"))
+DEFAULT_PQ_M = int(os.getenv("CODE_INDEX_PQ_M", "64"))
+DEFAULT_TRAIN_MIN = int(os.getenv("CODE_INDEX_TRAIN_MIN", "10000"))
+DEFAULT_RETRAIN_GROWTH = float(os.getenv("CODE_INDEX_RETRAIN_GROWTH", "2.0"))
+DEFAULT_REFINE = int(os.getenv("CODE_INDEX_REFINE", "4"))
+DEFAULT_BINARY_CANDIDATES = int(os.getenv("CODE_INDEX_BINARY_CANDIDATES", "256"))
+DEFAULT_COMPACT_DELETED = float(os.getenv("CODE_INDEX_COMPACT_DELETED", "0.25"))
+DATABASE_URL = os.getenv("CODE_CACHE_DATABASE_URL") or os.getenv("DATABASE_URL")
+DEFAULT_PG_INDEX = os.getenv("CODE_INDEX_PG_INDEX", "hnsw").lower()
+DEFAULT_PG_EF_SEARCH = int(os.getenv("CODE_INDEX_PG_EF_SEARCH", "100"))
+DEFAULT_PG_POOL_SIZE = int(os.getenv("CODE_INDEX_PG_POOL_SIZE", "8"))
+
+# Filtered queries with at most this many candidate rows skip the IVF
+# index and are searched exactly (cheaper than probing, and no recall loss)
+EXACT_FILTER_MAX = 4096
+
+# Incremental adds between index snapshots on disk (entries past the
+# snapshot are re-added from the vector file on open)
+SAVE_EVERY = 1000
+
+# PQ codebooks have 256 centroids per sub-quantizer
+MIN_TRAIN_ROWS = 256
+
+# pgvector change log rows kept for instances catching up (older ones are
+# pruned; an instance further behind rebuilds its maps)
+CHANGE_LOG_KEEP = 100000
+
+
+class CodeIndex(ABC):
+    """
+    Vector index behind CodeCacheService.
+
+    Mirrors the Chroma collection calls the code cache makes, so results
+    use Chroma's shapes: get() returns flat lists, query() one list per
+    query embedding. Distances are squared L2 between unit vectors
+    (Chroma's "l2" space, see similarity).
+    """
+
+    backend: str = "base"
+    name: str
+    space: str = "l2"
+
+    # Storage shared by every process (no segment publishing needed)
+    shared: bool = False
+
+    @property
+    @abstractmethod
+    def metadata(self) -> Dict[str, Any]:
+        """Collection-level metadata (embedding provider, description)."""
+
+    @abstractmethod
+    def modify(self, metadata: Dict[str, Any]):
+        """Replace the collection-level metadata."""
+
+    @abstractmethod
+    def count(self) -> int:
+        """Number of stored entries."""
+
+    @abstractmethod
+    def add(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        documents: List[str],
+        metadatas: List[Dict]
+    ):
+        """Store entries."""
+
+    @abstractmethod
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[Dict] = None,
+        include: Optional[List[str]] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """Entries matching ids/where, in insertion order."""
+
+    @abstractmethod
+    def query(
+        self,
+        query_embeddings: List[List[float]],
+        n_results: int = 10,
+        where: Optional[Dict] = None,
+        include: Optional[List[str]] = None,
+        min_similarity: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """Nearest entries per query embedding, closest first, none below min_similarity."""
+
+    @abstractmethod
+    def delete(self, ids: List[str], where: Optional[Dict] = None):
+        """Delete entries by id (those also matching where, if given)."""
+
+    @abstractmethod
+    def reset(self):
+        """Delete every entry, keeping the collection metadata."""
+
+    def partition_count(self, workflow_id: Any) -> int:
+        """Entries of one workflow (checked before embedding a scoped search)."""
+        return len(self.get(where={"workflow_id": workflow_id}, include=[])['ids'])
+
+    def change_version(self) -> Any:
+        """Position in the change feed of a shared index (see changes_since)."""
+        return None
+
+    def changes_since(self, version: Any) -> Optional[Tuple[Any, List[Tuple[str, Optional[str]]]]]:
+        """
+        Writes made to a shared index after version, by any process.
+
+        Returns:
+            (new version, [(op, id)] in order, op "add" or "delete"), or None
+            if they are not known (reset, or version too old): re-read everything
+        """
+        return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"backend": self.backend}
+
+    def close(self):
+        pass
+
+
+def open_code_index(
+    backend: str,
+    path: Optional[str],
+    name: str,
+    metadata: Optional[Dict] = None
+) -> CodeIndex:
+    """
+    Open (or create) a non-Chroma code index.
+
+    Args:
+        backend: "pgvector", "ivfpq" or "binary"
+        path: Directory for the index files (ivfpq and binary)
+        name: Collection name (table name for pgvector)
+        metadata: Collection metadata for a new index
+
+    Returns:
+        CodeIndex instance
+    """
+    if backend == "ivfpq":
+        return IVFPQIndex(path, name=name, metadata=metadata)
+
+    if backend == "binary":
+        return BinaryIndex(path, name=name, metadata=metadata)
+
+    if backend == "pgvector":
+        if not DATABASE_URL:
+            raise ValueError("CODE_INDEX_BACKEND=pgvector requires CODE_CACHE_DATABASE_URL or DATABASE_URL")
+        return PgVectorIndex(DATABASE_URL, name=name, metadata=metadata)
+
+    raise ValueError(f"Unknown code index backend: {backend} (expected 'chroma', 'pgvector', 'ivfpq' or 'binary')")
+
+
+def migrate_collection(source, target: CodeIndex, batch_size: int = 1000) -> int:
+    """
+    Copy every entry of a Chroma collection into a code index.
+
+    The target takes the source's provider metadata, so the embedding
+    model check keeps working after the switch. The source is left as is.
+
+    Args:
+        source: ChromaDB collection
+        target: Empty CodeIndex
+        batch_size: Entries read per page
+
+    Returns:
+        Number of entries copied
+    """
+    # HNSW settings and space describe the Chroma index, not this one
+    source_metadata = {
+        key: value for key, value in (source.metadata or {}).items() if not key.startswith("hnsw:")
+    }
+    target.modify({**target.metadata, **source_metadata})
+
+    copied = 0
+    while True:
+        page = source.get(
+            include=['embeddings', 'documents', 'metadatas'],
+            limit=batch_size,
+            offset=copied
+        )
+        if not page['ids']:
+            break
+        target.add(
+            ids=page['ids'],
+            embeddings=page['embeddings'],
+            documents=page['documents'],
+            metadatas=page['metadatas']
+        )
+        copied += len(page['ids'])
+
+    return copied
+
+
+def _normalize(vectors) -> np.ndarray:
+    """Vectors as a contiguous, unit-normalized float32 matrix."""
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(matrix / norms)
+
+
+def _import_faiss():
+    try:
+        import faiss
+    except ImportError:
+        raise ImportError(
+            "faiss-cpu required for CODE_INDEX_BACKEND=ivfpq. "
+            "Install with: pip install faiss-cpu"
+        )
+    return faiss
+
+
+def _pq_subquantizers(dims: int, requested: int) -> int:
+    """Largest sub-quantizer count <= requested that divides dims."""
+    for m in range(min(requested, dims), 0, -1):
+        if dims % m == 0:
+            return m
+    return 1
+
+
+class FileCodeIndex(CodeIndex):
+    """
+    Code index stored in a local directory.
+
+    Entries (ids, code, metadata) live in SQLite with the row number as key,
+    and unit-normalized vectors in an append-only file, memory-mapped for
+    reads. Subclasses add the search structure on top (_search) and may
+    keep extra files next to these.
+
+    A deleted entry leaves a tombstone (its row in the `deleted` table and
+    the in-memory bitmap) instead of a hole, so deletes cost O(deleted).
+    Once tombstones make up `compact_deleted` of the rows, the live rows
+    are renumbered and the vector file rewritten (see _compact).
+
+    Files in `path`:
+    - entries.sqlite3: ids, code, metadata, tombstones, index settings
+    - vector_file: one vector per row, in row order
+    """
+
+    vector_dtype = np.float32
+    vector_file = "vectors.f32"
+    # Files derived from the row numbers, removed before a compaction commits
+    derived_files: Tuple[str, ...] = ()
+
+    def __init__(
+        self,
+        path: str,
+        name: str = "cached_code",
+        metadata: Optional[Dict] = None,
+        compact_deleted: float = DEFAULT_COMPACT_DELETED
+    ):
+        """
+        Open or create the entry store.
+
+        Args:
+            path: Directory for the index files (created if missing)
+            name: Collection name
+            metadata: Collection metadata for a new index
+            compact_deleted: Fraction of deleted rows that triggers compaction
+
+        Raises:
+            ValueError: If the directory holds another backend's index
+        """
+        self.path = path
+        self.name = name
+        self.compact_deleted = compact_deleted
+
+        os.makedirs(path, exist_ok=True)
+        self._vectors_path = os.path.join(path, self.vector_file)
+        self._itemsize = np.dtype(self.vector_dtype).itemsize
+
+        self._lock = threading.RLock()
+        self._generation = 0  # bumped by reset(), so stale background work is dropped
+        self._conn = sqlite3.connect(os.path.join(path, "entries.sqlite3"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                row INTEGER PRIMARY KEY,
+                id TEXT NOT NULL UNIQUE,
+                document TEXT,
+                metadata TEXT NOT NULL
+            )
+            """
+        )
+        # Workflow isolation is the hot filter
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_entries_workflow ON entries(json_extract(metadata, '$.workflow_id'))"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS deleted (row INTEGER PRIMARY KEY)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.commit()
+
+        entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        tombstones = [row for row, in self._conn.execute("SELECT row FROM deleted")]
+        # Row numbers: live entries and tombstones
+        self._rows = entries + len(tombstones)
+        self._tombstones = len(tombstones)
+        self._deleted = np.zeros(self._rows, dtype=bool)  # capacity buffer, first self._rows valid
+        self._deleted[tombstones] = True
+        self._check_backend()
+
+        self._metadata = self._setting("metadata")
+        if self._metadata is None:
+            self._metadata = dict(metadata or {})
+            self._set_setting("metadata", self._metadata)
+        self._dims = self._setting("dims")
+
+        self._finish_compaction()
+        self._truncate_vectors()
+        self._mapped = None
+        self._workflow_counts: Optional[Dict[Any, int]] = None
+
+    def _check_backend(self):
+        backend = self._setting("backend")
+        if backend is None:
+            # Directories written before the setting existed are IVF-PQ
+            backend = "ivfpq" if self._rows else self.backend
+            self._set_setting("backend", backend)
+        if backend != self.backend:
+            self._conn.close()
+            raise ValueError(
+                f"{self.path} holds a {backend} code index, not {self.backend}. "
+                f"Remove it to rebuild from the Chroma collection"
+            )
+
+    # === Settings ===
+
+    def _setting(self, key: str):
+        row = self._conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _set_setting(self, key: str, value):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, json.dumps(value))
+        )
+        self._conn.commit()
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        return dict(self._metadata)
+
+    def modify(self, metadata: Dict[str, Any]):
+        with self._lock:
+            self._metadata = dict(metadata or {})
+            self._set_setting("metadata", self._metadata)
+
+    def count(self) -> int:
+        return self._rows - self._tombstones
+
+    def partition_count(self, workflow_id: Any) -> int:
+        """Entries of one workflow, from a per-workflow summary kept in memory."""
+        with self._lock:
+            if self._workflow_counts is None:
+                self._workflow_counts = dict(self._conn.execute(
+                    "SELECT json_extract(metadata, '$.workflow_id'), COUNT(*) FROM entries GROUP BY 1"
+                ).fetchall())
+            return self._workflow_counts.get(workflow_id, 0)
+
+    # === Vectors on disk ===
+
+    def _truncate_vectors(self):
+        """Drop vector rows written without a matching entry (crash mid-add)."""
+        if not os.path.exists(self._vectors_path) or not self._dims:
+            return
+        expected = self._rows * self._dims * self._itemsize
+        if os.path.getsize(self._vectors_path) > expected:
+            os.truncate(self._vectors_path, expected)
+
+    def _finish_compaction(self):
+        """Complete a compaction interrupted after its SQL commit, or drop one interrupted before."""
+        tmp_path = f"{self._vectors_path}.tmp"
+        if self._setting("compacting") is not None:
+            # The entries are renumbered: the rewritten file is the current one
+            if os.path.exists(tmp_path):
+                os.replace(tmp_path, self._vectors_path)
+            self._conn.execute("DELETE FROM settings WHERE key = 'compacting'")
+            self._conn.commit()
+        elif os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    def _vectors(self) -> np.ndarray:
+        """Read-only view of all stored vectors, tombstoned rows included (memory-mapped)."""
+        if self._rows == 0:
+            return np.zeros((0, self._dims or 0), dtype=self.vector_dtype)
+        if self._mapped is None or self._mapped.shape[0] != self._rows:
+            self._mapped = np.memmap(
+                self._vectors_path, dtype=self.vector_dtype, mode="r", shape=(self._rows, self._dims)
+            )
+        return self._mapped
+
+    def _live_rows(self) -> np.ndarray:
+        """Row numbers of the entries that are not deleted."""
+        if not self._tombstones:
+            return np.arange(self._rows, dtype=np.int64)
+        return np.flatnonzero(~self._deleted[:self._rows])
+
+    # === Writes ===
+
+    def add(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        documents: List[str],
+        metadatas: List[Dict]
+    ):
+        if not ids:
+            return
+        matrix = _normalize(embeddings)
+        if not (len(ids) == matrix.shape[0] == len(documents) == len(metadatas)):
+            raise ValueError("ids, embeddings, documents and metadatas must have the same length")
+
+        with self._lock:
+            if self._dims is None:
+                self._dims = int(matrix.shape[1])
+                self._set_setting("dims", self._dims)
+            elif matrix.shape[1] != self._dims:
+                raise ValueError(
+                    f"Embeddings have {matrix.shape[1]} dimensions, index '{self.name}' has {self._dims}"
+                )
+
+            start = self._rows
+            with open(self._vectors_path, "ab") as f:
+                f.write(matrix.astype(self.vector_dtype).tobytes())
+            self._conn.executemany(
+                "INSERT INTO entries (row, id, document, metadata) VALUES (?, ?, ?, ?)",
+                [
+                    (start + i, ids[i], documents[i], json.dumps(metadatas[i] or {}))
+                    for i in range(len(ids))
+                ]
+            )
+            self._conn.commit()
+            self._rows += len(ids)
+            if self._rows > self._deleted.shape[0]:
+                # Grow the bitmap geometrically instead of copying per add
+                grown = np.zeros(max(self._rows, 2 * self._deleted.shape[0], 1024), dtype=bool)
+                grown[:start] = self._deleted[:start]
+                self._deleted = grown
+            if self._workflow_counts is not None:
+                for metadata in metadatas:
+                    workflow_id = (metadata or {}).get("workflow_id")
+                    self._workflow_counts[workflow_id] = self._workflow_counts.get(workflow_id, 0) + 1
+            self._on_add(matrix, start)
+
+    def _on_add(self, matrix: np.ndarray, start: int):
+        """Index rows start.. (called with the lock held, after the entries are stored)."""
+
+    def delete(self, ids: List[str], where: Optional[Dict] = None):
+        """
+        Delete entries, leaving tombstones.
+
+        The entries leave SQLite and the search structure (_on_delete) and
+        their rows are marked deleted: O(deleted). The vector file is
+        compacted once tombstones reach `compact_deleted` of the rows.
+        """
+        if not ids:
+            return
+        with self._lock:
+            found = []
+            ids = list(ids)
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                found.extend(self._conn.execute(
+                    f"SELECT row, json_extract(metadata, '$.workflow_id') FROM entries WHERE id IN ({placeholders})",
+                    chunk
+                ).fetchall())
+            matching = self._rows_where(where)
+            if matching is not None:
+                matching = set(matching.tolist())
+                found = [(row, workflow_id) for row, workflow_id in found if row in matching]
+            if not found:
+                return
+
+            rows = np.asarray(sorted(row for row, _ in found), dtype=np.int64)
+            self._conn.executemany("DELETE FROM entries WHERE row = ?", [(int(row),) for row in rows])
+            self._conn.executemany("INSERT INTO deleted (row) VALUES (?)", [(int(row),) for row in rows])
+            self._conn.commit()
+
+            self._deleted[rows] = True
+            self._tombstones += rows.size
+            if self._workflow_counts is not None:
+                for _, workflow_id in found:
+                    self._workflow_counts[workflow_id] = self._workflow_counts.get(workflow_id, 1) - 1
+            self._on_delete(rows)
+
+            compacted = self._tombstones >= self.compact_deleted * self._rows
+            if compacted:
+                self._compact()
+        logger.info(
+            f"Deleted {rows.size} entries from code index '{self.name}' ({self.count()} left"
+            f"{', compacted' if compacted else ''})"
+        )
+
+    def _on_delete(self, rows: np.ndarray):
+        """Drop deleted rows from the search structure (called with the lock held)."""
+
+    def _compact(self):
+        """
+        Renumber the live rows and rewrite the vector file without tombstones (lock held).
+
+        The new file is written first and the SQL renumbering is the commit
+        point: an interrupted compaction is finished, or dropped, on the
+        next open (see _finish_compaction). Derived files (search structure
+        snapshots) are removed in between, as they follow the old numbering.
+        """
+        live = self._live_rows()
+        vectors = np.array(self._vectors()[live], dtype=self.vector_dtype)
+
+        tmp_path = f"{self._vectors_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(vectors.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        for filename in self.derived_files:
+            derived_path = os.path.join(self.path, filename)
+            if os.path.exists(derived_path):
+                os.remove(derived_path)
+
+        # Ascending order: each target row is already free
+        self._conn.executemany(
+            "UPDATE entries SET row = ? WHERE row = ?",
+            [(new, int(old)) for new, old in enumerate(live) if new != old]
+        )
+        self._conn.execute("DELETE FROM deleted")
+        self._conn.execute(
+            "INSERT OR REPLACE INTO settings (key, value) VALUES ('compacting', ?)", (json.dumps(int(live.size)),)
+        )
+        self._conn.commit()
+
+        self._mapped = None
+        os.replace(tmp_path, self._vectors_path)
+        self._conn.execute("DELETE FROM settings WHERE key = 'compacting'")
+        self._conn.commit()
+
+        self._generation += 1
+        logger.info(f"Compacted code index '{self.name}': {self._tombstones} deleted rows dropped")
+        self._rows = int(live.size)
+        self._tombstones = 0
+        self._deleted = np.zeros(self._rows, dtype=bool)
+        self._on_compact(vectors)
+
+    def _on_compact(self, vectors: np.ndarray):
+        """Rebuild the search structure for the renumbered rows (lock held)."""
+        self._on_reset()
+        if self._rows:
+            self._on_add(vectors, 0)
+
+    def reset(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.execute("DELETE FROM deleted")
+            self._conn.execute("DELETE FROM settings WHERE key NOT IN ('metadata', 'backend')")
+            self._conn.commit()
+            if os.path.exists(self._vectors_path):
+                os.remove(self._vectors_path)
+            self._generation += 1
+            self._rows = 0
+            self._tombstones = 0
+            self._deleted = np.zeros(0, dtype=bool)
+            self._dims = None
+            self._mapped = None
+            self._workflow_counts = None
+            self._on_reset()
+
+    def _on_reset(self):
+        """Drop the search structure and its files (called with the lock held)."""
+
+    # === Reads ===
+
+    def _rows_where(self, where: Optional[Dict]) -> Optional[np.ndarray]:
+        """Row numbers matching an equality/$in where clause (None = no filter)."""
+        conditions = flatten_where(where)
+        if not conditions:
+            return None
+
+        clauses, params = [], []
+        for field, value in conditions.items():
+            if not field.isidentifier():
+                raise ValueError(f"Invalid metadata field: {field}")
+            if isinstance(value, frozenset):
+                clauses.append(f"json_extract(metadata, '$.{field}') IN ({','.join('?' * len(value))})")
+                params.extend(sorted(value, key=str))
+            else:
+                clauses.append(f"json_extract(metadata, '$.{field}') = ?")
+                params.append(value)
+
+        sql = "SELECT row FROM entries WHERE " + " AND ".join(clauses)
+        rows = self._conn.execute(sql, params).fetchall()
+        return np.fromiter((row for row, in rows), dtype=np.int64, count=len(rows))
+
+    def _records(self, rows: Sequence[int]) -> List[Tuple[str, str, Dict]]:
+        """(id, document, metadata) per row, in the given order."""
+        found = {}
+        rows = [int(row) for row in rows]
+        for i in range(0, len(rows), 500):
+            chunk = rows[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for row, doc_id, document, metadata in self._conn.execute(
+                f"SELECT row, id, document, metadata FROM entries WHERE row IN ({placeholders})", chunk
+            ):
+                found[row] = (doc_id, document, json.loads(metadata))
+        return [found[row] for row in rows]
+
+    def _query_vector(self, query_embedding) -> np.ndarray:
+        query = _normalize(query_embedding)
+        if query.shape[1] != self._dims:
+            raise ValueError(f"Query has {query.shape[1]} dimensions, index '{self.name}' has {self._dims}")
+        return query
+
+    def _rerank(
+        self,
+        rows: np.ndarray,
+        query: np.ndarray,
+        n_results: int,
+        min_similarity: Optional[float] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact top rows among candidates, with squared L2 distances."""
+        similarity = np.asarray(self._vectors()[rows], dtype=np.float32) @ query[0]
+        if min_similarity is not None and min_similarity > 0:
+            passing = similarity >= min_similarity
+            rows, similarity = rows[passing], similarity[passing]
+        k = min(n_results, similarity.shape[0])
+        if k == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        top = np.argpartition(-similarity, k - 1)[:k]
+        top = top[np.argsort(-similarity[top], kind="stable")]
+        return rows[top], np.maximum(2.0 - 2.0 * similarity[top], 0.0)
+
+    @abstractmethod
+    def _search(
+        self,
+        query_embedding,
+        n_results: int,
+        where: Optional[Dict],
+        min_similarity: Optional[float] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Top rows and their squared L2 distances for one query (lock held)."""
+
+    def query(
+        self,
+        query_embeddings: List[List[float]],
+        n_results: int = 10,
+        where: Optional[Dict] = None,
+        include: Optional[List[str]] = None,
+        min_similarity: Optional[float] = None
+    ) -> Dict[str, Any]:
+        include = include or ['documents', 'metadatas', 'distances']
+        result = {'ids': [], 'documents': [], 'metadatas': [], 'distances': []}
+
+        with self._lock:
+            for query_embedding in query_embeddings:
+                if self.count() == 0 or n_results <= 0:
+                    rows, distances = [], []
+                else:
+                    rows, distances = self._search(query_embedding, n_results, where, min_similarity)
+                records = self._records(rows)
+                result['ids'].append([doc_id for doc_id, _, _ in records])
+                result['documents'].append([document for _, document, _ in records])
+                result['metadatas'].append([metadata for _, _, metadata in records])
+                result['distances'].append([float(d) for d in distances])
+
+        return {key: value for key, value in result.items() if key == 'ids' or key in include}
+
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[Dict] = None,
+        include: Optional[List[str]] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None
+    ) -> Dict[str, Any]:
+        include = include or ['documents', 'metadatas']
+
+        with self._lock:
+            candidates = self._rows_where(where)
+            if ids is not None:
+                placeholders = ",".join("?" * len(ids))
+                by_id = [row for row, in self._conn.execute(
+                    f"SELECT row FROM entries WHERE id IN ({placeholders})", list(ids)
+                )] if ids else []
+                by_id = np.asarray(sorted(by_id), dtype=np.int64)
+                candidates = by_id if candidates is None else np.intersect1d(candidates, by_id)
+
+            rows = candidates if candidates is not None else self._live_rows()
+            rows = np.sort(rows)[offset or 0:]
+            if limit is not None:
+                rows = rows[:limit]
+
+            records = self._records(rows)
+            embeddings = (
+                np.asarray(self._vectors()[rows], dtype=np.float32) if 'embeddings' in include else None
+            )
+
+        return {
+            'ids': [doc_id for doc_id, _, _ in records],
+            'documents': [document for _, document, _ in records] if 'documents' in include else None,
+            'metadatas': [metadata for _, _, metadata in records] if 'metadatas' in include else None,
+            'embeddings': embeddings,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class IVFPQIndex(FileCodeIndex):
+    """
+    FAISS IVF-PQ code index with exact re-ranking.
+
+    Files in `path` (besides FileCodeIndex's entries.sqlite3 and vectors.f32):
+    - ivfpq.faiss: trained index snapshot
+
+    Example:
+        >>> index = IVFPQIndex("/data/vector_db/code_index/cached_code")
+        >>> index.add(ids=["a"], embeddings=[vector], documents=["code"], metadatas=[{"workflow_id": 5}])
+        >>> index.query([vector], n_results=3, where={"workflow_id": 5})
+    """
+
+    backend = "ivfpq"
+    derived_files = ("ivfpq.faiss",)
+
+    def __init__(
+        self,
+        path: str,
+        name: str = "cached_code",
+        metadata: Optional[Dict] = None,
+        nlist: int = DEFAULT_NLIST,
+        nprobe: int = DEFAULT_NPROBE,
+        pq_m: int = DEFAULT_PQ_M,
+        train_min: int = DEFAULT_TRAIN_MIN,
+        retrain_growth: float = DEFAULT_RETRAIN_GROWTH,
+        refine: int = DEFAULT_REFINE,
+        compact_deleted: float = DEFAULT_COMPACT_DELETED
+    ):
+        """
+        Open or create the index.
+
+        Args:
+            path: Directory for the index files (created if missing)
+            name: Collection name
+            metadata: Collection metadata for a new index
+            nlist: Coarse centroids (0 = ~4 * sqrt(entries) at training time)
+            nprobe: Inverted lists scanned per query
+            pq_m: Bytes per vector (rounded down to a divisor of the dimensions)
+            train_min: Entries searched exactly before the first training
+            retrain_growth: Retrain once entries reach this multiple of the last training size
+            refine: Candidates re-ranked exactly per requested result
+            compact_deleted: Fraction of deleted rows that triggers compaction
+        """
+        self._faiss = _import_faiss()
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.pq_m = pq_m
+        self.train_min = max(train_min, MIN_TRAIN_ROWS)
+        self.retrain_growth = retrain_growth
+        self.refine = max(refine, 1)
+
+        super().__init__(path, name=name, metadata=metadata, compact_deleted=compact_deleted)
+        self._index_path = os.path.join(path, "ivfpq.faiss")
+        self._training = False
+        self._trained_rows = self._setting("trained_rows") or 0
+
+        self._index = None
+        self._unsaved = 0
+        self._load_index()
+
+        logger.info(
+            f"IVF-PQ code index at {path} ({self.count()} entries, "
+            f"{'trained' if self._index is not None else 'exact until trained'})"
+        )
+
+    # === Writes ===
+
+    def add(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        documents: List[str],
+        metadatas: List[Dict]
+    ):
+        super().add(ids, embeddings, documents, metadatas)
+        self._maybe_retrain()
+
+    def _on_add(self, matrix: np.ndarray, start: int):
+        if self._index is not None:
+            self._index.add_with_ids(matrix, np.arange(start, self._rows, dtype=np.int64))
+            self._unsaved += matrix.shape[0]
+            if self._unsaved >= SAVE_EVERY:
+                self._save_index()
+
+    def _on_delete(self, rows: np.ndarray):
+        if self._index is not None:
+            self._index.remove_ids(self._faiss.IDSelectorBatch(rows))
+            self._unsaved += rows.size
+            if self._unsaved >= SAVE_EVERY:
+                self._save_index()
+
+    def _on_compact(self, vectors: np.ndarray):
+        # Same vectors under new row numbers: the trained quantizer and codebooks stay
+        if self._index is None:
+            return
+        self._index.reset()
+        self._add_rows(self._index, vectors, 0, self._rows)
+        self._save_index()
+
+    def _on_reset(self):
+        if os.path.exists(self._index_path):
+            os.remove(self._index_path)
+        self._index = None
+        self._trained_rows = 0
+        self._unsaved = 0
+
+    # === Training ===
+
+    def _auto_nlist(self, rows: int) -> int:
+        nlist = self.nlist or int(4 * math.sqrt(rows))
+        # At least 39 training points per centroid
+        return max(1, min(nlist, rows // 39))
+
+    def _needs_training(self) -> bool:
+        if self.count() < self.train_min:
+            return False
+        if self._index is None:
+            return True
+        return self.count() >= self._trained_rows * self.retrain_growth
+
+    def _maybe_retrain(self):
+        """Start a background retraining when the index has outgrown its quantizer."""
+        with self._lock:
+            if self._training or not self._needs_training():
+                return
+            self._training = True
+
+        threading.Thread(target=self._train_in_background, name="code-index-train", daemon=True).start()
+
+    def _train_in_background(self):
+        try:
+            self.train()
+        except Exception as e:
+            logger.error(f"IVF-PQ training failed for '{self.name}': {e}")
+        finally:
+            with self._lock:
+                self._training = False
+
+    def train(self) -> bool:
+        """
+        Train a new IVF-PQ index on the stored vectors and swap it in.
+
+        Searches keep using the current index (or exact search) while
+        training; entries added meanwhile are caught up before the swap.
+
+        Returns:
+            False if there are too few entries to train
+        """
+        faiss = self._faiss
+
+        with self._lock:
+            rows = self._rows
+            live = self._live_rows()
+            if live.size < MIN_TRAIN_ROWS:
+                return False
+            vectors = self._vectors()
+            dims = self._dims
+            generation = self._generation
+
+        nlist = self._auto_nlist(live.size)
+        pq_m = _pq_subquantizers(dims, self.pq_m)
+        sample_size = min(live.size, max(nlist * 64, 20000))
+        sample_rows = np.sort(np.random.default_rng(0).choice(live, sample_size, replace=False))
+        sample = np.ascontiguousarray(vectors[sample_rows])
+
+        logger.info(f"Training IVF-PQ index '{self.name}': {live.size} entries, nlist={nlist}, pq_m={pq_m}")
+        quantizer = faiss.IndexFlatL2(dims)
+        index = faiss.IndexIVFPQ(quantizer, dims, nlist, pq_m, 8)
+        index.train(sample)
+        index.nprobe = self.nprobe
+        self._add_rows(index, vectors, 0, rows)
+
+        with self._lock:
+            if generation != self._generation:
+                logger.info(f"IVF-PQ index '{self.name}' was reset during training, dropping it")
+                return False
+            # Entries saved and deleted while training
+            self._add_rows(index, self._vectors(), rows, self._rows)
+            deleted = np.flatnonzero(self._deleted[:rows])
+            if deleted.size:
+                index.remove_ids(self._faiss.IDSelectorBatch(deleted))
+            self._index = index
+            self._trained_rows = int(live.size)
+            self._set_setting("trained_rows", self._trained_rows)
+            self._save_index()
+
+        logger.info(f"✓ IVF-PQ index '{self.name}' trained ({index.ntotal} entries)")
+        return True
+
+    def _add_rows(self, index, vectors: np.ndarray, start: int, end: int, chunk: int = 65536):
+        """Add rows start..end to a FAISS index, skipping tombstones."""
+        for offset in range(start, end, chunk):
+            stop = min(offset + chunk, end)
+            rows = np.arange(offset, stop, dtype=np.int64)
+            deleted = self._deleted[offset:stop]
+            if deleted.any():
+                rows = rows[~deleted]
+            index.add_with_ids(np.ascontiguousarray(vectors[rows]), rows)
+
+    def _save_index(self):
+        tmp_path = f"{self._index_path}.tmp"
+        self._faiss.write_index(self._index, tmp_path)
+        os.replace(tmp_path, self._index_path)
+        # Rows the snapshot covers (deletes make ntotal smaller than that)
+        self._set_setting("indexed_rows", self._rows)
+        self._unsaved = 0
+
+    def _load_index(self):
+        if not os.path.exists(self._index_path):
+            return
+        index = self._faiss.read_index(self._index_path)
+        indexed_rows = self._setting("indexed_rows")
+        if indexed_rows is None:
+            # Snapshots written before tombstones hold rows 0..ntotal
+            indexed_rows = index.ntotal
+        if indexed_rows > self._rows or index.d != self._dims:
+            logger.warning(f"Discarding stale IVF-PQ snapshot for '{self.name}'")
+            os.remove(self._index_path)
+            return
+        index.nprobe = self.nprobe
+        self._add_rows(index, self._vectors(), indexed_rows, self._rows)
+        if self._tombstones:
+            # Entries deleted after the snapshot was saved
+            index.remove_ids(self._faiss.IDSelectorBatch(np.flatnonzero(self._deleted[:indexed_rows])))
+        self._index = index
+
+    # === Reads ===
+
+    def _search(
+        self,
+        query_embedding,
+        n_results: int,
+        where: Optional[Dict],
+        min_similarity: Optional[float] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        query = self._query_vector(query_embedding)
+
+        candidates = self._rows_where(where)
+        if candidates is not None and candidates.size == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        exact = self._index is None or (candidates is not None and candidates.size <= EXACT_FILTER_MAX)
+
+        if exact:
+            rows = candidates if candidates is not None else self._live_rows()
+        else:
+            params = self._faiss.SearchParametersIVF()
+            params.nprobe = self.nprobe
+            if candidates is not None:
+                selector = self._faiss.IDSelectorBatch(candidates)
+                params.sel = selector
+            _, labels = self._index.search(query, n_results * self.refine, params=params)
+            # Unique: rows re-added after a crash between snapshot and setting
+            rows = np.unique(labels[0][labels[0] >= 0])
+
+        # Exact scores from the raw vectors (PQ distances are approximate)
+        return self._rerank(rows, query, n_results, min_similarity)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            index = self._index
+            stats = {
+                "backend": self.backend,
+                "entries": self.count(),
+                "deleted_rows": self._tombstones,
+                "trained": index is not None,
+                "trained_rows": self._trained_rows,
+                "training": self._training,
+                "nprobe": self.nprobe,
+            }
+            if index is not None:
+                stats["nlist"] = index.nlist
+                stats["pq_m"] = index.pq.M
+                # PQ code + 8-byte id per entry in the inverted lists
+                stats["bytes_per_entry"] = index.code_size + 8
+        return stats
+
+    def close(self):
+        with self._lock:
+            if self._index is not None and self._unsaved:
+                self._save_index()
+        super().close()
+
+
+# Set bits per byte value (fallback for numpy < 2.0 without bitwise_count)
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _sign_codes(vectors: np.ndarray) -> np.ndarray:
+    """One bit per dimension (1 = positive), packed 8 per byte."""
+    return np.packbits(np.asarray(vectors) > 0, axis=1)
+
+
+def _hamming(codes: np.ndarray, query_code: np.ndarray) -> np.ndarray:
+    """Hamming distance between each row of packed codes and one packed query."""
+    diff = np.bitwise_xor(codes, query_code)
+    if hasattr(np, "bitwise_count"):
+        if diff.shape[1] % 8 == 0:
+            # Popcount 64 bits at a time
+            diff = diff.view(np.uint64)
+        return np.bitwise_count(diff).sum(axis=1, dtype=np.uint32)
+    return _POPCOUNT[diff].sum(axis=1, dtype=np.uint32)
+
+
+class BinaryIndex(FileCodeIndex):
+    """
+    Sign-quantized code index with float16 re-ranking.
+
+    Search runs in two stages:
+    1. Every entry keeps one bit per dimension (the sign of each component)
+       in RAM; the `candidates` entries closest to the query's bits by
+       Hamming distance (XOR + popcount) are shortlisted.
+    2. Only the shortlist is scored exactly against the float16 vectors,
+       memory-mapped from disk, so distances and thresholds keep their
+       meaning.
+
+    A 1536-dim entry costs 192 bytes of RAM instead of 6 KB (32x less);
+    the float16 vectors (3 KB) stay in the page cache as far as memory allows.
+
+    Files in `path` (besides FileCodeIndex's entries.sqlite3):
+    - vectors.f16: unit-normalized float16 vectors
+    - codes.bin: packed sign bits, one per row (rebuilt from the vectors
+      if it falls behind)
+
+    Example:
+        >>> index = BinaryIndex("/data/vector_db/code_index/cached_code")
+        >>> index.add(ids=["a"], embeddings=[vector], documents=["code"], metadatas=[{"workflow_id": 5}])
+        >>> index.query([vector], n_results=3, where={"workflow_id": 5})
+    """
+
+    backend = "binary"
+    vector_dtype = np.float16
+    vector_file = "vectors.f16"
+    derived_files = ("codes.bin",)
+
+    def __init__(
+        self,
+        path: str,
+        name: str = "cached_code",
+        metadata: Optional[Dict] = None,
+        candidates: int = DEFAULT_BINARY_CANDIDATES,
+        refine: int = DEFAULT_REFINE,
+        compact_deleted: float = DEFAULT_COMPACT_DELETED
+    ):
+        """
+        Open or create the index.
+
+        Args:
+            path: Directory for the index files (created if missing)
+            name: Collection name
+            metadata: Collection metadata for a new index
+            candidates: Entries shortlisted by Hamming distance per query
+            refine: Minimum shortlist per requested result (for large n_results)
+            compact_deleted: Fraction of deleted rows that triggers compaction
+        """
+        self.candidates = max(candidates, 1)
+        self.refine = max(refine, 1)
+
+        super().__init__(path, name=name, metadata=metadata, compact_deleted=compact_deleted)
+        self._codes_path = os.path.join(path, "codes.bin")
+        self._codes = np.zeros((0, 0), dtype=np.uint8)  # capacity buffer, first self._rows rows valid
+        self._load_codes()
+
+        logger.info(f"Binary code index at {path} ({self.count()} entries)")
+
+    # === Codes ===
+
+    def _code_width(self) -> int:
+        return ((self._dims or 0) + 7) // 8
+
+    def _load_codes(self):
+        if not self._dims:
+            return
+        width = self._code_width()
+        stored = np.fromfile(self._codes_path, dtype=np.uint8) if os.path.exists(self._codes_path) else np.zeros(0, np.uint8)
+        complete = min(stored.size // width, self._rows)
+        codes = stored[:complete * width].reshape(complete, width)
+
+        if complete < self._rows:
+            # Entries stored without codes (crash mid-add)
+            codes = np.vstack([codes, _sign_codes(self._vectors()[complete:])])
+        if stored.size != self._rows * width:
+            with open(self._codes_path, "wb") as f:
+                f.write(codes.tobytes())
+
+        self._codes = codes
+
+    def _on_add(self, matrix: np.ndarray, start: int):
+        codes = _sign_codes(matrix)
+        with open(self._codes_path, "ab") as f:
+            f.write(codes.tobytes())
+
+        # Grow the in-memory buffer geometrically instead of copying per add
+        if self._rows > self._codes.shape[0]:
+            grown = np.zeros((max(self._rows, 2 * self._codes.shape[0], 1024), codes.shape[1]), dtype=np.uint8)
+            if start:
+                grown[:start] = self._codes[:start]
+            self._codes = grown
+        self._codes[start:self._rows] = codes
+
+    def _on_reset(self):
+        if os.path.exists(self._codes_path):
+            os.remove(self._codes_path)
+        self._codes = np.zeros((0, 0), dtype=np.uint8)
+
+    # === Reads ===
+
+    def _search(
+        self,
+        query_embedding,
+        n_results: int,
+        where: Optional[Dict],
+        min_similarity: Optional[float] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        query = self._query_vector(query_embedding)
+
+        rows = self._rows_where(where)
+        if rows is None and not self._tombstones:
+            rows = np.arange(self._rows, dtype=np.int64)
+            codes = self._codes[:self._rows]
+        else:
+            # Filtered or with tombstones: live matching rows only
+            rows = self._live_rows() if rows is None else rows
+            codes = self._codes[rows]
+
+        shortlist = max(self.candidates, n_results * self.refine)
+        if rows.size > shortlist:
+            distances = _hamming(codes, _sign_codes(query)[0])
+            rows = rows[np.argpartition(distances, shortlist - 1)[:shortlist]]
+            # Sequential reads from the mapped vectors
+            rows.sort()
+
+        return self._rerank(rows, query, n_results, min_similarity)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": self.backend,
+                "entries": self.count(),
+                "deleted_rows": self._tombstones,
+                "candidates": self.candidates,
+                # Sign bits in RAM; float16 vector on disk
+                "bytes_per_entry": self._code_width(),
+                "disk_bytes_per_entry": (self._dims or 0) * self._itemsize,
+            }
+
+
+def _import_psycopg2():
+    try:
+        import psycopg2
+        import psycopg2.pool
+        import psycopg2.extras
+    except ImportError:
+        raise ImportError(
+            "psycopg2 required for CODE_INDEX_BACKEND=pgvector. "
+            "Install with: pip install psycopg2-binary"
+        )
+    return psycopg2
+
+
+def _vector_literal(vector: np.ndarray) -> str:
+    """pgvector text form of a vector: [x1,x2,...]."""
+    return "[" + ",".join(format(float(x), ".9g") for x in vector) + "]"
+
+
+class PgVectorIndex(CodeIndex):
+    """
+    Postgres/pgvector code index.
+
+    One table per collection, with workflow_id and node_action as indexed
+    columns (the rest of the metadata as JSONB), so cached code can be
+    joined with executions. Vectors are stored unit-normalized; queries
+    order by L2 distance through an HNSW or IVFFlat index and report it
+    squared, like Chroma.
+
+    The ANN index yields ef_search (or the probed lists') candidates and
+    the WHERE clause filters them afterwards, so a workflow whose entries
+    are not among the global nearest would get no matches. Filtered
+    queries therefore use iterative index scans on pgvector >= 0.8, and
+    an exact scan scoped by the column indexes on older versions.
+
+    Example:
+        >>> index = PgVectorIndex("postgresql://localhost/nova", metadata=provider.collection_metadata())
+        >>> index.query([vector], n_results=3, where={"workflow_id": 5})
+    """
+
+    backend = "pgvector"
+    shared = True
+
+    # Columns promoted out of the JSONB metadata
+    COLUMNS = ("workflow_id", "node_action")
+
+    def __init__(
+        self,
+        dsn: str,
+        name: str = "cached_code",
+        metadata: Optional[Dict] = None,
+        index_type: str = DEFAULT_PG_INDEX,
+        ef_search: int = DEFAULT_PG_EF_SEARCH,
+        pool_size: int = DEFAULT_PG_POOL_SIZE,
+        nlist: int = DEFAULT_NLIST,
+        nprobe: int = DEFAULT_NPROBE
+    ):
+        """
+        Connect and create the table if missing.
+
+        Args:
+            dsn: Postgres connection string
+            name: Collection name, used as the table name
+            metadata: Collection metadata for a new table
+            index_type: "hnsw" or "ivfflat"
+            ef_search: HNSW candidate list size per query
+            pool_size: Max pooled connections
+            nlist: IVFFlat lists (0 = ~4 * sqrt(entries) when the index is built)
+            nprobe: IVFFlat lists scanned per query
+        """
+        if not name.isidentifier():
+            raise ValueError(f"Invalid table name for pgvector index: {name}")
+        if index_type not in ("hnsw", "ivfflat"):
+            raise ValueError(f"Unknown pgvector index type: {index_type} (expected 'hnsw' or 'ivfflat')")
+
+        self._psycopg2 = _import_psycopg2()
+        self.name = name
+        self.table = name
+        self.index_type = index_type
+        self.ef_search = ef_search
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self._pool = self._psycopg2.pool.ThreadedConnectionPool(1, max(pool_size, 1), dsn)
+        self._has_vector_index = False
+
+        with self._cursor() as cur:
+            # Serialize schema creation across service instances
+            cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (self.table,))
+            cur.execute("CREATE EXTENSION IF NOT EXISTS vector")
+            cur.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+            version = tuple(int(part) for part in cur.fetchone()[0].split(".")[:2] if part.isdigit())
+            cur.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table}_settings (key TEXT PRIMARY KEY, value JSONB NOT NULL)"
+            )
+            cur.execute(
+                f"INSERT INTO {self.table}_settings (key, value) VALUES ('metadata', %s) ON CONFLICT (key) DO NOTHING",
+                (self._psycopg2.extras.Json(dict(metadata or {})),)
+            )
+            cur.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table}_changes "
+                f"(seq BIGSERIAL PRIMARY KEY, op TEXT NOT NULL, id TEXT)"
+            )
+
+        # pgvector 0.8 keeps scanning the index until enough rows pass the filter
+        self._iterative_scan = version >= (0, 8)
+        self._metadata = self._load_metadata()
+        dims = self._table_dims() or (metadata or {}).get("embedding_dimensions")
+        self._dims = int(dims) if dims else None
+        if self._dims:
+            self._create_table(self._dims)
+
+        logger.info(f"pgvector code index on table {self.table} ({self.count()} entries, {index_type})")
+
+    @contextmanager
+    def _cursor(self):
+        """Pooled connection; the block runs in one transaction."""
+        conn = self._pool.getconn()
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    yield cur
+        finally:
+            self._pool.putconn(conn)
+
+    def _table_dims(self) -> Optional[int]:
+        with self._cursor() as cur:
+            cur.execute(
+                """
+                SELECT a.atttypmod FROM pg_attribute a
+                WHERE a.attrelid = to_regclass(%s) AND a.attname = 'embedding'
+                """,
+                (self.table,)
+            )
+            row = cur.fetchone()
+        return row[0] if row and row[0] > 0 else None
+
+    def _create_table(self, dims: int):
+        with self._cursor() as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (self.table,))
+            cur.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {self.table} (
+                    seq BIGSERIAL PRIMARY KEY,
+                    id TEXT NOT NULL UNIQUE,
+                    workflow_id INTEGER,
+                    node_action TEXT,
+                    document TEXT,
+                    metadata JSONB NOT NULL,
+                    embedding vector({int(dims)}) NOT NULL
+                )
+                """
+            )
+            cur.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_workflow_id_idx ON {self.table} (workflow_id)")
+            cur.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_node_action_idx ON {self.table} (node_action)")
+        self._ensure_vector_index()
+
+    def _ensure_vector_index(self):
+        """
+        Create the ANN index.
+
+        HNSW is built right away and maintained on insert. IVFFlat
+        centroids come from the rows present at build time, so it waits
+        for enough rows (searches are exact until then).
+        """
+        if self._has_vector_index or not self._dims:
+            return
+
+        with self._cursor() as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (self.table,))
+            cur.execute("SELECT to_regclass(%s)", (f"{self.table}_embedding_idx",))
+            if cur.fetchone()[0] is not None:
+                pass
+            elif self.index_type == "hnsw":
+                cur.execute(
+                    f"CREATE INDEX IF NOT EXISTS {self.table}_embedding_idx "
+                    f"ON {self.table} USING hnsw (embedding vector_l2_ops)"
+                )
+            else:
+                cur.execute(f"SELECT count(*) FROM {self.table}")
+                rows = cur.fetchone()[0]
+                lists = self.nlist or int(4 * math.sqrt(rows))
+                if rows < max(lists, 1) * 39:
+                    return
+                cur.execute(
+                    f"CREATE INDEX IF NOT EXISTS {self.table}_embedding_idx "
+                    f"ON {self.table} USING ivfflat (embedding vector_l2_ops) WITH (lists = {int(lists)})"
+                )
+        self._has_vector_index = True
+
+    # === Metadata ===
+
+    def _load_metadata(self) -> Dict[str, Any]:
+        with self._cursor() as cur:
+            cur.execute(f"SELECT value FROM {self.table}_settings WHERE key = 'metadata'")
+            row = cur.fetchone()
+        return dict(row[0]) if row else {}
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        # Read on every search (model/dimension checks), so served from memory
+        return dict(self._metadata)
+
+    def modify(self, metadata: Dict[str, Any]):
+        self._metadata = dict(metadata or {})
+        with self._cursor() as cur:
+            cur.execute(
+                f"""
+                INSERT INTO {self.table}_settings (key, value) VALUES ('metadata', %s)
+                ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value
+                """,
+                (self._psycopg2.extras.Json(dict(metadata or {})),)
+            )
+
+    def count(self) -> int:
+        if not self._dims:
+            return 0
+        with self._cursor() as cur:
+            cur.execute(f"SELECT count(*) FROM {self.table}")
+            return cur.fetchone()[0]
+
+    # === Writes ===
+
+    def add(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        documents: List[str],
+        metadatas: List[Dict]
+    ):
+        if not ids:
+            return
+        matrix = _normalize(embeddings)
+        if not (len(ids) == matrix.shape[0] == len(documents) == len(metadatas)):
+            raise ValueError("ids, embeddings, documents and metadatas must have the same length")
+
+        if self._dims is None:
+            self._dims = int(matrix.shape[1])
+            self._create_table(self._dims)
+        elif matrix.shape[1] != self._dims:
+            raise ValueError(
+                f"Embeddings have {matrix.shape[1]} dimensions, index '{self.name}' has {self._dims}"
+            )
+
+        Json = self._psycopg2.extras.Json
+        rows = [
+            (
+                ids[i],
+                (metadatas[i] or {}).get("workflow_id"),
+                (metadatas[i] or {}).get("node_action"),
+                documents[i],
+                Json(metadatas[i] or {}),
+                _vector_literal(matrix[i])
+            )
+            for i in range(len(ids))
+        ]
+        with self._cursor() as cur:
+            self._lock_changes(cur)
+            added = self._psycopg2.extras.execute_values(
+                cur,
+                f"""
+                INSERT INTO {self.table} (id, workflow_id, node_action, document, metadata, embedding)
+                VALUES %s ON CONFLICT (id) DO NOTHING RETURNING id
+                """,
+                rows,
+                template="(%s, %s, %s, %s, %s, %s::vector)",
+                fetch=True
+            )
+            self._log_changes(cur, "add", [row[0] for row in added])
+
+        self._ensure_vector_index()
+
+    def delete(self, ids: List[str], where: Optional[Dict] = None):
+        if not ids or not self._dims:
+            return
+        condition, params = self._where_sql(where)
+        with self._cursor() as cur:
+            self._lock_changes(cur)
+            cur.execute(
+                f"DELETE FROM {self.table} WHERE id = ANY(%s) AND {condition} RETURNING id",
+                [list(ids)] + params
+            )
+            self._log_changes(cur, "delete", [row[0] for row in cur.fetchall()])
+
+    def reset(self):
+        if self._dims:
+            with self._cursor() as cur:
+                self._lock_changes(cur)
+                cur.execute(f"TRUNCATE {self.table}")
+                self._log_changes(cur, "reset", [None])
+
+    def _lock_changes(self, cur):
+        """Serialize writers, so change log order is commit order (readers never miss a row)."""
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (f"{self.table}_changes",))
+
+    def _log_changes(self, cur, op: str, ids: List[Optional[str]]):
+        if not ids:
+            return
+        self._psycopg2.extras.execute_values(
+            cur, f"INSERT INTO {self.table}_changes (op, id) VALUES %s", [(op, doc_id) for doc_id in ids]
+        )
+        cur.execute(
+            f"DELETE FROM {self.table}_changes WHERE seq <= (SELECT max(seq) FROM {self.table}_changes) - %s",
+            (CHANGE_LOG_KEEP,)
+        )
+
+    def change_version(self) -> int:
+        with self._cursor() as cur:
+            cur.execute(f"SELECT COALESCE(max(seq), 0) FROM {self.table}_changes")
+            return cur.fetchone()[0]
+
+    def changes_since(self, version: Any) -> Optional[Tuple[int, List[Tuple[str, Optional[str]]]]]:
+        if version is None:
+            return None
+        with self._cursor() as cur:
+            cur.execute(f"SELECT seq, op, id FROM {self.table}_changes WHERE seq > %s ORDER BY seq", (version,))
+            rows = cur.fetchall()
+        if not rows:
+            return version, []
+        # A gap means pruned past our position (or a rolled back write), and
+        # a reset removed everything: either way, re-read
+        if rows[0][0] > version + 1 or any(op == "reset" for _, op, _ in rows):
+            return None
+        return rows[-1][0], [(op, doc_id) for _, op, doc_id in rows]
+
+    def partition_count(self, workflow_id: Any) -> int:
+        # Shared with other processes, so counted in Postgres (indexed column)
+        if not self._dims:
+            return 0
+        condition, params = self._where_sql({"workflow_id": workflow_id})
+        with self._cursor() as cur:
+            cur.execute(f"SELECT count(*) FROM {self.table} WHERE {condition}", params)
+            return cur.fetchone()[0]
+
+    # === Reads ===
+
+    def _where_sql(self, where: Optional[Dict]) -> Tuple[str, List]:
+        """SQL condition and parameters for an equality/$in where clause."""
+        clauses, params = [], []
+        for field, value in flatten_where(where).items():
+            if isinstance(value, frozenset):
+                values = sorted(value, key=str)
+                if field in self.COLUMNS:
+                    clauses.append(f"{field} = ANY(%s)")
+                    params.append(values)
+                else:
+                    clauses.append("metadata -> %s = ANY(%s::jsonb[])")
+                    params.extend([field, [self._psycopg2.extras.Json(v) for v in values]])
+            elif field in self.COLUMNS:
+                clauses.append(f"{field} = %s")
+                params.append(value)
+            else:
+                clauses.append("metadata @> %s")
+                params.append(self._psycopg2.extras.Json({field: value}))
+        return (" AND ".join(clauses) if clauses else "TRUE"), params
+
+    def query(
+        self,
+        query_embeddings: List[List[float]],
+        n_results: int = 10,
+        where: Optional[Dict] = None,
+        include: Optional[List[str]] = None,
+        min_similarity: Optional[float] = None
+    ) -> Dict[str, Any]:
+        include = include or ['documents', 'metadatas', 'distances']
+        result = {'ids': [], 'documents': [], 'metadatas': [], 'distances': []}
+        condition, params = self._where_sql(where)
+        filtered = bool(params)
+        max_distance = None
+        if min_similarity is not None and min_similarity > 0:
+            # L2 distance between unit vectors at that similarity
+            max_distance = math.sqrt(max(2.0 - 2.0 * min_similarity, 0.0))
+            condition += " AND embedding <-> %s::vector <= %s"
+
+        with self._cursor() as cur:
+            if self.index_type == "hnsw":
+                cur.execute("SET LOCAL hnsw.ef_search = %s", (max(self.ef_search, n_results),))
+            else:
+                cur.execute("SET LOCAL ivfflat.probes = %s", (self.nprobe,))
+            if filtered:
+                if not self._iterative_scan:
+                    # Exact distances over the rows the btree indexes select
+                    cur.execute("SET LOCAL enable_indexscan = off")
+                elif self.index_type == "hnsw":
+                    cur.execute("SET LOCAL hnsw.iterative_scan = strict_order")
+                else:
+                    # Only mode IVFFlat has; rows are re-sorted below
+                    cur.execute("SET LOCAL ivfflat.iterative_scan = relaxed_order")
+
+            for query_embedding in query_embeddings:
+                hits = []
+                if self._dims and n_results > 0:
+                    query = _vector_literal(_normalize(query_embedding)[0])
+                    radius = [query, max_distance] if max_distance is not None else []
+                    cur.execute(
+                        f"""
+                        SELECT id, document, metadata, embedding <-> %s::vector AS distance
+                        FROM {self.table} WHERE {condition}
+                        ORDER BY embedding <-> %s::vector LIMIT %s
+                        """,
+                        [query, *params, *radius, query, n_results]
+                    )
+                    hits = sorted(cur.fetchall(), key=lambda hit: hit[3])
+                result['ids'].append([doc_id for doc_id, _, _, _ in hits])
+                result['documents'].append([document for _, document, _, _ in hits])
+                result['metadatas'].append([metadata for _, _, metadata, _ in hits])
+                result['distances'].append([float(distance) ** 2 for _, _, _, distance in hits])
+
+        return {key: value for key, value in result.items() if key == 'ids' or key in include}
+
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[Dict] = None,
+        include: Optional[List[str]] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None
+    ) -> Dict[str, Any]:
+        include = include or ['documents', 'metadatas']
+        rows = []
+
+        if self._dims:
+            condition, params = self._where_sql(where)
+            if ids is not None:
+                condition += " AND id = ANY(%s)"
+                params.append(list(ids))
+            vectors = "embedding::text" if 'embeddings' in include else "NULL"
+            sql = f"SELECT id, document, metadata, {vectors} FROM {self.table} WHERE {condition} ORDER BY seq"
+            if limit is not None:
+                sql += " LIMIT %s"
+                params.append(limit)
+            if offset:
+                sql += " OFFSET %s"
+                params.append(offset)
+            with self._cursor() as cur:
+                cur.execute(sql, params)
+                rows = cur.fetchall()
+
+        return {
+            'ids': [row[0] for row in rows],
+            'documents': [row[1] for row in rows] if 'documents' in include else None,
+            'metadatas': [row[2] for row in rows] if 'metadatas' in include else None,
+            'embeddings': np.asarray(
+                [json.loads(row[3]) for row in rows], dtype=np.float32
+            ) if 'embeddings' in include else None,
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend,
+            "table": self.table,
+            "entries": self.count(),
+            "vector_index": self.index_type if self._has_vector_index else None,
+        }
+
+    def close(self):
+        self._pool.closeall()
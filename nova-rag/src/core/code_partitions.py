@@ -0,0 +1,339 @@
+"""
+Code Partitions - The Chroma code cache, one collection per workflow.
+
+Code searches are scoped to one workflow, yet the cache was one global
+collection filtered with where={"workflow_id": ...}: every search walked an
+HNSW graph holding every workflow's entries, a selective filter could leave
+the workflow's own entries unreached, and a workflow with nothing cached
+still paid for a query embedding (the only empty check was the global count).
+
+PartitionedCollection stores each workflow's entries in its own Chroma
+collection `<name>__wf<workflow_id>` and keeps a presence summary (entries
+per workflow) in memory:
+
+- Saves go to the workflow's partition, created on first save
+- Queries with a workflow_id search only that partition's small HNSW index;
+  the workflow_id condition is implied and dropped from the where clause
+- partition_count(workflow_id) answers from memory, so CodeCacheService
+  skips the embedding call for workflows with nothing cached
+- Reads without a workflow_id fan out over every partition and merge
+
+The collection named `<name>` stays as the manifest: it keeps the
+collection metadata (embedding model, dimensions, HNSW settings), which new
+partitions copy, and holds no entries. Entries of a collection written
+before partitioning are moved into partitions on first open.
+
+Like SegmentCollection and CodeIndex, it implements the part of the Chroma
+collection API CodeCacheService uses (count, add, get, query, modify,
+metadata).
+
+Configuration via environment:
+- CODE_CACHE_PARTITIONED: Partition the Chroma code cache by workflow (default: true)
+"""
+
+import os
+import re
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+from .dimension_migration import _collection_names, recover_dimension_migration
+from .segments import flatten_where
+
+logger = logging.getLogger(__name__)
+
+PARTITIONED = os.getenv("CODE_CACHE_PARTITIONED", "true").lower() in ("1", "true", "yes")
+
+PARTITION_MARKER = "__wf"
+
+# Entries stored without a workflow_id (see CodeCacheService._store)
+NO_WORKFLOW = -1
+
+# Leaves room for the rebuild suffixes within Chroma's 63-character names
+_KEY_RE = re.compile(r"-?[A-Za-z0-9]{1,32}")
+
+
+def partition_name(name: str, workflow_id: Any) -> str:
+    """
+    Chroma collection holding one workflow's entries.
+
+    Example:
+        >>> partition_name("cached_code", 7)
+        'cached_code__wf7'
+    """
+    key = str(workflow_id)
+    if not _KEY_RE.fullmatch(key):
+        # Chroma names allow few characters; other ids get a stable digest
+        key = "h" + hashlib.md5(key.encode()).hexdigest()[:16]
+    return f"{name}{PARTITION_MARKER}{key}"
+
+
+def partition_names(client, name: str) -> List[str]:
+    """Partitions of `name`, including ones only present mid-rebuild."""
+    pattern = re.compile(rf"({re.escape(name + PARTITION_MARKER)}-?[A-Za-z0-9]+)(__.*)?")
+    found = set()
+    for collection_name in _collection_names(client):
+        match = pattern.fullmatch(collection_name)
+        if match:
+            found.add(match.group(1))
+    return sorted(found)
+
+
+def open_collection(client, name: str):
+    """`name` as a PartitionedCollection if it has partitions, else the plain Chroma collection."""
+    if partition_names(client, name):
+        return PartitionedCollection(client, name)
+    return client.get_collection(name)
+
+
+def _where(conditions: Dict[str, Any]) -> Optional[Dict]:
+    """Chroma where clause from flatten_where conditions."""
+    clauses = [
+        {field: {"$in": sorted(value, key=str)} if isinstance(value, frozenset) else value}
+        for field, value in conditions.items()
+    ]
+    if not clauses:
+        return None
+    if len(clauses) == 1:
+        return clauses[0]
+    return {"$and": clauses}
+
+
+class PartitionedCollection:
+    """
+    Chroma code cache split into one collection per workflow_id.
+
+    Example:
+        >>> collection = PartitionedCollection(client, "cached_code", metadata)
+        >>> collection.add(ids=["a"], embeddings=[vector], documents=["code"], metadatas=[{"workflow_id": 5}])
+        >>> collection.partition_count(5), collection.partition_count(6)
+        (1, 0)
+        >>> collection.query(query_embeddings=[vector], n_results=3, where={"workflow_id": 5})
+    """
+
+    def __init__(self, client, name: str = "cached_code", metadata: Optional[Dict] = None, batch_size: int = 500):
+        """
+        Open the partitions of `name`, creating the manifest if missing.
+
+        Args:
+            client: ChromaDB client
+            name: Collection name (the manifest collection)
+            metadata: Metadata for a new manifest
+            batch_size: Entries moved per page from a pre-partitioning collection
+        """
+        self.client = client
+        self.name = name
+        self._lock = threading.RLock()
+
+        for partition in partition_names(client, name):
+            recover_dimension_migration(client, partition)
+
+        try:
+            self.manifest = client.get_collection(name=name)
+        except Exception:
+            self.manifest = client.create_collection(name=name, metadata=metadata)
+
+        self._partitions: Dict[str, Any] = {}
+        self._counts: Dict[str, int] = {}
+        for partition in partition_names(client, name):
+            collection = client.get_collection(name=partition)
+            self._partitions[partition] = collection
+            self._counts[partition] = collection.count()
+
+        if self.manifest.count() > 0:
+            self._split_manifest(batch_size)
+
+    def _split_manifest(self, batch_size: int):
+        """Move entries stored in the manifest (pre-partitioning collection) into partitions."""
+        total = self.manifest.count()
+        logger.info(f"Partitioning {total} cached codes of '{self.name}' by workflow...")
+        while True:
+            page = self.manifest.get(include=['embeddings', 'documents', 'metadatas'], limit=batch_size)
+            if not page['ids']:
+                break
+            # Re-running after a crash re-adds ids that are already there; Chroma skips them
+            self.add(page['ids'], page['embeddings'], page['documents'], page['metadatas'])
+            self.manifest.delete(ids=page['ids'])
+
+        for partition, collection in self._partitions.items():
+            self._counts[partition] = collection.count()
+        logger.info(f"✓ Partitioned {total} cached codes into {len(self._partitions)} workflows")
+
+    # === Collection API ===
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        return self.manifest.metadata
+
+    def modify(self, name: Optional[str] = None, metadata: Optional[Dict[str, Any]] = None):
+        if name is not None and name != self.name:
+            raise ValueError("Partitioned collections cannot be renamed")
+        if metadata is not None:
+            self.manifest.modify(metadata=metadata)
+
+    def count(self) -> int:
+        return sum(self._counts.values())
+
+    def partition_count(self, workflow_id: Any) -> int:
+        """Entries cached for one workflow (from memory, no Chroma call)."""
+        return self._counts.get(partition_name(self.name, workflow_id), 0)
+
+    @property
+    def partitions(self) -> Dict[str, Any]:
+        """Partition name -> Chroma collection."""
+        return dict(self._partitions)
+
+    def replace(self, partition: str, collection):
+        """Swap in a rebuilt partition (or manifest) collection."""
+        with self._lock:
+            if partition == self.name:
+                self.manifest = collection
+            else:
+                self._partitions[partition] = collection
+
+    def add(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        documents: List[str],
+        metadatas: List[Dict]
+    ):
+        groups: Dict[str, List[int]] = {}
+        for i, metadata in enumerate(metadatas):
+            workflow_id = (metadata or {}).get("workflow_id", NO_WORKFLOW)
+            groups.setdefault(partition_name(self.name, workflow_id), []).append(i)
+
+        with self._lock:
+            for partition, rows in groups.items():
+                collection = self._partitions.get(partition)
+                if collection is None:
+                    collection = self.client.get_or_create_collection(
+                        name=partition, metadata=self.manifest.metadata
+                    )
+                    self._partitions[partition] = collection
+                    self._counts[partition] = collection.count()
+                collection.add(
+                    ids=[ids[i] for i in rows],
+                    embeddings=[embeddings[i] for i in rows],
+                    documents=[documents[i] for i in rows],
+                    metadatas=[metadatas[i] for i in rows]
+                )
+                self._counts[partition] += len(rows)
+
+    def _select(self, where: Optional[Dict]):
+        """(partitions to read, remaining where clause) for a where clause."""
+        conditions = flatten_where(where)
+        if "workflow_id" not in conditions:
+            return sorted(self._partitions.items()), where
+
+        partition = partition_name(self.name, conditions.pop("workflow_id"))
+        collection = self._partitions.get(partition)
+        return ([(partition, collection)] if collection is not None else []), _where(conditions)
+
+    def query(
+        self,
+        query_embeddings: List[List[float]],
+        n_results: int = 10,
+        where: Optional[Dict] = None,
+        include: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        include = include or ['documents', 'metadatas', 'distances']
+        selected, where = self._select(where)
+        selected = [(partition, collection) for partition, collection in selected if self._counts.get(partition)]
+
+        if len(selected) == 1:
+            partition, collection = selected[0]
+            return collection.query(
+                query_embeddings=query_embeddings,
+                n_results=min(n_results, self._counts[partition]),
+                where=where,
+                include=include
+            )
+
+        # Fan out, then keep the closest n_results per query
+        fields = ['ids', 'documents', 'metadatas', 'distances']
+        merged = {field: [[] for _ in query_embeddings] for field in fields}
+        for partition, collection in selected:
+            results = collection.query(
+                query_embeddings=query_embeddings,
+                n_results=min(n_results, self._counts[partition]),
+                where=where,
+                include=['documents', 'metadatas', 'distances']
+            )
+            for field in fields:
+                for q, values in enumerate(results[field]):
+                    merged[field][q].extend(values)
+
+        for q, distances in enumerate(merged['distances']):
+            order = sorted(range(len(distances)), key=distances.__getitem__)[:n_results]
+            for field in fields:
+                merged[field][q] = [merged[field][q][i] for i in order]
+        return {field: values for field, values in merged.items() if field == 'ids' or field in include}
+
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[Dict] = None,
+        include: Optional[List[str]] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None
+    ) -> Dict[str, Any]:
+        include = include or ['documents', 'metadatas']
+        selected, where = self._select(where)
+        result = {'ids': [], 'documents': [], 'metadatas': [], 'embeddings': []}
+
+        # Unfiltered pages are located from the partition counts
+        skip = offset or 0
+        remaining = limit
+        for partition, collection in selected:
+            if ids is None and where is None:
+                size = self._counts.get(partition, 0)
+                if skip >= size:
+                    skip -= size
+                    continue
+                page = collection.get(include=include, limit=remaining, offset=skip or None)
+                skip = 0
+            else:
+                page = collection.get(ids=ids, where=where, include=include)
+                dropped = min(skip, len(page['ids']))
+                skip -= dropped
+                end = None if remaining is None else dropped + remaining
+                page = {key: page[key][dropped:end] if page.get(key) is not None else None for key in result}
+
+            for key in result:
+                if page.get(key) is not None:
+                    result[key].extend(page[key])
+            if remaining is not None:
+                remaining -= len(page['ids'])
+                if remaining <= 0:
+                    break
+
+        return {
+            'ids': result['ids'],
+            'documents': result['documents'] if 'documents' in include else None,
+            'metadatas': result['metadatas'] if 'metadatas' in include else None,
+            'embeddings': result['embeddings'] if 'embeddings' in include else None,
+        }
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None):
+        """Delete entries by id and/or where (a workflow_id condition picks the partition)."""
+        selected, where = self._select(where)
+        with self._lock:
+            for partition, collection in selected:
+                if not self._counts.get(partition):
+                    continue
+                collection.delete(ids=ids, where=where)
+                self._counts[partition] = collection.count()
+
+    def reset(self):
+        """Delete every partition, keeping the manifest and its metadata."""
+        with self._lock:
+            for partition in list(self._partitions):
+                self.client.delete_collection(partition)
+            self._partitions.clear()
+            self._counts.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        largest = max(self._counts.values(), default=0)
+        return {"partitions": len(self._partitions), "largest_partition": largest}
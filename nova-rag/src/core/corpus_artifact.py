@@ -0,0 +1,214 @@
+"""
+Corpus Artifact - Precomputed knowledge-base embeddings shipped with the build.
+
+On a fresh deploy the docs collection is empty, and embedding every chunk of
+knowledge/integrations and knowledge/official_docs at startup costs tens of
+seconds of provider calls. Instead, a build step chunks the corpus with
+DocumentLoader, embeds it once and writes a compact, versioned artifact:
+
+    knowledge/corpus_artifact/
+        manifest.json        - version, provider/model/dims, corpus hash, count
+        embeddings.f16.npy   - float16 matrix (num_chunks x dims)
+        chunks.jsonl         - text, source, topic, metadata per chunk
+
+Startup bulk-loads the artifact into the collection with no provider calls,
+as long as it matches the current provider and corpus (otherwise it falls
+back to embedding the corpus).
+
+Build:
+    python -m src.core.corpus_artifact [--output DIR]
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .document_loader import DocumentLoader
+from .embedding_providers import EmbeddingProvider
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_VERSION = 1
+DEFAULT_ARTIFACT_DIR = str(Path(__file__).parent.parent.parent / "knowledge" / "corpus_artifact")
+
+# Chunking used for the served documentation corpus
+CHUNK_SIZE = 700
+CHUNK_OVERLAP = 100
+
+MANIFEST_FILE = "manifest.json"
+EMBEDDINGS_FILE = "embeddings.f16.npy"
+CHUNKS_FILE = "chunks.jsonl"
+
+
+def load_corpus_chunks(knowledge_dir: Optional[str] = None) -> List[Dict[str, str]]:
+    """Chunk the knowledge corpus exactly as served by /rag/query."""
+    loader = DocumentLoader(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    return loader.load_knowledge_base(knowledge_dir)
+
+
+def corpus_hash(chunks: List[Dict[str, str]]) -> str:
+    """Stable hash of chunk texts and metadata (detects stale artifacts)."""
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(json.dumps(
+            [chunk['text'], chunk.get('source'), chunk.get('topic'), chunk.get('metadata', {})],
+            sort_keys=True,
+            ensure_ascii=False
+        ).encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def build_corpus_artifact(
+    provider: EmbeddingProvider,
+    output_dir: str = DEFAULT_ARTIFACT_DIR,
+    chunks: Optional[List[Dict[str, str]]] = None,
+    batch_size: int = 100
+) -> Dict[str, any]:
+    """
+    Embed the corpus and write the artifact (atomically replaces output_dir).
+
+    Args:
+        provider: Embedding provider (must match the one used at runtime)
+        output_dir: Artifact directory
+        chunks: Pre-chunked corpus (defaults to load_corpus_chunks())
+        batch_size: Texts per provider request
+
+    Returns:
+        The written manifest
+    """
+    if chunks is None:
+        chunks = load_corpus_chunks()
+    if not chunks:
+        raise ValueError("No documentation chunks found to embed")
+
+    logger.info(f"Embedding {len(chunks)} chunks with {provider}...")
+    vectors = []
+    for i in range(0, len(chunks), batch_size):
+        vectors.extend(provider.embed([chunk['text'] for chunk in chunks[i:i + batch_size]]))
+
+    matrix = np.asarray(vectors, dtype=np.float16)
+
+    manifest = {
+        "version": ARTIFACT_VERSION,
+        **provider.collection_metadata(),
+        "embedding_dimensions": int(matrix.shape[1]),
+        "count": len(chunks),
+        "dtype": "float16",
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "corpus_hash": corpus_hash(chunks),
+        "created_at": datetime.now().isoformat()
+    }
+
+    # Write to a sibling temp dir, then swap in place
+    output_path = Path(output_dir)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    staging = Path(tempfile.mkdtemp(prefix=".corpus_artifact_", dir=output_path.parent))
+
+    try:
+        np.save(staging / EMBEDDINGS_FILE, matrix)
+        with open(staging / CHUNKS_FILE, "w", encoding="utf-8") as f:
+            for chunk in chunks:
+                f.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+        with open(staging / MANIFEST_FILE, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+
+        if output_path.exists():
+            shutil.rmtree(output_path)
+        os.replace(staging, output_path)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    logger.info(
+        f"Wrote corpus artifact to {output_dir}: {manifest['count']} chunks, "
+        f"{manifest['embedding_dimensions']} dims ({matrix.nbytes / 1024:.0f} KiB)"
+    )
+    return manifest
+
+
+def load_corpus_artifact(
+    provider: EmbeddingProvider,
+    artifact_dir: str = DEFAULT_ARTIFACT_DIR,
+    expected_hash: Optional[str] = None
+) -> Optional[Tuple[List[Dict[str, str]], List[List[float]]]]:
+    """
+    Load a prebuilt artifact if it is usable with the current provider.
+
+    Args:
+        provider: Embedding provider the collection is built with
+        artifact_dir: Artifact directory
+        expected_hash: Corpus hash the artifact must match (skip check if None)
+
+    Returns:
+        (chunks, embeddings) or None if missing, stale or built with another model
+    """
+    manifest_path = Path(artifact_dir) / MANIFEST_FILE
+    if not manifest_path.exists():
+        logger.info(f"No corpus artifact at {artifact_dir}")
+        return None
+
+    try:
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+
+        if manifest.get("version") != ARTIFACT_VERSION:
+            logger.warning(f"Ignoring corpus artifact: version {manifest.get('version')} != {ARTIFACT_VERSION}")
+            return None
+
+        current = provider.collection_metadata()
+        if (manifest.get("embedding_provider"), manifest.get("embedding_model")) != (
+            current["embedding_provider"], current["embedding_model"]
+        ):
+            logger.warning(
+                f"Ignoring corpus artifact built with {manifest.get('embedding_provider')}/"
+                f"{manifest.get('embedding_model')} (current: {current['embedding_provider']}/"
+                f"{current['embedding_model']})"
+            )
+            return None
+
+        if expected_hash is not None and manifest.get("corpus_hash") != expected_hash:
+            logger.warning("Ignoring stale corpus artifact: knowledge docs changed since build")
+            return None
+
+        matrix = np.load(Path(artifact_dir) / EMBEDDINGS_FILE)
+        with open(Path(artifact_dir) / CHUNKS_FILE, encoding="utf-8") as f:
+            chunks = [json.loads(line) for line in f if line.strip()]
+
+        if len(chunks) != matrix.shape[0] or len(chunks) != manifest.get("count"):
+            logger.warning("Ignoring corrupt corpus artifact: chunk/vector count mismatch")
+            return None
+
+        embeddings = matrix.astype(np.float32).tolist()
+        logger.info(f"Loaded corpus artifact: {len(chunks)} chunks ({manifest.get('created_at')})")
+        return chunks, embeddings
+
+    except Exception as e:
+        logger.warning(f"Failed to load corpus artifact from {artifact_dir}: {e}")
+        return None
+
+
+if __name__ == "__main__":
+    import argparse
+    from .embedding_providers import get_embedding_provider
+
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Build precomputed knowledge-corpus embeddings")
+    parser.add_argument("--output", default=DEFAULT_ARTIFACT_DIR, help="Artifact directory")
+    args = parser.parse_args()
+
+    provider = get_embedding_provider()
+    try:
+        build_corpus_artifact(provider, output_dir=args.output)
+    finally:
+        provider.close()
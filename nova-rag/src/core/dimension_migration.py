@@ -0,0 +1,346 @@
+"""
+Dimension Migration - Rebuild a Chroma collection with a different embedding
+size or HNSW settings.
+
+text-embedding-3 models can return shorter vectors (the API `dimensions`
+parameter); the short vector is the full one truncated and re-normalized.
+Collections record the size they store in `embedding_dimensions`, while the
+provider, the embedding cache and the micro-batcher keep producing one
+full-size vector per text that each collection reduces on write and query
+(see reduce_dimensions).
+
+Changing the size (or the HNSW settings, which Chroma fixes at creation,
+see hnsw_tuning) of a collection that already has data is done online:
+
+1. A staging collection `<name>__<dims>d` is filled in the background.
+   Stored vectors are copied or re-projected (truncated) when the model
+   allows it, otherwise texts are re-embedded.
+2. Under the owner's write lock, entries added meanwhile are copied and the
+   owner switches to the staging collection in one reference swap.
+3. The old collection is renamed to `<name>__retired`, the staging one takes
+   the original name, and the old one is deleted.
+
+If the process dies during step 3, recover_dimension_migration() finishes
+it on the next start.
+
+Command line (service stopped, since Chroma is single-process):
+    python -m src.core.dimension_migration migrate --collection cached_code --dimensions 512
+    python -m src.core.dimension_migration benchmark --dimensions 256 512 1536
+
+Configuration via environment:
+- DOCS_EMBEDDING_DIMENSIONS: Stored dimensions for nova_docs (default: 0 = model size)
+- CODE_EMBEDDING_DIMENSIONS: Stored dimensions for the code cache (default: 0 = model size)
+"""
+
+import os
+import logging
+from contextlib import nullcontext
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from .embedding_providers import TRUNCATABLE_MODELS, reduce_dimensions
+from .hnsw_tuning import hnsw_metadata
+
+logger = logging.getLogger(__name__)
+
+DOCS_EMBEDDING_DIMENSIONS = int(os.getenv("DOCS_EMBEDDING_DIMENSIONS", "0"))
+CODE_EMBEDDING_DIMENSIONS = int(os.getenv("CODE_EMBEDDING_DIMENSIONS", "0"))
+
+RETIRED_SUFFIX = "__retired"
+
+
+def staging_name(name: str, dimensions: int) -> str:
+    return f"{name}__{dimensions}d"
+
+
+def collection_dimensions(collection, default: Optional[int] = None) -> Optional[int]:
+    """Dimensions a collection stores (from its metadata)."""
+    return (collection.metadata or {}).get("embedding_dimensions") or default
+
+
+def _collection_names(client) -> List[str]:
+    # Chroma < 0.6 returns Collection objects, later versions names
+    return [getattr(collection, "name", collection) for collection in client.list_collections()]
+
+
+def _stored_dimensions(collection) -> Optional[int]:
+    """Size of the first stored vector (collections without embedding_dimensions)."""
+    page = collection.get(include=['embeddings'], limit=1)
+    return len(page['embeddings'][0]) if page['ids'] else None
+
+
+def recover_dimension_migration(client, name: str):
+    """
+    Finish or discard an interrupted migration of `name`.
+
+    - Old collection already retired: the staging collection is complete,
+      give it the original name
+    - Old collection still in place: the staging copy is stale, drop it
+    """
+    names = _collection_names(client)
+    staging = [n for n in names if n.startswith(f"{name}__") and n.endswith("d") and n[len(name) + 2:-1].isdigit()]
+
+    for candidate in staging:
+        if name not in names:
+            logger.warning(f"Completing interrupted dimension migration: {candidate} -> {name}")
+            client.get_collection(candidate).modify(name=name)
+            names.append(name)
+        else:
+            logger.warning(f"Dropping incomplete dimension migration: {candidate}")
+            client.delete_collection(candidate)
+
+    if f"{name}{RETIRED_SUFFIX}" in names and name in names:
+        client.delete_collection(f"{name}{RETIRED_SUFFIX}")
+
+
+def rebuild_collection(
+    client,
+    name: str,
+    dimensions: int,
+    hnsw: Optional[Dict[str, int]] = None,
+    space: Optional[str] = None,
+    reembed: Optional[Callable[[List[str], List[Dict]], List[List[float]]]] = None,
+    lock=None,
+    on_switch: Optional[Callable] = None,
+    batch_size: int = 500
+):
+    """
+    Rebuild collection `name` at `dimensions` and switch over atomically.
+
+    Args:
+        client: ChromaDB client owning the collection
+        name: Collection to rebuild
+        dimensions: Target dimensions
+        hnsw: HNSW settings for the new collection (default: keep the current ones)
+        space: Distance space for the new collection (default: keep the current one).
+               Stored vectors are unit-normalized, so they are copied as-is.
+        reembed: (documents, metadatas) -> full-size vectors, used when the
+                 stored vectors cannot be truncated (model without reduced
+                 dimensions, or a target larger than the stored size)
+        lock: Held by the owner around its writes; held here for the final
+              catch-up and switch so no write lands in the old collection
+        on_switch: Called with the new collection while the lock is held
+        batch_size: Entries copied per page
+
+    Returns:
+        The new collection (already named `name`)
+
+    Raises:
+        ValueError: If vectors can neither be truncated nor re-embedded
+    """
+    source = client.get_collection(name)
+    metadata = dict(source.metadata or {})
+    source_dims = collection_dimensions(source) or _stored_dimensions(source)
+
+    project = source_dims == dimensions or (
+        metadata.get("embedding_model") in TRUNCATABLE_MODELS and bool(source_dims) and dimensions <= source_dims
+    )
+    if not project and reembed is None:
+        raise ValueError(
+            f"Collection '{name}' ({metadata.get('embedding_model')}, {source_dims} dims) "
+            f"cannot be re-projected to {dimensions} dims and no re-embed function was given"
+        )
+
+    target_name = staging_name(name, dimensions)
+    if target_name in _collection_names(client):
+        client.delete_collection(target_name)
+    if hnsw is not None:
+        metadata = {key: value for key, value in metadata.items() if not key.startswith("hnsw:") or key == "hnsw:space"}
+        metadata.update(hnsw_metadata(hnsw))
+    if space is not None:
+        metadata["hnsw:space"] = space
+    target = client.create_collection(
+        name=target_name,
+        metadata={**metadata, "embedding_dimensions": dimensions}
+    )
+
+    logger.info(
+        f"Rebuilding '{name}' ({source_dims} -> {dimensions} dims, {metadata.get('hnsw:space', 'l2')} space, "
+        f"{'copying' if project else 're-embedding'} {source.count()} entries)"
+    )
+
+    def copy_pending(copied: int) -> int:
+        while True:
+            page = source.get(
+                include=['embeddings', 'documents', 'metadatas'],
+                limit=batch_size,
+                offset=copied
+            )
+            if not page['ids']:
+                return copied
+            vectors = page['embeddings'] if project else reembed(page['documents'], page['metadatas'])
+            target.add(
+                ids=page['ids'],
+                embeddings=reduce_dimensions([list(v) for v in vectors], dimensions),
+                documents=page['documents'],
+                metadatas=page['metadatas']
+            )
+            copied += len(page['ids'])
+
+    # Bulk copy without blocking writers, then catch up under the lock
+    copied = copy_pending(0)
+    with lock or nullcontext():
+        copy_pending(copied)
+        if on_switch is not None:
+            on_switch(target)
+
+    source.modify(name=f"{name}{RETIRED_SUFFIX}")
+    target.modify(name=name)
+    client.delete_collection(f"{name}{RETIRED_SUFFIX}")
+
+    logger.info(f"✓ '{name}' rebuilt: {dimensions}-dim vectors, {target.count()} entries")
+    return target
+
+
+def _reduce_matrix(matrix: np.ndarray, dimensions: int) -> np.ndarray:
+    """reduce_dimensions for a float32 matrix."""
+    head = matrix[:, :dimensions]
+    norms = np.linalg.norm(head, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(head / norms, dtype=np.float32)
+
+
+def benchmark_dimensions(
+    vectors,
+    dimensions: List[int],
+    top_k: int = 10,
+    num_queries: int = 200,
+    seed: int = 0
+) -> List[Dict]:
+    """
+    Recall and latency of reduced-dimension search.
+
+    Queries are stored vectors (each excluded from its own results). The
+    reference neighbours come from exact search on the full-size vectors;
+    each size is measured with exact search (ExactIndex) and Chroma HNSW.
+
+    Args:
+        vectors: Full-size embeddings (num_vectors x dims)
+        dimensions: Sizes to compare (capped at the stored size)
+        top_k: Neighbours compared per query
+        num_queries: Number of query vectors sampled
+        seed: Sampling seed
+
+    Returns:
+        One dict per size: dimensions, bytes_per_vector, recall_exact,
+        recall_hnsw, exact_ms and hnsw_ms (median per query)
+    """
+    import time
+    import chromadb
+    from chromadb.config import Settings
+    from .exact_index import ExactIndex
+
+    full = _reduce_matrix(np.asarray(vectors, dtype=np.float32), np.asarray(vectors).shape[1])
+    count, native = full.shape
+    if count <= top_k:
+        raise ValueError(f"Need more than top_k={top_k} vectors, got {count}")
+    queries = np.random.default_rng(seed).choice(count, min(num_queries, count), replace=False)
+
+    def neighbours(hits, query):
+        return [row for row in hits if row != query][:top_k]
+
+    reference = ExactIndex(full, [""] * count, [{}] * count, normalized=True)
+    truth = {
+        int(q): set(neighbours([row for row, _ in reference.search_rows(full[q], top_k + 1)], q))
+        for q in queries
+    }
+
+    client = chromadb.EphemeralClient(settings=Settings(anonymized_telemetry=False, allow_reset=True))
+    results = []
+
+    for dims in sorted({min(d, native) for d in dimensions}):
+        reduced = _reduce_matrix(full, dims)
+        index = ExactIndex(reduced, [""] * count, [{}] * count, normalized=True)
+
+        collection = client.create_collection(name=f"benchmark_{dims}d")
+        for start in range(0, count, 5000):
+            stop = min(start + 5000, count)
+            collection.add(
+                ids=[str(i) for i in range(start, stop)],
+                embeddings=reduced[start:stop].tolist()
+            )
+
+        exact_times, hnsw_times, exact_hits, hnsw_hits = [], [], 0, 0
+        for q in queries:
+            q = int(q)
+            started = time.perf_counter()
+            rows = [row for row, _ in index.search_rows(reduced[q], top_k + 1)]
+            exact_times.append(time.perf_counter() - started)
+            exact_hits += len(truth[q] & set(neighbours(rows, q)))
+
+            started = time.perf_counter()
+            ids = collection.query(query_embeddings=[reduced[q].tolist()], n_results=top_k + 1, include=[])['ids'][0]
+            hnsw_times.append(time.perf_counter() - started)
+            hnsw_hits += len(truth[q] & set(neighbours([int(i) for i in ids], q)))
+
+        client.delete_collection(f"benchmark_{dims}d")
+        total = top_k * len(queries)
+        results.append({
+            "dimensions": dims,
+            "bytes_per_vector": dims * 4,
+            "recall_exact": round(exact_hits / total, 4),
+            "recall_hnsw": round(hnsw_hits / total, 4),
+            "exact_ms": round(float(np.median(exact_times)) * 1000, 3),
+            "hnsw_ms": round(float(np.median(hnsw_times)) * 1000, 3),
+        })
+
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    from pathlib import Path
+
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Reduced-dimension embeddings: migrate a collection or benchmark recall vs latency")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    migrate = commands.add_parser("migrate", help="Rebuild a collection at a new size (offline: stop the service first)")
+    migrate.add_argument("--collection", choices=["nova_docs", "cached_code"], required=True)
+    migrate.add_argument("--dimensions", type=int, required=True)
+    migrate.add_argument("--persist-dir", default=None, help="Chroma directory (default: knowledge/vector_db)")
+
+    benchmark = commands.add_parser("benchmark", help="Recall@k and query latency per size")
+    benchmark.add_argument("--collection", default="nova_docs", help="Collection whose stored vectors are used")
+    benchmark.add_argument("--persist-dir", default=None, help="Chroma directory (default: knowledge/vector_db)")
+    benchmark.add_argument("--artifact", default=None, help="Use a corpus artifact directory instead of a collection")
+    benchmark.add_argument("--dimensions", type=int, nargs="+", default=[256, 512, 1536])
+    benchmark.add_argument("--top-k", type=int, default=10)
+    benchmark.add_argument("--queries", type=int, default=200)
+
+    args = parser.parse_args()
+    persist_dir = args.persist_dir or str(Path(__file__).parent.parent.parent.parent / "knowledge" / "vector_db")
+
+    if args.command == "migrate":
+        if args.collection == "nova_docs":
+            from .vector_store import VectorStore
+            service = VectorStore(persist_directory=persist_dir, dimensions=args.dimensions)
+        else:
+            from .code_cache_service import CodeCacheService
+            service = CodeCacheService(persist_directory=persist_dir, index_backend="chroma", dimensions=args.dimensions)
+        if service.needs_rebuild:
+            service.rebuild_collection()
+        else:
+            logger.info(f"{args.collection} already stores {service.dimensions}-dim vectors")
+
+    else:
+        if args.artifact:
+            from .corpus_artifact import EMBEDDINGS_FILE
+            vectors = np.load(Path(args.artifact) / EMBEDDINGS_FILE).astype(np.float32)
+        else:
+            import chromadb
+            from chromadb.config import Settings
+            client = chromadb.PersistentClient(path=persist_dir, settings=Settings(anonymized_telemetry=False))
+            from .code_partitions import open_collection
+            vectors = np.asarray(open_collection(client, args.collection).get(include=['embeddings'])['embeddings'], dtype=np.float32)
+
+        rows = benchmark_dimensions(vectors, args.dimensions, top_k=args.top_k, num_queries=args.queries)
+        print(f"\n{len(vectors)} vectors, recall@{args.top_k} vs full-size exact search, median latency per query\n")
+        print(f"{'dims':>6} {'bytes/vec':>10} {'recall exact':>13} {'recall hnsw':>12} {'exact ms':>9} {'hnsw ms':>8}")
+        for row in rows:
+            print(
+                f"{row['dimensions']:>6} {row['bytes_per_vector']:>10} {row['recall_exact']:>13.4f} "
+                f"{row['recall_hnsw']:>12.4f} {row['exact_ms']:>9.3f} {row['hnsw_ms']:>8.3f}"
+            )
@@ -255,11 +255,11 @@ class DocumentLoader:
 
         all_chunks = []
 
-        # Find all .md files (except _index.md)
-        md_files = [
+        # Find all .md files (except _index.md), sorted for a stable chunk order
+        md_files = sorted(
             f for f in integrations_path.glob("*.md")
             if f.stem != "_index"
-        ]
+        )
 
         logger.info(f"Found {len(md_files)} integration docs to load")
 
@@ -278,6 +278,56 @@ class DocumentLoader:
 
         return all_chunks
 
+    def load_knowledge_base(
+        self,
+        knowledge_dir: Optional[str] = None
+    ) -> List[Dict[str, str]]:
+        """
+        Load the full knowledge corpus served by /rag/query.
+
+        Includes integration docs plus the official docs
+        (PyMuPDF, Google Cloud Vision).
+
+        Args:
+            knowledge_dir: Path to knowledge directory.
+                           Defaults to nova-rag/knowledge
+
+        Returns:
+            List of all document chunks, in a stable order
+        """
+        if knowledge_dir is None:
+            knowledge_dir = str(Path(__file__).parent.parent.parent / "knowledge")
+
+        knowledge_path = Path(knowledge_dir)
+        all_chunks = []
+
+        # Load integration docs
+        logger.info("Loading integration docs...")
+        integration_chunks = self.load_integration_docs(str(knowledge_path / "integrations"))
+        all_chunks.extend(integration_chunks)
+        logger.info(f"  ✓ Loaded {len(integration_chunks)} chunks from integrations")
+
+        # Official docs: (file, source)
+        official_docs = [
+            ("pymupdf_official.md", "pymupdf"),
+            ("google_vision_ocr.md", "google_vision"),
+        ]
+
+        for filename, source in official_docs:
+            path = knowledge_path / "official_docs" / filename
+            if not path.exists():
+                continue
+
+            chunks = self.load_markdown_file(
+                file_path=str(path),
+                source=source,
+                topic="official"
+            )
+            all_chunks.extend(chunks)
+            logger.info(f"  ✓ Loaded {len(chunks)} chunks from {filename}")
+
+        return all_chunks
+
 
 # Example usage
 if __name__ == "__main__":
@@ -0,0 +1,296 @@
+"""
+Embedding Micro-Batcher - Coalesce concurrent embedding calls into one request.
+
+Concurrent workflow nodes hit /rag/query and /code/search at the same time,
+each needing a single-text embedding. The batcher collects texts that arrive
+within a short window (or until a max batch size), sends them to the provider
+as one batched request, and fans the vectors back out to the waiting callers.
+
+Sync callers are batched by a collector thread; async callers are batched
+on the event loop and dispatched with the provider's async client, so
+waiting requests hold no threads.
+
+It is itself an EmbeddingProvider wrapping another one, so it slots in
+between the embedding cache and the real provider:
+
+    EmbeddingCache -> MicroBatchingProvider -> scheduler lane -> OpenAI / local provider
+
+Configuration via environment:
+- EMBEDDING_BATCH_WINDOW_MS: Collection window in milliseconds (default: 5)
+- EMBEDDING_BATCH_MAX_SIZE: Max texts per provider request (default: 64)
+"""
+
+import os
+import time
+import queue
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from .embedding_providers import EmbeddingProvider
+from .embedding_scheduler import Priority
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5"))
+DEFAULT_MAX_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", "64"))
+
+
+class MicroBatchingProvider(EmbeddingProvider):
+    """
+    Provider wrapper that batches concurrent embed() calls.
+
+    Example:
+        >>> provider = MicroBatchingProvider(OpenAIEmbeddingProvider(), window_ms=5)
+        >>> provider.embed(["how to open PDF"])  # batched with concurrent callers
+    """
+
+    def __init__(
+        self,
+        provider: EmbeddingProvider,
+        window_ms: float = DEFAULT_WINDOW_MS,
+        max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+        max_concurrent_batches: int = 4
+    ):
+        """
+        Initialize micro-batcher.
+
+        Args:
+            provider: Provider that performs the actual embedding
+            window_ms: How long to wait for more texts after the first arrives
+            max_batch_size: Dispatch as soon as this many texts are pending
+            max_concurrent_batches: Batches allowed in flight at once
+        """
+        self.provider = provider
+        self.name = provider.name
+        self.model_name = provider.model_name
+        self.window = max(0.0, window_ms) / 1000.0
+        self.max_batch_size = max(1, max_batch_size)
+
+        self._queue: "queue.Queue[Tuple[List[str], Future]]" = queue.Queue()
+        self._dispatcher = ThreadPoolExecutor(
+            max_workers=max(1, max_concurrent_batches),
+            thread_name_prefix="embedding-batch"
+        )
+        self._closed = False
+        self._stats_lock = threading.Lock()
+        self.requests = 0
+        self.batches = 0
+        self.texts = 0
+
+        # Event-loop side (async callers), only touched from the loop thread
+        self._async_pending: List[Tuple[List[str], asyncio.Future]] = []
+        self._async_pending_count = 0
+        self._async_timer: Optional[asyncio.TimerHandle] = None
+        self._async_tasks = set()
+
+        self._collector = threading.Thread(
+            target=self._collect_loop,
+            name="embedding-batch-collector",
+            daemon=True
+        )
+        self._collector.start()
+
+        logger.info(
+            f"Embedding micro-batching enabled (window={window_ms}ms, max_batch={self.max_batch_size})"
+        )
+
+    @property
+    def dimensions(self):
+        return self.provider.dimensions
+
+    @property
+    def cache_namespace(self) -> str:
+        return self.provider.cache_namespace
+
+    @property
+    def max_request_inputs(self) -> int:
+        return self.provider.max_request_inputs
+
+    @property
+    def max_request_tokens(self) -> int:
+        return self.provider.max_request_tokens
+
+    def count_tokens(self, text: str) -> int:
+        return self.provider.count_tokens(text)
+
+    def collection_metadata(self) -> Dict[str, any]:
+        return self.provider.collection_metadata()
+
+    def for_priority(self, priority: int) -> EmbeddingProvider:
+        # Only interactive (single-query) traffic benefits from batching
+        if priority == Priority.INTERACTIVE:
+            return self
+        return self.provider.for_priority(priority)
+
+    def submit(self, texts: List[str]) -> Future:
+        """
+        Queue texts for the next batch.
+
+        Args:
+            texts: Texts to embed
+
+        Returns:
+            Future resolving to the list of vectors aligned with texts
+        """
+        if self._closed:
+            raise RuntimeError("MicroBatchingProvider is closed")
+
+        future: Future = Future()
+        self._queue.put((list(texts), future))
+        return future
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+
+        # Large inputs (bulk ingestion) are already batches, send them directly
+        if len(texts) >= self.max_batch_size:
+            return self.provider.embed(texts)
+
+        return self.submit(texts).result()
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+
+        if len(texts) >= self.max_batch_size:
+            return await self.provider.aembed(texts)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._async_pending.append((list(texts), future))
+        self._async_pending_count += len(texts)
+
+        if self._async_pending_count >= self.max_batch_size:
+            self._flush_async()
+        elif self._async_timer is None:
+            self._async_timer = loop.call_later(self.window, self._flush_async)
+
+        return await future
+
+    def _flush_async(self):
+        """Dispatch the pending async batch (runs on the event loop)."""
+        if self._async_timer is not None:
+            self._async_timer.cancel()
+            self._async_timer = None
+
+        batch = self._async_pending
+        self._async_pending = []
+        self._async_pending_count = 0
+        if not batch:
+            return
+
+        task = asyncio.ensure_future(self._adispatch(batch))
+        self._async_tasks.add(task)
+        task.add_done_callback(self._async_tasks.discard)
+
+    async def _adispatch(self, batch: List[Tuple[List[str], asyncio.Future]]):
+        """Send one batched async provider request and resolve the waiters."""
+        unique_texts = list(dict.fromkeys(text for texts, _ in batch for text in texts))
+
+        try:
+            vectors = await self.provider.aembed(unique_texts)
+            self._resolve(batch, unique_texts, vectors)
+        except Exception as e:
+            logger.warning(f"Batched embedding request failed ({len(unique_texts)} texts): {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self._record_batch(len(batch), len(unique_texts))
+
+    def _collect_loop(self):
+        """Background thread: gather pending requests into batches."""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+
+            batch = [item]
+            pending = len(item[0])
+            deadline = time.monotonic() + self.window
+
+            while pending < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._dispatcher.submit(self._dispatch, batch)
+                    return
+                batch.append(item)
+                pending += len(item[0])
+
+            self._dispatcher.submit(self._dispatch, batch)
+
+    def _dispatch(self, batch: List[Tuple[List[str], Future]]):
+        """Send one batched provider request and fan results back out."""
+        unique_texts = list(dict.fromkeys(text for texts, _ in batch for text in texts))
+
+        try:
+            vectors = self.provider.embed(unique_texts)
+            self._resolve(batch, unique_texts, vectors)
+        except Exception as e:
+            # Every caller not answered yet gets the error instead of waiting forever
+            logger.warning(f"Batched embedding request failed ({len(unique_texts)} texts): {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self._record_batch(len(batch), len(unique_texts))
+
+    @staticmethod
+    def _resolve(batch: List[Tuple[List[str], Any]], unique_texts: List[str], vectors: List[List[float]]):
+        """Fan a batch's vectors out to its callers' futures (skipping cancelled ones)."""
+        if len(vectors) != len(unique_texts):
+            raise ValueError(f"Provider returned {len(vectors)} vectors for {len(unique_texts)} texts")
+        by_text = dict(zip(unique_texts, vectors))
+        for texts, future in batch:
+            if not future.done():
+                future.set_result([by_text[text] for text in texts])
+
+    def _record_batch(self, requests: int, texts: int):
+        with self._stats_lock:
+            self.requests += requests
+            self.batches += 1
+            self.texts += texts
+
+        logger.debug(f"Embedded batch of {texts} texts for {requests} callers")
+
+    def get_stats(self) -> Dict[str, any]:
+        """
+        Get batching statistics.
+
+        Returns:
+            Dict with requests, batches, texts and avg_requests_per_batch
+        """
+        with self._stats_lock:
+            return {
+                "requests": self.requests,
+                "batches": self.batches,
+                "texts": self.texts,
+                "avg_requests_per_batch": round(self.requests / self.batches, 2) if self.batches else 0.0
+            }
+
+    def _stop(self):
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._collector.join(timeout=1.0)
+            self._dispatcher.shutdown(wait=True)
+
+    def close(self):
+        self._stop()
+        self.provider.close()
+
+    async def aclose(self):
+        await asyncio.to_thread(self._stop)
+        await self.provider.aclose()
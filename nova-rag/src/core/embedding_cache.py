@@ -0,0 +1,343 @@
+"""
+Embedding Cache - Persistent, content-addressed cache for embedding vectors.
+
+Stores embeddings on disk (SQLite) keyed by a hash of (model name, text),
+so repeated texts (same prompt + schema across workflow runs, unchanged
+documentation chunks on /rag/reload) never hit the embedding provider twice.
+
+Features:
+- Content-addressed keys: sha256(model + text)
+- Size-bounded LRU eviction (least recently used entries are dropped first)
+- Read-only lookups: hits are remembered in memory and their last_access is
+  written in one batch (before an eviction, or once per touch interval), so
+  concurrent workers do not serialize on a write for every cache hit
+- Thread-safe (called from the Chroma executor and sync callers)
+- Shared by worker processes: entries are counted in SQLite, inside the
+  write that may evict, so every worker enforces the same bound
+- Async lookups via aget_or_embed
+- Shared by VectorStore and CodeCacheService
+
+Configuration via environment:
+- EMBEDDING_CACHE_MAX_ENTRIES: Vectors kept before LRU eviction (default: 50000)
+- EMBEDDING_CACHE_TOUCH_INTERVAL: Seconds between last_access writes for cache hits (default: 30)
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from array import array
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence
+
+from .executors import run_in_chroma_executor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "50000"))
+DEFAULT_TOUCH_INTERVAL = float(os.getenv("EMBEDDING_CACHE_TOUCH_INTERVAL", "30"))
+DEFAULT_FILENAME = "embedding_cache.sqlite3"
+
+
+class EmbeddingCache:
+    """
+    On-disk LRU cache of embedding vectors.
+
+    Example:
+        >>> cache = EmbeddingCache("/tmp/chroma_db/embedding_cache.sqlite3")
+        >>> vectors = cache.get_or_embed(
+        ...     "text-embedding-3-small",
+        ...     ["how to open PDF"],
+        ...     embed_fn=lambda texts: call_provider(texts)
+        ... )
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        touch_interval: float = DEFAULT_TOUCH_INTERVAL
+    ):
+        """
+        Initialize embedding cache.
+
+        Args:
+            path: SQLite file path (created if missing)
+            max_entries: Maximum number of cached vectors before LRU eviction
+            touch_interval: Seconds cache hits wait in memory before their
+                            last_access is written (0 = write on every hit)
+        """
+        if max_entries < 1:
+            raise ValueError("max_entries must be >= 1")
+
+        self.path = path
+        self.max_entries = max_entries
+        self.touch_interval = touch_interval
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # key -> last hit not yet written to last_access
+        self._touched: Dict[str, float] = {}
+        self._last_flush = time.monotonic()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                dims INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)"
+        )
+        self._conn.commit()
+
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        logger.info(f"Embedding cache at {path} ({self._count} entries, max {max_entries})")
+
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        """Content-addressed key for a (model, text) pair."""
+        digest = hashlib.sha256()
+        digest.update(model.encode("utf-8"))
+        digest.update(b"\x00")
+        digest.update(text.encode("utf-8"))
+        return digest.hexdigest()
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """
+        Look up cached vectors.
+
+        Args:
+            model: Embedding model name
+            texts: Texts to look up
+
+        Returns:
+            List aligned with texts; None where the text is not cached
+        """
+        if not texts:
+            return []
+
+        keys = [self.make_key(model, text) for text in texts]
+        unique_keys = list(dict.fromkeys(keys))
+        found: Dict[str, List[float]] = {}
+
+        with self._lock:
+            # SQLite limits bound parameters per statement, query in slices
+            for i in range(0, len(unique_keys), 500):
+                chunk = unique_keys[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    chunk
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = self._decode(blob)
+
+            if found:
+                now = time.time()
+                for key in found:
+                    self._touched[key] = now
+                if time.monotonic() - self._last_flush >= self.touch_interval:
+                    self._flush_touches_locked()
+                    self._conn.commit()
+
+            hits = sum(1 for key in keys if key in found)
+            self.hits += hits
+            self.misses += len(keys) - hits
+
+        return [found.get(key) for key in keys]
+
+    def put_many(
+        self,
+        model: str,
+        texts: Sequence[str],
+        embeddings: Sequence[Sequence[float]]
+    ):
+        """
+        Store vectors and evict least recently used entries if over capacity.
+
+        Args:
+            model: Embedding model name
+            texts: Texts that were embedded
+            embeddings: Vectors aligned with texts
+        """
+        if len(texts) != len(embeddings):
+            raise ValueError("texts and embeddings must have the same length")
+        if not texts:
+            return
+
+        now = time.time()
+        rows = {
+            self.make_key(model, text): (model, len(vector), self._encode(vector), now)
+            for text, vector in zip(texts, embeddings)
+        }
+
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, model, dims, vector, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(key, *row) for key, row in rows.items()]
+            )
+            # Other workers write the same file: count inside this write
+            # transaction (it holds the database's write lock)
+            self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            # Evict by up-to-date recency
+            if self._count > self.max_entries:
+                self._flush_touches_locked()
+            self._evict_locked()
+            self._conn.commit()
+
+    def get_or_embed(
+        self,
+        model: str,
+        texts: Sequence[str],
+        embed_fn: Callable[[List[str]], List[List[float]]]
+    ) -> List[List[float]]:
+        """
+        Return vectors for texts, calling embed_fn only for cache misses.
+
+        Duplicate texts within the same call are embedded once.
+
+        Args:
+            model: Embedding model name (part of the cache key)
+            texts: Texts to embed
+            embed_fn: Provider call for the missing texts (batch in, batch out)
+
+        Returns:
+            List of vectors aligned with texts
+        """
+        cached = self.get_many(model, texts)
+        missing = list(dict.fromkeys(
+            text for text, vector in zip(texts, cached) if vector is None
+        ))
+
+        if missing:
+            computed = embed_fn(missing)
+            self.put_many(model, missing, computed)
+            by_text = dict(zip(missing, computed))
+            cached = [
+                vector if vector is not None else list(by_text[text])
+                for text, vector in zip(texts, cached)
+            ]
+
+        return cached
+
+    async def aget_or_embed(
+        self,
+        model: str,
+        texts: Sequence[str],
+        aembed_fn: Callable[[List[str]], Awaitable[List[List[float]]]]
+    ) -> List[List[float]]:
+        """
+        Async variant of get_or_embed.
+
+        SQLite reads/writes run on the Chroma executor; aembed_fn is awaited
+        on the event loop.
+        """
+        cached = await run_in_chroma_executor(self.get_many, model, texts)
+        missing = list(dict.fromkeys(
+            text for text, vector in zip(texts, cached) if vector is None
+        ))
+
+        if missing:
+            computed = await aembed_fn(missing)
+            await run_in_chroma_executor(self.put_many, model, missing, computed)
+            by_text = dict(zip(missing, computed))
+            cached = [
+                vector if vector is not None else list(by_text[text])
+                for text, vector in zip(texts, cached)
+            ]
+
+        return cached
+
+    def _flush_touches_locked(self):
+        """Write the last_access of the hits remembered since the last flush (lock held)."""
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                [(last_access, key) for key, last_access in self._touched.items()]
+            )
+            self._touched.clear()
+        self._last_flush = time.monotonic()
+
+    def flush(self):
+        """Write pending last_access updates now."""
+        with self._lock:
+            self._flush_touches_locked()
+            self._conn.commit()
+
+    def _evict_locked(self):
+        """Drop least recently used entries down to max_entries (lock held)."""
+        overflow = self._count - self.max_entries
+        if overflow <= 0:
+            return
+
+        deleted = self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN ("
+            "SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+            (overflow,)
+        ).rowcount
+        self._count -= deleted
+        self.evictions += deleted
+        logger.debug(f"Evicted {deleted} embeddings from cache")
+
+    @staticmethod
+    def _encode(vector: Sequence[float]) -> bytes:
+        return array("f", vector).tobytes()
+
+    @staticmethod
+    def _decode(blob: bytes) -> List[float]:
+        vector = array("f")
+        vector.frombytes(blob)
+        return vector.tolist()
+
+    def get_stats(self) -> Dict[str, any]:
+        """
+        Get cache statistics.
+
+        Returns:
+            Dict with entries, max_entries, hits, misses, hit_rate, evictions
+        """
+        with self._lock:
+            # Current for every worker sharing the file
+            self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "entries": self._count,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions
+        }
+
+    def clear(self):
+        """Remove all cached vectors."""
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+            self._touched.clear()
+            self._count = 0
+        logger.info("Embedding cache cleared")
+
+    def close(self):
+        """Write pending last_access updates and close the SQLite connection."""
+        with self._lock:
+            self._flush_touches_locked()
+            self._conn.commit()
+            self._conn.close()
@@ -0,0 +1,517 @@
+"""
+Embedding Providers - Pluggable backends for text embeddings.
+
+Providers:
+- OpenAIEmbeddingProvider: OpenAI embeddings API (text-embedding-3-small, 1536 dims)
+- LocalEmbeddingProvider: CPU model (all-MiniLM-L6-v2, 384 dims), no network.
+  Runs ONNX (bundled with chromadb) or sentence-transformers, batching
+  across a process pool.
+
+Every collection records the provider it was built with (collection metadata),
+so vectors from different models are never mixed in the same index.
+
+Selection via environment:
+- EMBEDDING_PROVIDER: "openai" (default) or "local"
+- OPENAI_EMBEDDING_MODEL: OpenAI model (default: text-embedding-3-small)
+- LOCAL_EMBEDDING_MODEL: Local model (default: all-MiniLM-L6-v2)
+- LOCAL_EMBEDDING_BACKEND: "onnx" (default) or "sentence-transformers"
+- LOCAL_EMBEDDING_WORKERS: Process pool size (default: 1 = in-process)
+- OPENAI_MAX_CONNECTIONS: Async HTTP pool size (default: 100)
+- OPENAI_MAX_KEEPALIVE: Idle keep-alive connections kept open (default: 20)
+"""
+
+import os
+import math
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Known output dimensions per model
+MODEL_DIMENSIONS = {
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+    "all-MiniLM-L6-v2": 384,
+}
+
+# Models whose vectors can be shortened by truncating and re-normalizing
+# (what the OpenAI `dimensions` request parameter does server-side)
+TRUNCATABLE_MODELS = {"text-embedding-3-small", "text-embedding-3-large"}
+
+# Collections created before providers were recorded were always built with this
+LEGACY_COLLECTION_PROVIDER = {
+    "embedding_provider": "openai",
+    "embedding_model": "text-embedding-3-small",
+    "embedding_dimensions": 1536,
+}
+
+
+class EmbeddingProvider(ABC):
+    """
+    Base class for embedding backends.
+
+    Subclasses set `name`, `model_name` and `dimensions` and implement `embed`.
+    """
+
+    name: str = "base"
+
+    # Per-request limits used by bulk ingestion to pack batches
+    max_request_inputs: int = 256
+    max_request_tokens: int = 100_000
+
+    def __init__(self, model_name: str, dimensions: Optional[int] = None):
+        self.model_name = model_name
+        self.dimensions = dimensions or MODEL_DIMENSIONS.get(model_name)
+
+    def count_tokens(self, text: str) -> int:
+        """
+        Estimate tokens in text (offline).
+
+        Default is a conservative ~3 characters per token; providers with
+        a real tokenizer override this.
+        """
+        return len(text) // 3 + 1
+
+    @abstractmethod
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed a batch of texts.
+
+        Args:
+            texts: Texts to embed
+
+        Returns:
+            List of vectors aligned with texts
+        """
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        """
+        Async variant of embed.
+
+        Default runs embed() in a worker thread; providers with a native
+        async client override this.
+        """
+        return await asyncio.to_thread(self.embed, texts)
+
+    def for_priority(self, priority: int) -> "EmbeddingProvider":
+        """
+        Provider to use for traffic of the given priority class.
+
+        Plain providers are unscheduled and return themselves; scheduler
+        lanes (see embedding_scheduler) return the lane for that class.
+        """
+        return self
+
+    @property
+    def cache_namespace(self) -> str:
+        """Key prefix for the embedding cache (provider + model)."""
+        return f"{self.name}:{self.model_name}"
+
+    def collection_metadata(self) -> Dict[str, any]:
+        """Metadata recorded on collections built with this provider."""
+        return {
+            "embedding_provider": self.name,
+            "embedding_model": self.model_name,
+            "embedding_dimensions": self.dimensions or 0,
+        }
+
+    def close(self):
+        """Release provider resources (pools, connections)."""
+
+    async def aclose(self):
+        """Release async resources, then sync ones."""
+        self.close()
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(model={self.model_name!r}, dims={self.dimensions})"
+
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    """Embeddings from the OpenAI API."""
+
+    name = "openai"
+
+    # OpenAI embeddings API limits: 2048 inputs and 300k tokens per request
+    max_request_inputs = 2048
+    max_request_tokens = 300_000
+
+    def __init__(
+        self,
+        model_name: str = "text-embedding-3-small",
+        api_key: Optional[str] = None,
+        client=None,
+        async_client=None
+    ):
+        """
+        Initialize OpenAI provider.
+
+        Args:
+            model_name: OpenAI embedding model
+            api_key: API key (defaults to OPENAI_API_KEY)
+            client: Optional existing OpenAI client to reuse
+            async_client: Optional existing AsyncOpenAI client to reuse
+        """
+        super().__init__(model_name)
+        self._api_key = api_key or os.getenv('OPENAI_API_KEY')
+
+        if client is None:
+            from openai import OpenAI
+            client = OpenAI(api_key=self._api_key)
+        self.client = client
+        self._async_client = async_client
+        self._encoding = None
+        self._encoding_failed = False
+
+    def count_tokens(self, text: str) -> int:
+        """Count tokens with tiktoken when available, else estimate."""
+        if self._encoding is None and not self._encoding_failed:
+            try:
+                import tiktoken
+                self._encoding = tiktoken.encoding_for_model(self.model_name)
+            except Exception as e:
+                # tiktoken missing, or its BPE file not cached and no network
+                self._encoding_failed = True
+                logger.info(f"tiktoken unavailable ({e}), estimating token counts")
+
+        if self._encoding is None:
+            return super().count_tokens(text)
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+    @property
+    def async_client(self):
+        """AsyncOpenAI client on a keep-alive connection pool (created on first use)."""
+        if self._async_client is None:
+            import httpx
+            from openai import AsyncOpenAI
+
+            limits = httpx.Limits(
+                max_connections=int(os.getenv("OPENAI_MAX_CONNECTIONS", "100")),
+                max_keepalive_connections=int(os.getenv("OPENAI_MAX_KEEPALIVE", "20")),
+                keepalive_expiry=30.0
+            )
+            self._async_client = AsyncOpenAI(
+                api_key=self._api_key,
+                http_client=httpx.AsyncClient(
+                    limits=limits,
+                    timeout=httpx.Timeout(30.0, connect=5.0)
+                )
+            )
+        return self._async_client
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+
+        response = self.client.embeddings.create(
+            input=texts,
+            model=self.model_name
+        )
+        return [item.embedding for item in response.data]
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+
+        response = await self.async_client.embeddings.create(
+            input=texts,
+            model=self.model_name
+        )
+        return [item.embedding for item in response.data]
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.close()
+            self._async_client = None
+        self.close()
+
+
+# === Local CPU provider ===
+
+# Model instance inside each pool worker process (loaded once per process)
+_worker_model = None
+
+
+def _load_local_model(backend: str, model_name: str):
+    """Load a local embedding model for the given backend."""
+    if backend == "onnx":
+        from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+
+        if model_name != ONNXMiniLM_L6_V2.MODEL_NAME:
+            raise ValueError(
+                f"ONNX backend only ships {ONNXMiniLM_L6_V2.MODEL_NAME}, got {model_name}. "
+                "Use LOCAL_EMBEDDING_BACKEND=sentence-transformers for other models."
+            )
+        return ONNXMiniLM_L6_V2(preferred_providers=["CPUExecutionProvider"])
+
+    if backend == "sentence-transformers":
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise ImportError(
+                "sentence-transformers required for this backend. "
+                "Install with: pip install sentence-transformers"
+            )
+        return SentenceTransformer(model_name, device="cpu")
+
+    raise ValueError(f"Unknown local embedding backend: {backend}")
+
+
+def _encode_with_model(model, backend: str, texts: List[str]) -> List[List[float]]:
+    """Run a loaded model on a batch of texts, returning plain float lists."""
+    if backend == "sentence-transformers":
+        vectors = model.encode(texts, normalize_embeddings=True, show_progress_bar=False)
+    else:
+        vectors = model(texts)
+    return [[float(x) for x in vector] for vector in vectors]
+
+
+def _init_worker(backend: str, model_name: str):
+    """Process pool initializer: load the model once per worker."""
+    global _worker_model
+    _worker_model = _load_local_model(backend, model_name)
+
+
+def _worker_embed(backend: str, texts: List[str]) -> List[List[float]]:
+    """Embed a batch inside a pool worker."""
+    return _encode_with_model(_worker_model, backend, texts)
+
+
+class LocalEmbeddingProvider(EmbeddingProvider):
+    """
+    CPU embeddings with no network hop.
+
+    With workers > 1, batches are split across a process pool
+    (one model copy per worker). With workers == 1, runs in-process.
+    """
+
+    name = "local"
+
+    def __init__(
+        self,
+        model_name: str = "all-MiniLM-L6-v2",
+        backend: str = "onnx",
+        workers: int = 1,
+        batch_size: int = 32
+    ):
+        """
+        Initialize local provider.
+
+        Args:
+            model_name: Local model name
+            backend: "onnx" or "sentence-transformers"
+            workers: Number of worker processes (1 = in-process)
+            batch_size: Texts per worker batch
+        """
+        super().__init__(model_name)
+        self.backend = backend
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+
+        self._model = None
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+        if self.workers > 1:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(backend, model_name)
+            )
+            logger.info(f"Local embeddings: {model_name} ({backend}) on {self.workers} worker processes")
+        else:
+            logger.info(f"Local embeddings: {model_name} ({backend}) in-process")
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+
+        batches = [
+            texts[i:i + self.batch_size]
+            for i in range(0, len(texts), self.batch_size)
+        ]
+
+        if self._pool is None:
+            if self._model is None:
+                self._model = _load_local_model(self.backend, self.model_name)
+            results = [_encode_with_model(self._model, self.backend, batch) for batch in batches]
+        else:
+            results = self._pool.map(_worker_embed, [self.backend] * len(batches), batches)
+
+        vectors = [vector for batch in results for vector in batch]
+
+        if self.dimensions is None and vectors:
+            self.dimensions = len(vectors[0])
+
+        return vectors
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+# === Factory & collection bookkeeping ===
+
+def get_embedding_provider(name: Optional[str] = None) -> EmbeddingProvider:
+    """
+    Build the configured embedding provider.
+
+    Args:
+        name: "openai" or "local" (defaults to EMBEDDING_PROVIDER env, then "openai")
+
+    Returns:
+        EmbeddingProvider instance
+    """
+    name = (name or os.getenv("EMBEDDING_PROVIDER", "openai")).lower()
+
+    if name == "openai":
+        return OpenAIEmbeddingProvider(
+            model_name=os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
+        )
+
+    if name == "local":
+        return LocalEmbeddingProvider(
+            model_name=os.getenv("LOCAL_EMBEDDING_MODEL", "all-MiniLM-L6-v2"),
+            backend=os.getenv("LOCAL_EMBEDDING_BACKEND", "onnx"),
+            workers=int(os.getenv("LOCAL_EMBEDDING_WORKERS", "1"))
+        )
+
+    raise ValueError(f"Unknown embedding provider: {name} (expected 'openai' or 'local')")
+
+
+def resolve_dimensions(provider: EmbeddingProvider, requested: Optional[int]) -> Optional[int]:
+    """
+    Output dimensions to store for a collection.
+
+    Args:
+        provider: Provider the collection is built with
+        requested: Requested dimensions (None/0 = the model's full size)
+
+    Returns:
+        Dimensions to store (None if the model size is unknown)
+
+    Raises:
+        ValueError: If the model cannot be shortened or requested exceeds its size
+    """
+    native = provider.dimensions
+    if not requested or requested == native:
+        return native
+    if provider.model_name not in TRUNCATABLE_MODELS:
+        raise ValueError(
+            f"{provider.model_name} does not support reduced dimensions "
+            f"(supported: {', '.join(sorted(TRUNCATABLE_MODELS))})"
+        )
+    if requested < 1 or (native and requested > native):
+        raise ValueError(f"{provider.model_name} supports 1-{native} dimensions, got {requested}")
+    return requested
+
+
+def reduce_dimensions(vectors: List[List[float]], dimensions: Optional[int]) -> List[List[float]]:
+    """
+    Shorten vectors to the first `dimensions` components, re-normalized.
+
+    Vectors already at that size are returned unchanged, so applying it
+    twice is harmless.
+
+    Raises:
+        ValueError: If a vector is shorter than dimensions
+    """
+    if not dimensions or all(len(vector) == dimensions for vector in vectors):
+        return vectors
+
+    reduced = []
+    for vector in vectors:
+        if len(vector) < dimensions:
+            raise ValueError(f"Cannot reduce a {len(vector)}-dim vector to {dimensions} dimensions")
+        head = [float(x) for x in vector[:dimensions]]
+        norm = math.sqrt(sum(x * x for x in head)) or 1.0
+        reduced.append([x / norm for x in head])
+    return reduced
+
+
+def check_collection_provider(collection, provider: EmbeddingProvider):
+    """
+    Verify a collection was built with the given provider.
+
+    Empty collections without provider metadata are stamped with the
+    current provider. Non-empty legacy collections are assumed to be
+    OpenAI text-embedding-3-small (the only model used before providers).
+
+    Args:
+        collection: ChromaDB collection
+        provider: Provider about to read/write the collection
+
+    Raises:
+        ValueError: If the collection was built with a different provider/model
+    """
+    metadata = dict(collection.metadata or {})
+    current = provider.collection_metadata()
+
+    if "embedding_provider" not in metadata:
+        if collection.count() == 0:
+            metadata.update(current)
+            collection.modify(metadata=metadata)
+            return
+        recorded = LEGACY_COLLECTION_PROVIDER
+    else:
+        recorded = {key: metadata.get(key) for key in current}
+
+    if (recorded["embedding_provider"], recorded["embedding_model"]) != (
+        current["embedding_provider"], current["embedding_model"]
+    ):
+        raise ValueError(
+            f"Collection '{collection.name}' was built with "
+            f"{recorded['embedding_provider']}/{recorded['embedding_model']} "
+            f"({recorded['embedding_dimensions']} dims) but the current provider is "
+            f"{current['embedding_provider']}/{current['embedding_model']}. "
+            "Clear the collection or select the matching EMBEDDING_PROVIDER."
+        )
+
+
+def validate_query_embedding(
+    collection,
+    provider: EmbeddingProvider,
+    vector: List[float],
+    model_name: Optional[str] = None
+) -> List[float]:
+    """
+    Check a client-supplied query vector against a collection.
+
+    Args:
+        collection: ChromaDB collection the vector will be searched in
+        provider: Provider the collection is built with (fallback metadata)
+        vector: Query embedding sent by the client
+        model_name: Model the client says produced the vector (optional)
+
+    Returns:
+        The vector as a list of floats
+
+    Raises:
+        ValueError: On model or dimension mismatch, or non-finite values
+    """
+    metadata = collection.metadata or {}
+    expected_model = metadata.get("embedding_model") or provider.model_name
+    expected_dims = metadata.get("embedding_dimensions") or provider.dimensions
+
+    if model_name and model_name != expected_model:
+        raise ValueError(
+            f"query_embedding was computed with {model_name}, "
+            f"but collection '{collection.name}' uses {expected_model}"
+        )
+    if expected_dims and len(vector) > expected_dims and expected_model in TRUNCATABLE_MODELS:
+        # Full-size vector for a reduced-dimension collection
+        vector = reduce_dimensions([vector], expected_dims)[0]
+    if expected_dims and len(vector) != expected_dims:
+        raise ValueError(
+            f"query_embedding has {len(vector)} dimensions, "
+            f"collection '{collection.name}' expects {expected_dims}"
+        )
+    if not all(math.isfinite(x) for x in vector):
+        raise ValueError("query_embedding contains non-finite values")
+
+    return [float(x) for x in vector]
@@ -0,0 +1,434 @@
+"""
+Embedding Scheduler - Priority classes for all embedding provider traffic.
+
+Live /code/search and /rag/query calls share the provider quota with
+/rag/reload (bulk ingestion) and save_code backfills. Without coordination a
+reload can take every connection and the whole token-per-minute budget, and
+interactive latency spikes until it finishes.
+
+Every provider request goes through one scheduler with three priority
+classes, each with its own concurrency cap and token-rate budget:
+
+    INTERACTIVE  - query embeddings (search)       -> served first
+    SAVE         - code embeddings on save_code
+    BULK         - documentation ingestion/reload  -> served last
+
+When the global concurrency limit is saturated, waiting interactive requests
+are admitted before saves, and saves before bulk. Per-class caps keep bulk
+from ever holding all the slots, so an interactive request never waits
+behind a reload.
+
+Each class is exposed as a lane: an EmbeddingProvider that callers pick with
+provider.for_priority(Priority.X):
+
+    EmbeddingCache -> MicroBatchingProvider -> lane(INTERACTIVE) -+
+    save_code -----------------------------> lane(SAVE) ----------+-> scheduler -> provider
+    BulkEmbedder --------------------------> lane(BULK) ----------+
+
+Configuration via environment:
+- EMBEDDING_MAX_CONCURRENCY: Total in-flight provider requests (default: 16)
+- EMBEDDING_CONCURRENCY_INTERACTIVE / _SAVE / _BULK: Per-class caps (default: 16 / 4 / 4)
+- EMBEDDING_TPM_INTERACTIVE / _SAVE / _BULK: Per-class tokens per minute,
+  0 = unlimited (default: 0 / 200000 / 500000)
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+from enum import IntEnum
+from typing import Dict, List, Optional
+
+from .embedding_providers import EmbeddingProvider
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    """Embedding traffic classes (lower value = served first)."""
+    INTERACTIVE = 0
+    SAVE = 1
+    BULK = 2
+
+
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "16"))
+
+DEFAULT_LANES = {
+    Priority.INTERACTIVE: {
+        "max_concurrency": int(os.getenv("EMBEDDING_CONCURRENCY_INTERACTIVE", "16")),
+        "tokens_per_minute": int(os.getenv("EMBEDDING_TPM_INTERACTIVE", "0")),
+    },
+    Priority.SAVE: {
+        "max_concurrency": int(os.getenv("EMBEDDING_CONCURRENCY_SAVE", "4")),
+        "tokens_per_minute": int(os.getenv("EMBEDDING_TPM_SAVE", "200000")),
+    },
+    Priority.BULK: {
+        "max_concurrency": int(os.getenv("EMBEDDING_CONCURRENCY_BULK", "4")),
+        "tokens_per_minute": int(os.getenv("EMBEDDING_TPM_BULK", "500000")),
+    },
+}
+
+# Token buckets hold at most this many seconds of budget (burst size)
+BURST_SECONDS = 10.0
+
+
+class _TokenBucket:
+    """Token-rate budget; a tokens_per_minute of 0 means unlimited."""
+
+    def __init__(self, tokens_per_minute: int):
+        self.tokens_per_minute = max(0, tokens_per_minute)
+        self.rate = self.tokens_per_minute / 60.0
+        self.capacity = self.rate * BURST_SECONDS
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        if self.rate:
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, cost: int, now: float) -> float:
+        """Seconds until cost can be taken (0 = now)."""
+        if not self.rate:
+            return 0.0
+        self._refill(now)
+        # Requests larger than the burst size go through once the bucket is full
+        needed = min(cost, self.capacity)
+        if self.tokens >= needed:
+            return 0.0
+        return (needed - self.tokens) / self.rate
+
+    def take(self, cost: int):
+        if self.rate:
+            # May go negative for oversized requests; later requests wait it out
+            self.tokens -= cost
+
+
+class _Lane:
+    """Per-class state: concurrency, token budget and counters."""
+
+    def __init__(self, priority: Priority, max_concurrency: int, tokens_per_minute: int):
+        self.priority = priority
+        self.max_concurrency = max(1, max_concurrency)
+        self.bucket = _TokenBucket(tokens_per_minute)
+        self.active = 0
+        self.requests = 0
+        self.tokens = 0
+        self.waited = 0
+        self.wait_seconds = 0.0
+
+
+class _Waiter:
+    """A request waiting for admission (sync thread or async task)."""
+
+    __slots__ = ("priority", "seq", "cost", "granted", "event", "loop", "future")
+
+    def __init__(self, priority: Priority, seq: int, cost: int):
+        self.priority = priority
+        self.seq = seq
+        self.cost = cost
+        self.granted = False
+        self.event: Optional[threading.Event] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.future: Optional[asyncio.Future] = None
+
+    def wake(self):
+        if self.event is not None:
+            self.event.set()
+        elif self.loop is not None:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class EmbeddingScheduler:
+    """
+    Admission control for embedding requests by priority class.
+
+    Example:
+        >>> scheduler = EmbeddingScheduler(OpenAIEmbeddingProvider())
+        >>> search_provider = scheduler.lane(Priority.INTERACTIVE)
+        >>> search_provider.embed(["how to open PDF"])
+    """
+
+    def __init__(
+        self,
+        provider: EmbeddingProvider,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        lanes: Optional[Dict[Priority, Dict[str, int]]] = None
+    ):
+        """
+        Initialize scheduler.
+
+        Args:
+            provider: Provider that performs the actual embedding
+            max_concurrency: Total provider requests in flight across classes
+            lanes: Per-class {"max_concurrency", "tokens_per_minute"} overrides
+        """
+        self.provider = provider
+        self.max_concurrency = max(1, max_concurrency)
+
+        config = {priority: dict(values) for priority, values in DEFAULT_LANES.items()}
+        for priority, values in (lanes or {}).items():
+            config[Priority(priority)].update(values)
+
+        self._lanes = {
+            priority: _Lane(priority, values["max_concurrency"], values["tokens_per_minute"])
+            for priority, values in config.items()
+        }
+        self._views = {priority: ScheduledProvider(self, priority) for priority in Priority}
+
+        self._lock = threading.Lock()
+        self._waiters: List[_Waiter] = []
+        self._active = 0
+        self._seq = 0
+
+        logger.info(
+            "Embedding scheduler: "
+            + ", ".join(
+                f"{lane.priority.name.lower()}={lane.max_concurrency} slots/"
+                f"{lane.bucket.tokens_per_minute or 'unlimited'} tpm"
+                for lane in self._lanes.values()
+            )
+            + f" (total {self.max_concurrency})"
+        )
+
+    def lane(self, priority: Priority) -> "ScheduledProvider":
+        """Provider view that submits requests with the given priority."""
+        return self._views[Priority(priority)]
+
+    def _cost(self, texts: List[str]) -> int:
+        return sum(self.provider.count_tokens(text) for text in texts)
+
+    def _enqueue(self, priority: Priority, cost: int) -> _Waiter:
+        with self._lock:
+            self._seq += 1
+            waiter = _Waiter(priority, self._seq, cost)
+            self._waiters.append(waiter)
+        return waiter
+
+    def _grant_locked(self) -> float:
+        """
+        Admit waiters in priority order (lock held).
+
+        Returns:
+            Seconds until a token budget refills for the first waiter blocked
+            only by tokens (0 if none)
+        """
+        now = time.monotonic()
+        retry_in = 0.0
+
+        for waiter in sorted(self._waiters, key=lambda w: (w.priority, w.seq)):
+            if self._active >= self.max_concurrency:
+                break
+
+            lane = self._lanes[waiter.priority]
+            if lane.active >= lane.max_concurrency:
+                continue
+
+            wait = lane.bucket.wait_time(waiter.cost, now)
+            if wait > 0:
+                retry_in = wait if not retry_in else min(retry_in, wait)
+                continue
+
+            lane.bucket.take(waiter.cost)
+            lane.active += 1
+            lane.requests += 1
+            lane.tokens += waiter.cost
+            self._active += 1
+            waiter.granted = True
+            self._waiters.remove(waiter)
+            waiter.wake()
+
+        return retry_in
+
+    def _acquire(self, priority: Priority, cost: int):
+        """Block the calling thread until the request is admitted."""
+        waiter = self._enqueue(priority, cost)
+        waiter.event = threading.Event()
+        started = time.monotonic()
+
+        with self._lock:
+            retry_in = self._grant_locked()
+
+        while not waiter.granted:
+            waiter.event.wait(timeout=retry_in or None)
+            with self._lock:
+                retry_in = self._grant_locked()
+
+        self._record_wait(priority, started)
+
+    async def _aacquire(self, priority: Priority, cost: int):
+        """Wait on the event loop (no thread held) until the request is admitted."""
+        waiter = self._enqueue(priority, cost)
+        waiter.loop = asyncio.get_running_loop()
+        waiter.future = waiter.loop.create_future()
+        started = time.monotonic()
+
+        with self._lock:
+            retry_in = self._grant_locked()
+
+        try:
+            while not waiter.granted:
+                try:
+                    await asyncio.wait_for(asyncio.shield(waiter.future), timeout=retry_in or None)
+                except asyncio.TimeoutError:
+                    pass
+                with self._lock:
+                    retry_in = self._grant_locked()
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter.granted:
+                    self._release_locked(priority)
+                else:
+                    self._waiters.remove(waiter)
+            raise
+
+        self._record_wait(priority, started)
+
+    def _release(self, priority: Priority):
+        with self._lock:
+            self._release_locked(priority)
+
+    def _release_locked(self, priority: Priority):
+        self._lanes[priority].active -= 1
+        self._active -= 1
+        self._grant_locked()
+
+    def _record_wait(self, priority: Priority, started: float):
+        waited = time.monotonic() - started
+        if waited > 0.001:
+            with self._lock:
+                lane = self._lanes[priority]
+                lane.waited += 1
+                lane.wait_seconds += waited
+
+    def embed(self, texts: List[str], priority: Priority) -> List[List[float]]:
+        """
+        Embed texts once the priority class is admitted.
+
+        Args:
+            texts: Texts to embed
+            priority: Traffic class
+
+        Returns:
+            List of vectors aligned with texts
+        """
+        if not texts:
+            return []
+
+        self._acquire(priority, self._cost(texts))
+        try:
+            return self.provider.embed(texts)
+        finally:
+            self._release(priority)
+
+    async def aembed(self, texts: List[str], priority: Priority) -> List[List[float]]:
+        """Async variant of embed."""
+        if not texts:
+            return []
+
+        await self._aacquire(priority, self._cost(texts))
+        try:
+            return await self.provider.aembed(texts)
+        finally:
+            self._release(priority)
+
+    def get_stats(self) -> Dict[str, any]:
+        """
+        Get scheduling statistics.
+
+        Returns:
+            Dict with in_flight, max_concurrency and per-class counters
+            (active, waiting, requests, tokens, waited, avg_wait_ms)
+        """
+        with self._lock:
+            waiting = {priority: 0 for priority in Priority}
+            for waiter in self._waiters:
+                waiting[waiter.priority] += 1
+
+            return {
+                "in_flight": self._active,
+                "max_concurrency": self.max_concurrency,
+                "classes": {
+                    lane.priority.name.lower(): {
+                        "active": lane.active,
+                        "waiting": waiting[lane.priority],
+                        "max_concurrency": lane.max_concurrency,
+                        "tokens_per_minute": lane.bucket.tokens_per_minute,
+                        "requests": lane.requests,
+                        "tokens": lane.tokens,
+                        "waited": lane.waited,
+                        "avg_wait_ms": round(lane.wait_seconds * 1000 / lane.waited, 2) if lane.waited else 0.0
+                    }
+                    for lane in self._lanes.values()
+                }
+            }
+
+    def close(self):
+        self.provider.close()
+
+    async def aclose(self):
+        await self.provider.aclose()
+
+
+class ScheduledProvider(EmbeddingProvider):
+    """
+    One priority class of an EmbeddingScheduler, usable as a provider.
+
+    for_priority() switches to the sibling lane, so a service holding any
+    lane can route saves and bulk loads to the right class.
+    """
+
+    def __init__(self, scheduler: EmbeddingScheduler, priority: Priority):
+        self.scheduler = scheduler
+        self.priority = priority
+        self.name = scheduler.provider.name
+        self.model_name = scheduler.provider.model_name
+
+    @property
+    def dimensions(self):
+        return self.scheduler.provider.dimensions
+
+    @property
+    def cache_namespace(self) -> str:
+        return self.scheduler.provider.cache_namespace
+
+    @property
+    def max_request_inputs(self) -> int:
+        return self.scheduler.provider.max_request_inputs
+
+    @property
+    def max_request_tokens(self) -> int:
+        return self.scheduler.provider.max_request_tokens
+
+    def count_tokens(self, text: str) -> int:
+        return self.scheduler.provider.count_tokens(text)
+
+    def collection_metadata(self) -> Dict[str, any]:
+        return self.scheduler.provider.collection_metadata()
+
+    def for_priority(self, priority: int) -> "ScheduledProvider":
+        return self.scheduler.lane(priority)
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return self.scheduler.embed(texts, self.priority)
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        return await self.scheduler.aembed(texts, self.priority)
+
+    def get_stats(self) -> Dict[str, any]:
+        return self.scheduler.get_stats()
+
+    def close(self):
+        self.scheduler.close()
+
+    async def aclose(self):
+        await self.scheduler.aclose()
+
+    def __repr__(self) -> str:
+        return f"ScheduledProvider({self.priority.name}, {self.scheduler.provider!r})"
@@ -0,0 +1,574 @@
+"""
+Exact Index - In-memory exact search for the static documentation collection.
+
+nova_docs holds a few hundred chunks and only changes on /rag/reload, yet
+every /rag/query went through Chroma's HNSW index and SQLite metadata layer.
+ExactIndex is a read-only snapshot of the collection:
+
+- One contiguous, L2-normalized float32 matrix (num_chunks x dims)
+- Exact top-k with a single matrix-vector product (no recall loss)
+- Source/topic filters as precomputed boolean masks
+- A BM25 index over the same chunks (see lexical_index), built on first
+  lexical or hybrid query, for identifier lookups and rank fusion
+
+Snapshots are immutable; VectorStore builds a new one after each load and
+swaps the reference, so queries always see either the old or the new corpus
+in full, never a half-loaded one.
+
+VectorStore keeps one ExactIndex per source (SourceIndexes):
+
+- A query filtered to a source searches only that source's index
+- Unfiltered queries fan out to every source and merge the per-source top-k
+  lists; distances are exact cosine and BM25 scores use statistics combined
+  over all sources, so merged rankings equal those of one corpus-wide index
+- Large corpora fan out on a small thread pool (numpy releases the GIL)
+- Reloading one source rebuilds only that source's index
+
+Configuration via environment:
+- DOCS_EXACT_SEARCH: Serve /rag/query from the in-memory index (default: true)
+- DOCS_PARALLEL_FANOUT_ROWS: Rows searched from which an unfiltered query
+  fans out on threads instead of one source after another (default: 20000)
+"""
+
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .lexical_index import BM25Index, BM25Stats, reciprocal_rank_fusion
+from .similarity import collection_space, to_distance, to_similarity
+
+logger = logging.getLogger(__name__)
+
+EXACT_SEARCH_ENABLED = os.getenv("DOCS_EXACT_SEARCH", "true").lower() in ("1", "true", "yes")
+
+# Rows each ranking contributes to hybrid rank fusion
+HYBRID_CANDIDATES = 50
+
+# Below this many rows, thread hand-offs cost more than the searches they overlap
+PARALLEL_FANOUT_ROWS = int(os.getenv("DOCS_PARALLEL_FANOUT_ROWS", "20000"))
+FANOUT_WORKERS = min(8, os.cpu_count() or 1)
+
+_fanout_executor: Optional[ThreadPoolExecutor] = None
+_fanout_lock = threading.Lock()
+
+
+def _fan_out(indexes: Sequence["ExactIndex"], search: Callable[["ExactIndex"], List]) -> List[List]:
+    """search() on every index, on threads when there are enough rows to gain from it."""
+    global _fanout_executor
+
+    if len(indexes) < 2 or sum(len(index) for index in indexes) < PARALLEL_FANOUT_ROWS:
+        return [search(index) for index in indexes]
+
+    with _fanout_lock:
+        if _fanout_executor is None:
+            _fanout_executor = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix="docs-fanout")
+    return list(_fanout_executor.map(search, indexes))
+
+
+class ExactIndex:
+    """
+    Immutable exact-search snapshot of a documentation collection.
+
+    Example:
+        >>> index = ExactIndex.from_collection(store.collection)
+        >>> index.search(query_vector, top_k=5, filter_source="pymupdf")
+    """
+
+    def __init__(
+        self,
+        embeddings: Sequence[Sequence[float]],
+        documents: Sequence[str],
+        metadatas: Sequence[Dict],
+        space: str = "l2",
+        ids: Optional[Sequence[str]] = None,
+        normalized: bool = False
+    ):
+        """
+        Build the snapshot.
+
+        Args:
+            embeddings: Vectors aligned with documents
+            documents: Chunk texts
+            metadatas: Chunk metadata (source, topic)
+            space: Chroma distance space the collection uses ("l2", "cosine" or "ip"),
+                   so reported distances stay on the same scale as Chroma's
+            ids: Document IDs (defaults to row numbers)
+            normalized: embeddings is already an L2-normalized float32 matrix
+                        (e.g. a memory-mapped segment); used as-is, no copy
+        """
+        if normalized:
+            matrix = embeddings
+        else:
+            matrix = np.asarray(embeddings, dtype=np.float32)
+        if matrix.ndim != 2 or matrix.shape[0] != len(documents):
+            raise ValueError("embeddings must be a (num_documents x dims) matrix")
+
+        if not normalized:
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            matrix = np.ascontiguousarray(matrix / norms)
+        self.matrix = matrix
+        self.space = space
+
+        self.ids = list(ids) if ids is not None else [str(i) for i in range(len(documents))]
+        self.documents = list(documents)
+        self.metadatas = list(metadatas)
+        self.sources = [meta.get('source', 'unknown') for meta in self.metadatas]
+        self.topics = [meta.get('topic', 'general') for meta in self.metadatas]
+
+        # field -> value -> boolean row mask (source/topic precomputed,
+        # other fields built on first use)
+        self._masks = {
+            'source': self._build_masks(self.sources),
+            'topic': self._build_masks(self.topics),
+        }
+        self._lexical: Optional[BM25Index] = None
+
+    @staticmethod
+    def _build_masks(values: List) -> Dict[any, np.ndarray]:
+        array = np.empty(len(values), dtype=object)
+        array[:] = values
+        return {value: array == value for value in set(values)}
+
+    def _mask(self, field: str, value) -> Optional[np.ndarray]:
+        masks = self._masks.get(field)
+        if masks is None:
+            masks = self._build_masks([meta.get(field) for meta in self.metadatas])
+            self._masks[field] = masks
+        return masks.get(value)
+
+    def _candidates(self, where: Optional[Dict[str, any]]) -> Tuple[bool, Optional[np.ndarray]]:
+        """
+        (any row can match, boolean row mask or None if unfiltered) for
+        equality filters; a frozenset value accepts any of its values.
+        """
+        candidates = None
+        for field, value in (where or {}).items():
+            if isinstance(value, frozenset):
+                masks = [m for m in (self._mask(field, v) for v in value) if m is not None]
+                mask = np.logical_or.reduce(masks) if masks else None
+            else:
+                mask = self._mask(field, value)
+            if mask is None:
+                return False, None
+            candidates = mask if candidates is None else candidates & mask
+        return True, candidates
+
+    @classmethod
+    def from_collection(cls, collection, where: Optional[Dict[str, any]] = None) -> "ExactIndex":
+        """Snapshot the documents of a Chroma collection (all, or those matching where)."""
+        results = collection.get(where=where, include=['embeddings', 'documents', 'metadatas'])
+        space = collection_space(collection)
+        embeddings = results['embeddings']
+        if embeddings is None or len(embeddings) == 0:
+            embeddings = np.zeros((0, 0), dtype=np.float32)
+
+        return cls(embeddings, results['documents'], results['metadatas'], space=space, ids=results['ids'])
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    @property
+    def nbytes(self) -> int:
+        return self.matrix.nbytes
+
+    def count_where(self, field: str, value, mask: Optional[np.ndarray] = None) -> int:
+        """Number of rows whose metadata field equals value (among the rows in mask, if given)."""
+        matching = self._mask(field, value)
+        if matching is None:
+            return 0
+        return int((matching & mask).sum() if mask is not None else matching.sum())
+
+    @property
+    def lexical(self) -> BM25Index:
+        """BM25 index over the chunk texts (built once, on first use)."""
+        if self._lexical is None:
+            self._lexical = BM25Index(self.documents)
+        return self._lexical
+
+    def search_rows(
+        self,
+        query_embedding: Sequence[float],
+        top_k: int = 5,
+        where: Optional[Dict[str, any]] = None,
+        min_similarity: Optional[float] = None,
+        mask: Optional[np.ndarray] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        Exact top-k search returning row numbers.
+
+        Args:
+            query_embedding: Query vector
+            top_k: Number of results
+            where: Equality filters on metadata fields (all must match)
+            min_similarity: Drop rows below this similarity before ranking
+                            (see similarity)
+            mask: Boolean row mask of the rows that may be returned
+                  (e.g. the live rows of a segment)
+
+        Returns:
+            List of (row, distance), closest first
+        """
+        if not self.documents or top_k <= 0:
+            return []
+
+        query = self._query_vector(query_embedding)
+        matchable, candidates = self._candidates(where)
+        if not matchable:
+            return []
+        if mask is not None:
+            candidates = mask if candidates is None else candidates & mask
+
+        if candidates is None:
+            rows = None
+            similarity = self.matrix @ query
+        else:
+            rows = np.flatnonzero(candidates)
+            if rows.size == 0:
+                return []
+            similarity = self.matrix[rows] @ query
+
+        if min_similarity is not None and min_similarity > 0:
+            passing = np.flatnonzero(similarity >= min_similarity)
+            if passing.size == 0:
+                return []
+            rows = passing if rows is None else rows[passing]
+            similarity = similarity[passing]
+
+        k = min(top_k, similarity.shape[0])
+        top = np.argpartition(-similarity, k - 1)[:k]
+        top = top[np.argsort(-similarity[top], kind="stable")]
+        distances = to_distance(similarity[top], self.space)
+
+        return [
+            (int(rows[position]) if rows is not None else int(position), float(distance))
+            for position, distance in zip(top, distances)
+        ]
+
+    def _query_vector(self, query_embedding: Sequence[float]) -> np.ndarray:
+        query = np.asarray(query_embedding, dtype=np.float32)
+        if query.shape != (self.matrix.shape[1],):
+            raise ValueError(
+                f"Query has {query.shape[0]} dimensions, index has {self.matrix.shape[1]}"
+            )
+        norm = np.linalg.norm(query)
+        return query / norm if norm else query
+
+    def similarities(self, rows: Sequence[int], query_embedding: Sequence[float]) -> np.ndarray:
+        """Cosine similarity of the given rows to a query vector."""
+        if not len(rows):
+            return np.zeros(0, dtype=np.float32)
+        return self.matrix[list(rows)] @ self._query_vector(query_embedding)
+
+    def lexical_rows(
+        self,
+        query_text: str,
+        top_k: int = 5,
+        where: Optional[Dict[str, any]] = None,
+        stats: Optional[BM25Stats] = None
+    ) -> List[Tuple[int, float, float]]:
+        """
+        BM25 top-k returning row numbers.
+
+        Args:
+            query_text: Query text
+            top_k: Number of results
+            where: Equality filters on metadata fields (all must match)
+            stats: Collection statistics to score against (see BM25Stats)
+
+        Returns:
+            List of (row, bm25_score, coverage), best first
+        """
+        matchable, candidates = self._candidates(where)
+        if not matchable:
+            return []
+        return self.lexical.search(query_text, top_k, candidates, stats)
+
+    def search(
+        self,
+        query_embedding: Sequence[float],
+        top_k: int = 5,
+        filter_source: Optional[str] = None,
+        filter_topic: Optional[str] = None
+    ) -> List[Dict[str, any]]:
+        """
+        Exact top-k search over documentation chunks.
+
+        Args:
+            query_embedding: Query vector
+            top_k: Number of results
+            filter_source: Only chunks from this source
+            filter_topic: Only chunks with this topic
+
+        Returns:
+            List of dicts with text, source, topic, distance and score
+            (same format as VectorStore.query)
+        """
+        where = self._where(filter_source, filter_topic)
+        return [
+            self._result(i, distance, to_similarity(distance, self.space))
+            for i, distance in self.search_rows(query_embedding, top_k, where)
+        ]
+
+    def search_lexical(
+        self,
+        query_text: str,
+        top_k: int = 5,
+        filter_source: Optional[str] = None,
+        filter_topic: Optional[str] = None
+    ) -> List[Dict[str, any]]:
+        """
+        BM25 top-k search, no embedding needed.
+
+        score is the fraction of query terms found in the chunk and distance
+        1 - score, like the degraded lexical ranking in VectorStore.
+
+        Returns:
+            List of dicts with text, source, topic, distance and score
+        """
+        where = self._where(filter_source, filter_topic)
+        return [
+            self._result(i, round(1.0 - coverage, 4), round(coverage, 4))
+            for i, _, coverage in self.lexical_rows(query_text, top_k, where)
+        ]
+
+    def search_hybrid(
+        self,
+        query_text: str,
+        query_embedding: Sequence[float],
+        top_k: int = 5,
+        filter_source: Optional[str] = None,
+        filter_topic: Optional[str] = None
+    ) -> List[Dict[str, any]]:
+        """
+        Vector and BM25 rankings merged by reciprocal rank fusion.
+
+        Each ranking contributes its best HYBRID_CANDIDATES rows; the fused
+        order decides which chunks are returned. score is still the cosine
+        similarity of each chunk to the query (see similarity), so it is
+        not monotonic down the list; fused_score is.
+
+        Returns:
+            List of dicts with text, source, topic, distance, score and fused_score
+        """
+        where = self._where(filter_source, filter_topic)
+        depth = max(top_k, HYBRID_CANDIDATES)
+        fused = reciprocal_rank_fusion([
+            [row for row, _ in self.search_rows(query_embedding, depth, where)],
+            [row for row, _, _ in self.lexical_rows(query_text, depth, where)]
+        ])[:top_k]
+
+        rows = [row for row, _ in fused]
+        return [
+            {**self._result(row, distance, to_similarity(distance, self.space)), "fused_score": round(fused_score, 6)}
+            for (row, fused_score), distance in zip(fused, self._distances(rows, query_embedding))
+        ]
+
+    def _distances(self, rows: Sequence[int], query_embedding: Sequence[float]) -> List[float]:
+        return [float(to_distance(float(s), self.space)) for s in self.similarities(rows, query_embedding)]
+
+    @staticmethod
+    def _where(filter_source: Optional[str], filter_topic: Optional[str]) -> Dict[str, str]:
+        where = {}
+        if filter_source:
+            where['source'] = filter_source
+        if filter_topic:
+            where['topic'] = filter_topic
+        return where
+
+    def _result(self, row: int, distance: float, score: float) -> Dict[str, any]:
+        return {
+            'text': self.documents[row],
+            'source': self.sources[row],
+            'topic': self.topics[row],
+            'distance': distance,
+            'score': score
+        }
+
+
+class SourceIndexes:
+    """
+    One ExactIndex per documentation source, searched like a single index.
+
+    Example:
+        >>> indexes = SourceIndexes.from_collection(store.collection)
+        >>> indexes.search(query_vector, top_k=5)                          # every source, merged
+        >>> indexes.search(query_vector, top_k=5, filter_source="pymupdf")  # pymupdf only
+        >>> indexes = SourceIndexes.from_collection(store.collection, sources=["imap"], base=indexes)
+    """
+
+    def __init__(self, indexes: Dict[str, ExactIndex]):
+        """
+        Args:
+            indexes: Source name -> snapshot of that source's chunks (empty ones are dropped)
+        """
+        self.indexes = {source: index for source, index in indexes.items() if len(index)}
+        self._stats: Optional[BM25Stats] = None
+
+    @classmethod
+    def from_collection(
+        cls,
+        collection,
+        sources: Optional[Iterable[str]] = None,
+        base: Optional["SourceIndexes"] = None
+    ) -> "SourceIndexes":
+        """
+        Snapshot a Chroma collection, one index per source.
+
+        Args:
+            collection: Documentation collection
+            sources: Only re-read these sources; the others are taken from base
+            base: Previous snapshot whose unchanged source indexes are reused as-is
+
+        Returns:
+            New SourceIndexes (base is not modified)
+        """
+        if sources is not None and base is not None:
+            indexes = dict(base.indexes)
+            for source in set(sources):
+                indexes[source] = ExactIndex.from_collection(collection, where={'source': source})
+            return cls(indexes)
+
+        results = collection.get(include=['embeddings', 'documents', 'metadatas'])
+        space = collection_space(collection)
+        groups: Dict[str, List[int]] = {}
+        for row, metadata in enumerate(results['metadatas']):
+            groups.setdefault(metadata.get('source', 'unknown'), []).append(row)
+
+        embeddings = np.asarray(results['embeddings'], dtype=np.float32) if groups else None
+        return cls({
+            source: ExactIndex(
+                embeddings[rows],
+                [results['documents'][row] for row in rows],
+                [results['metadatas'][row] for row in rows],
+                space=space,
+                ids=[results['ids'][row] for row in rows]
+            )
+            for source, rows in groups.items()
+        })
+
+    def __len__(self) -> int:
+        return sum(len(index) for index in self.indexes.values())
+
+    @property
+    def nbytes(self) -> int:
+        return sum(index.nbytes for index in self.indexes.values())
+
+    @property
+    def sources(self) -> List[str]:
+        return sorted(self.indexes)
+
+    def count_where(self, field: str, value) -> int:
+        """Number of rows whose metadata field equals value."""
+        if field == 'source':
+            index = self.indexes.get(value)
+            return len(index) if index is not None else 0
+        return sum(index.count_where(field, value) for index in self.indexes.values())
+
+    @property
+    def lexical_stats(self) -> BM25Stats:
+        """BM25 statistics of all sources combined (builds every source's BM25 index)."""
+        if self._stats is None:
+            self._stats = BM25Stats.combine([index.lexical for index in self.indexes.values()])
+        return self._stats
+
+    def _select(self, filter_source: Optional[str]) -> List[Tuple[str, ExactIndex]]:
+        if filter_source:
+            index = self.indexes.get(filter_source)
+            return [(filter_source, index)] if index is not None else []
+        return sorted(self.indexes.items())
+
+    def _vector_hits(
+        self,
+        query_embedding: Sequence[float],
+        top_k: int,
+        filter_source: Optional[str],
+        filter_topic: Optional[str]
+    ) -> List[Tuple[str, int, float]]:
+        """(source, row, distance), closest first across the selected sources."""
+        selected = self._select(filter_source)
+        where = ExactIndex._where(None, filter_topic)
+        found = _fan_out([index for _, index in selected], lambda index: index.search_rows(query_embedding, top_k, where))
+        hits = [
+            (source, row, distance)
+            for (source, _), rows in zip(selected, found)
+            for row, distance in rows
+        ]
+        hits.sort(key=lambda hit: hit[2])
+        return hits[:top_k]
+
+    def _lexical_hits(
+        self,
+        query_text: str,
+        top_k: int,
+        filter_source: Optional[str],
+        filter_topic: Optional[str]
+    ) -> List[Tuple[str, int, float]]:
+        """(source, row, coverage), best BM25 score first across the selected sources."""
+        selected = self._select(filter_source)
+        if not selected:
+            return []
+        stats = self.lexical_stats
+        where = ExactIndex._where(None, filter_topic)
+        found = _fan_out([index for _, index in selected], lambda index: index.lexical_rows(query_text, top_k, where, stats))
+        hits = [
+            (source, row, score, coverage)
+            for (source, _), rows in zip(selected, found)
+            for row, score, coverage in rows
+        ]
+        hits.sort(key=lambda hit: hit[2], reverse=True)
+        return [(source, row, coverage) for source, row, _, coverage in hits[:top_k]]
+
+    def search(
+        self,
+        query_embedding: Sequence[float],
+        top_k: int = 5,
+        filter_source: Optional[str] = None,
+        filter_topic: Optional[str] = None
+    ) -> List[Dict[str, any]]:
+        """Exact top-k search (same arguments and results as ExactIndex.search)."""
+        results = []
+        for source, row, distance in self._vector_hits(query_embedding, top_k, filter_source, filter_topic):
+            index = self.indexes[source]
+            results.append(index._result(row, distance, to_similarity(distance, index.space)))
+        return results
+
+    def search_lexical(
+        self,
+        query_text: str,
+        top_k: int = 5,
+        filter_source: Optional[str] = None,
+        filter_topic: Optional[str] = None
+    ) -> List[Dict[str, any]]:
+        """BM25 top-k search (same arguments and results as ExactIndex.search_lexical)."""
+        return [
+            self.indexes[source]._result(row, round(1.0 - coverage, 4), round(coverage, 4))
+            for source, row, coverage in self._lexical_hits(query_text, top_k, filter_source, filter_topic)
+        ]
+
+    def search_hybrid(
+        self,
+        query_text: str,
+        query_embedding: Sequence[float],
+        top_k: int = 5,
+        filter_source: Optional[str] = None,
+        filter_topic: Optional[str] = None
+    ) -> List[Dict[str, any]]:
+        """Rank fusion of the merged vector and BM25 rankings (see ExactIndex.search_hybrid)."""
+        depth = max(top_k, HYBRID_CANDIDATES)
+        fused = reciprocal_rank_fusion([
+            [(source, row) for source, row, _ in self._vector_hits(query_embedding, depth, filter_source, filter_topic)],
+            [(source, row) for source, row, _ in self._lexical_hits(query_text, depth, filter_source, filter_topic)]
+        ])[:top_k]
+
+        results = []
+        for (source, row), fused_score in fused:
+            index = self.indexes[source]
+            distance = index._distances([row], query_embedding)[0]
+            result = index._result(row, distance, to_similarity(distance, index.space))
+            results.append({**result, "fused_score": round(fused_score, 6)})
+        return results
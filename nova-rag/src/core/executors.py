@@ -0,0 +1,64 @@
+"""
+Executors - Dedicated thread pool for blocking storage work on the async path.
+
+Async handlers must never block the event loop. ChromaDB (and the SQLite
+embedding cache) only have sync APIs, so their calls run on a dedicated
+executor instead of the shared anyio threadpool. Embedding calls use
+AsyncOpenAI directly and do not occupy a thread while waiting.
+
+Configuration via environment:
+- CHROMA_EXECUTOR_WORKERS: Threads for storage work (default: 8)
+"""
+
+import os
+import asyncio
+import functools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = int(os.getenv("CHROMA_EXECUTOR_WORKERS", "8"))
+
+_executor: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+
+
+def get_chroma_executor() -> ThreadPoolExecutor:
+    """Return the shared storage executor, creating it on first use."""
+    global _executor
+
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=DEFAULT_WORKERS,
+                thread_name_prefix="chroma"
+            )
+            logger.info(f"Started Chroma executor with {DEFAULT_WORKERS} threads")
+        return _executor
+
+
+async def run_in_chroma_executor(fn: Callable, *args, **kwargs) -> Any:
+    """
+    Run a blocking storage call on the Chroma executor.
+
+    Example:
+        >>> count = await run_in_chroma_executor(collection.count)
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_chroma_executor(),
+        functools.partial(fn, *args, **kwargs)
+    )
+
+
+def shutdown_chroma_executor():
+    """Stop the storage executor (on service shutdown)."""
+    global _executor
+
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
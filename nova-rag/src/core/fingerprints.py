@@ -0,0 +1,219 @@
+"""
+Fingerprints - Canonical identity of a code cache request, for exact hits.
+
+A repeated execution asks the code cache for the same task with the same
+input schema, yet every lookup paid for a query embedding and an ANN search,
+and small differences (spacing, key order, an invoice number or a date in
+the prompt) could still push the similarity under the threshold.
+
+A request fingerprint hashes:
+
+- The ai_description, lowercased, whitespace collapsed, and volatile literals
+  (UUIDs, dates and times, e-mail addresses, URLs, hex digests, numbers of
+  four or more digits) replaced by placeholders. Short numbers stay as they
+  are: "top 5 rows" and "top 10 rows" are different tasks.
+- The input_schema signature: sorted keys with their types, nested
+  structures included, values ignored.
+
+The search query is the searchable text CodeCacheService builds
+("Prompt: ...\\n\\nInput Schema:\\n{json}"), so the same fingerprint can be
+computed from a saved document and from a query (parse_searchable_text).
+FingerprintIndex maps fingerprints (per workflow) to ready-to-return
+matches, so an exact repeat is a dictionary lookup. Entries are kept by id,
+so the map follows deletions and writes made by other processes.
+
+Configuration via environment:
+- CODE_CACHE_EXACT_MATCH: Answer exact repeats from the fingerprint map before
+  embedding the query (default: true)
+
+Example:
+    >>> a = request_fingerprint("Leer email  de factura 2025-001234", {"pdf": "base64_large", "user": "str"})
+    >>> b = request_fingerprint("leer email de factura 2025-009876", {"user": "str", "pdf": "base64_large"})
+    >>> a == b
+    True
+"""
+
+import os
+import re
+import json
+import hashlib
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+EXACT_MATCH_ENABLED = os.getenv("CODE_CACHE_EXACT_MATCH", "true").lower() in ("1", "true", "yes")
+
+# Order matters: longer literals first, so a date is not split into numbers
+_VOLATILE_PATTERNS = [
+    (re.compile(r"\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b"), "<uuid>"),
+    (re.compile(r"\b(?:https?|ftp)://\S+"), "<url>"),
+    (re.compile(r"\b[\w.+-]+@[\w-]+(?:\.[\w-]+)+\b"), "<email>"),
+    (re.compile(r"\b\d{4}-\d{2}-\d{2}(?:[t ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:z|[+-]\d{2}:?\d{2})?)?\b"), "<date>"),
+    (re.compile(r"\b\d{1,2}[/.]\d{1,2}[/.]\d{2,4}\b"), "<date>"),
+    (re.compile(r"\b\d{1,2}:\d{2}(?::\d{2})?\b"), "<time>"),
+    (re.compile(r"\b(?=[0-9a-f]*\d)(?=[0-9a-f]*[a-f])[0-9a-f]{12,}\b"), "<hex>"),
+    (re.compile(r"\d{4,}"), "<n>"),
+]
+
+_PROMPT_PREFIX = "Prompt:"
+_SCHEMA_HEADER = "Input Schema:\n"
+
+
+def canonical_description(text: str) -> str:
+    """
+    Task description with case, spacing and volatile literals normalized.
+
+    Example:
+        >>> canonical_description("Send  report to ana@example.com on 2025-11-23")
+        'send report to <email> on <date>'
+    """
+    text = " ".join(text.lower().split())
+    for pattern, placeholder in _VOLATILE_PATTERNS:
+        text = pattern.sub(placeholder, text)
+    return text
+
+
+def schema_signature(schema: Any) -> str:
+    """
+    Key and type signature of an input schema (key order and values ignored).
+
+    Values of a compact schema are type names ("str", "base64_large") and
+    are kept, digits aside; other values contribute only their type.
+
+    Example:
+        >>> schema_signature({"b": "str", "a": {"rows": [{"id": 1}]}})
+        '{a:{rows:[{id:int}]},b:str}'
+    """
+    if isinstance(schema, dict):
+        fields = sorted(f"{key}:{schema_signature(value)}" for key, value in schema.items())
+        return "{" + ",".join(fields) + "}"
+    if isinstance(schema, (list, tuple)):
+        return "[" + "|".join(sorted({schema_signature(item) for item in schema})) + "]"
+    if isinstance(schema, str):
+        return re.sub(r"\d+", "<n>", schema.strip().lower())
+    if schema is None:
+        return "null"
+    return type(schema).__name__
+
+
+def request_fingerprint(description: Optional[str], schema: Any = None) -> str:
+    """Fingerprint of a task description and input schema (sha256 hex)."""
+    canonical = json.dumps([
+        canonical_description(description) if description is not None else None,
+        schema_signature(schema) if schema is not None else None
+    ])
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def parse_searchable_text(text: str) -> Tuple[Optional[str], Any]:
+    """
+    Split a searchable text back into (description, input_schema).
+
+    Understands the format of CodeCacheService._build_searchable_text; other
+    text is taken as the description, and a schema that is not valid JSON is
+    kept as text.
+    """
+    text = text.strip()
+    if text.startswith(_SCHEMA_HEADER):
+        head, schema_text = "", text[len(_SCHEMA_HEADER):]
+    else:
+        head, separator, schema_text = text.partition("\n\n" + _SCHEMA_HEADER)
+        if not separator:
+            schema_text = None
+
+    description = None
+    if head.startswith(_PROMPT_PREFIX):
+        description = head[len(_PROMPT_PREFIX):].strip()
+    elif head:
+        description = head
+
+    schema = None
+    if schema_text is not None:
+        try:
+            schema = json.loads(schema_text)
+        except ValueError:
+            schema = schema_text
+    return description, schema
+
+
+def query_fingerprint(query: str) -> str:
+    """Fingerprint of a search query (see parse_searchable_text)."""
+    return request_fingerprint(*parse_searchable_text(query))
+
+
+class FingerprintIndex:
+    """
+    In-memory map of request fingerprints to cached matches.
+
+    Example:
+        >>> index = FingerprintIndex()
+        >>> index.add(fingerprint, workflow_id=5, match=match, created_at="2025-11-23T10:00:00")
+        >>> index.lookup(fingerprint, workflow_id=5)
+        [match]
+    """
+
+    def __init__(self, version: Any = None):
+        """
+        Args:
+            version: What the index was built from (e.g. a segment generation),
+                     so callers can tell when to rebuild it
+        """
+        self.version = version
+        # (workflow_id, fingerprint) -> [(created_at, match)]
+        self._entries: Dict[Tuple[Any, str], List[Tuple[str, Dict]]] = {}
+        # fingerprint -> workflow_ids, for searches across workflows
+        self._workflows: Dict[str, set] = {}
+        # match id -> its (workflow_id, fingerprint) key
+        self._ids: Dict[str, Tuple[Any, str]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return sum(len(matches) for matches in self._entries.values())
+
+    def add(self, fingerprint: str, workflow_id: Any, match: Dict, created_at: str = ""):
+        """Add a match (replacing the one with the same id, if any)."""
+        doc_id = match.get("id")
+        with self._lock:
+            if doc_id is not None:
+                self._remove_locked(doc_id)
+                self._ids[doc_id] = (workflow_id, fingerprint)
+            self._entries.setdefault((workflow_id, fingerprint), []).append((created_at or "", match))
+            self._workflows.setdefault(fingerprint, set()).add(workflow_id)
+
+    def remove(self, doc_id: str):
+        """Drop the match with this id (deleted from the collection)."""
+        with self._lock:
+            self._remove_locked(doc_id)
+
+    def _remove_locked(self, doc_id: str):
+        key = self._ids.pop(doc_id, None)
+        if key is None:
+            return
+        entries = [entry for entry in self._entries.get(key, ()) if entry[1].get("id") != doc_id]
+        if entries:
+            self._entries[key] = entries
+        else:
+            self._entries.pop(key, None)
+            workflow_id, fingerprint = key
+            workflows = self._workflows.get(fingerprint, set())
+            workflows.discard(workflow_id)
+            if not workflows:
+                self._workflows.pop(fingerprint, None)
+
+    def lookup(self, fingerprint: str, workflow_id: Any = None, top_k: int = 5) -> List[Dict]:
+        """
+        Matches saved with this fingerprint, newest first.
+
+        Args:
+            fingerprint: request_fingerprint of the query
+            workflow_id: Only matches of this workflow (None = any workflow)
+            top_k: Maximum matches returned
+        """
+        with self._lock:
+            workflows = [workflow_id] if workflow_id is not None else self._workflows.get(fingerprint, ())
+            found = [
+                entry
+                for workflow in workflows
+                for entry in self._entries.get((workflow, fingerprint), ())
+            ]
+        found.sort(key=lambda entry: entry[0], reverse=True)
+        return [match for _, match in found[:top_k]]
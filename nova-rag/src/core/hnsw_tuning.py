@@ -0,0 +1,321 @@
+"""
+HNSW Tuning - Per-collection HNSW settings, and a sweep to choose them.
+
+Chroma fixes a collection's HNSW parameters when the collection is created
+(metadata keys "hnsw:M", "hnsw:construction_ef", ...). The two collections
+have opposite workloads, so they get separate settings:
+
+- nova_docs: small, static, rebuilt only on corpus loads -> a denser graph
+  and a wider search for recall (build cost is paid once)
+- cached_code: grows with every successful execution -> cheaper inserts and
+  fewer persistence flushes under a save-heavy load
+
+Settings apply when a collection is created. When DOCS_HNSW / CODE_HNSW is
+set and differs from what an existing collection was built with, the
+collection is rebuilt online at startup (see
+dimension_migration.rebuild_collection). The distance space is not
+configurable here: scores and thresholds are derived from it.
+
+Tuning (service stopped, since Chroma is single-process):
+    python -m src.core.hnsw_tuning --collection cached_code --target-recall 0.95 --apply
+
+A sample of the collection's vectors is held out of the graphs built for
+the sweep and used as queries, with exact top-k over the remaining vectors
+as ground truth. Every M x construction_ef graph is built with hnswlib
+(Chroma's HNSW implementation) and searched at every search_ef. Each
+combination reports recall@k, p50/p99 single-query latency, build time and
+index size; the fastest combination (by p99) reaching the target recall is
+chosen, the report is written next to the Chroma DB, and --apply rebuilds
+the collection with it.
+
+Configuration via environment:
+- DOCS_HNSW: Settings for nova_docs (default: M=32,construction_ef=200,search_ef=128)
+- CODE_HNSW: Settings for the code cache (default: M=16,construction_ef=100,search_ef=64,batch_size=500,sync_threshold=5000)
+  Comma-separated key=value pairs among M, construction_ef, search_ef,
+  num_threads, batch_size and sync_threshold
+"""
+
+import os
+import json
+import time
+import logging
+import tempfile
+import multiprocessing
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+HNSW_KEYS = ("M", "construction_ef", "search_ef", "num_threads", "batch_size", "sync_threshold")
+
+# Chroma's values for collections created without hnsw:* metadata
+CHROMA_DEFAULTS = {
+    "M": 16,
+    "construction_ef": 100,
+    "search_ef": 10,
+    "num_threads": multiprocessing.cpu_count(),
+    "batch_size": 100,
+    "sync_threshold": 1000,
+}
+
+DOCS_HNSW_DEFAULTS = {"M": 32, "construction_ef": 200, "search_ef": 128}
+CODE_HNSW_DEFAULTS = {"M": 16, "construction_ef": 100, "search_ef": 64, "batch_size": 500, "sync_threshold": 5000}
+
+DOCS_HNSW = os.getenv("DOCS_HNSW", "")
+CODE_HNSW = os.getenv("CODE_HNSW", "")
+
+# Sweep grid
+DEFAULT_M_VALUES = (8, 16, 32, 48)
+DEFAULT_CONSTRUCTION_EF_VALUES = (100, 200)
+DEFAULT_SEARCH_EF_VALUES = (16, 32, 64, 128, 256)
+
+
+def parse_hnsw(spec: str) -> Dict[str, int]:
+    """
+    Parse "M=16,search_ef=64" into settings.
+
+    Args:
+        spec: Comma-separated key=value pairs (empty = no settings)
+
+    Returns:
+        Dict of HNSW settings
+
+    Raises:
+        ValueError: On unknown keys or non-integer values
+    """
+    settings = {}
+    for pair in filter(None, (part.strip() for part in spec.split(","))):
+        key, _, value = pair.partition("=")
+        key = key.strip()
+        if key not in HNSW_KEYS:
+            raise ValueError(f"Unknown HNSW setting '{key}' (expected one of: {', '.join(HNSW_KEYS)})")
+        try:
+            settings[key] = int(value)
+        except ValueError:
+            raise ValueError(f"HNSW setting {key} must be an integer, got '{value.strip()}'")
+        if settings[key] <= (2 if key in ("batch_size", "sync_threshold") else 0):
+            raise ValueError(f"HNSW setting {key} is too small: {settings[key]}")
+    return settings
+
+
+def format_hnsw(settings: Dict[str, int]) -> str:
+    """Inverse of parse_hnsw (for DOCS_HNSW / CODE_HNSW)."""
+    return ",".join(f"{key}={settings[key]}" for key in HNSW_KEYS if key in settings)
+
+
+def resolve_hnsw(requested: Optional[Dict[str, int]], env_spec: str, defaults: Dict[str, int]) -> Dict[str, int]:
+    """Explicit settings, else the environment, else the collection's defaults."""
+    if requested is not None:
+        return dict(requested)
+    return parse_hnsw(env_spec) if env_spec else dict(defaults)
+
+
+def hnsw_metadata(settings: Dict[str, int]) -> Dict[str, int]:
+    """Settings as Chroma collection metadata."""
+    return {f"hnsw:{key}": value for key, value in settings.items()}
+
+
+def collection_hnsw(collection) -> Dict[str, int]:
+    """Settings a Chroma collection was built with (Chroma defaults for unset keys)."""
+    metadata = collection.metadata or {}
+    return {key: int(metadata.get(f"hnsw:{key}", CHROMA_DEFAULTS[key])) for key in HNSW_KEYS}
+
+
+def hnsw_differs(collection, settings: Dict[str, int]) -> bool:
+    """A collection was built with other values for any of these settings."""
+    built = collection_hnsw(collection)
+    return any(built[key] != value for key, value in settings.items())
+
+
+def _import_hnswlib():
+    try:
+        import hnswlib
+    except ImportError:
+        raise ImportError(
+            "hnswlib required for HNSW tuning (installed with chromadb). "
+            "Install with: pip install chroma-hnswlib"
+        )
+    return hnswlib
+
+
+def _normalize(vectors) -> np.ndarray:
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(matrix / norms)
+
+
+def sweep_hnsw(
+    vectors,
+    top_k: int = 10,
+    num_queries: int = 200,
+    m_values: Sequence[int] = DEFAULT_M_VALUES,
+    construction_ef_values: Sequence[int] = DEFAULT_CONSTRUCTION_EF_VALUES,
+    search_ef_values: Sequence[int] = DEFAULT_SEARCH_EF_VALUES,
+    seed: int = 0
+) -> List[Dict]:
+    """
+    Measure recall, latency and size for each HNSW parameter combination.
+
+    Args:
+        vectors: Stored embeddings (num_vectors x dims)
+        top_k: Neighbours compared per query (recall@top_k)
+        num_queries: Vectors held out of the graph and used as queries
+        m_values: Graph degrees to try
+        construction_ef_values: Build-time candidate lists to try
+        search_ef_values: Query-time candidate lists to try
+        seed: Sampling seed
+
+    Returns:
+        One dict per combination: M, construction_ef, search_ef, recall,
+        p50_ms, p99_ms, build_seconds and index_bytes
+    """
+    hnswlib = _import_hnswlib()
+
+    matrix = _normalize(vectors)
+    count, dims = matrix.shape
+    num_queries = min(num_queries, count // 10)
+    if num_queries == 0 or count - num_queries <= top_k:
+        raise ValueError(f"Too few vectors to tune ({count})")
+
+    held_out = np.zeros(count, dtype=bool)
+    held_out[np.random.default_rng(seed).choice(count, num_queries, replace=False)] = True
+    queries, indexed = matrix[held_out], matrix[~held_out]
+
+    # Exact neighbours among the indexed vectors
+    similarity = queries @ indexed.T
+    truth = np.argpartition(-similarity, top_k - 1, axis=1)[:, :top_k]
+
+    results = []
+    for m in m_values:
+        for construction_ef in construction_ef_values:
+            index = hnswlib.Index(space="l2", dim=dims)
+            index.init_index(max_elements=indexed.shape[0], M=m, ef_construction=construction_ef)
+            started = time.perf_counter()
+            index.add_items(indexed, np.arange(indexed.shape[0]))
+            build_seconds = time.perf_counter() - started
+
+            with tempfile.TemporaryDirectory() as tmp:
+                index_path = os.path.join(tmp, "index.bin")
+                index.save_index(index_path)
+                index_bytes = os.path.getsize(index_path)
+
+            # Single-query latency, like one API request
+            index.set_num_threads(1)
+            for search_ef in search_ef_values:
+                index.set_ef(max(search_ef, top_k))
+                latencies, hits = [], 0
+                for query, expected in zip(queries, truth):
+                    started = time.perf_counter()
+                    labels, _ = index.knn_query(query, k=top_k)
+                    latencies.append(time.perf_counter() - started)
+                    hits += len(set(labels[0].tolist()) & set(expected.tolist()))
+
+                results.append({
+                    "M": m,
+                    "construction_ef": construction_ef,
+                    "search_ef": search_ef,
+                    "recall": round(hits / (top_k * num_queries), 4),
+                    "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 3),
+                    "p99_ms": round(float(np.percentile(latencies, 99)) * 1000, 3),
+                    "build_seconds": round(build_seconds, 3),
+                    "index_bytes": index_bytes,
+                })
+            logger.info(f"Swept M={m}, construction_ef={construction_ef}")
+
+    return results
+
+
+def choose_hnsw(results: List[Dict], target_recall: float = 0.95) -> Dict:
+    """
+    Fastest combination (p99, then size) reaching target_recall.
+
+    Falls back to the highest recall when none reaches the target.
+    """
+    passing = [row for row in results if row["recall"] >= target_recall]
+    if not passing:
+        logger.warning(f"No HNSW setting reached recall {target_recall}; choosing the highest recall")
+        return max(results, key=lambda row: (row["recall"], -row["p99_ms"]))
+    return min(passing, key=lambda row: (row["p99_ms"], row["index_bytes"]))
+
+
+if __name__ == "__main__":
+    import argparse
+    from pathlib import Path
+
+    import chromadb
+    from chromadb.config import Settings
+    from .code_partitions import open_collection
+
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Sweep HNSW parameters for a collection and optionally rebuild it")
+    parser.add_argument("--collection", choices=["nova_docs", "cached_code"], required=True)
+    parser.add_argument("--persist-dir", default=None, help="Chroma directory (default: knowledge/vector_db)")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200, help="Held-out query vectors")
+    parser.add_argument("--target-recall", type=float, default=0.95)
+    parser.add_argument("--m", type=int, nargs="+", default=list(DEFAULT_M_VALUES))
+    parser.add_argument("--construction-ef", type=int, nargs="+", default=list(DEFAULT_CONSTRUCTION_EF_VALUES))
+    parser.add_argument("--search-ef", type=int, nargs="+", default=list(DEFAULT_SEARCH_EF_VALUES))
+    parser.add_argument("--apply", action="store_true", help="Rebuild the collection with the chosen settings")
+
+    args = parser.parse_args()
+    persist_dir = args.persist_dir or str(Path(__file__).parent.parent.parent.parent / "knowledge" / "vector_db")
+
+    client = chromadb.PersistentClient(path=persist_dir, settings=Settings(anonymized_telemetry=False))
+    collection = open_collection(client, args.collection)
+    vectors = np.asarray(collection.get(include=['embeddings'])['embeddings'], dtype=np.float32)
+    current = collection_hnsw(collection)
+
+    rows = sweep_hnsw(
+        vectors,
+        top_k=args.top_k,
+        num_queries=args.queries,
+        m_values=args.m,
+        construction_ef_values=args.construction_ef,
+        search_ef_values=args.search_ef
+    )
+    chosen = choose_hnsw(rows, args.target_recall)
+
+    print(f"\n{args.collection}: {len(vectors)} vectors, recall@{args.top_k} on held-out queries\n")
+    print(f"{'M':>4} {'c_ef':>5} {'s_ef':>5} {'recall':>7} {'p50 ms':>7} {'p99 ms':>7} {'build s':>8} {'MB':>7}")
+    for row in rows:
+        marker = "  <- chosen" if row is chosen else ""
+        print(
+            f"{row['M']:>4} {row['construction_ef']:>5} {row['search_ef']:>5} {row['recall']:>7.4f} "
+            f"{row['p50_ms']:>7.3f} {row['p99_ms']:>7.3f} {row['build_seconds']:>8.2f} "
+            f"{row['index_bytes'] / 1e6:>7.1f}{marker}"
+        )
+
+    settings = {key: chosen[key] for key in ("M", "construction_ef", "search_ef")}
+    report_path = os.path.join(persist_dir, f"hnsw_tuning_{args.collection}.json")
+    with open(report_path, "w") as f:
+        json.dump({
+            "collection": args.collection,
+            "entries": len(vectors),
+            "top_k": args.top_k,
+            "target_recall": args.target_recall,
+            "current": current,
+            "chosen": chosen,
+            "results": rows,
+            "tuned_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }, f, indent=2)
+    print(f"\nReport: {report_path}")
+
+    env_name = "DOCS_HNSW" if args.collection == "nova_docs" else "CODE_HNSW"
+    print(f"Chosen: {env_name}={format_hnsw(settings)}")
+
+    if args.apply:
+        del client
+        if args.collection == "nova_docs":
+            from .vector_store import VectorStore
+            service = VectorStore(persist_directory=persist_dir)
+        else:
+            from .code_cache_service import CodeCacheService
+            service = CodeCacheService(persist_directory=persist_dir, index_backend="chroma")
+        # Swept settings on top of the configured ones (batch_size, sync_threshold, ...)
+        settings = {**service.hnsw, **settings}
+        service.rebuild_collection(hnsw=settings)
+        print(f"Rebuilt {args.collection}. Set {env_name}={format_hnsw(settings)} so restarts keep these settings.")
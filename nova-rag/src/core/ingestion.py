@@ -0,0 +1,289 @@
+"""
+Ingestion - Token-aware bulk embedding with adaptive rate-limit backoff.
+
+Used by VectorStore.add_documents (startup load, /rag/reload). Instead of
+fixed 100-document batches with no retry, bulk embedding:
+
+- Packs batches by token budget (offline tokenizer) and provider input limits
+- Keeps several batches in flight at once
+- Backs off adaptively on 429s (honors Retry-After, halves concurrency,
+  then grows it back additively on success)
+- Splits a batch in half when the provider rejects it (400/413), so one
+  oversized chunk does not fail the whole load
+- Retries transient failures (connection errors, 5xx) with exponential backoff
+
+Configuration via environment:
+- INGEST_MAX_IN_FLIGHT: Concurrent embedding requests (default: 4)
+- INGEST_MAX_RETRIES: Retries per batch for rate limits/transient errors (default: 6)
+"""
+
+import os
+import time
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from .embedding_providers import EmbeddingProvider
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_IN_FLIGHT = int(os.getenv("INGEST_MAX_IN_FLIGHT", "4"))
+DEFAULT_MAX_RETRIES = int(os.getenv("INGEST_MAX_RETRIES", "6"))
+MAX_BACKOFF_SECONDS = 60.0
+
+
+def pack_batches(
+    texts: List[str],
+    count_tokens: Callable[[str], int],
+    max_tokens: int,
+    max_inputs: int
+) -> List[List[int]]:
+    """
+    Greedily pack texts into batches under a token and input budget.
+
+    A single text above max_tokens gets a batch of its own.
+
+    Args:
+        texts: Texts to pack (order is preserved)
+        count_tokens: Token counter
+        max_tokens: Token budget per batch
+        max_inputs: Max texts per batch
+
+    Returns:
+        List of batches, each a list of indices into texts
+    """
+    batches: List[List[int]] = []
+    current: List[int] = []
+    current_tokens = 0
+
+    for i, text in enumerate(texts):
+        tokens = count_tokens(text)
+        if current and (current_tokens + tokens > max_tokens or len(current) >= max_inputs):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+
+    if current:
+        batches.append(current)
+
+    return batches
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD limit on in-flight provider requests.
+
+    Rate limits halve the limit and pause new requests until the backoff
+    expires; each round of successes raises the limit by one.
+    """
+
+    def __init__(self, max_limit: int):
+        self.max_limit = max(1, max_limit)
+        self.limit = self.max_limit
+        self._in_flight = 0
+        self._successes = 0
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while True:
+                wait = self._paused_until - time.monotonic()
+                if wait <= 0 and self._in_flight < self.limit:
+                    self._in_flight += 1
+                    return
+                self._cond.wait(timeout=wait if wait > 0 else None)
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self):
+        with self._cond:
+            self._successes += 1
+            if self._successes >= self.limit and self.limit < self.max_limit:
+                self.limit += 1
+                self._successes = 0
+                self._cond.notify_all()
+
+    def on_rate_limit(self, delay: float):
+        with self._cond:
+            self.limit = max(1, self.limit // 2)
+            self._successes = 0
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            self._cond.notify_all()
+
+
+def _classify_error(error: Exception) -> str:
+    """Map a provider error to rate_limit / rejected / transient / fatal."""
+    status = getattr(error, "status_code", None)
+    if status == 429:
+        return "rate_limit"
+    if status in (400, 413):
+        return "rejected"
+    if status is None or status >= 500:
+        return "transient"
+    return "fatal"
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Seconds from a Retry-After header, if the provider sent one."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class BulkEmbedder:
+    """
+    Embed large text sets within provider limits at maximum sustained throughput.
+
+    Example:
+        >>> embedder = BulkEmbedder(provider)
+        >>> vectors = embedder.embed(texts, on_batch=lambda t, v: cache.put_many(model, t, v))
+    """
+
+    def __init__(
+        self,
+        provider: EmbeddingProvider,
+        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        token_budget: Optional[int] = None,
+        base_delay: float = 0.5
+    ):
+        """
+        Initialize bulk embedder.
+
+        Args:
+            provider: Embedding provider
+            max_in_flight: Max concurrent requests
+            max_retries: Retries per batch for rate limits/transient errors
+            token_budget: Tokens per request (default: 80% of provider limit)
+            base_delay: First backoff delay in seconds
+        """
+        self.provider = provider
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_retries = max_retries
+        self.token_budget = token_budget or int(provider.max_request_tokens * 0.8)
+        self.base_delay = base_delay
+        self._limiter = AdaptiveConcurrency(self.max_in_flight)
+        self._stats_lock = threading.Lock()
+        self.stats = {"requests": 0, "rate_limited": 0, "retries": 0, "splits": 0}
+
+    def embed(
+        self,
+        texts: List[str],
+        on_batch: Optional[Callable[[List[str], List[List[float]]], None]] = None
+    ) -> List[List[float]]:
+        """
+        Embed texts in token-packed batches, several in flight.
+
+        Args:
+            texts: Texts to embed
+            on_batch: Called with (texts, vectors) as each batch completes
+                      (e.g. to persist progress in the embedding cache)
+
+        Returns:
+            List of vectors aligned with texts
+        """
+        if not texts:
+            return []
+
+        batches = pack_batches(
+            texts,
+            self.provider.count_tokens,
+            self.token_budget,
+            self.provider.max_request_inputs
+        )
+        logger.info(
+            f"Embedding {len(texts)} texts in {len(batches)} token-packed batches "
+            f"(budget {self.token_budget} tokens, {self.max_in_flight} in flight)"
+        )
+
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        pool = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="ingest")
+
+        try:
+            futures = [
+                pool.submit(self._embed_batch, [texts[i] for i in batch], on_batch)
+                for batch in batches
+            ]
+            for batch, future in zip(batches, futures):
+                for i, vector in zip(batch, future.result()):
+                    results[i] = vector
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+        logger.info(f"Bulk embedding done: {self.stats}")
+        return results
+
+    def _embed_batch(
+        self,
+        texts: List[str],
+        on_batch: Optional[Callable[[List[str], List[List[float]]], None]]
+    ) -> List[List[float]]:
+        """Embed one batch with backoff, retries and splitting."""
+        attempt = 0
+
+        while True:
+            self._limiter.acquire()
+            try:
+                self._count("requests")
+                vectors = self.provider.embed(texts)
+            except Exception as e:
+                self._limiter.release()
+                kind = _classify_error(e)
+
+                if kind == "rejected" and len(texts) > 1:
+                    # Isolate the offending input(s) instead of failing the load
+                    self._count("splits")
+                    middle = len(texts) // 2
+                    logger.warning(f"Batch of {len(texts)} rejected ({e}), splitting")
+                    return (
+                        self._embed_batch(texts[:middle], on_batch)
+                        + self._embed_batch(texts[middle:], on_batch)
+                    )
+
+                if kind in ("rate_limit", "transient") and attempt < self.max_retries:
+                    delay = min(self.base_delay * (2 ** attempt), MAX_BACKOFF_SECONDS)
+                    delay = _retry_after(e) or delay * (0.5 + random.random() / 2)
+                    attempt += 1
+
+                    if kind == "rate_limit":
+                        self._count("rate_limited")
+                        self._limiter.on_rate_limit(delay)
+                        logger.warning(
+                            f"Rate limited, backing off {delay:.2f}s "
+                            f"(concurrency now {self._limiter.limit})"
+                        )
+                    else:
+                        self._count("retries")
+                        logger.warning(f"Embedding request failed ({e}), retrying in {delay:.2f}s")
+                        time.sleep(delay)
+                    continue
+
+                raise
+
+            self._limiter.release()
+            self._limiter.on_success()
+
+            if on_batch is not None:
+                on_batch(texts, vectors)
+            return vectors
+
+    def _count(self, key: str):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def get_stats(self) -> Dict[str, int]:
+        """Request, rate-limit, retry and split counters."""
+        with self._stats_lock:
+            return dict(self.stats)
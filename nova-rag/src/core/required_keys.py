@@ -0,0 +1,177 @@
+"""
+Required Keys - Compatibility of cached code with the caller's context keys.
+
+Every cached entry records the context keys its code reads (required_keys,
+extracted from the code when it was saved). Code whose required keys are not
+all in the caller's available_keys fails or misbehaves when NOVA runs it,
+yet search_code ranked it like any other match.
+
+RequiredKeysIndex is an inverted index over those keys:
+
+- Entries with the same required_keys value share one slot; each slot keeps
+  a bitset of its keys and the number of entries using it (entries are
+  tracked by id, so deletions, also those made by other instances sharing
+  the backend, take a value out of compatible() once no entry uses it)
+- Each key has a bitset of the slots that require it
+- compatible(available_keys) ORs the bitsets of the keys that are NOT
+  available and keeps every other slot: the required_keys values whose keys
+  are all available (required ⊆ available), a handful of big-int
+  operations however many entries there are
+
+The compatible values become a {"required_keys": {"$in": [...]}} filter, so
+every backend restricts the vector search to compatible entries (Chroma
+filters before walking HNSW).
+
+Key extraction is not exact (dynamic or conditional key access), so the
+check is opt-in per search or via the environment:
+
+- "off": no key check (default)
+- "strict": only compatible entries are searched
+- "penalty": every entry is searched; scores drop by KEY_PENALTY times the
+  fraction of required keys that are missing, then the threshold applies
+
+Configuration via environment:
+- CODE_CACHE_KEY_FILTER: Default key check, "off", "strict" or "penalty" (default: off)
+- CODE_CACHE_KEY_PENALTY: Score penalty for missing all required keys (default: 0.1)
+"""
+
+import os
+import threading
+from typing import Dict, Iterable, List, Optional
+
+KEY_FILTER_MODES = ("off", "strict", "penalty")
+DEFAULT_KEY_FILTER = os.getenv("CODE_CACHE_KEY_FILTER", "off").lower()
+KEY_PENALTY = float(os.getenv("CODE_CACHE_KEY_PENALTY", "0.1"))
+
+
+def resolve_key_filter(mode: Optional[str], available_keys: Optional[Iterable[str]]) -> str:
+    """
+    Key check to apply to one search ("off" when no available_keys are given).
+
+    Raises:
+        ValueError: If mode is unknown
+    """
+    mode = (mode or DEFAULT_KEY_FILTER).lower()
+    if mode not in KEY_FILTER_MODES:
+        raise ValueError(f"Unknown key filter '{mode}' (expected one of {', '.join(KEY_FILTER_MODES)})")
+    return mode if available_keys is not None else "off"
+
+
+def split_keys(required_keys: Optional[str]) -> List[str]:
+    """Keys of a stored required_keys value ("a,b" -> ["a", "b"])."""
+    return [key.strip() for key in (required_keys or "").split(",") if key.strip()]
+
+
+def missing_fraction(required_keys: Iterable[str], available_keys: Iterable[str]) -> float:
+    """Fraction of required keys not in available_keys (0 when nothing is required)."""
+    required = set(required_keys)
+    if not required:
+        return 0.0
+    return len(required - set(available_keys)) / len(required)
+
+
+def penalized_score(score: float, missing: float) -> float:
+    """Similarity lowered by KEY_PENALTY times the fraction of missing required keys."""
+    return max(score - KEY_PENALTY * missing, 0.0)
+
+
+class RequiredKeysIndex:
+    """
+    Inverted index from context keys to the required_keys values needing them.
+
+    Example:
+        >>> index = RequiredKeysIndex()
+        >>> index.add("invoice_pdf")
+        >>> index.add("email_user,email_password")
+        >>> index.add("")
+        >>> index.compatible(["invoice_pdf", "email_user"])
+        ['', 'invoice_pdf']
+    """
+
+    def __init__(self):
+        # slot -> stored required_keys value, its key bitset and entry count
+        self._values: List[str] = []
+        self._value_bits: List[int] = []
+        self._counts: List[int] = []
+        self._slots: Dict[str, int] = {}
+        # entry id -> its required_keys value
+        self._ids: Dict[str, str] = {}
+        # key -> bit number, and bitset of the slots requiring it
+        self._key_bits: Dict[str, int] = {}
+        self._postings: Dict[str, int] = {}
+        self._all = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Number of entries indexed."""
+        return sum(self._counts)
+
+    def add(self, required_keys: Optional[str], doc_id: Optional[str] = None):
+        """Index one entry by its stored required_keys value (re-adding an id replaces it)."""
+        value = required_keys or ""
+        with self._lock:
+            if doc_id is not None:
+                if self._ids.get(doc_id) == value:
+                    return
+                self._remove_locked(doc_id)
+                self._ids[doc_id] = value
+            slot = self._slots.get(value)
+            if slot is None:
+                slot = len(self._values)
+                bits = 0
+                for key in split_keys(value):
+                    bit = self._key_bits.setdefault(key, len(self._key_bits))
+                    bits |= 1 << bit
+                    self._postings[key] = self._postings.get(key, 0) | (1 << slot)
+                self._values.append(value)
+                self._value_bits.append(bits)
+                self._counts.append(0)
+                self._slots[value] = slot
+            self._all |= 1 << slot
+            self._counts[slot] += 1
+
+    def remove(self, doc_id: str):
+        """Unindex a deleted entry (added with its id)."""
+        with self._lock:
+            self._remove_locked(doc_id)
+
+    def _remove_locked(self, doc_id: str):
+        value = self._ids.pop(doc_id, None)
+        if value is None:
+            return
+        slot = self._slots[value]
+        self._counts[slot] -= 1
+        if not self._counts[slot]:
+            self._all &= ~(1 << slot)
+
+    def compatible(self, available_keys: Iterable[str]) -> List[str]:
+        """Stored required_keys values whose keys are all in available_keys."""
+        available = set(available_keys)
+        with self._lock:
+            blocked = 0
+            for key, slots in self._postings.items():
+                if key not in available:
+                    blocked |= slots
+            allowed = self._all & ~blocked
+            return [value for slot, value in enumerate(self._values) if allowed >> slot & 1]
+
+    def missing_fraction(self, required_keys: Optional[str], available_keys: Iterable[str]) -> float:
+        """Fraction of a stored required_keys value's keys not in available_keys."""
+        value = required_keys or ""
+        with self._lock:
+            slot = self._slots.get(value)
+            if slot is None:
+                return missing_fraction(split_keys(value), available_keys)
+            bits = self._value_bits[slot]
+            available = 0
+            for key in available_keys:
+                bit = self._key_bits.get(key)
+                if bit is not None:
+                    available |= 1 << bit
+        if not bits:
+            return 0.0
+        return bin(bits & ~available).count("1") / bin(bits).count("1")
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"keys": len(self._key_bits), "key_sets": sum(1 for count in self._counts if count)}
@@ -0,0 +1,257 @@
+"""
+Resilience - Latency budgets, circuit breaking and embedding-free matching.
+
+Searches used to wait as long as the embedding provider took, and returned
+[] or a 500 when it failed, so workflow nodes hung on a slow upstream. Now:
+
+- Each search may carry a latency budget (timeout_ms). If the embedding step
+  does not finish within it, the search is answered without embeddings.
+  The embedding keeps running in the background and lands in the embedding
+  cache, so the next identical query is fast again.
+- A circuit breaker opens after repeated provider errors/timeouts and
+  short-circuits straight to the degraded path until a trial call succeeds.
+- Degraded answers come from exact fingerprint matches (normalized text
+  hash stored at save time) and lexical token overlap, and are flagged as
+  degraded in the response.
+
+Configuration via environment:
+- SEARCH_TIMEOUT_MS: Default latency budget for the embedding step, 0 = none (default: 0)
+- EMBEDDING_BREAKER_FAILURES: Consecutive failures that open the breaker (default: 5)
+- EMBEDDING_BREAKER_RESET_SECONDS: Open time before a trial call (default: 30)
+"""
+
+import os
+import re
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SEARCH_TIMEOUT_MS = int(os.getenv("SEARCH_TIMEOUT_MS", "0"))
+DEFAULT_FAILURE_THRESHOLD = int(os.getenv("EMBEDDING_BREAKER_FAILURES", "5"))
+DEFAULT_RESET_SECONDS = float(os.getenv("EMBEDDING_BREAKER_RESET_SECONDS", "30"))
+
+_TOKEN_RE = re.compile(r"[a-z0-9_]+")
+
+# Runs sync embedding calls that have a deadline (the caller stops waiting,
+# the call itself finishes in the background and warms the cache)
+_deadline_pool: Optional[ThreadPoolExecutor] = None
+_deadline_pool_lock = threading.Lock()
+
+
+class EmbeddingUnavailable(Exception):
+    """The embedding step cannot be used for this request."""
+
+    def __init__(self, reason: str, message: str = ""):
+        super().__init__(message or reason)
+        self.reason = reason  # "timeout", "circuit_open" or "error"
+
+
+def resolve_timeout(timeout_ms: Optional[int]) -> Optional[float]:
+    """Latency budget in seconds (None = wait indefinitely)."""
+    if timeout_ms is None:
+        timeout_ms = DEFAULT_SEARCH_TIMEOUT_MS
+    return timeout_ms / 1000.0 if timeout_ms and timeout_ms > 0 else None
+
+
+def _get_deadline_pool() -> ThreadPoolExecutor:
+    global _deadline_pool
+    with _deadline_pool_lock:
+        if _deadline_pool is None:
+            _deadline_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="embed-deadline")
+        return _deadline_pool
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker for the embedding provider.
+
+    closed -> open after failure_threshold failures in a row; open -> half-open
+    after reset_seconds, when a single trial call is let through; its outcome
+    closes or re-opens the breaker.
+
+    Example:
+        >>> breaker = CircuitBreaker()
+        >>> vector = breaker.call(lambda: provider.embed([query])[0], timeout=0.3)
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        reset_seconds: float = DEFAULT_RESET_SECONDS
+    ):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self.rejected = 0
+        self.timeouts = 0
+        self.errors = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state_locked(time.monotonic())
+
+    def _state_locked(self, now: float) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if now - self._opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        """Whether a provider call may be attempted now."""
+        with self._lock:
+            state = self._state_locked(time.monotonic())
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info("Embedding circuit breaker closed (provider recovered)")
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        """Give up a half-open trial without an outcome (the caller went away)."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self, reason: str = "error"):
+        with self._lock:
+            if reason == "timeout":
+                self.timeouts += 1
+            else:
+                self.errors += 1
+
+            self._failures += 1
+            reopen = self._trial_in_flight
+            self._trial_in_flight = False
+
+            if reopen or (self._opened_at is None and self._failures >= self.failure_threshold):
+                self._opened_at = time.monotonic()
+                logger.warning(
+                    f"Embedding circuit breaker open for {self.reset_seconds}s "
+                    f"after {self._failures} consecutive failures"
+                )
+
+    def call(self, fn: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+        """
+        Run fn through the breaker within an optional deadline.
+
+        Args:
+            fn: Provider call
+            timeout: Seconds to wait (None = no deadline)
+
+        Returns:
+            fn's result
+
+        Raises:
+            EmbeddingUnavailable: breaker open, deadline exceeded or fn failed
+        """
+        if not self.allow():
+            raise EmbeddingUnavailable("circuit_open")
+
+        try:
+            if timeout is None:
+                result = fn()
+            else:
+                result = _get_deadline_pool().submit(fn).result(timeout=timeout)
+        except FutureTimeoutError:
+            self.record_failure("timeout")
+            raise EmbeddingUnavailable("timeout", f"embedding exceeded {timeout * 1000:.0f}ms budget")
+        except Exception as e:
+            self.record_failure()
+            raise EmbeddingUnavailable("error", str(e)) from e
+        except BaseException:
+            self.release_trial()
+            raise
+
+        self.record_success()
+        return result
+
+    async def acall(
+        self,
+        coro_fn: Callable[[], Awaitable[Any]],
+        timeout: Optional[float] = None
+    ) -> Any:
+        """Async variant of call (the coroutine is shielded past the deadline)."""
+        if not self.allow():
+            raise EmbeddingUnavailable("circuit_open")
+
+        task = asyncio.ensure_future(coro_fn())
+        try:
+            result = await asyncio.wait_for(asyncio.shield(task), timeout=timeout)
+        except asyncio.TimeoutError:
+            # Let it finish in the background (warms the embedding cache)
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self.record_failure("timeout")
+            raise EmbeddingUnavailable("timeout", f"embedding exceeded {timeout * 1000:.0f}ms budget")
+        except Exception as e:
+            self.record_failure()
+            raise EmbeddingUnavailable("error", str(e)) from e
+        except BaseException:
+            # Cancelled (client disconnect, a caller's wait_for): no outcome,
+            # but a half-open trial must not stay taken forever
+            self.release_trial()
+            raise
+
+        self.record_success()
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        """State and rejected/timeout/error counters."""
+        with self._lock:
+            return {
+                "state": self._state_locked(time.monotonic()),
+                "consecutive_failures": self._failures,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "errors": self.errors
+            }
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase and collapse whitespace (fingerprint input)."""
+    return " ".join(text.lower().split())
+
+
+def text_fingerprint(text: str) -> str:
+    """Exact-match fingerprint of a text, insensitive to case and spacing."""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def tokenize(text: str) -> Set[str]:
+    """Set of lowercase word tokens."""
+    return set(_TOKEN_RE.findall(text.lower()))
+
+
+def dice_similarity(a: Iterable[str], b: Iterable[str]) -> float:
+    """Dice coefficient of two token sets (0-1)."""
+    a, b = set(a), set(b)
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+def query_coverage(query_tokens: Iterable[str], doc_tokens: Iterable[str]) -> float:
+    """Fraction of query tokens present in the document (0-1)."""
+    query_tokens = set(query_tokens)
+    if not query_tokens:
+        return 0.0
+    return len(query_tokens & set(doc_tokens)) / len(query_tokens)
@@ -0,0 +1,687 @@
+"""
+Segments - Memory-mapped, read-only index segments shared across workers.
+
+Each uvicorn worker used to open its own chromadb.PersistentClient and keep
+its own copy of every index, so the service ran a single process. In
+multi-worker mode (RAG_WORKERS > 1):
+
+- One worker wins the writer lock. It owns Chroma, loads the docs, applies
+  every write, and publishes each collection as a segment:
+
+      <root>/<name>/CURRENT            - name of the live generation
+      <root>/<name>/<generation>/
+          vectors.f32.npy              - L2-normalized float32 matrix
+          records.json                 - ids, documents, metadatas
+          manifest.json                - count, dims, space, collection metadata
+
+  Publishing writes a new generation directory and then atomically replaces
+  CURRENT, so readers never see a half-written segment.
+
+  Between full exports the writer appends deltas to the live generation
+  (<generation>/deltas/<n>/, the same files plus the ids deleted since the
+  previous publish), and CURRENT names "<generation>+<n>". A burst of saves
+  or an eviction batch costs what it changed, not a re-export of the whole
+  collection; a new full generation is written only when the deltas pile
+  up (SEGMENT_MAX_DELTAS) or the generation is SEGMENT_COMPACT_SECONDS old.
+
+- The other workers are readers. They open segments with np.load(mmap_mode="r"),
+  so the vectors live once in the OS page cache no matter how many workers
+  map them. SegmentCollection exposes a segment through the subset of the
+  Chroma collection API that VectorStore and CodeCacheService use, so the
+  search code (degraded mode, single-flight, filters) is unchanged. It
+  picks up new generations as the writer publishes them, and maps only the
+  new deltas when the generation stays the same.
+
+- Readers never write. save_code, code cache clear and /rag/reload are put
+  in a spool directory, and the writer applies them in order.
+
+Configuration via environment:
+- RAG_WORKERS: Number of uvicorn workers; > 1 enables segments (default: 1)
+- SEGMENTS_DIR: Segment root (default: <vector_db>/segments)
+- SEGMENT_REFRESH_SECONDS: How often readers check for a new generation (default: 1)
+- SEGMENT_MAX_DELTAS: Deltas appended to a generation before the next full export (default: 32)
+- SEGMENT_COMPACT_SECONDS: Age of a generation after which the next change is
+  published as a full export instead of a delta (default: 300)
+"""
+
+import os
+import json
+import time
+import uuid
+import shutil
+import logging
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .exact_index import ExactIndex
+from .similarity import DEFAULT_SPACE, collection_space
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+RAG_WORKERS = int(os.getenv("RAG_WORKERS", "1"))
+DEFAULT_SEGMENTS_DIR = os.getenv("SEGMENTS_DIR") or str(
+    Path(__file__).parent.parent.parent.parent / "knowledge" / "vector_db" / "segments"
+)
+SEGMENT_REFRESH_SECONDS = float(os.getenv("SEGMENT_REFRESH_SECONDS", "1"))
+SEGMENT_MAX_DELTAS = int(os.getenv("SEGMENT_MAX_DELTAS", "32"))
+SEGMENT_COMPACT_SECONDS = float(os.getenv("SEGMENT_COMPACT_SECONDS", "300"))
+
+CURRENT_FILE = "CURRENT"
+VECTORS_FILE = "vectors.f32.npy"
+RECORDS_FILE = "records.json"
+MANIFEST_FILE = "manifest.json"
+DELTAS_DIR = "deltas"
+SPOOL_DIR = "spool"
+WRITER_LOCK_FILE = "writer.lock"
+
+
+def split_version(version: Optional[str]) -> Tuple[Optional[str], int]:
+    """("<generation>+<n>" or "<generation>") -> (generation, deltas)."""
+    if not version:
+        return None, 0
+    generation, _, deltas = version.partition("+")
+    return generation, int(deltas or 0)
+
+
+def _load_part(path: Path) -> Tuple[Dict[str, Any], ExactIndex, List[str]]:
+    """(manifest, index, deleted ids) of a generation or delta directory."""
+    with open(path / MANIFEST_FILE, encoding="utf-8") as f:
+        manifest = json.load(f)
+    with open(path / RECORDS_FILE, encoding="utf-8") as f:
+        records = json.load(f)
+
+    if manifest["count"]:
+        matrix = np.load(path / VECTORS_FILE, mmap_mode="r")
+    else:
+        matrix = np.zeros((0, manifest.get("dims") or 0), dtype=np.float32)
+
+    index = ExactIndex(
+        matrix,
+        records["documents"],
+        records["metadatas"],
+        space=manifest.get("space", "l2"),
+        ids=records["ids"],
+        normalized=True
+    )
+    return manifest, index, records.get("deleted", [])
+
+
+class Segment:
+    """
+    One published generation of a collection, vectors memory-mapped.
+
+    The generation's own rows come first, then each delta's; rows deleted
+    or replaced by a later delta are masked out.
+    """
+
+    def __init__(self, path: Path, deltas: int = 0, previous: Optional["Segment"] = None):
+        """
+        Args:
+            path: Generation directory
+            deltas: Number of deltas to apply
+            previous: Segment of the same generation already mapped, whose
+                      parts are reused (only newer deltas are read)
+        """
+        self.path = path
+        self.deltas = deltas
+        self.generation = path.name if not deltas else f"{path.name}+{deltas}"
+
+        if previous is not None and previous.path == path and previous.deltas <= deltas:
+            self.manifest = previous.manifest
+            self.parts = list(previous.parts)
+            self.live = list(previous.live)
+            self._rows = dict(previous._rows)
+            self.changes = list(previous.changes)
+            first = previous.deltas + 1
+        else:
+            self.manifest, base, _ = _load_part(path)
+            self.parts = [base]
+            self.live = [None]
+            self._rows = {doc_id: (0, row) for row, doc_id in enumerate(base.ids)}
+            # Per delta: [(op, id)], for readers keeping maps in step (see changes_since)
+            self.changes: List[List[Tuple[str, str]]] = []
+            first = 1
+
+        copied = set()
+
+        def drop(doc_id: str):
+            located = self._rows.pop(doc_id, None)
+            if located is None:
+                return
+            part, row = located
+            if part not in copied:
+                live = self.live[part]
+                self.live[part] = np.ones(len(self.parts[part]), dtype=bool) if live is None else live.copy()
+                copied.add(part)
+            self.live[part][row] = False
+
+        for number in range(first, deltas + 1):
+            _, index, deleted = _load_part(path / DELTAS_DIR / str(number))
+            for doc_id in deleted:
+                drop(doc_id)
+            part = len(self.parts)
+            self.parts.append(index)
+            self.live.append(None)
+            for row, doc_id in enumerate(index.ids):
+                # Re-published id (saved while a full export ran): latest wins
+                drop(doc_id)
+                self._rows[doc_id] = (part, row)
+            self.changes.append([("delete", doc_id) for doc_id in deleted] + [("add", doc_id) for doc_id in index.ids])
+
+        self._merged: Optional[ExactIndex] = None
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        return self.manifest.get("collection_metadata", {})
+
+    @property
+    def space(self) -> str:
+        return self.manifest.get("space", "l2")
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    @property
+    def index(self) -> ExactIndex:
+        """One ExactIndex over the live rows (the generation's own, until deltas are appended)."""
+        if len(self.parts) == 1 and self.live[0] is None:
+            return self.parts[0]
+        if self._merged is None:
+            rows = self.rows()
+            self._merged = ExactIndex(
+                self.vectors(rows),
+                [self.parts[part].documents[row] for part, row in rows],
+                [self.parts[part].metadatas[row] for part, row in rows],
+                space=self.space,
+                ids=[self.parts[part].ids[row] for part, row in rows],
+                normalized=True
+            )
+        return self._merged
+
+    def rows(self, conditions: Optional[Dict[str, Any]] = None) -> List[Tuple[int, int]]:
+        """(part, row) of the live rows matching flatten_where conditions, in publish order."""
+        conditions = conditions or {}
+        return [
+            (part, row)
+            for part, index in enumerate(self.parts)
+            for row, meta in enumerate(index.metadatas)
+            if (self.live[part] is None or self.live[part][row])
+            and all(where_matches(meta.get(field), value) for field, value in conditions.items())
+        ]
+
+    def vectors(self, rows: Sequence[Tuple[int, int]]) -> np.ndarray:
+        """Vectors of (part, row) pairs, in the given order."""
+        dims = next((index.matrix.shape[1] for index in self.parts if len(index)), 0)
+        vectors = np.empty((len(rows), dims), dtype=np.float32)
+        by_part: Dict[int, Tuple[List[int], List[int]]] = {}
+        for position, (part, row) in enumerate(rows):
+            positions, part_rows = by_part.setdefault(part, ([], []))
+            positions.append(position)
+            part_rows.append(row)
+        for part, (positions, part_rows) in by_part.items():
+            vectors[positions] = self.parts[part].matrix[part_rows]
+        return vectors
+
+    def count_where(self, field: str, value) -> int:
+        return sum(index.count_where(field, value, self.live[part]) for part, index in enumerate(self.parts))
+
+    def search_rows(
+        self,
+        query_embedding: Sequence[float],
+        top_k: int,
+        conditions: Optional[Dict[str, Any]] = None,
+        min_similarity: Optional[float] = None
+    ) -> List[Tuple[int, int, float]]:
+        """Exact top-k over every part: (part, row, distance), closest first."""
+        hits = [
+            (part, row, distance)
+            for part, index in enumerate(self.parts)
+            for row, distance in index.search_rows(
+                query_embedding, top_k, conditions, min_similarity, mask=self.live[part]
+            )
+        ]
+        hits.sort(key=lambda hit: hit[2])
+        return hits[:top_k]
+
+
+class SegmentStore:
+    """
+    Publish and open segments under a root directory.
+
+    Example:
+        >>> store = SegmentStore("/data/vector_db/segments")
+        >>> store.publish("docs", vector_store.collection)    # writer
+        >>> collection = store.collection("docs")              # readers
+    """
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        (self.root / SPOOL_DIR).mkdir(exist_ok=True)
+        self._lock_file = None
+
+    # --- Writer side ---
+
+    def try_acquire_writer(self) -> bool:
+        """
+        Try to become the single writer process (non-blocking).
+
+        The lock is held until the process exits.
+
+        Returns:
+            True if this process is the writer
+        """
+        if fcntl is None:
+            return True
+
+        lock_file = open(self.root / WRITER_LOCK_FILE, "a+")
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(str(os.getpid()))
+        lock_file.flush()
+        self._lock_file = lock_file
+        return True
+
+    def release_writer(self):
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def publish(self, name: str, collection) -> str:
+        """
+        Export a Chroma collection as a new generation and make it current.
+
+        Args:
+            name: Segment name ("docs", "code")
+            collection: ChromaDB collection to export
+
+        Returns:
+            The new generation name
+        """
+        results = collection.get(include=['embeddings', 'documents', 'metadatas'])
+        collection_metadata = dict(collection.metadata or {})
+
+        segment_dir = self.root / name
+        segment_dir.mkdir(parents=True, exist_ok=True)
+        generation = f"{time.time_ns()}-{os.getpid()}"
+        staging = segment_dir / f".{generation}"
+
+        count, nbytes = self._write_part(staging, results, {
+            "space": collection_space(collection),
+            "collection_metadata": collection_metadata,
+            "default_dims": collection_metadata.get("embedding_dimensions", 0)
+        })
+        try:
+            os.replace(staging, segment_dir / generation)
+            _atomic_write(segment_dir / CURRENT_FILE, generation)
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        self._collect_garbage(segment_dir, keep={generation})
+        logger.info(f"Published segment {name}/{generation}: {count} vectors ({nbytes / 1024:.0f} KiB)")
+        return generation
+
+    def publish_changes(
+        self,
+        name: str,
+        collection,
+        added_ids: Sequence[str],
+        deleted_ids: Sequence[str]
+    ) -> str:
+        """
+        Publish what changed since the last publish.
+
+        Appends a delta (the added entries, the deleted ids) to the current
+        generation; exports a new generation instead when there is none yet,
+        it has SEGMENT_MAX_DELTAS deltas, or it is SEGMENT_COMPACT_SECONDS old.
+
+        Args:
+            name: Segment name
+            collection: ChromaDB collection the changes were made to
+            added_ids: Entries added since the last publish
+            deleted_ids: Entries deleted since the last publish
+
+        Returns:
+            The new version ("<generation>+<n>" for a delta)
+        """
+        generation, deltas = split_version(self.current_generation(name))
+        if (
+            generation is None
+            or deltas >= SEGMENT_MAX_DELTAS
+            or time.time_ns() - int(generation.split("-")[0]) >= SEGMENT_COMPACT_SECONDS * 1e9
+        ):
+            return self.publish(name, collection)
+
+        results = collection.get(ids=list(added_ids), include=['embeddings', 'documents', 'metadatas']) \
+            if added_ids else {'ids': [], 'embeddings': [], 'documents': [], 'metadatas': []}
+        generation_dir = self.root / name / generation
+        number = deltas + 1
+        staging = generation_dir / DELTAS_DIR / f".{number}"
+        (generation_dir / DELTAS_DIR).mkdir(exist_ok=True)
+        shutil.rmtree(staging, ignore_errors=True)
+
+        count, _ = self._write_part(staging, results, {"space": collection_space(collection)}, deleted=list(deleted_ids))
+        version = f"{generation}+{number}"
+        try:
+            target = generation_dir / DELTAS_DIR / str(number)
+            shutil.rmtree(target, ignore_errors=True)
+            os.replace(staging, target)
+            _atomic_write(self.root / name / CURRENT_FILE, version)
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        logger.info(f"Published segment delta {name}/{version}: {count} added, {len(deleted_ids)} deleted")
+        return version
+
+    @staticmethod
+    def _write_part(
+        staging: Path,
+        results: Dict[str, Any],
+        manifest: Dict[str, Any],
+        deleted: Optional[List[str]] = None
+    ) -> Tuple[int, int]:
+        """Write vectors, records and manifest into a new directory; returns (count, vector bytes)."""
+        embeddings = results['embeddings']
+        count = len(results['ids'])
+
+        matrix = np.asarray(embeddings if count else np.zeros((0, 0)), dtype=np.float32)
+        if count:
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            matrix = np.ascontiguousarray(matrix / norms)
+
+        default_dims = manifest.pop("default_dims", 0)
+        manifest = {
+            "count": count,
+            "dims": int(matrix.shape[1]) if count else default_dims,
+            **manifest,
+            "created_at": datetime.now().isoformat()
+        }
+        records = {
+            "ids": results['ids'],
+            "documents": results['documents'],
+            "metadatas": results['metadatas']
+        }
+        if deleted is not None:
+            records["deleted"] = deleted
+
+        staging.mkdir()
+        try:
+            np.save(staging / VECTORS_FILE, matrix)
+            with open(staging / RECORDS_FILE, "w", encoding="utf-8") as f:
+                json.dump(records, f, ensure_ascii=False)
+            with open(staging / MANIFEST_FILE, "w", encoding="utf-8") as f:
+                json.dump(manifest, f, indent=2)
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        return count, matrix.nbytes
+
+    def _collect_garbage(self, segment_dir: Path, keep: set):
+        """Drop all but the newest generations (readers finish on unlinked mmaps)."""
+        generations = sorted(
+            (path for path in segment_dir.iterdir() if path.is_dir() and not path.name.startswith(".")),
+            key=lambda path: path.name
+        )
+        for path in generations[:-2]:
+            if path.name not in keep:
+                shutil.rmtree(path, ignore_errors=True)
+
+    # --- Reader side ---
+
+    def current_generation(self, name: str) -> Optional[str]:
+        """Live version of a segment: "<generation>" or "<generation>+<deltas>"."""
+        try:
+            return (self.root / name / CURRENT_FILE).read_text(encoding="utf-8").strip() or None
+        except FileNotFoundError:
+            return None
+
+    def open(self, name: str, previous: Optional[Segment] = None) -> Optional[Segment]:
+        """
+        Open the current version of a segment (None if never published).
+
+        Args:
+            name: Segment name
+            previous: Segment mapped before; if the generation is the same,
+                      only the deltas appended since are read
+        """
+        for _ in range(3):
+            generation, deltas = split_version(self.current_generation(name))
+            if generation is None:
+                return None
+            try:
+                return Segment(self.root / name / generation, deltas, previous)
+            except FileNotFoundError:
+                # Garbage-collected between reading CURRENT and opening it
+                continue
+        return None
+
+    def collection(self, name: str, metadata: Optional[Dict[str, Any]] = None) -> "SegmentCollection":
+        """Read-only, auto-refreshing collection view of a segment."""
+        return SegmentCollection(self, name, metadata)
+
+    # --- Write spool (readers -> writer) ---
+
+    def enqueue(self, op: str, **payload):
+        """Queue a write for the writer process."""
+        entry = {"op": op, "queued_at": datetime.now().isoformat(), **payload}
+        filename = f"{time.time_ns()}-{uuid.uuid4().hex[:8]}.json"
+        _atomic_write(self.root / SPOOL_DIR / filename, json.dumps(entry, ensure_ascii=False))
+        logger.info(f"Queued {op} for the writer process")
+
+    def drain(self) -> List[Dict[str, Any]]:
+        """Take queued writes in arrival order (writer only)."""
+        spool = self.root / SPOOL_DIR
+        entries = []
+        for path in sorted(spool.glob("*.json")):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    entries.append(json.load(f))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Dropping unreadable spool entry {path.name}: {e}")
+            path.unlink(missing_ok=True)
+        return entries
+
+
+def _atomic_write(path: Path, text: str):
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class SegmentCollection:
+    """
+    Read-only stand-in for a Chroma collection, backed by a segment.
+
+    Supports count(), get() and query() with equality/$and where filters,
+    which is what VectorStore and CodeCacheService call on the read path.
+    query() also takes min_similarity, like CodeIndex (threshold pushdown).
+    """
+
+    def __init__(self, store: SegmentStore, name: str, metadata: Optional[Dict[str, Any]] = None):
+        self.store = store
+        self.name = name
+        self._default_metadata = metadata or {}
+        self._segment: Optional[Segment] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _current(self) -> Optional[Segment]:
+        """The live segment, reopened if the writer published a new generation."""
+        now = time.monotonic()
+        if now - self._checked_at < SEGMENT_REFRESH_SECONDS:
+            return self._segment
+
+        with self._lock:
+            if now - self._checked_at >= SEGMENT_REFRESH_SECONDS:
+                generation = self.store.current_generation(self.name)
+                if generation is not None and (
+                    self._segment is None or self._segment.generation != generation
+                ):
+                    segment = self.store.open(self.name, self._segment)
+                    if segment is not None:
+                        self._segment = segment
+                        logger.info(f"Mapped segment {self.name}/{segment.generation} ({len(segment)} vectors)")
+                self._checked_at = now
+        return self._segment
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        segment = self._current()
+        return segment.metadata if segment is not None else self._default_metadata
+
+    @property
+    def space(self) -> str:
+        segment = self._current()
+        return segment.space if segment is not None else DEFAULT_SPACE
+
+    @property
+    def generation(self) -> Optional[str]:
+        """Generation of the live segment (None before the first publish)."""
+        segment = self._current()
+        return segment.generation if segment is not None else None
+
+    @property
+    def exact_index(self) -> Optional[ExactIndex]:
+        """ExactIndex over the live segment (None before the first publish)."""
+        segment = self._current()
+        return segment.index if segment is not None else None
+
+    def count(self) -> int:
+        segment = self._current()
+        return len(segment) if segment is not None else 0
+
+    def change_version(self) -> Optional[str]:
+        """Version of the live segment (see changes_since)."""
+        return self.generation
+
+    def changes_since(self, version: Optional[str]) -> Optional[Tuple[Optional[str], List[Tuple[str, str]]]]:
+        """
+        Deltas appended after version, like CodeIndex.changes_since.
+
+        Returns:
+            (live version, [(op, id)]), or None if a new generation replaced
+            the one version belongs to
+        """
+        segment = self._current()
+        if segment is None:
+            return (None, []) if version is None else None
+        if segment.generation == version:
+            return version, []
+        generation, deltas = split_version(version)
+        if generation != segment.path.name or deltas > segment.deltas:
+            return None
+        return segment.generation, [change for delta in segment.changes[deltas:] for change in delta]
+
+    def partition_count(self, workflow_id: Any) -> int:
+        """Entries of one workflow in the live segment."""
+        segment = self._current()
+        return segment.count_where("workflow_id", workflow_id) if segment is not None else 0
+
+    def modify(self, **kwargs):
+        raise RuntimeError(f"Segment collection '{self.name}' is read-only")
+
+    def add(self, **kwargs):
+        raise RuntimeError(f"Segment collection '{self.name}' is read-only (writes go through the writer process)")
+
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[Dict] = None,
+        include: Optional[List[str]] = None,
+        **kwargs
+    ) -> Dict[str, Any]:
+        include = include or ['documents', 'metadatas']
+        segment = self._current()
+        rows = segment.rows(flatten_where(where)) if segment is not None else []
+        if ids is not None:
+            wanted = set(ids)
+            rows = [(part, row) for part, row in rows if segment.parts[part].ids[row] in wanted]
+
+        parts = segment.parts if segment is not None else []
+        return {
+            'ids': [parts[part].ids[row] for part, row in rows],
+            'documents': [parts[part].documents[row] for part, row in rows] if 'documents' in include else None,
+            'metadatas': [parts[part].metadatas[row] for part, row in rows] if 'metadatas' in include else None,
+            'embeddings': (segment.vectors(rows) if rows else []) if 'embeddings' in include else None,
+        }
+
+    def query(
+        self,
+        query_embeddings: List[List[float]],
+        n_results: int = 10,
+        where: Optional[Dict] = None,
+        include: Optional[List[str]] = None,
+        min_similarity: Optional[float] = None,
+        **kwargs
+    ) -> Dict[str, Any]:
+        include = include or ['documents', 'metadatas', 'distances']
+        segment = self._current()
+        result = {'ids': [], 'documents': [], 'metadatas': [], 'distances': []}
+
+        for query_embedding in query_embeddings:
+            hits = []
+            if segment is not None:
+                hits = segment.search_rows(query_embedding, n_results, flatten_where(where), min_similarity)
+            parts = segment.parts if segment is not None else []
+            result['ids'].append([parts[part].ids[row] for part, row, _ in hits])
+            result['documents'].append([parts[part].documents[row] for part, row, _ in hits])
+            result['metadatas'].append([parts[part].metadatas[row] for part, row, _ in hits])
+            result['distances'].append([distance for _, _, distance in hits])
+
+        return {key: value for key, value in result.items() if key == 'ids' or key in include}
+
+
+def flatten_where(where: Optional[Dict]) -> Dict[str, Any]:
+    """
+    Conditions from a Chroma where clause ({field: value} or $and).
+
+    Equality conditions map a field to its value; {"$in": [...]} conditions
+    map it to a frozenset of accepted values (see where_matches).
+    """
+    if not where:
+        return {}
+    if "$and" in where:
+        conditions = {}
+        for clause in where["$and"]:
+            conditions.update(flatten_where(clause))
+        return conditions
+
+    conditions = {}
+    for field, value in where.items():
+        if isinstance(value, dict):
+            if set(value) == {"$in"}:
+                value = frozenset(value["$in"])
+            elif set(value) == {"$eq"}:
+                value = value["$eq"]
+            else:
+                raise ValueError(f"Only equality and $in filters are supported, got {value}")
+        conditions[field] = value
+    return conditions
+
+
+def where_matches(actual: Any, condition: Any) -> bool:
+    """A metadata value satisfies one flatten_where condition."""
+    if isinstance(condition, frozenset):
+        return actual in condition
+    return actual == condition
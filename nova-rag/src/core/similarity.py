@@ -0,0 +1,54 @@
+"""
+Similarity - One definition of similarity for every search path.
+
+Similarity is the cosine similarity between the query and a stored vector,
+clipped to [0, 1] (higher = closer). It is what /rag/query and /code/search
+report as `score` and what code search thresholds compare against,
+whatever index answered the query.
+
+Indexes report distances on the scale of their space; these helpers convert
+exactly (embeddings are unit-normalized):
+- "cosine" (new Chroma collections): distance = 1 - similarity
+- "ip": distance = 1 - similarity
+- "l2" (Chroma's default, collections created before cosine was the
+  default; also the file and pgvector code indexes): squared L2 distance
+  = 2 - 2 * similarity
+
+Existing "l2" Chroma collections keep working and are rebuilt in cosine
+space at startup (see dimension_migration.rebuild_collection).
+
+Example:
+    >>> space = collection_space(collection)
+    >>> results = collection.query(query_embeddings=[vector], n_results=5)
+    >>> scores = [to_similarity(d, space) for d in results['distances'][0]]
+"""
+
+from typing import Union
+
+import numpy as np
+
+# Space of newly created Chroma collections
+DEFAULT_SPACE = "cosine"
+
+Number = Union[float, np.ndarray]
+
+
+def collection_space(collection) -> str:
+    """Distance space of a collection or index (Chroma's "l2" if unrecorded)."""
+    space = getattr(collection, "space", None)
+    if space:
+        return space
+    return (collection.metadata or {}).get("hnsw:space", "l2")
+
+
+def to_similarity(distance: Number, space: str) -> Number:
+    """Distance in `space` -> similarity in [0, 1]."""
+    similarity = 1.0 - distance / 2.0 if space == "l2" else 1.0 - distance
+    return np.clip(similarity, 0.0, 1.0) if isinstance(similarity, np.ndarray) else min(max(similarity, 0.0), 1.0)
+
+
+def to_distance(similarity: Number, space: str) -> Number:
+    """Cosine similarity -> distance in `space` (inverse of to_similarity)."""
+    if space == "l2":
+        return np.maximum(2.0 - 2.0 * similarity, 0.0)
+    return 1.0 - similarity
@@ -0,0 +1,95 @@
+"""
+Single Flight - Coalesce identical in-flight calls.
+
+When several callers ask for the same thing at the same time (fan-out bursts,
+workflow replays), only the first one does the work; the others wait for its
+result instead of repeating the embedding call and the Chroma query.
+
+Supports both sync callers (threads) and async callers (event loop).
+"""
+
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Deduplicate concurrent calls that share a key.
+
+    Example:
+        >>> flight = SingleFlight()
+        >>> result = flight.do(("search", query), lambda: expensive(query))
+        >>> result = await flight.ado(("search", query), lambda: aexpensive(query))
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+        self._async_calls: Dict[Hashable, asyncio.Future] = {}
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """
+        Run fn once for all concurrent callers with the same key.
+
+        Args:
+            key: Hashable identity of the request
+            fn: Work to run if no identical call is in flight
+
+        Returns:
+            fn's result (shared between coalesced callers)
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+        return future.result()
+
+    async def ado(self, key: Hashable, coro_fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Async variant of do (callers on the same event loop).
+
+        Args:
+            key: Hashable identity of the request
+            coro_fn: Coroutine factory to run if no identical call is in flight
+
+        Returns:
+            The coroutine's result (shared between coalesced callers)
+        """
+        task = self._async_calls.get(key)
+
+        if task is None:
+            task = asyncio.ensure_future(coro_fn())
+            self._async_calls[key] = task
+            task.add_done_callback(lambda _: self._async_calls.pop(key, None))
+        else:
+            self.coalesced += 1
+
+        # Shield so one cancelled caller does not cancel the shared work
+        return await asyncio.shield(task)
+
+    @property
+    def in_flight(self) -> int:
+        """Number of distinct calls currently running."""
+        return len(self._calls) + len(self._async_calls)
@@ -2,7 +2,25 @@
 Vector Store Manager - Chroma-based document retrieval for AI code generation.
 
 This module manages the vector database for storing and retrieving documentation.
-Uses ChromaDB with sentence-transformers for embeddings.
+Uses ChromaDB with a pluggable embedding provider (OpenAI or local CPU model).
+
+Queries run in one of three modes:
+- "vector": nearest neighbours of the query embedding
+- "hybrid": vector and BM25 rankings merged by reciprocal rank fusion, so
+  identifier queries ("fitz.open", "psycopg2") surface the chunks that
+  name them (see lexical_index). Results come in fused order, reported
+  as fused_score next to the cosine score, which is then not monotonic
+- "lexical": BM25 only, no embedding call
+
+BM25 runs over the in-memory snapshot (SourceIndexes, or the segment in reader
+workers); without one, hybrid falls back to vector search and lexical to a
+token-coverage scan of the collection.
+
+The writer's snapshot holds one index per source (see exact_index), so
+replace_source() reloads one library's docs without rebuilding the others.
+
+Configuration via environment:
+- DOCS_SEARCH_MODE: Default query mode (default: vector)
 """
 
 import os
@@ -13,15 +31,36 @@ from pathlib import Path
 try:
     import chromadb
     from chromadb.config import Settings
-    from openai import OpenAI
 except ImportError:
     raise ImportError(
-        "ChromaDB and OpenAI required. "
-        "Install with: pip install chromadb openai"
+        "ChromaDB required. "
+        "Install with: pip install chromadb"
     )
 
+from .embedding_cache import EmbeddingCache, DEFAULT_FILENAME as EMBEDDING_CACHE_FILENAME
+from .dimension_migration import (
+    DOCS_EMBEDDING_DIMENSIONS, collection_dimensions, rebuild_collection, recover_dimension_migration
+)
+from .hnsw_tuning import DOCS_HNSW, DOCS_HNSW_DEFAULTS, hnsw_differs, hnsw_metadata, resolve_hnsw
+from .similarity import DEFAULT_SPACE, collection_space, to_similarity
+from .embedding_providers import (
+    EmbeddingProvider, get_embedding_provider, check_collection_provider, validate_query_embedding,
+    resolve_dimensions, reduce_dimensions
+)
+from .executors import run_in_chroma_executor
+from .embedding_scheduler import Priority
+from .exact_index import SourceIndexes, EXACT_SEARCH_ENABLED
+from .segments import SegmentCollection, SegmentStore
+from .ingestion import BulkEmbedder
+from .resilience import (
+    CircuitBreaker, EmbeddingUnavailable, resolve_timeout, tokenize, query_coverage
+)
+
 logger = logging.getLogger(__name__)
 
+SEARCH_MODES = ("vector", "hybrid", "lexical")
+DOCS_SEARCH_MODE = os.getenv("DOCS_SEARCH_MODE", "vector").lower()
+
 
 class VectorStore:
     """
@@ -29,7 +68,8 @@ class VectorStore:
 
     Uses:
     - ChromaDB for vector storage (local, persistent)
-    - sentence-transformers/all-MiniLM-L6-v2 for embeddings (384 dims)
+    - EmbeddingProvider for embeddings (OpenAI text-embedding-3-small by default,
+      or local all-MiniLM-L6-v2 with EMBEDDING_PROVIDER=local)
 
     Example:
         >>> store = VectorStore()
@@ -45,7 +85,14 @@ class VectorStore:
     def __init__(
         self,
         persist_directory: Optional[str] = None,
-        collection_name: str = "nova_docs"
+        collection_name: str = "nova_docs",
+        embedding_cache: Optional[EmbeddingCache] = None,
+        embedding_provider: Optional[EmbeddingProvider] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        collection=None,
+        segment_store: Optional[SegmentStore] = None,
+        dimensions: Optional[int] = None,
+        hnsw: Optional[Dict[str, int]] = None
     ):
         """
         Initialize vector store.
@@ -54,6 +101,23 @@ class VectorStore:
             persist_directory: Where to store the Chroma DB.
                               Defaults to /nova/knowledge/vector_db
             collection_name: Name of the collection (default: "nova_docs")
+            embedding_cache: Optional embedding cache to reuse.
+                             Defaults to one stored next to the Chroma DB.
+            embedding_provider: Optional embedding provider to reuse.
+                                Defaults to the one selected by EMBEDDING_PROVIDER.
+            circuit_breaker: Optional breaker for the query embedding step
+                             (shared with CodeCacheService in the API)
+            collection: Optional prebuilt collection, e.g. a read-only
+                        SegmentCollection in reader workers (no Chroma client
+                        is opened and the collection cannot be written)
+            segment_store: Writer only - publish the collection as a shared
+                           segment after every load
+            dimensions: Stored vector size for new collections (defaults to
+                        DOCS_EMBEDDING_DIMENSIONS, 0 = model size). An existing
+                        collection keeps its size until rebuild_collection().
+            hnsw: HNSW settings for new collections (defaults to DOCS_HNSW, see
+                  hnsw_tuning). When given or set in the environment, an
+                  existing collection built otherwise is rebuilt.
         """
         # Default persist directory
         if persist_directory is None:
@@ -66,34 +130,85 @@ class VectorStore:
         # Ensure directory exists
         os.makedirs(persist_directory, exist_ok=True)
 
-        # Initialize ChromaDB client with persistence
-        self.client = chromadb.PersistentClient(
-            path=persist_directory,
-            settings=Settings(
-                anonymized_telemetry=False,  # Disable telemetry
-                allow_reset=True
+        # Initialize ChromaDB client with persistence (not in reader workers)
+        self.client = None
+        if collection is None:
+            self.client = chromadb.PersistentClient(
+                path=persist_directory,
+                settings=Settings(
+                    anonymized_telemetry=False,  # Disable telemetry
+                    allow_reset=True
+                )
             )
+        self.segment_store = segment_store
+
+        # Embedding provider (OpenAI or local CPU model, see EMBEDDING_PROVIDER)
+        if embedding_provider is None:
+            embedding_provider = get_embedding_provider()
+        self.embedding_provider = embedding_provider
+        self.embedding_model_name = embedding_provider.model_name
+        logger.info(f"Using embedding provider: {embedding_provider}")
+        self.target_dimensions = resolve_dimensions(
+            embedding_provider, DOCS_EMBEDDING_DIMENSIONS if dimensions is None else dimensions
         )
+        self.hnsw = resolve_hnsw(hnsw, DOCS_HNSW, DOCS_HNSW_DEFAULTS)
+        self._hnsw_configured = hnsw is not None or bool(DOCS_HNSW)
+
+        # Embedding cache (skips provider calls for already-embedded texts)
+        if embedding_cache is None:
+            embedding_cache = EmbeddingCache(
+                os.path.join(persist_directory, EMBEDDING_CACHE_FILENAME)
+            )
+        self.embedding_cache = embedding_cache
 
-        # Initialize OpenAI client for embeddings
-        logger.info("Initializing OpenAI client for embeddings...")
-        self.openai_client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-        self.embedding_model_name = "text-embedding-3-small"
-        logger.info(f"Using OpenAI embedding model: {self.embedding_model_name}")
+        # Queries fall back to lexical ranking when the provider is slow or failing
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
 
         # Get or create collection
-        try:
-            self.collection = self.client.get_collection(
-                name=collection_name
-            )
-            logger.info(f"Loaded existing collection: {collection_name}")
-            logger.info(f"Collection size: {self.collection.count()} documents")
-        except Exception:
-            self.collection = self.client.create_collection(
-                name=collection_name,
-                metadata={"description": "NOVA AI documentation for code generation"}
-            )
-            logger.info(f"Created new collection: {collection_name}")
+        if collection is not None:
+            self.collection = collection
+            logger.info(f"Using read-only collection: {collection.name}")
+        else:
+            recover_dimension_migration(self.client, collection_name)
+            try:
+                self.collection = self.client.get_collection(
+                    name=collection_name
+                )
+                logger.info(f"Loaded existing collection: {collection_name}")
+                logger.info(f"Collection size: {self.collection.count()} documents")
+            except Exception:
+                self.collection = self._create_collection()
+                logger.info(f"Created new collection: {collection_name}")
+
+        # Refuse to mix vectors from different embedding models
+        check_collection_provider(self.collection, self.embedding_provider)
+
+        # In-memory exact-search snapshot (see exact_index), rebuilt after loads.
+        # Segment-backed collections already search a shared mmapped matrix.
+        self.exact_search = EXACT_SEARCH_ENABLED and collection is None
+        self._exact_index: Optional[SourceIndexes] = None
+        # Set by clear(keep_index=True): the next rebuild must drop sources that are gone
+        self._full_rebuild = False
+        if self.exact_search and self.collection.count() > 0:
+            self.rebuild_exact_index()
+
+    def _create_collection(self, dimensions: Optional[int] = None):
+        """Create the collection (cosine space), recording the embedding provider, vector size and HNSW settings."""
+        return self.client.create_collection(
+            name=self.collection_name,
+            metadata={
+                "description": "NOVA AI documentation for code generation",
+                **self.embedding_provider.collection_metadata(),
+                "embedding_dimensions": dimensions or self.target_dimensions or 0,
+                "hnsw:space": DEFAULT_SPACE,
+                **hnsw_metadata(self.hnsw)
+            }
+        )
+
+    @property
+    def dimensions(self) -> Optional[int]:
+        """Vector size the current collection stores."""
+        return collection_dimensions(self.collection, self.target_dimensions)
 
     def add_documents(
         self,
@@ -109,7 +224,8 @@ class VectorStore:
                 - source (optional): Source library (e.g., "pymupdf", "easyocr")
                 - topic (optional): Topic/category (e.g., "opening", "text_extraction")
                 - metadata (optional): Additional metadata dict
-            batch_size: Process in batches to avoid memory issues
+            batch_size: Documents per Chroma write. Embedding requests are
+                        packed separately by token budget (see BulkEmbedder).
 
         Returns:
             Number of documents added
@@ -130,44 +246,16 @@ class VectorStore:
 
         logger.info(f"Adding {len(documents)} documents to vector store...")
 
+        # Embed everything first (token-packed, concurrent, with backoff).
+        # Completed batches are cached, so a failed load resumes where it stopped.
+        embeddings = self._embed_bulk([doc['text'] for doc in documents])
+
         added_count = 0
 
-        # Process in batches
+        # Write to Chroma in batches
         for i in range(0, len(documents), batch_size):
             batch = documents[i:i + batch_size]
-
-            # Extract texts and metadata
-            texts = [doc['text'] for doc in batch]
-
-            # Generate unique IDs
-            ids = [f"doc_{self.collection.count() + j}" for j in range(len(batch))]
-
-            # Build metadata for each document
-            metadatas = []
-            for doc in batch:
-                meta = {
-                    'source': doc.get('source', 'unknown'),
-                    'topic': doc.get('topic', 'general'),
-                }
-                # Add any additional metadata
-                if 'metadata' in doc:
-                    meta.update(doc['metadata'])
-                metadatas.append(meta)
-
-            # Generate embeddings with OpenAI (batch)
-            response = self.openai_client.embeddings.create(
-                input=texts,
-                model=self.embedding_model_name
-            )
-            embeddings = [item.embedding for item in response.data]
-
-            # Add to collection
-            self.collection.add(
-                ids=ids,
-                embeddings=embeddings,
-                documents=texts,
-                metadatas=metadatas
-            )
+            self._write_batch(batch, embeddings[i:i + batch_size])
 
             added_count += len(batch)
             logger.debug(f"Added batch {i // batch_size + 1}: {len(batch)} documents")
@@ -175,14 +263,121 @@ class VectorStore:
         logger.info(f"Successfully added {added_count} documents")
         logger.info(f"Total documents in collection: {self.collection.count()}")
 
+        self.rebuild_exact_index(self._sources(documents))
+        self.publish_segment()
+
         return added_count
 
+    def add_embedded_documents(
+        self,
+        documents: List[Dict[str, str]],
+        embeddings: List[List[float]],
+        batch_size: int = 500
+    ) -> int:
+        """
+        Add documents with precomputed embeddings (no provider calls).
+
+        Used to bulk-load the prebuilt corpus artifact on startup.
+
+        Args:
+            documents: Same format as add_documents
+            embeddings: Vectors aligned with documents
+            batch_size: Documents per Chroma write
+
+        Returns:
+            Number of documents added
+        """
+        if len(documents) != len(embeddings):
+            raise ValueError("documents and embeddings must have the same length")
+
+        for i in range(0, len(documents), batch_size):
+            self._write_batch(documents[i:i + batch_size], embeddings[i:i + batch_size])
+
+        logger.info(f"Bulk-loaded {len(documents)} pre-embedded documents")
+
+        self.rebuild_exact_index(self._sources(documents))
+        self.publish_segment()
+
+        return len(documents)
+
+    def replace_source(self, source: str, documents: List[Dict[str, str]]) -> int:
+        """
+        Replace every chunk of one source, leaving the other sources untouched.
+
+        The new chunks are embedded before the old ones are deleted, and only
+        this source's in-memory index is rebuilt.
+
+        Args:
+            source: Source to replace (e.g. "pymupdf")
+            documents: Its new chunks (same format as add_documents; their
+                       source is forced to `source`)
+
+        Returns:
+            Number of documents written
+
+        Example:
+            >>> store.replace_source("pymupdf", load_corpus_chunks(sources=["pymupdf"]))
+        """
+        documents = [{**doc, 'source': source} for doc in documents]
+        embeddings = self._embed_bulk([doc['text'] for doc in documents]) if documents else []
+
+        self.collection.delete(where={'source': source})
+        for i in range(0, len(documents), 100):
+            self._write_batch(documents[i:i + 100], embeddings[i:i + 100])
+        logger.info(f"Replaced source '{source}': {len(documents)} documents")
+
+        self.rebuild_exact_index([source])
+        self.publish_segment()
+
+        return len(documents)
+
+    @staticmethod
+    def _sources(documents: List[Dict[str, str]]) -> List[str]:
+        return sorted({doc.get('source', 'unknown') for doc in documents})
+
+    def _write_batch(self, batch: List[Dict[str, str]], embeddings: List[List[float]]):
+        """Add one batch of documents and their embeddings to the collection."""
+        # Extract texts and metadata
+        texts = [doc['text'] for doc in batch]
+
+        # Unique IDs numbered per source, so replacing one source never
+        # collides with another source's IDs
+        next_id: Dict[str, int] = {}
+        ids = []
+        for doc in batch:
+            source = doc.get('source', 'unknown')
+            if source not in next_id:
+                next_id[source] = len(self.collection.get(where={'source': source}, include=[])['ids'])
+            ids.append(f"doc_{source}_{next_id[source]}")
+            next_id[source] += 1
+
+        # Build metadata for each document
+        metadatas = []
+        for doc in batch:
+            meta = {
+                'source': doc.get('source', 'unknown'),
+                'topic': doc.get('topic', 'general'),
+            }
+            # Add any additional metadata
+            if 'metadata' in doc:
+                meta.update(doc['metadata'])
+            metadatas.append(meta)
+
+        self.collection.add(
+            ids=ids,
+            embeddings=reduce_dimensions(embeddings, self.dimensions),
+            documents=texts,
+            metadatas=metadatas
+        )
+
     def query(
         self,
         query_text: str,
         top_k: int = 5,
         filter_source: Optional[str] = None,
-        filter_topic: Optional[str] = None
+        filter_topic: Optional[str] = None,
+        timeout_ms: Optional[int] = None,
+        mode: Optional[str] = None
     ) -> List[Dict[str, any]]:
         """
         Query the vector store for relevant documents.
@@ -192,71 +387,464 @@ class VectorStore:
             top_k: Number of results to return (default: 5)
             filter_source: Filter by source library (e.g., "pymupdf")
             filter_topic: Filter by topic (e.g., "opening")
+            timeout_ms: Latency budget for the embedding step (default: SEARCH_TIMEOUT_MS)
+            mode: "vector", "hybrid" or "lexical" (default: DOCS_SEARCH_MODE)
 
         Returns:
             List of dicts with keys:
                 - text: Document text
                 - source: Source library
                 - topic: Topic/category
-                - distance: Similarity distance (lower = more similar)
+                - distance: Distance in the collection's space (lower = more similar)
+                - score: Cosine similarity in [0, 1] (see similarity); in
+                  lexical mode, the fraction of query terms in the chunk
 
         Example:
             >>> results = store.query("extract text from PDF", top_k=3)
             >>> for doc in results:
             ...     print(f"{doc['source']}: {doc['text'][:100]}...")
         """
-        if self.collection.count() == 0:
+        return self.query_detailed(
+            query_text, top_k, filter_source, filter_topic, timeout_ms, mode=mode
+        )["results"]
+
+    def query_detailed(
+        self,
+        query_text: str,
+        top_k: int = 5,
+        filter_source: Optional[str] = None,
+        filter_topic: Optional[str] = None,
+        timeout_ms: Optional[int] = None,
+        query_embedding: Optional[List[float]] = None,
+        embedding_model: Optional[str] = None,
+        mode: Optional[str] = None
+    ) -> Dict[str, any]:
+        """
+        query, also reporting whether the answer is degraded.
+
+        When the embedding step misses the latency budget, fails, or the
+        circuit breaker is open, results are ranked lexically instead.
+
+        Args:
+            query_embedding: Precomputed query vector (skips embedding the query);
+                             must match the collection's model and dimensions
+            embedding_model: Model that produced query_embedding (checked if given)
+            mode: "vector", "hybrid" or "lexical" (default: DOCS_SEARCH_MODE);
+                  lexical never embeds the query
+
+        Returns:
+            Dict with results, degraded (bool), degraded_reason
+            ("timeout", "circuit_open", "error" or None) and query_embedding
+            (the vector searched with, None if degraded)
+
+        Raises:
+            ValueError: If query_embedding does not match the collection, or
+                        mode is unknown
+        """
+        mode = self._resolve_mode(mode)
+        if query_embedding is not None:
+            query_embedding = validate_query_embedding(
+                self.collection, self.embedding_provider, query_embedding, embedding_model
+            )
+
+        if self._exact_index is None and self.collection.count() == 0:
+            logger.warning("Vector store is empty. No documents to query.")
+            return self._query_result([], query_embedding=query_embedding)
+
+        if mode == "lexical":
+            results = self._query_lexical(query_text, top_k, filter_source, filter_topic)
+            return self._query_result(results, query_embedding=query_embedding)
+
+        fused_text = query_text if mode == "hybrid" else None
+        if query_embedding is not None:
+            results = self._query_collection(query_embedding, top_k, filter_source, filter_topic, fused_text)
+            return self._query_result(results, query_embedding=query_embedding)
+
+        try:
+            # Generate query embedding (cached), within the latency budget
+            query_embedding = self.circuit_breaker.call(
+                lambda: self._embed([query_text])[0],
+                timeout=resolve_timeout(timeout_ms)
+            )
+        except EmbeddingUnavailable as e:
+            logger.warning(f"Query embedding unavailable ({e}), using lexical ranking")
+            results = self._query_lexical(query_text, top_k, filter_source, filter_topic)
+            return self._query_result(results, degraded_reason=e.reason)
+
+        results = self._query_collection(query_embedding, top_k, filter_source, filter_topic, fused_text)
+
+        logger.debug(f"Query '{query_text[:50]}...' returned {len(results)} results")
+
+        return self._query_result(results, query_embedding=query_embedding)
+
+    async def aquery(
+        self,
+        query_text: str,
+        top_k: int = 5,
+        filter_source: Optional[str] = None,
+        filter_topic: Optional[str] = None,
+        timeout_ms: Optional[int] = None,
+        mode: Optional[str] = None
+    ) -> List[Dict[str, any]]:
+        """
+        Async variant of query.
+
+        The embedding call is awaited on the event loop; Chroma work runs
+        on the dedicated Chroma executor.
+        """
+        result = await self.aquery_detailed(query_text, top_k, filter_source, filter_topic, timeout_ms, mode=mode)
+        return result["results"]
+
+    async def aquery_detailed(
+        self,
+        query_text: str,
+        top_k: int = 5,
+        filter_source: Optional[str] = None,
+        filter_topic: Optional[str] = None,
+        timeout_ms: Optional[int] = None,
+        query_embedding: Optional[List[float]] = None,
+        embedding_model: Optional[str] = None,
+        mode: Optional[str] = None
+    ) -> Dict[str, any]:
+        """Async variant of query_detailed."""
+        mode = self._resolve_mode(mode)
+        if query_embedding is not None:
+            query_embedding = validate_query_embedding(
+                self.collection, self.embedding_provider, query_embedding, embedding_model
+            )
+
+        if self._exact_index is None and await run_in_chroma_executor(self.collection.count) == 0:
             logger.warning("Vector store is empty. No documents to query.")
-            return []
+            return self._query_result([], query_embedding=query_embedding)
 
-        # Build where filter if source/topic specified
-        where_filter = {}
+        if mode == "lexical":
+            results = await self._aquery_lexical(query_text, top_k, filter_source, filter_topic)
+            return self._query_result(results, query_embedding=query_embedding)
+
+        fused_text = query_text if mode == "hybrid" else None
+        if query_embedding is not None:
+            results = await self._aquery_collection(query_embedding, top_k, filter_source, filter_topic, fused_text)
+            return self._query_result(results, query_embedding=query_embedding)
+
+        try:
+            query_embedding = await self.circuit_breaker.acall(
+                lambda: self._aembed_one(query_text),
+                timeout=resolve_timeout(timeout_ms)
+            )
+        except EmbeddingUnavailable as e:
+            logger.warning(f"Query embedding unavailable ({e}), using lexical ranking")
+            results = await self._aquery_lexical(query_text, top_k, filter_source, filter_topic)
+            return self._query_result(results, degraded_reason=e.reason)
+
+        results = await self._aquery_collection(query_embedding, top_k, filter_source, filter_topic, fused_text)
+
+        logger.debug(f"Query '{query_text[:50]}...' returned {len(results)} results")
+
+        return self._query_result(results, query_embedding=query_embedding)
+
+    @staticmethod
+    def _resolve_mode(mode: Optional[str]) -> str:
+        mode = (mode or DOCS_SEARCH_MODE).lower()
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode '{mode}' (expected one of {', '.join(SEARCH_MODES)})")
+        return mode
+
+    def _snapshot(self):
+        """In-memory snapshot of the docs (own SourceIndexes, or the live segment's ExactIndex in readers)."""
+        if self._exact_index is not None:
+            return self._exact_index
+        if isinstance(self.collection, SegmentCollection):
+            return self.collection.exact_index
+        return None
+
+    @staticmethod
+    def _query_result(
+        results: List[Dict],
+        degraded_reason: Optional[str] = None,
+        query_embedding: Optional[List[float]] = None
+    ) -> Dict[str, any]:
+        return {
+            "results": results,
+            "degraded": degraded_reason is not None,
+            "degraded_reason": degraded_reason,
+            "query_embedding": query_embedding
+        }
+
+    @staticmethod
+    def _build_where(filter_source: Optional[str], filter_topic: Optional[str]) -> Optional[Dict]:
+        """Chroma where filter for source/topic (None if unfiltered)."""
+        conditions = []
         if filter_source:
-            where_filter['source'] = filter_source
+            conditions.append({'source': filter_source})
         if filter_topic:
-            where_filter['topic'] = filter_topic
+            conditions.append({'topic': filter_topic})
 
-        # Generate query embedding with OpenAI
-        response = self.openai_client.embeddings.create(
-            input=query_text,
-            model=self.embedding_model_name
-        )
-        query_embedding = response.data[0].embedding
+        if not conditions:
+            return None
+        if len(conditions) == 1:
+            return conditions[0]
+        return {'$and': conditions}
+
+    def _query_collection(
+        self,
+        query_embedding: List[float],
+        top_k: int,
+        filter_source: Optional[str],
+        filter_topic: Optional[str],
+        fused_text: Optional[str] = None
+    ) -> List[Dict[str, any]]:
+        """
+        Run the nearest-neighbour query for an embedding and format results.
+
+        With fused_text (hybrid mode) and a snapshot, the vector ranking is
+        fused with BM25 results for that text.
+        """
+        if fused_text is not None:
+            snapshot = self._snapshot()
+            if snapshot is not None:
+                return snapshot.search_hybrid(fused_text, query_embedding, top_k, filter_source, filter_topic)
+
+        # Exact in-memory search when a snapshot is loaded
+        index = self._exact_index
+        if index is not None:
+            return index.search(query_embedding, top_k, filter_source, filter_topic)
 
         # Query collection
         results = self.collection.query(
             query_embeddings=[query_embedding],
             n_results=top_k,
-            where=where_filter if where_filter else None,
+            where=self._build_where(filter_source, filter_topic),
             include=['documents', 'metadatas', 'distances']
         )
 
         # Format results
+        space = collection_space(self.collection)
         formatted_results = []
         for i in range(len(results['documents'][0])):
             formatted_results.append({
                 'text': results['documents'][0][i],
                 'source': results['metadatas'][0][i].get('source', 'unknown'),
                 'topic': results['metadatas'][0][i].get('topic', 'general'),
-                'distance': results['distances'][0][i]
+                'distance': results['distances'][0][i],
+                'score': to_similarity(results['distances'][0][i], space)
             })
 
-        logger.debug(f"Query '{query_text[:50]}...' returned {len(formatted_results)} results")
-
         return formatted_results
 
-    def clear(self):
+    async def _aquery_collection(
+        self,
+        query_embedding: List[float],
+        top_k: int,
+        filter_source: Optional[str],
+        filter_topic: Optional[str],
+        fused_text: Optional[str] = None
+    ) -> List[Dict[str, any]]:
+        """Async variant of _query_collection (exact and hybrid search stay on the loop)."""
+        snapshot = self._snapshot() if fused_text is not None else None
+        if snapshot is not None:
+            return snapshot.search_hybrid(fused_text, query_embedding, top_k, filter_source, filter_topic)
+
+        index = self._exact_index
+        if index is not None:
+            # One small matrix-vector product, cheaper than an executor hop
+            return index.search(query_embedding, top_k, filter_source, filter_topic)
+
+        return await run_in_chroma_executor(
+            self._query_collection, query_embedding, top_k, filter_source, filter_topic
+        )
+
+    def _query_lexical(
+        self,
+        query_text: str,
+        top_k: int,
+        filter_source: Optional[str],
+        filter_topic: Optional[str]
+    ) -> List[Dict[str, any]]:
+        """
+        Embedding-free ranking: BM25 over the snapshot, or by the fraction
+        of query tokens in each chunk when there is none.
+
+        score is the coverage and distance 1 - coverage, so callers can keep
+        treating lower distances as better.
+        """
+        snapshot = self._snapshot()
+        if snapshot is not None:
+            return snapshot.search_lexical(query_text, top_k, filter_source, filter_topic)
+
+        results = self.collection.get(
+            where=self._build_where(filter_source, filter_topic),
+            include=['documents', 'metadatas']
+        )
+
+        query_tokens = tokenize(query_text)
+        scored = [
+            (query_coverage(query_tokens, tokenize(text)), text, metadata)
+            for text, metadata in zip(results['documents'], results['metadatas'])
+        ]
+        scored = [item for item in scored if item[0] > 0]
+        scored.sort(key=lambda item: item[0], reverse=True)
+
+        return [
+            {
+                'text': text,
+                'source': metadata.get('source', 'unknown'),
+                'topic': metadata.get('topic', 'general'),
+                'distance': round(1.0 - coverage, 4),
+                'score': round(coverage, 4)
+            }
+            for coverage, text, metadata in scored[:top_k]
+        ]
+
+    async def _aquery_lexical(
+        self,
+        query_text: str,
+        top_k: int,
+        filter_source: Optional[str],
+        filter_topic: Optional[str]
+    ) -> List[Dict[str, any]]:
+        """Async variant of _query_lexical (BM25 stays on the loop, the collection scan does not)."""
+        snapshot = self._snapshot()
+        if snapshot is not None:
+            return snapshot.search_lexical(query_text, top_k, filter_source, filter_topic)
+
+        return await run_in_chroma_executor(
+            self._query_lexical, query_text, top_k, filter_source, filter_topic
+        )
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed texts, reusing cached vectors when available.
+
+        Args:
+            texts: Texts to embed
+
+        Returns:
+            List of embedding vectors aligned with texts, at the collection's dimensions
+        """
+        return reduce_dimensions(self.embedding_cache.get_or_embed(
+            self.embedding_provider.cache_namespace,
+            texts,
+            self.embedding_provider.embed
+        ), self.dimensions)
+
+    def _embed_bulk(self, texts: List[str]) -> List[List[float]]:
+        """Embed many texts for ingestion, caching each batch as it completes."""
+        namespace = self.embedding_provider.cache_namespace
+        # Ingestion runs in the BULK scheduler class so it never starves searches
+        bulk = BulkEmbedder(self.embedding_provider.for_priority(Priority.BULK))
+
+        return self.embedding_cache.get_or_embed(
+            namespace,
+            texts,
+            lambda missing: bulk.embed(
+                missing,
+                on_batch=lambda done, vectors: self.embedding_cache.put_many(namespace, done, vectors)
+            )
+        )
+
+    async def _aembed_one(self, text: str) -> List[float]:
+        return (await self._aembed([text]))[0]
+
+    async def _aembed(self, texts: List[str]) -> List[List[float]]:
+        """Async variant of _embed."""
+        return reduce_dimensions(await self.embedding_cache.aget_or_embed(
+            self.embedding_provider.cache_namespace,
+            texts,
+            self.embedding_provider.aembed
+        ), self.dimensions)
+
+    def rebuild_exact_index(self, sources: Optional[List[str]] = None):
+        """
+        Snapshot the collection into new SourceIndexes and swap them in.
+
+        Queries running during the rebuild keep using the previous snapshot.
+
+        Args:
+            sources: Only re-read these sources and reuse the current indexes
+                     of the others (default: rebuild everything)
+        """
+        if not self.exact_search:
+            return
+
+        base = None if self._full_rebuild else self._exact_index
+        index = SourceIndexes.from_collection(self.collection, sources, base)
+        if len(index) and DOCS_SEARCH_MODE != "vector":
+            # Build BM25 before the swap so the first hybrid query does not pay for it
+            index.lexical_stats
+        self._exact_index = index if len(index) else None
+        self._full_rebuild = False
+        logger.info(
+            f"Exact search index: {len(index)} documents in {len(index.indexes)} sources "
+            f"({index.nbytes / 1024:.0f} KiB)"
+            + (f", rebuilt {', '.join(sorted(set(sources)))}" if sources is not None and base is not None else "")
+        )
+
+    @property
+    def needs_rebuild(self) -> bool:
+        """The collection stores a different size, is not in cosine space, or was built with other configured HNSW settings."""
+        if self.client is None:
+            return False
+        return (
+            self.dimensions != self.target_dimensions
+            or collection_space(self.collection) != DEFAULT_SPACE
+            or (self._hnsw_configured and hnsw_differs(self.collection, self.hnsw))
+        )
+
+    def rebuild_collection(self, dimensions: Optional[int] = None, hnsw: Optional[Dict[str, int]] = None):
+        """
+        Rebuild the collection at a new vector size and/or HNSW settings and switch to it.
+
+        Blocking; queries keep using the current collection (and exact
+        index) until the switch. See dimension_migration.
+
+        Args:
+            dimensions: Target size (defaults to target_dimensions)
+            hnsw: HNSW settings (defaults to the configured ones)
+        """
+        dimensions = resolve_dimensions(self.embedding_provider, dimensions or self.target_dimensions)
+        hnsw = dict(hnsw or self.hnsw)
+
+        def switch(collection):
+            self.collection = collection
+            self.rebuild_exact_index()
+            self.publish_segment()
+
+        rebuild_collection(
+            self.client,
+            self.collection_name,
+            dimensions,
+            hnsw=hnsw,
+            space=DEFAULT_SPACE,
+            reembed=lambda documents, metadatas: self._embed_bulk(documents),
+            on_switch=switch
+        )
+        self.target_dimensions = dimensions
+        self.hnsw = hnsw
+
+    def publish_segment(self):
+        """Publish the collection for reader workers (writer with segments only)."""
+        if self.segment_store is not None:
+            self.segment_store.publish("docs", self.collection)
+
+    def clear(self, keep_index: bool = False):
         """
         Clear all documents from the collection.
 
         WARNING: This is destructive and cannot be undone.
+
+        Args:
+            keep_index: Keep serving queries from the current exact-search
+                        snapshot until the next load rebuilds it (reload)
         """
         logger.warning(f"Clearing collection: {self.collection_name}")
+        dimensions = self.dimensions
         self.client.delete_collection(self.collection_name)
-        self.collection = self.client.create_collection(
-            name=self.collection_name,
-            metadata={"description": "NOVA AI documentation for code generation"}
-        )
+        self.collection = self._create_collection(dimensions)
+        if keep_index:
+            self._full_rebuild = True
+        else:
+            self._exact_index = None
+            self.publish_segment()
         logger.info("Collection cleared and recreated")
 
     def get_stats(self) -> Dict[str, any]:
@@ -0,0 +1,52 @@
+"""
+Shared test fixtures.
+
+FakeEmbeddingProvider gives deterministic, network-free embeddings
+(hashed bag of words), so texts sharing words get similar vectors.
+"""
+
+import re
+import math
+import hashlib
+import tempfile
+import shutil
+
+import pytest
+
+from src.core.embedding_providers import EmbeddingProvider
+
+
+class FakeEmbeddingProvider(EmbeddingProvider):
+    """Deterministic bag-of-words embeddings for tests."""
+
+    name = "fake"
+
+    def __init__(self, model_name: str = "fake-bow", dimensions: int = 64):
+        super().__init__(model_name, dimensions)
+        self.calls = []
+
+    def embed(self, texts):
+        self.calls.append(list(texts))
+        return [self._vector(text) for text in texts]
+
+    def _vector(self, text):
+        vector = [0.0] * self.dimensions
+        for word in re.findall(r"\w+", text.lower()):
+            bucket = int(hashlib.md5(word.encode()).hexdigest(), 16) % self.dimensions
+            vector[bucket] += 1.0
+        norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+        return [x / norm for x in vector]
+
+
+@pytest.fixture
+def fake_provider():
+    """Network-free embedding provider."""
+    return FakeEmbeddingProvider()
+
+
+@pytest.fixture
+def temp_dir():
+    """Temporary directory removed after the test."""
+    path = tempfile.mkdtemp()
+    yield path
+    shutil.rmtree(path)
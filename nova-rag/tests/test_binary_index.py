@@ -0,0 +1,119 @@
+"""
+Tests for the binary-quantized code index backend
+
+Tests that the code cache can shortlist by sign bits and re-rank with float16:
+- Neighbours and distances match exact float32 search
+- Workflow filters, persistence, and codes rebuilt after a crash
+- A directory holding another backend's index is refused
+- CodeCacheService imports Chroma entries and keeps its scores
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+from src.core.code_cache_service import CodeCacheService
+from src.core.code_index import BinaryIndex, _hamming, _sign_codes
+from tests.conftest import FakeEmbeddingProvider
+
+
+DOCUMENT = {
+    "ai_description": "Extract text from PDF invoice",
+    "input_schema": {"pdf_data": "base64_large"},
+    "code": "import fitz",
+    "node_action": "extract_pdf",
+    "node_description": "Extract text from invoice PDF",
+    "workflow_id": 7,
+    "metadata": {}
+}
+
+
+def _random_entries(count, dims=128, seed=0):
+    vectors = np.random.default_rng(seed).normal(size=(count, dims)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return (
+        [f"id_{i}" for i in range(count)],
+        vectors,
+        [f"code {i}" for i in range(count)],
+        [{"workflow_id": i % 4} for i in range(count)]
+    )
+
+
+def test_hamming_distance():
+    codes = _sign_codes(np.array([[1.0, -1.0] * 32, [-1.0, 1.0] * 32, [1.0, 1.0] * 32]))
+    assert codes.shape == (3, 8)
+    assert _hamming(codes, codes[0]).tolist() == [0, 64, 32]
+
+
+def test_matches_exact_search(temp_dir):
+    index = BinaryIndex(temp_dir, candidates=200)
+    ids, vectors, documents, metadatas = _random_entries(3000)
+    index.add(ids, vectors, documents, metadatas)
+
+    # Slightly perturbed stored vectors as queries
+    queries = vectors[:50] + np.random.default_rng(1).normal(scale=0.02, size=(50, 128)).astype(np.float32)
+    result = index.query(queries.tolist(), n_results=3)
+    assert [hits[0] for hits in result['ids']] == ids[:50]
+
+    exact = 2.0 - 2.0 * (vectors[:50] * (queries / np.linalg.norm(queries, axis=1, keepdims=True))).sum(axis=1)
+    assert [hits[0] for hits in result['distances']] == pytest.approx(exact.tolist(), abs=2e-3)
+
+    filtered = index.query([vectors[10].tolist()], n_results=5, where={"workflow_id": 2})
+    assert filtered['ids'][0][0] == "id_10"
+    assert all(m["workflow_id"] == 2 for m in filtered['metadatas'][0])
+
+    stats = index.get_stats()
+    assert stats["bytes_per_entry"] == 16 and stats["disk_bytes_per_entry"] == 256
+
+
+def test_persists_and_rebuilds_codes(temp_dir):
+    index = BinaryIndex(temp_dir)
+    ids, vectors, documents, metadatas = _random_entries(500)
+    index.add(ids, vectors, documents, metadatas)
+    index.close()
+
+    # Crash between storing the entries and writing their codes
+    os.truncate(os.path.join(temp_dir, "codes.bin"), 100 * 16)
+
+    reopened = BinaryIndex(temp_dir, candidates=10)
+    assert reopened.count() == 500
+    assert reopened.query([vectors[450].tolist()], n_results=1)['ids'] == [["id_450"]]
+    assert os.path.getsize(os.path.join(temp_dir, "codes.bin")) == 500 * 16
+
+    reopened.add(["late"], vectors[:1], ["late code"], [{"workflow_id": 9}])
+    assert reopened.get(where={"workflow_id": 9})['documents'] == ["late code"]
+
+    reopened.reset()
+    assert reopened.count() == 0
+    assert reopened.query([vectors[5].tolist()], n_results=1)['ids'] == [[]]
+
+
+def test_refuses_other_backend_directory(temp_dir):
+    faiss = pytest.importorskip("faiss")
+    from src.core.code_index import IVFPQIndex
+
+    ids, vectors, documents, metadatas = _random_entries(10)
+    ivfpq = IVFPQIndex(temp_dir)
+    ivfpq.add(ids, vectors, documents, metadatas)
+    ivfpq.close()
+
+    with pytest.raises(ValueError, match="ivfpq"):
+        BinaryIndex(temp_dir)
+
+
+def test_code_cache_on_binary_index(temp_dir):
+    provider = FakeEmbeddingProvider()
+    chroma_cache = CodeCacheService(persist_directory=temp_dir, embedding_provider=provider)
+    chroma_cache.save_code(DOCUMENT)
+    query = chroma_cache._build_searchable_text(DOCUMENT)
+    expected = chroma_cache.search_code(query, threshold=0.5, workflow_id=7)
+
+    cache = CodeCacheService(persist_directory=temp_dir, embedding_provider=provider, index_backend="binary")
+    assert isinstance(cache.collection, BinaryIndex)
+
+    matches = cache.search_code(query, threshold=0.5, workflow_id=7)
+    assert [m["node_action"] for m in matches] == [m["node_action"] for m in expected]
+    assert matches[0]["score"] == pytest.approx(expected[0]["score"], abs=1e-3)
+    assert cache.search_code(query, threshold=0.5, workflow_id=8) == []
+    assert cache.get_stats()["index"]["backend"] == "binary"
@@ -0,0 +1,178 @@
+"""
+Tests for the server-side analysis of cached code
+
+Tests that save_code derives context keys and imports from the code itself:
+- context reads, optional reads, writes and printed context_updates
+- Dynamic key access is flagged; imports are reduced to top-level modules
+- The analysis is stored with the entry and returned with matches
+- Code that does not parse (or a slow analysis) keeps the caller's metadata
+- The process pool gives the same results as in-process analysis
+- A timed-out analysis or a dead worker replaces the pool
+"""
+
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from src.core import code_analysis
+from src.core.code_analysis import analysis_result, analyze_code, submit_analysis
+from src.core.code_cache_service import CodeCacheService
+from tests.conftest import FakeEmbeddingProvider
+
+
+CODE = '''
+import base64
+import json
+import fitz
+from email.mime.text import MIMEText
+
+pdf = fitz.open(stream=base64.b64decode(context["invoice_pdf"]), filetype="pdf")
+limit = context.get("max_pages", 10)
+if "language" in context:
+    pass
+context["page_count"] = len(pdf)
+pages = min(context["page_count"], limit)
+
+print(json.dumps({
+    "status": "success",
+    "context_updates": {"invoice_text": "...", "pages_read": pages},
+    "message": "ok"
+}))
+'''
+
+
+def document(code=CODE, metadata=None):
+    return {
+        "ai_description": "Extract text from invoice PDF",
+        "input_schema": {"invoice_pdf": "base64_large"},
+        "code": code,
+        "node_action": "extract_pdf",
+        "node_description": "Extract PDF text",
+        "workflow_id": 5,
+        "metadata": metadata if metadata is not None else {"required_keys": ["invoice_pdf", "page_count"]}
+    }
+
+
+@pytest.fixture
+def in_process(monkeypatch):
+    monkeypatch.setattr(code_analysis, "ANALYSIS_WORKERS", 0)
+
+
+def test_analyze_context_access():
+    analysis = analyze_code(CODE)
+
+    assert analysis == {
+        "required_keys": ["invoice_pdf"],
+        "optional_keys": ["language", "max_pages"],
+        "result_keys": ["invoice_text", "page_count", "pages_read"],
+        "imports": ["base64", "email", "fitz", "json"],
+        "dynamic_keys": False
+    }
+
+
+@pytest.mark.parametrize("code", [
+    "value = context[name]",
+    "value = context.get(key_name)",
+    "for key in context:\n    print(key)",
+    "names = [k for k in context.keys()]",
+    "run(**context)",
+    "copy = {**context}",
+])
+def test_dynamic_access_is_flagged(code):
+    assert analyze_code(code)["dynamic_keys"] is True
+
+
+def test_read_before_write_is_required():
+    analysis = analyze_code("total = context['total'] + 1\ncontext['total'] = total\ncontext.update(done=True)")
+
+    assert analysis["required_keys"] == ["total"]
+    assert analysis["result_keys"] == ["done", "total"]
+
+
+def test_augmented_assignment_reads_and_del_does_not_write():
+    analysis = analyze_code("context['total'] += 1\ndel context['scratch']")
+
+    assert analysis["required_keys"] == ["total"]
+    assert analysis["result_keys"] == ["total"]
+
+
+def test_dynamic_imports():
+    code = "import importlib\nrequests = importlib.import_module('requests.adapters')\nx = __import__('yaml')"
+    assert analyze_code(code)["imports"] == ["importlib", "requests", "yaml"]
+
+
+def test_invalid_code_and_timeouts_return_none(in_process):
+    assert analysis_result(submit_analysis("def broken(:")) is None
+    assert analysis_result(Future(), timeout_ms=1) is None
+
+
+def test_process_pool_matches_in_process():
+    try:
+        assert analysis_result(submit_analysis(CODE), timeout_ms=30000) == analyze_code(CODE)
+        assert code_analysis._executor is not None
+    finally:
+        code_analysis.shutdown_analysis_executor()
+
+
+def test_pool_is_replaced_after_timeout_and_dead_worker():
+    try:
+        code_analysis.warm_analysis_executor()
+        executor = code_analysis._executor
+        assert executor is not None
+
+        # Still running at the deadline: the pool (and its busy worker) is replaced
+        future = submit_analysis(CODE * 5000)
+        while not (future.running() or future.done()):
+            time.sleep(0.001)
+        assert analysis_result(future, timeout_ms=1) is None
+        assert code_analysis._executor is not executor
+
+        executor = code_analysis.get_analysis_executor()
+        analysis_result(submit_analysis(CODE), timeout_ms=30000)
+        for process in list(executor._processes.values()):
+            process.kill()
+            process.join()
+        assert analysis_result(submit_analysis(CODE), timeout_ms=30000) in (None, analyze_code(CODE))
+        assert analysis_result(submit_analysis(CODE), timeout_ms=30000) == analyze_code(CODE)
+    finally:
+        code_analysis.shutdown_analysis_executor()
+
+
+def test_save_stores_analysis(temp_dir, in_process):
+    cache = CodeCacheService(persist_directory=temp_dir, embedding_provider=FakeEmbeddingProvider())
+    cache.save_code(document())
+
+    stored = cache.collection.get(include=['metadatas'])['metadatas'][0]
+    assert stored["required_keys"] == "invoice_pdf"
+    assert stored["analyzed"] is True
+
+    match = cache.search_code("Extract text from invoice PDF", threshold=0.3, workflow_id=5)[0]
+    assert match["metadata"]["required_keys"] == ["invoice_pdf"]
+    assert match["metadata"]["optional_keys"] == ["language", "max_pages"]
+    assert match["metadata"]["result_keys"] == ["invoice_text", "page_count", "pages_read"]
+    assert match["metadata"]["dynamic_keys"] is False
+    # No libraries_used from the caller: the imports are used
+    assert match["metadata"]["libraries_used"] == ["base64", "email", "fitz", "json"]
+
+
+def test_imports_replace_caller_libraries(temp_dir, in_process):
+    cache = CodeCacheService(persist_directory=temp_dir, embedding_provider=FakeEmbeddingProvider())
+    cache.save_code(document(metadata={"required_keys": ["page_count"], "libraries_used": ["PyPDF2"]}))
+
+    match = cache.search_code("Extract text from invoice PDF", threshold=0.3, workflow_id=5)[0]
+    assert match["metadata"]["libraries_used"] == ["base64", "email", "fitz", "json"]
+    assert match["metadata"]["required_keys"] == ["invoice_pdf"]
+
+
+def test_unparsable_code_keeps_caller_metadata(temp_dir, in_process):
+    cache = CodeCacheService(persist_directory=temp_dir, embedding_provider=FakeEmbeddingProvider())
+    cache.save_code(document(code="print(context['a'] +", metadata={
+        "required_keys": ["a"], "libraries_used": ["json"]
+    }))
+
+    match = cache.search_code("Extract text from invoice PDF", threshold=0.3, workflow_id=5)[0]
+    assert match["metadata"]["required_keys"] == ["a"]
+    assert match["metadata"]["libraries_used"] == ["json"]
+    assert match["metadata"]["analyzed"] is False
+    assert "result_keys" not in match["metadata"]
@@ -0,0 +1,264 @@
+"""
+Tests for the size-bounded code cache
+
+Tests that evict() keeps the cache under its limits:
+- Per-workflow quotas apply before the global limit
+- Entries with hits, recent use or several successes outlive the others
+- Each run deletes at most one batch
+- Deleted entries leave search results, the fingerprint map and the index
+- Every backend deletes (Chroma, partitioned, ivfpq and binary)
+- File indexes leave tombstones and compact past a threshold, keeping
+  the trained IVF-PQ quantizer and surviving an interrupted compaction
+"""
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from src.core.code_cache_service import CodeCacheService
+from src.core.code_eviction import HitTracker, RetentionTable, plan_evictions, retention_score
+from src.core.code_index import BinaryIndex, IVFPQIndex
+from tests.conftest import FakeEmbeddingProvider
+
+
+NOW = datetime(2025, 11, 23, 12, 0, 0)
+
+
+def document(n, workflow_id=1, days_old=0, success_count=1):
+    return {
+        "ai_description": f"Task number {n} for workflow {workflow_id}",
+        "input_schema": {"item": "str"},
+        "code": f"# code {n}",
+        "node_action": "task",
+        "node_description": f"Task {n}",
+        "workflow_id": workflow_id,
+        "metadata": {
+            "success_count": success_count,
+            "created_at": (NOW - timedelta(days=days_old)).isoformat()
+        }
+    }
+
+
+def codes(cache):
+    return sorted(cache.collection.get(include=['documents'])['documents'])
+
+
+def make_cache(temp_dir, **options):
+    return CodeCacheService(persist_directory=temp_dir, embedding_provider=FakeEmbeddingProvider(), **options)
+
+
+def add_entries(index, n, dims=16):
+    vectors = np.random.default_rng(0).normal(size=(n, dims)).astype(np.float32)
+    index.add(
+        ids=[f"id_{i}" for i in range(n)],
+        embeddings=vectors.tolist(),
+        documents=[f"code {i}" for i in range(n)],
+        metadatas=[{"workflow_id": i % 2} for i in range(n)]
+    )
+    return vectors
+
+
+def nearest(index, vector):
+    return index.query([vector.tolist()], n_results=1)['ids'][0]
+
+
+def test_retention_score():
+    now = NOW.timestamp()
+    assert retention_score(0, now, now) == pytest.approx(1.0)
+    assert retention_score(3, now, now) == pytest.approx(4.0)
+    assert retention_score(0, now - 168 * 3600, now, half_life_hours=168) == pytest.approx(0.5)
+
+
+def test_plan_applies_quotas_then_global_limit():
+    entries = [
+        ("a1", 1, 0.1), ("a2", 1, 0.9), ("a3", 1, 0.5),
+        ("b1", 2, 0.2), ("b2", 2, 0.3),
+        ("c1", 3, 0.05),
+    ]
+    assert plan_evictions(entries, max_per_workflow=2) == [("a1", 1)]
+    assert plan_evictions(entries, max_entries=4) == [("c1", 3), ("a1", 1)]
+    assert plan_evictions(entries, max_entries=3, max_per_workflow=2) == [("c1", 3), ("a1", 1), ("b1", 2)]
+    assert plan_evictions(entries, max_entries=3, max_per_workflow=2, limit=1) == [("c1", 3)]
+    assert plan_evictions(entries, max_entries=10) == []
+
+
+def test_hit_tracker_merge_and_take():
+    tracker = HitTracker()
+    tracker.record(["a", "b"], now=10.0)
+    tracker.record(["a"], now=20.0)
+
+    taken = tracker.take()
+    assert taken == {"a": [2, 20.0], "b": [1, 10.0]}
+    assert len(tracker) == 0
+
+    tracker.merge(taken)
+    tracker.merge({"a": [1, 15.0]})
+    assert tracker.get("a") == (3, 20.0)
+
+
+def test_retention_table_scores_with_hits():
+    now = NOW.timestamp()
+    table = RetentionTable()
+    table.add("a", {"workflow_id": 1, "success_count": 3, "created_at": NOW.isoformat()})
+    table.add("b", {"created_at": (NOW - timedelta(hours=168)).isoformat()})
+    tracker = HitTracker()
+    tracker.record(["b"], now=now)
+
+    assert sorted(table.scores(tracker, now)) == [("a", 1, pytest.approx(3.0)), ("b", -1, pytest.approx(2.0))]
+    table.remove("a")
+    assert len(table) == 1
+
+
+def test_per_workflow_quota_keeps_used_entries(temp_dir):
+    cache = make_cache(temp_dir, max_per_workflow=3)
+    for n in range(5):
+        cache.save_code(document(n, workflow_id=1, days_old=10 - n))
+    cache.save_code(document(9, workflow_id=2, days_old=30))
+
+    # The oldest entry is searched, the second oldest has succeeded often
+    hit = cache.search_code(cache._build_searchable_text(document(0)), workflow_id=1)
+    assert [m["code"] for m in hit] == ["# code 0"]
+    cache.save_code(document(5, workflow_id=1, days_old=9, success_count=20))
+
+    assert cache.evict() == 3
+    assert codes(cache) == ["# code 0", "# code 4", "# code 5", "# code 9"]
+    assert cache.evict() == 0
+
+    stats = cache.get_stats()["eviction"]
+    assert stats["evicted_total"] == 3 and stats["runs"] == 2
+    assert stats["max_per_workflow"] == 3
+
+
+def test_global_limit_runs_in_batches(temp_dir):
+    cache = make_cache(temp_dir, max_entries=2)
+    for n in range(5):
+        cache.save_code(document(n, workflow_id=n % 2, days_old=5 - n))
+
+    assert cache.evict(batch=2) == 2
+    assert cache.evict(batch=2) == 1
+    assert cache.evict(batch=2) == 0
+    assert codes(cache) == ["# code 3", "# code 4"]
+
+
+def test_evicted_entries_leave_search_and_maps(temp_dir):
+    cache = make_cache(temp_dir, max_entries=1)
+    cache.save_code(document(0, days_old=3))
+    cache.save_code(document(1, days_old=0))
+    query = cache._build_searchable_text(document(0))
+    assert cache.search_code_detailed(query, workflow_id=1)["exact_match"] is True
+
+    # Forget the hit so the older entry goes
+    cache.take_hits()
+    maps = (cache._fingerprints, cache._required_keys, cache._retention)
+    assert cache.evict() == 1
+
+    # Victims leave the maps in place; nothing is rebuilt
+    assert (cache._fingerprints, cache._required_keys, cache._retention) == maps
+    assert len(cache._fingerprints) == len(cache._retention) == 1
+    result = cache.search_code_detailed(query, threshold=0.99, workflow_id=1)
+    assert result["exact_match"] is False
+    assert result["matches"] == []
+    assert cache.collection.partition_count(1) == 1
+
+
+def test_disabled_by_default(temp_dir):
+    cache = make_cache(temp_dir)
+    cache.save_code(document(0))
+
+    assert cache.eviction_enabled is False
+    assert cache.evict() == 0
+    assert cache.get_stats()["eviction"]["runs"] == 0
+
+
+@pytest.mark.parametrize("options", [
+    {"partitioned": False},
+    {"index_backend": "ivfpq"},
+    {"index_backend": "binary"},
+])
+def test_eviction_on_backends(temp_dir, options):
+    cache = make_cache(temp_dir, max_entries=2, **options)
+    for n in range(4):
+        cache.save_code(document(n, workflow_id=n % 2, days_old=4 - n))
+
+    assert cache.evict() == 2
+    assert codes(cache) == ["# code 2", "# code 3"]
+
+    matches = cache.search_code(cache._build_searchable_text(document(3, workflow_id=1)), workflow_id=1)
+    assert matches[0]["code"] == "# code 3"
+
+
+@pytest.mark.parametrize("index_class", [IVFPQIndex, BinaryIndex])
+def test_file_index_delete_leaves_tombstones(temp_dir, index_class):
+    index = index_class(temp_dir, metadata={}, compact_deleted=0.5)
+    vectors = add_entries(index, 20)
+
+    index.delete(ids=["id_0", "id_3", "id_5"])
+    index.delete(ids=["id_4", "id_7"], where={"workflow_id": 1})
+
+    remaining = [i for i in range(20) if i not in (0, 3, 5, 7)]
+    assert index.count() == len(remaining)
+    assert index.get_stats()["deleted_rows"] == 4
+    assert index.get(include=[])['ids'] == [f"id_{i}" for i in remaining]
+    assert index.partition_count(0) == 9
+    assert nearest(index, vectors[0]) != ["id_0"]
+    for i in (1, 6, 19):
+        assert nearest(index, vectors[i]) == [f"id_{i}"]
+
+    reopened = index_class(temp_dir, compact_deleted=0.5)
+    assert reopened.count() == len(remaining)
+    assert reopened.get_stats()["deleted_rows"] == 4
+    assert nearest(reopened, vectors[3]) != ["id_3"]
+
+    # 10 of 20 rows deleted: the live rows are renumbered
+    reopened.delete(ids=[f"id_{i}" for i in range(8, 14)])
+    remaining = [i for i in remaining if not 8 <= i < 14]
+    assert reopened.get_stats()["deleted_rows"] == 0
+    assert reopened.get(include=[])['ids'] == [f"id_{i}" for i in remaining]
+    assert nearest(reopened, vectors[19]) == ["id_19"]
+
+    compacted = index_class(temp_dir)
+    assert compacted.count() == len(remaining)
+    assert nearest(compacted, vectors[14]) == ["id_14"]
+
+
+def test_ivfpq_delete_keeps_trained_quantizer(temp_dir):
+    index = IVFPQIndex(temp_dir, metadata={}, train_min=256, pq_m=4, compact_deleted=0.1)
+    vectors = add_entries(index, 400)
+    assert index.train()
+
+    index.delete(ids=[f"id_{i}" for i in range(20)])
+    stats = index.get_stats()
+    assert stats["trained"] and stats["deleted_rows"] == 20
+    assert nearest(index, vectors[0]) != ["id_0"]
+    assert nearest(index, vectors[100]) == ["id_100"]
+
+    # Compaction re-adds the live rows to the same quantizer
+    index.delete(ids=[f"id_{i}" for i in range(20, 60)])
+    stats = index.get_stats()
+    assert stats["trained"] and stats["deleted_rows"] == 0 and stats["entries"] == 340
+    assert nearest(index, vectors[100]) == ["id_100"]
+
+    reopened = IVFPQIndex(temp_dir, train_min=256, pq_m=4)
+    assert reopened.get_stats()["trained"]
+    assert nearest(reopened, vectors[399]) == ["id_399"]
+
+
+def test_interrupted_compaction_finishes_on_open(temp_dir, monkeypatch):
+    index = BinaryIndex(temp_dir, metadata={}, compact_deleted=0.25)
+    vectors = add_entries(index, 8)
+
+    # Crash after the renumbering is committed, before the new file is in place
+    def crash(source, target):
+        raise OSError("crashed")
+    monkeypatch.setattr("src.core.code_index.os.replace", crash)
+    with pytest.raises(OSError):
+        index.delete(ids=["id_0", "id_1"])
+    monkeypatch.undo()
+
+    reopened = BinaryIndex(temp_dir)
+    assert reopened.count() == 6
+    assert reopened.get_stats()["deleted_rows"] == 0
+    assert reopened.get(include=[])['ids'] == [f"id_{i}" for i in range(2, 8)]
+    for i in (2, 7):
+        assert nearest(reopened, vectors[i]) == [f"id_{i}"]
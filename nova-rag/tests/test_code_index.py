@@ -0,0 +1,104 @@
+"""
+Tests for the IVF-PQ code index backend
+
+Tests that the code cache can run on FAISS IVF-PQ instead of Chroma HNSW:
+- Before training, search is exact and matches Chroma's distances
+- After training, nearest neighbours are still found and re-ranked exactly
+- Workflow filters, persistence across reopen and reset
+- Existing Chroma entries are migrated once into the new index
+"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip("faiss")
+
+from src.core.code_cache_service import CodeCacheService
+from src.core.code_index import IVFPQIndex
+from tests.conftest import FakeEmbeddingProvider
+
+
+DOCUMENT = {
+    "ai_description": "Extract text from PDF invoice",
+    "input_schema": {"pdf_data": "base64_large"},
+    "code": "import fitz",
+    "node_action": "extract_pdf",
+    "node_description": "Extract text from invoice PDF",
+    "workflow_id": 7,
+    "metadata": {}
+}
+
+
+def _random_entries(count, dims=64, seed=0):
+    vectors = np.random.default_rng(seed).normal(size=(count, dims)).astype(np.float32)
+    return (
+        [f"id_{i}" for i in range(count)],
+        vectors,
+        [f"code {i}" for i in range(count)],
+        [{"workflow_id": i % 4} for i in range(count)]
+    )
+
+
+def test_trained_index_finds_neighbours(temp_dir):
+    """Every stored vector is its own nearest neighbour, with exact distances."""
+    index = IVFPQIndex(temp_dir, nlist=16, nprobe=4, pq_m=16, train_min=10**6)
+    ids, vectors, documents, metadatas = _random_entries(2000)
+
+    index.add(ids[:400], vectors[:400], documents[:400], metadatas[:400])
+    assert index.get_stats()["trained"] is False
+
+    index.add(ids[400:], vectors[400:], documents[400:], metadatas[400:])
+    index.train()
+    stats = index.get_stats()
+    assert stats["trained"] is True and stats["bytes_per_entry"] == 16 + 8
+
+    result = index.query(vectors[:50].tolist(), n_results=3)
+    assert [hits[0] for hits in result['ids']] == ids[:50]
+    assert all(hits[0] == pytest.approx(0.0, abs=1e-5) for hits in result['distances'])
+
+    filtered = index.query([vectors[10].tolist()], n_results=5, where={"workflow_id": 2})
+    assert filtered['ids'][0][0] == "id_10"
+    assert all(m["workflow_id"] == 2 for m in filtered['metadatas'][0])
+
+
+def test_persists_and_resets(temp_dir):
+    index = IVFPQIndex(temp_dir, nlist=8, pq_m=8, train_min=10**6)
+    ids, vectors, documents, metadatas = _random_entries(600)
+    index.add(ids, vectors, documents, metadatas)
+    index.train()
+    index.add(["late"], vectors[:1], ["late code"], [{"workflow_id": 9}])
+    index.close()
+
+    reopened = IVFPQIndex(temp_dir, nlist=8, pq_m=8, train_min=10**6)
+    assert reopened.count() == 601
+    assert reopened.get_stats()["trained"] is True
+    assert reopened.get(where={"workflow_id": 9})['documents'] == ["late code"]
+    assert reopened.query([vectors[5].tolist()], n_results=1)['ids'] == [["id_5"]]
+
+    reopened.reset()
+    assert reopened.count() == 0
+    assert reopened.query([vectors[5].tolist()], n_results=1)['ids'] == [[]]
+
+
+def test_code_cache_migrates_chroma_entries(temp_dir):
+    """Switching backends imports the Chroma cache once, and search keeps working."""
+    provider = FakeEmbeddingProvider()
+    chroma_cache = CodeCacheService(persist_directory=temp_dir, embedding_provider=provider)
+    chroma_cache.save_code(DOCUMENT)
+    query = chroma_cache._build_searchable_text(DOCUMENT)
+    expected = chroma_cache.search_code(query, threshold=0.5, workflow_id=7)
+
+    cache = CodeCacheService(
+        persist_directory=temp_dir, embedding_provider=provider, index_backend="ivfpq"
+    )
+    assert isinstance(cache.collection, IVFPQIndex)
+    assert cache.search_code(query, threshold=0.5, workflow_id=7) == expected
+    assert cache.get_stats()["index"]["backend"] == "ivfpq"
+
+    # Cleared index is not re-populated from Chroma on the next start
+    cache.clear()
+    cache.collection.close()
+    restarted = CodeCacheService(
+        persist_directory=temp_dir, embedding_provider=provider, index_backend="ivfpq"
+    )
+    assert restarted.get_stats()["total_codes"] == 0
@@ -0,0 +1,134 @@
+"""
+Tests for the per-workflow partitioned code cache
+
+Tests that each workflow's cached code lives in its own small index:
+- Saves land in one Chroma collection per workflow; searches read only it
+- A workflow with nothing cached returns before any embedding call
+- Unscoped reads merge every partition (closest first, stable paging)
+- A pre-partitioning collection is split on first open
+- Rebuilds with new HNSW settings rebuild every partition
+- Reader workers check presence against the mapped segment
+"""
+
+import pytest
+
+from src.core import segments
+from src.core.code_cache_service import CodeCacheService
+from src.core.code_partitions import PartitionedCollection, partition_name, partition_names
+from src.core.hnsw_tuning import collection_hnsw
+from src.core.segments import SegmentStore
+from tests.conftest import FakeEmbeddingProvider
+
+
+def document(workflow_id, action="extract_pdf", description="Extract text from invoice PDF"):
+    return {
+        "ai_description": f"{description} ({action})",
+        "input_schema": {"pdf_data": "base64_large"},
+        "code": f"# {action} for workflow {workflow_id}",
+        "node_action": action,
+        "node_description": description,
+        "workflow_id": workflow_id,
+        "metadata": {}
+    }
+
+
+@pytest.fixture
+def cache(temp_dir):
+    cache = CodeCacheService(persist_directory=temp_dir, embedding_provider=FakeEmbeddingProvider())
+    for workflow_id in (7, 7, 8, None):
+        cache.save_code(document(workflow_id))
+    return cache
+
+
+def test_saves_and_searches_stay_in_the_workflow_partition(cache):
+    collection = cache.collection
+    assert isinstance(collection, PartitionedCollection)
+    assert partition_names(cache.client, "cached_code") == [
+        "cached_code__wf-1", "cached_code__wf7", "cached_code__wf8"
+    ]
+    assert cache.client.get_collection("cached_code").count() == 0
+    assert collection.count() == 4
+    assert [collection.partition_count(w) for w in (7, 8, -1, 9)] == [2, 1, 1, 0]
+
+    query = cache._build_searchable_text(document(8))
+    matches = cache.search_code(query, threshold=0.5, workflow_id=8)
+    assert [m["code"] for m in matches] == ["# extract_pdf for workflow 8"]
+
+    stats = cache.get_stats()
+    assert stats["total_codes"] == 4
+    assert stats["index"]["partitions"] == 3
+
+
+def test_empty_partition_skips_embedding(cache):
+    calls = len(cache.embedding_provider.calls)
+
+    assert cache.search_code("Extract text from invoice PDF", threshold=0.1, workflow_id=9) == []
+    assert len(cache.embedding_provider.calls) == calls
+
+    cache.search_code("Extract text from invoice PDF", threshold=0.1, workflow_id=7)
+    assert len(cache.embedding_provider.calls) == calls + 1
+
+
+def test_unscoped_reads_merge_partitions(cache):
+    query = cache.embedding_provider._vector(cache._build_searchable_text(document(7)))
+    results = cache.collection.query(query_embeddings=[query], n_results=3)
+
+    assert len(results["ids"][0]) == 3
+    assert results["distances"][0] == sorted(results["distances"][0])
+
+    everything = cache.collection.get()
+    pages = [cache.collection.get(limit=3, offset=offset)["ids"] for offset in (0, 3)]
+    assert pages[0] + pages[1] == everything["ids"]
+    assert sorted(m["workflow_id"] for m in cache.collection.get(where={"node_action": "extract_pdf"})["metadatas"]) == [-1, 7, 7, 8]
+
+
+def test_splits_pre_partitioning_collection(temp_dir):
+    provider = FakeEmbeddingProvider()
+    flat = CodeCacheService(persist_directory=temp_dir, embedding_provider=provider, partitioned=False)
+    for workflow_id in (3, 4, 4):
+        flat.save_code(document(workflow_id))
+
+    cache = CodeCacheService(client=flat.client, embedding_provider=provider)
+
+    assert cache.collection.partition_count(4) == 2
+    assert cache.client.get_collection("cached_code").count() == 0
+    query = cache._build_searchable_text(document(3))
+    assert len(cache.search_code(query, threshold=0.5, workflow_id=3)) == 1
+
+
+def test_rebuild_rebuilds_every_partition(cache):
+    cache.rebuild_collection(hnsw={**cache.hnsw, "M": 8})
+
+    assert collection_hnsw(cache.collection)["M"] == 8
+    for collection in cache.collection.partitions.values():
+        assert collection_hnsw(collection)["M"] == 8
+    assert cache.collection.partition_count(7) == 2
+
+    query = cache._build_searchable_text(document(7))
+    assert len(cache.search_code(query, threshold=0.5, workflow_id=7)) == 2
+
+    cache.clear()
+    assert cache.get_stats()["total_codes"] == 0
+    assert partition_names(cache.client, "cached_code") == []
+
+
+def test_reader_presence_from_segment(cache, temp_dir, monkeypatch):
+    monkeypatch.setattr(segments, "SEGMENT_REFRESH_SECONDS", 0.0)
+    store = SegmentStore(f"{temp_dir}/segments")
+    store.publish("code", cache.collection)
+
+    reader = CodeCacheService(
+        embedding_provider=cache.embedding_provider,
+        collection=store.collection("code", cache.embedding_provider.collection_metadata())
+    )
+
+    assert reader.collection.partition_count(7) == 2
+    calls = len(cache.embedding_provider.calls)
+    assert reader.search_code("anything", threshold=0.1, workflow_id=9) == []
+    assert len(cache.embedding_provider.calls) == calls
+
+
+def test_partition_names_are_valid_chroma_names():
+    assert partition_name("cached_code", 7) == "cached_code__wf7"
+    assert partition_name("cached_code", -1) == "cached_code__wf-1"
+    assert partition_name("cached_code", "tenant/a b").startswith("cached_code__wfh")
@@ -0,0 +1,73 @@
+"""
+Tests for the precomputed corpus artifact
+
+Tests build/load of knowledge-corpus embeddings:
+- Round trip through the float16 artifact
+- Stale corpus or different provider is rejected
+- Bulk load into VectorStore makes no provider calls
+"""
+
+import os
+
+import pytest
+
+from src.core.corpus_artifact import (
+    build_corpus_artifact,
+    load_corpus_artifact,
+    corpus_hash,
+)
+from src.core.vector_store import VectorStore
+from tests.conftest import FakeEmbeddingProvider
+
+
+CHUNKS = [
+    {"text": "fitz.open() opens a PDF document", "source": "pymupdf", "topic": "official",
+     "metadata": {"section": "Opening"}},
+    {"text": "imaplib.IMAP4_SSL connects to a mailbox", "source": "imap", "topic": "imap",
+     "metadata": {"section": "Connect"}},
+]
+
+
+def test_round_trip(temp_dir, fake_provider):
+    """Loaded chunks and vectors match what was built."""
+    artifact_dir = os.path.join(temp_dir, "artifact")
+    manifest = build_corpus_artifact(fake_provider, output_dir=artifact_dir, chunks=CHUNKS)
+
+    loaded = load_corpus_artifact(fake_provider, artifact_dir, expected_hash=corpus_hash(CHUNKS))
+
+    assert manifest["count"] == 2
+    assert manifest["embedding_dimensions"] == 64
+    chunks, embeddings = loaded
+    assert chunks == CHUNKS
+    expected = fake_provider._vector(CHUNKS[0]["text"])
+    assert embeddings[0] == pytest.approx(expected, abs=1e-3)
+
+
+def test_stale_or_foreign_artifact_rejected(temp_dir, fake_provider):
+    """Changed docs or another embedding model fall back to embedding."""
+    artifact_dir = os.path.join(temp_dir, "artifact")
+    build_corpus_artifact(fake_provider, output_dir=artifact_dir, chunks=CHUNKS)
+
+    changed = CHUNKS[:1]
+    assert load_corpus_artifact(fake_provider, artifact_dir, expected_hash=corpus_hash(changed)) is None
+    assert load_corpus_artifact(FakeEmbeddingProvider(model_name="other"), artifact_dir) is None
+    assert load_corpus_artifact(fake_provider, os.path.join(temp_dir, "missing")) is None
+
+
+def test_bulk_load_skips_provider(temp_dir, fake_provider):
+    """Pre-embedded documents are added without embedding calls."""
+    artifact_dir = os.path.join(temp_dir, "artifact")
+    build_corpus_artifact(fake_provider, output_dir=artifact_dir, chunks=CHUNKS)
+    chunks, embeddings = load_corpus_artifact(fake_provider, artifact_dir)
+
+    store = VectorStore(persist_directory=os.path.join(temp_dir, "db"), embedding_provider=fake_provider)
+    fake_provider.calls.clear()
+    store.add_embedded_documents(chunks, embeddings)
+
+    assert fake_provider.calls == []
+    assert store.get_stats()["total_documents"] == 2
+    assert store.get_stats()["sources"] == ["imap", "pymupdf"]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
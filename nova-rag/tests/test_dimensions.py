@@ -0,0 +1,113 @@
+"""
+Tests for reduced-dimension embeddings
+
+Tests that collections can store truncated (Matryoshka) vectors:
+- Truncation renormalizes and is only allowed for models trained for it
+- The code cache stores reduced vectors and accepts full-size client embeddings
+- rebuild_collection() rebuilds a collection without re-embedding and switches atomically
+- An interrupted switch is finished on the next start
+"""
+
+import numpy as np
+import pytest
+
+from src.core.code_cache_service import CodeCacheService
+from src.core.dimension_migration import benchmark_dimensions, recover_dimension_migration, staging_name
+from src.core.embedding_providers import reduce_dimensions, resolve_dimensions
+from src.core.vector_store import VectorStore
+from tests.conftest import FakeEmbeddingProvider
+
+
+DOCUMENT = {
+    "ai_description": "Extract text from PDF invoice",
+    "input_schema": {"pdf_data": "base64_large"},
+    "code": "import fitz",
+    "node_action": "extract_pdf",
+    "node_description": "Extract text from invoice PDF",
+    "workflow_id": 7,
+    "metadata": {}
+}
+
+DOCS = [
+    {"text": "PyMuPDF opens PDFs with fitz.open()", "source": "pymupdf", "topic": "opening"},
+    {"text": "EasyOCR reads text from images", "source": "easyocr", "topic": "text"},
+    {"text": "Gmail API sends messages with users.messages.send", "source": "gmail", "topic": "send"},
+]
+
+
+def truncatable():
+    return FakeEmbeddingProvider(model_name="text-embedding-3-small", dimensions=64)
+
+
+def test_reduce_and_resolve():
+    reduced = reduce_dimensions([[3.0, 4.0, 12.0]], 2)
+    assert reduced[0] == pytest.approx([0.6, 0.8])
+    assert reduce_dimensions([[1.0, 0.0]], 2) == [[1.0, 0.0]]
+
+    assert resolve_dimensions(truncatable(), 0) == 64
+    assert resolve_dimensions(truncatable(), 16) == 16
+    with pytest.raises(ValueError):
+        resolve_dimensions(truncatable(), 128)
+    with pytest.raises(ValueError):
+        resolve_dimensions(FakeEmbeddingProvider(), 16)
+
+
+def test_code_cache_stores_reduced_vectors(temp_dir):
+    provider = truncatable()
+    cache = CodeCacheService(persist_directory=temp_dir, embedding_provider=provider, dimensions=16)
+    assert cache.save_code(DOCUMENT)["success"] is True
+
+    stored = cache.collection.get(include=['embeddings'])['embeddings']
+    assert len(stored[0]) == 16
+    assert cache.get_stats()["index"]["dimensions"] == 16
+
+    # Full-size client embedding is reduced to the collection's size
+    query = cache._build_searchable_text(DOCUMENT)
+    full = provider.embed([query])[0]
+    matches = cache.search_code_detailed(query, threshold=0.5, query_embedding=full)["matches"]
+    assert [m["node_action"] for m in matches] == ["extract_pdf"]
+    assert matches[0]["score"] == pytest.approx(1.0, abs=1e-4)
+
+
+def test_vector_store_migration_projects_vectors(temp_dir):
+    provider = truncatable()
+    store = VectorStore(persist_directory=temp_dir, embedding_provider=provider)
+    store.add_documents(DOCS)
+    assert store.dimensions == 64
+    calls = len(provider.calls)
+
+    store.rebuild_collection(16)
+
+    assert provider.calls[calls:] == []
+    assert store.dimensions == 16 and not store.needs_rebuild
+    assert store.collection.count() == 3
+    assert [c.name for c in store.client.list_collections()] == ["nova_docs"]
+    assert store.query("open PDFs with fitz", top_k=1)[0]["source"] == "pymupdf"
+
+    # Restart keeps the migrated size
+    restarted = VectorStore(persist_directory=temp_dir, embedding_provider=provider, dimensions=16)
+    assert restarted.dimensions == 16 and not restarted.needs_rebuild
+
+
+def test_recovers_interrupted_switch(temp_dir):
+    provider = truncatable()
+    store = VectorStore(persist_directory=temp_dir, embedding_provider=provider, dimensions=16)
+    store.add_documents(DOCS)
+
+    # Crash after the source was removed but before the staging copy was renamed
+    store.collection.modify(name=staging_name("nova_docs", 16))
+    recover_dimension_migration(store.client, "nova_docs")
+
+    names = [c.name for c in store.client.list_collections()]
+    assert names == ["nova_docs"]
+    assert store.client.get_collection("nova_docs").count() == 3
+
+
+def test_benchmark_reports_recall():
+    vectors = np.random.default_rng(0).normal(size=(200, 32))
+    rows = benchmark_dimensions(vectors, [8, 32], top_k=5, num_queries=20)
+
+    assert [row["dimensions"] for row in rows] == [8, 32]
+    assert rows[1]["recall_exact"] == pytest.approx(1.0)
+    assert rows[0]["recall_exact"] < 1.0
+    assert rows[0]["bytes_per_vector"] == 32
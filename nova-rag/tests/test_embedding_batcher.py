@@ -0,0 +1,143 @@
+"""
+Tests for the embedding micro-batcher
+
+Tests that concurrent embed() calls are coalesced:
+- Callers within the window share one provider request
+- Max batch size triggers dispatch
+- Provider errors reach every waiting caller
+- A provider returning too few vectors fails every caller instead of hanging
+"""
+
+import asyncio
+import threading
+
+import pytest
+
+from src.core.embedding_batcher import MicroBatchingProvider
+from tests.conftest import FakeEmbeddingProvider
+
+
+def _embed_concurrently(provider, texts):
+    """Call provider.embed([text]) from one thread per text."""
+    results = {}
+    barrier = threading.Barrier(len(texts))
+
+    def worker(text):
+        barrier.wait()
+        results[text] = provider.embed([text])[0]
+
+    threads = [threading.Thread(target=worker, args=(text,)) for text in texts]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_calls_share_one_request():
+    """Texts arriving within the window go out as a single batch."""
+    inner = FakeEmbeddingProvider()
+    batcher = MicroBatchingProvider(inner, window_ms=200, max_batch_size=64)
+
+    texts = [f"query number {i}" for i in range(8)]
+    results = _embed_concurrently(batcher, texts)
+    batcher.close()
+
+    assert len(inner.calls) == 1
+    assert sorted(inner.calls[0]) == sorted(texts)
+    for text in texts:
+        assert results[text] == inner._vector(text)
+
+
+def test_max_batch_size_splits_batches():
+    """No provider request exceeds max_batch_size."""
+    inner = FakeEmbeddingProvider()
+    batcher = MicroBatchingProvider(inner, window_ms=200, max_batch_size=3)
+
+    _embed_concurrently(batcher, [f"text {i}" for i in range(7)])
+    batcher.close()
+
+    assert all(len(call) <= 3 for call in inner.calls)
+    assert sum(len(call) for call in inner.calls) == 7
+
+
+def test_identical_texts_embedded_once():
+    """Concurrent callers with the same text share one vector."""
+    inner = FakeEmbeddingProvider()
+    batcher = MicroBatchingProvider(inner, window_ms=200)
+
+    futures = [batcher.submit(["same query"]) for _ in range(5)]
+    vectors = [future.result() for future in futures]
+    batcher.close()
+
+    assert inner.calls == [["same query"]]
+    assert all(vector == vectors[0] for vector in vectors)
+
+
+def test_provider_error_propagates():
+    """Every caller in a failed batch gets the exception."""
+
+    class FailingProvider(FakeEmbeddingProvider):
+        def embed(self, texts):
+            raise RuntimeError("rate limited")
+
+    batcher = MicroBatchingProvider(FailingProvider(), window_ms=50)
+    futures = [batcher.submit([f"q{i}"]) for i in range(3)]
+
+    for future in futures:
+        with pytest.raises(RuntimeError, match="rate limited"):
+            future.result()
+    batcher.close()
+
+
+def test_short_provider_response_fails_every_caller():
+    """Fewer vectors than texts: every caller gets the error, none blocks."""
+
+    class ShortProvider(FakeEmbeddingProvider):
+        def embed(self, texts):
+            return super().embed(texts)[:-1]
+
+        async def aembed(self, texts):
+            return self.embed(texts)
+
+    batcher = MicroBatchingProvider(ShortProvider(), window_ms=50)
+    futures = [batcher.submit([f"q{i}"]) for i in range(3)]
+    for future in futures:
+        with pytest.raises(ValueError, match="2 vectors for 3 texts"):
+            future.result(timeout=5)
+
+    async def run():
+        return await asyncio.gather(*[batcher.aembed([f"a{i}"]) for i in range(3)], return_exceptions=True)
+
+    results = asyncio.run(asyncio.wait_for(run(), timeout=5))
+    assert all(isinstance(result, ValueError) for result in results)
+    batcher.close()
+
+
+def test_async_callers_share_one_request():
+    """Concurrent aembed() calls are batched on the event loop."""
+    inner = FakeEmbeddingProvider()
+    batcher = MicroBatchingProvider(inner, window_ms=50)
+
+    async def run():
+        return await asyncio.gather(*[batcher.aembed([f"async {i}"]) for i in range(6)])
+
+    results = asyncio.run(run())
+    batcher.close()
+
+    assert len(inner.calls) == 1
+    assert results[2][0] == inner._vector("async 2")
+
+
+def test_delegates_provider_identity():
+    """Cache keys and collection metadata match the wrapped provider."""
+    inner = FakeEmbeddingProvider()
+    batcher = MicroBatchingProvider(inner)
+
+    assert batcher.cache_namespace == inner.cache_namespace
+    assert batcher.collection_metadata() == inner.collection_metadata()
+    batcher.close()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
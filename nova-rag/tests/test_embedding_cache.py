@@ -0,0 +1,138 @@
+"""
+Tests for Embedding Cache
+
+Tests the persistent embedding cache including:
+- Cache hits skip the provider
+- Keys depend on model and text
+- LRU eviction when over capacity
+- Persistence across instances
+- Hits are written to last_access in batches, not on every lookup
+- Workers sharing the file enforce one bound and report the real count
+"""
+
+import pytest
+import tempfile
+import shutil
+import os
+
+from src.core.embedding_cache import EmbeddingCache
+
+
+@pytest.fixture
+def temp_db_path():
+    """Create temporary directory for test cache."""
+    temp_dir = tempfile.mkdtemp()
+    yield temp_dir
+    shutil.rmtree(temp_dir)
+
+
+class CountingEmbedder:
+    """Fake provider that records every text it embeds."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(text)), 1.0, 0.5] for text in texts]
+
+
+def test_get_or_embed_uses_cache(temp_db_path):
+    """Second lookup for the same text does not call the provider."""
+    cache = EmbeddingCache(os.path.join(temp_db_path, "cache.sqlite3"))
+    embedder = CountingEmbedder()
+
+    first = cache.get_or_embed("model-a", ["hello", "world"], embedder)
+    second = cache.get_or_embed("model-a", ["world", "hello", "new"], embedder)
+
+    assert embedder.calls == [["hello", "world"], ["new"]]
+    assert first[0] == second[1]
+    assert first[1] == second[0]
+    assert cache.get_stats()["hits"] == 2
+
+
+def test_duplicate_texts_embedded_once(temp_db_path):
+    """Repeated texts in one call are sent to the provider once."""
+    cache = EmbeddingCache(os.path.join(temp_db_path, "cache.sqlite3"))
+    embedder = CountingEmbedder()
+
+    vectors = cache.get_or_embed("model-a", ["same", "same", "other"], embedder)
+
+    assert embedder.calls == [["same", "other"]]
+    assert vectors[0] == vectors[1]
+
+
+def test_key_includes_model(temp_db_path):
+    """Same text under a different model is a cache miss."""
+    cache = EmbeddingCache(os.path.join(temp_db_path, "cache.sqlite3"))
+    embedder = CountingEmbedder()
+
+    cache.get_or_embed("model-a", ["hello"], embedder)
+    cache.get_or_embed("model-b", ["hello"], embedder)
+
+    assert len(embedder.calls) == 2
+
+
+def test_lru_eviction(temp_db_path):
+    """Least recently used entries are evicted when over capacity."""
+    cache = EmbeddingCache(os.path.join(temp_db_path, "cache.sqlite3"), max_entries=2)
+    embedder = CountingEmbedder()
+
+    cache.get_or_embed("m", ["a"], embedder)
+    cache.get_or_embed("m", ["b"], embedder)
+    cache.get_or_embed("m", ["a"], embedder)  # touch "a", "b" is now LRU
+    cache.get_or_embed("m", ["c"], embedder)
+
+    assert cache.get_stats()["entries"] == 2
+    assert cache.get_stats()["evictions"] == 1
+    assert cache.get_many("m", ["a", "b", "c"])[1] is None
+
+
+def test_hits_do_not_write_until_flushed(temp_db_path):
+    """Lookups keep recency in memory; eviction and flush write it."""
+    path = os.path.join(temp_db_path, "cache.sqlite3")
+    cache = EmbeddingCache(path, max_entries=2, touch_interval=3600)
+    embedder = CountingEmbedder()
+    cache.get_or_embed("m", ["a"], embedder)
+    cache.get_or_embed("m", ["b"], embedder)
+
+    changes = cache._conn.total_changes
+    cache.get_many("m", ["a"])
+    assert cache._conn.total_changes == changes
+
+    # The pending touch still decides what is evicted
+    cache.get_or_embed("m", ["c"], embedder)
+    assert cache.get_many("m", ["a", "b"])[1] is None
+
+    cache.flush()
+    assert cache._touched == {}
+
+
+def test_workers_sharing_the_file_keep_one_bound(temp_db_path):
+    """Each instance counts the rows the others inserted before evicting."""
+    path = os.path.join(temp_db_path, "cache.sqlite3")
+    workers = [EmbeddingCache(path, max_entries=4) for _ in range(3)]
+    embedder = CountingEmbedder()
+
+    for i in range(12):
+        workers[i % 3].get_or_embed("m", [f"text {i}"], embedder)
+
+    assert all(worker.get_stats()["entries"] == 4 for worker in workers)
+    assert sum(worker.evictions for worker in workers) == 8
+
+
+def test_persists_across_instances(temp_db_path):
+    """Vectors survive reopening the cache file."""
+    path = os.path.join(temp_db_path, "cache.sqlite3")
+    EmbeddingCache(path).get_or_embed("m", ["persisted"], CountingEmbedder())
+
+    reopened = EmbeddingCache(path)
+    embedder = CountingEmbedder()
+    vectors = reopened.get_or_embed("m", ["persisted"], embedder)
+
+    assert embedder.calls == []
+    assert vectors[0] == [9.0, 1.0, 0.5]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,88 @@
+"""
+Tests for embedding providers
+
+Tests provider selection and per-collection provider bookkeeping:
+- Collections record the provider they were built with
+- Opening a collection with a different provider fails loudly
+- Services run end-to-end with a network-free provider
+"""
+
+import pytest
+
+from src.core.embedding_providers import (
+    OpenAIEmbeddingProvider,
+    get_embedding_provider,
+)
+from src.core.vector_store import VectorStore
+from src.core.code_cache_service import CodeCacheService
+from tests.conftest import FakeEmbeddingProvider
+
+
+def test_collection_records_provider(temp_dir, fake_provider):
+    """New collections store provider, model and dimensions."""
+    store = VectorStore(persist_directory=temp_dir, embedding_provider=fake_provider)
+
+    metadata = store.collection.metadata
+    assert metadata["embedding_provider"] == "fake"
+    assert metadata["embedding_model"] == "fake-bow"
+    assert metadata["embedding_dimensions"] == 64
+
+
+def test_provider_mismatch_raises(temp_dir, fake_provider):
+    """Reopening a non-empty collection with another model is rejected."""
+    store = VectorStore(persist_directory=temp_dir, embedding_provider=fake_provider)
+    store.add_documents([{"text": "fitz.open opens a PDF", "source": "pymupdf"}])
+
+    with pytest.raises(ValueError, match="was built with fake/fake-bow"):
+        VectorStore(
+            persist_directory=temp_dir,
+            embedding_provider=FakeEmbeddingProvider(model_name="other-model")
+        )
+
+
+def test_clear_keeps_provider_metadata(temp_dir, fake_provider):
+    """Recreated collections still record the provider."""
+    store = VectorStore(persist_directory=temp_dir, embedding_provider=fake_provider)
+    store.clear()
+
+    assert store.collection.metadata["embedding_provider"] == "fake"
+
+
+def test_code_cache_offline_roundtrip(temp_dir, fake_provider):
+    """Code cache saves and finds code without any network provider."""
+    cache = CodeCacheService(
+        persist_directory=temp_dir,
+        collection_name="test_cached_code",
+        embedding_provider=fake_provider
+    )
+
+    cache.save_code({
+        "ai_description": "Extract text from PDF",
+        "input_schema": {"pdf_data": "base64_large"},
+        "code": "import fitz",
+        "node_action": "extract_pdf",
+        "node_description": "Extract PDF",
+        "metadata": {}
+    })
+
+    matches = cache.search_code(
+        "Prompt: Extract text from PDF\n\nInput Schema:\n{\n  \"pdf_data\": \"base64_large\"\n}",
+        threshold=0.9
+    )
+
+    assert len(matches) == 1
+    assert matches[0]["node_action"] == "extract_pdf"
+
+
+def test_factory_selects_provider(monkeypatch):
+    """EMBEDDING_PROVIDER chooses the backend."""
+    monkeypatch.setenv("EMBEDDING_PROVIDER", "openai")
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    assert isinstance(get_embedding_provider(), OpenAIEmbeddingProvider)
+
+    with pytest.raises(ValueError):
+        get_embedding_provider("unknown")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
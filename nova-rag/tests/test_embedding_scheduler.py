@@ -0,0 +1,144 @@
+"""
+Tests for the embedding priority scheduler
+
+Tests that provider traffic is admitted by priority class:
+- Interactive requests jump ahead of queued bulk requests
+- Per-class concurrency caps leave room for interactive traffic
+- Token budgets throttle one class without touching the others
+- Lanes route through for_priority (including via the micro-batcher)
+"""
+
+import asyncio
+import threading
+import time
+
+from src.core.embedding_batcher import MicroBatchingProvider
+from src.core.embedding_scheduler import EmbeddingScheduler, Priority
+from tests.conftest import FakeEmbeddingProvider
+
+
+class GatedProvider(FakeEmbeddingProvider):
+    """Fake provider whose calls block until the gate opens."""
+
+    def __init__(self):
+        super().__init__()
+        self.gate = threading.Event()
+        self.started = threading.Semaphore(0)
+        self.order = []
+
+    def embed(self, texts):
+        self.order.append(texts[0])
+        self.started.release()
+        self.gate.wait(timeout=5)
+        return super().embed(texts)
+
+
+def _start(fn, *args):
+    thread = threading.Thread(target=fn, args=args)
+    thread.start()
+    return thread
+
+
+def test_interactive_admitted_before_queued_bulk():
+    """With all slots busy, a later interactive request goes before earlier bulk ones."""
+    provider = GatedProvider()
+    scheduler = EmbeddingScheduler(provider, max_concurrency=1)
+
+    threads = [_start(scheduler.embed, ["bulk-1"], Priority.BULK)]
+    assert provider.started.acquire(timeout=2)
+
+    threads.append(_start(scheduler.embed, ["bulk-2"], Priority.BULK))
+    time.sleep(0.05)
+    threads.append(_start(scheduler.embed, ["search"], Priority.INTERACTIVE))
+    time.sleep(0.05)
+
+    provider.gate.set()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert provider.order == ["bulk-1", "search", "bulk-2"]
+
+
+def test_bulk_cap_leaves_room_for_interactive():
+    """Bulk saturating its own cap does not block interactive requests."""
+    provider = GatedProvider()
+    scheduler = EmbeddingScheduler(
+        provider,
+        max_concurrency=4,
+        lanes={Priority.BULK: {"max_concurrency": 2}}
+    )
+
+    threads = [_start(scheduler.embed, [f"bulk-{i}"], Priority.BULK) for i in range(4)]
+    assert provider.started.acquire(timeout=2)
+    assert provider.started.acquire(timeout=2)
+    time.sleep(0.05)
+
+    stats = scheduler.get_stats()["classes"]["bulk"]
+    assert stats["active"] == 2
+    assert stats["waiting"] == 2
+
+    threads.append(_start(scheduler.embed, ["search"], Priority.INTERACTIVE))
+    assert provider.started.acquire(timeout=2)
+    assert provider.order[-1] == "search"
+
+    provider.gate.set()
+    for thread in threads:
+        thread.join(timeout=5)
+
+
+def test_token_budget_throttles_only_its_class():
+    """An exhausted bulk token budget delays bulk but not interactive requests."""
+    provider = FakeEmbeddingProvider()
+    # 600 tokens/min -> 100-token burst, refilled at 10 tokens/s
+    scheduler = EmbeddingScheduler(
+        provider,
+        lanes={Priority.BULK: {"tokens_per_minute": 600}}
+    )
+    text = "x" * 297  # ~100 tokens with the default estimate
+
+    scheduler.embed([text], Priority.BULK)
+
+    started = time.monotonic()
+    scheduler.embed([text], Priority.INTERACTIVE)
+    assert time.monotonic() - started < 0.5
+
+    blocked = threading.Thread(target=scheduler.embed, args=([text], Priority.BULK))
+    blocked.start()
+    blocked.join(timeout=0.5)
+    assert blocked.is_alive()
+    assert scheduler.get_stats()["classes"]["bulk"]["waiting"] == 1
+
+
+def test_async_requests_are_scheduled():
+    """aembed goes through the same admission control."""
+    provider = FakeEmbeddingProvider()
+    scheduler = EmbeddingScheduler(provider)
+
+    async def run():
+        return await asyncio.gather(*(
+            scheduler.lane(priority).aembed([f"text {priority.name}"])
+            for priority in Priority
+        ))
+
+    results = asyncio.run(run())
+
+    assert [len(vectors) for vectors in results] == [1, 1, 1]
+    classes = scheduler.get_stats()["classes"]
+    assert all(classes[p.name.lower()]["requests"] == 1 for p in Priority)
+    assert scheduler.get_stats()["in_flight"] == 0
+
+
+def test_for_priority_routes_to_lanes():
+    """The batcher keeps interactive traffic and hands other classes to their lanes."""
+    scheduler = EmbeddingScheduler(FakeEmbeddingProvider())
+    batcher = MicroBatchingProvider(scheduler.lane(Priority.INTERACTIVE), window_ms=1)
+
+    try:
+        assert batcher.for_priority(Priority.INTERACTIVE) is batcher
+        assert batcher.for_priority(Priority.BULK) is scheduler.lane(Priority.BULK)
+        assert scheduler.lane(Priority.SAVE).for_priority(Priority.BULK) is scheduler.lane(Priority.BULK)
+
+        batcher.for_priority(Priority.SAVE).embed(["save me"])
+        assert scheduler.get_stats()["classes"]["save"]["requests"] == 1
+    finally:
+        batcher.close()
@@ -0,0 +1,73 @@
+"""
+Tests for the in-memory exact-search index
+
+Tests that /rag/query can be served without Chroma's HNSW layer:
+- Results and distances match a Chroma query on the same collection
+- Source/topic masks filter like Chroma where clauses
+- Reload keeps serving the old snapshot until the new one is swapped in
+"""
+
+import numpy as np
+import pytest
+
+from src.core.exact_index import ExactIndex
+from src.core.vector_store import VectorStore
+from tests.conftest import FakeEmbeddingProvider
+
+
+DOCS = [
+    {"text": "PyMuPDF opens PDFs with fitz.open()", "source": "pymupdf", "topic": "opening"},
+    {"text": "Extract text from PDF pages with page.get_text()", "source": "pymupdf", "topic": "text"},
+    {"text": "EasyOCR reads text from images, use gpu=False", "source": "easyocr", "topic": "text"},
+    {"text": "Google Vision OCR detects text in scanned images", "source": "google_vision", "topic": "official"},
+]
+
+
+@pytest.fixture
+def store(temp_dir):
+    store = VectorStore(persist_directory=temp_dir, embedding_provider=FakeEmbeddingProvider())
+    store.add_documents(DOCS)
+    return store
+
+
+def test_matches_chroma_results(store):
+    """Exact search returns Chroma's neighbours with the same L2 distances."""
+    query = store.embedding_provider._vector("extract text from PDF")
+
+    exact = store._query_collection(query, 4, None, None)
+    chroma = store.collection.query(query_embeddings=[query], n_results=4, include=['documents', 'distances'])
+
+    assert [r['text'] for r in exact] == chroma['documents'][0]
+    assert np.allclose([r['distance'] for r in exact], chroma['distances'][0], atol=1e-4)
+
+
+def test_masks_filter_source_and_topic(store):
+    """Filters combine as AND; unknown values return nothing."""
+    query = store.embedding_provider._vector("text")
+    index = store._exact_index
+
+    assert {r['source'] for r in index.search(query, 10, filter_topic="text")} == {"pymupdf", "easyocr"}
+    both = index.search(query, 10, filter_source="pymupdf", filter_topic="text")
+    assert [r['text'] for r in both] == [DOCS[1]['text']]
+    assert index.search(query, 10, filter_source="missing") == []
+
+
+def test_reload_swaps_snapshot_atomically(store):
+    """clear(keep_index=True) keeps serving the old corpus until the new load."""
+    query = store.embedding_provider._vector("open PDFs")
+
+    store.clear(keep_index=True)
+    assert store.collection.count() == 0
+    assert store.query("open PDFs", top_k=1)[0]['source'] == "pymupdf"
+
+    store.add_documents([{"text": "New docs about opening spreadsheets", "source": "openpyxl", "topic": "opening"}])
+    assert [r['source'] for r in store._query_collection(query, 5, None, None)] == ["openpyxl"]
+
+    store.clear()
+    assert store.query("open PDFs") == []
+
+
+def test_rejects_wrong_dimensions():
+    index = ExactIndex([[1.0, 0.0]], ["a"], [{"source": "s"}])
+    with pytest.raises(ValueError):
+        index.search([1.0, 0.0, 0.0])
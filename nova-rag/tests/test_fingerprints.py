@@ -0,0 +1,193 @@
+"""
+Tests for the exact-fingerprint fast path of the code cache
+
+Tests that exact repeats of a saved request skip the embedding call:
+- Descriptions are canonicalized (case, spacing, volatile literals)
+- Schema signatures ignore key order and values, keep keys and types
+- A repeated query returns score 1.0 without embedding or index search
+- Matches stay scoped by workflow_id; other queries take the semantic path
+- Reader workers and entries saved before fingerprints get the map too
+- Reader maps follow segment deltas without being rebuilt
+"""
+
+import asyncio
+
+import pytest
+
+from src.core import segments
+from src.core.code_cache_service import CodeCacheService
+from src.core.fingerprints import (
+    canonical_description, parse_searchable_text, query_fingerprint, request_fingerprint, schema_signature
+)
+from src.core.segments import SegmentStore
+from tests.conftest import FakeEmbeddingProvider
+
+
+def document(workflow_id=None, prompt="Leer email y extraer PDF de facturas", code="import fitz"):
+    return {
+        "ai_description": prompt,
+        "input_schema": {"email_user": "str", "email_password": "str", "invoice_pdf": "base64_large"},
+        "code": code,
+        "node_action": "extract_pdf",
+        "node_description": "Extract PDF text",
+        "workflow_id": workflow_id,
+        "metadata": {"success_count": 1, "libraries_used": ["fitz"]}
+    }
+
+
+@pytest.fixture
+def cache(temp_dir):
+    return CodeCacheService(persist_directory=temp_dir, embedding_provider=FakeEmbeddingProvider())
+
+
+def test_canonical_description_normalizes_volatile_literals():
+    assert canonical_description("  Send REPORT\nto ana@example.com  ") == "send report to <email>"
+    assert canonical_description("Factura 2025-001234 del 2025-11-23T10:00:00") == "factura <n>-<n> del <date>"
+    assert canonical_description("id 550e8400-e29b-41d4-a716-446655440000 at 10:30") == "id <uuid> at <time>"
+    assert canonical_description("Read top 5 rows") != canonical_description("Read top 10 rows")
+
+
+def test_schema_signature_keeps_keys_and_types():
+    assert schema_signature({"b": "str", "a": "int"}) == schema_signature({"a": "int", "b": "str"})
+    assert schema_signature({"rows": [{"id": 1}, {"id": 2}]}) == "{rows:[{id:int}]}"
+    assert schema_signature({"a": "str"}) != schema_signature({"a": "base64_large"})
+    assert schema_signature({"a": "str"}) != schema_signature({"a": "str", "b": "str"})
+
+
+def test_query_and_document_fingerprints_agree(cache):
+    doc = document()
+    query = cache._build_searchable_text(doc)
+
+    assert parse_searchable_text(query) == (doc["ai_description"], doc["input_schema"])
+    assert query_fingerprint(query) == request_fingerprint(doc["ai_description"], doc["input_schema"])
+    assert parse_searchable_text("plain task text") == ("plain task text", None)
+
+
+def test_exact_repeat_skips_embedding(cache):
+    cache.save_code(document(workflow_id=5))
+    calls = len(cache.embedding_provider.calls)
+
+    # Reordered schema, different spacing and case: still the same request
+    query = "Prompt: LEER email  y extraer PDF de facturas\n\nInput Schema:\n" \
+            '{"invoice_pdf": "base64_large", "email_user": "str", "email_password": "str"}'
+    result = cache.search_code_detailed(query, threshold=0.99, workflow_id=5)
+
+    assert result["exact_match"] is True
+    assert result["query_embedding"] is None
+    assert [m["score"] for m in result["matches"]] == [1.0]
+    assert result["matches"][0]["code"] == "import fitz"
+    assert len(cache.embedding_provider.calls) == calls
+
+    async_result = asyncio.run(cache.asearch_code_detailed(query, threshold=0.99, workflow_id=5))
+    assert async_result["exact_match"] is True
+    assert len(cache.embedding_provider.calls) == calls
+
+
+def test_exact_matches_are_scoped_by_workflow(cache):
+    cache.save_code(document(workflow_id=5, code="# wf5"))
+    cache.save_code(document(workflow_id=6, code="# wf6"))
+    query = cache._build_searchable_text(document())
+
+    assert [m["code"] for m in cache.search_code(query, workflow_id=6)] == ["# wf6"]
+    assert sorted(m["code"] for m in cache.search_code(query)) == ["# wf5", "# wf6"]
+
+    result = cache.search_code_detailed(query, threshold=0.1, workflow_id=7)
+    assert result["exact_match"] is False
+
+
+def test_other_queries_take_semantic_path(cache):
+    cache.save_code(document(workflow_id=5))
+    calls = len(cache.embedding_provider.calls)
+
+    query = cache._build_searchable_text(document(prompt="Extraer PDF de facturas desde email"))
+    result = cache.search_code_detailed(query, threshold=0.1, workflow_id=5)
+
+    assert result["exact_match"] is False
+    assert len(cache.embedding_provider.calls) == calls + 1
+
+
+def test_map_built_from_existing_entries(cache, temp_dir):
+    cache.save_code(document(workflow_id=5))
+    assert cache.collection.get(include=['metadatas'])['metadatas'][0]["request_fingerprint"]
+
+    restarted = CodeCacheService(client=cache.client, embedding_provider=cache.embedding_provider)
+    calls = len(cache.embedding_provider.calls)
+    query = cache._build_searchable_text(document())
+
+    assert restarted.search_code_detailed(query, workflow_id=5)["exact_match"] is True
+    assert len(cache.embedding_provider.calls) == calls
+
+    restarted.clear()
+    assert restarted.search_code_detailed(query, workflow_id=5)["matches"] == []
+
+
+def test_legacy_entries_without_request_fingerprint(cache):
+    doc = document(workflow_id=5)
+    searchable_text = cache._build_searchable_text(doc)
+    cache.collection.add(
+        ids=["legacy"],
+        embeddings=[cache.embedding_provider._vector(searchable_text)],
+        documents=["# legacy"],
+        metadatas=[{"workflow_id": 5, "search_text": searchable_text, "node_action": "extract_pdf"}]
+    )
+
+    result = cache.search_code_detailed(searchable_text, workflow_id=5)
+    assert result["exact_match"] is True
+    assert result["matches"][0]["code"] == "# legacy"
+
+
+def test_reader_rebuilds_map_per_generation(cache, temp_dir, monkeypatch):
+    monkeypatch.setattr(segments, "SEGMENT_REFRESH_SECONDS", 0.0)
+    store = SegmentStore(f"{temp_dir}/segments")
+    cache.save_code(document(workflow_id=5, code="# first"))
+    store.publish("code", cache.collection)
+
+    reader = CodeCacheService(
+        embedding_provider=cache.embedding_provider,
+        collection=store.collection("code", cache.embedding_provider.collection_metadata())
+    )
+    query = cache._build_searchable_text(document())
+    assert [m["code"] for m in reader.search_code(query, workflow_id=5)] == ["# first"]
+
+    cache.save_code(document(workflow_id=5, code="# second"))
+    store.publish("code", cache.collection)
+
+    assert [m["code"] for m in reader.search_code(query, workflow_id=5)] == ["# second", "# first"]
+
+
+def test_reader_map_follows_deltas(cache, temp_dir, monkeypatch):
+    monkeypatch.setattr(segments, "SEGMENT_REFRESH_SECONDS", 0.0)
+    store = SegmentStore(f"{temp_dir}/segments")
+    cache.segment_store = store
+    cache.save_code(document(workflow_id=5, code="# first"))
+    cache.publish_segment(force=True)
+
+    reader = CodeCacheService(
+        embedding_provider=cache.embedding_provider,
+        collection=store.collection("code", cache.embedding_provider.collection_metadata())
+    )
+    query = cache._build_searchable_text(document())
+    assert [m["code"] for m in reader.search_code(query, workflow_id=5)] == ["# first"]
+    index = reader._fingerprints
+
+    second = cache.save_code(document(workflow_id=5, code="# second"))["id"]
+    cache.publish_segment()
+    assert [m["code"] for m in reader.search_code(query, workflow_id=5)] == ["# second", "# first"]
+
+    cache.collection.delete(ids=[second])
+    cache._segment_deleted.append(second)
+    cache.publish_segment()
+    assert [m["code"] for m in reader.search_code(query, workflow_id=5)] == ["# first"]
+    assert reader._fingerprints is index
+
+
+def test_exact_match_can_be_disabled(temp_dir):
+    cache = CodeCacheService(
+        persist_directory=temp_dir, embedding_provider=FakeEmbeddingProvider(), exact_match=False
+    )
+    cache.save_code(document(workflow_id=5))
+    query = cache._build_searchable_text(document())
+
+    result = cache.search_code_detailed(query, threshold=0.5, workflow_id=5)
+    assert result["exact_match"] is False
+    assert len(result["matches"]) == 1
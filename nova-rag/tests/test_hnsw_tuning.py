@@ -0,0 +1,85 @@
+"""
+Tests for per-collection HNSW settings and tuning
+
+Tests that HNSW parameters are configurable per collection:
+- Settings are parsed strictly and recorded on new collections
+- Configured settings that differ from an existing collection trigger an online rebuild
+- The sweep measures recall on held-out queries and picks the fastest passing setting
+"""
+
+import numpy as np
+import pytest
+
+from src.core.code_cache_service import CodeCacheService
+from src.core.hnsw_tuning import (
+    CHROMA_DEFAULTS, choose_hnsw, collection_hnsw, format_hnsw, parse_hnsw, sweep_hnsw
+)
+from src.core.vector_store import VectorStore
+from tests.conftest import FakeEmbeddingProvider
+
+
+DOCS = [
+    {"text": "PyMuPDF opens PDFs with fitz.open()", "source": "pymupdf", "topic": "opening"},
+    {"text": "EasyOCR reads text from images", "source": "easyocr", "topic": "text"},
+    {"text": "Gmail API sends messages with users.messages.send", "source": "gmail", "topic": "send"},
+]
+
+
+def test_parse_hnsw():
+    settings = parse_hnsw("M=24, search_ef=80")
+    assert settings == {"M": 24, "search_ef": 80}
+    assert parse_hnsw(format_hnsw(settings)) == settings
+    assert parse_hnsw("") == {}
+
+    with pytest.raises(ValueError):
+        parse_hnsw("space=cosine")
+    with pytest.raises(ValueError):
+        parse_hnsw("M=many")
+    with pytest.raises(ValueError):
+        parse_hnsw("batch_size=1")
+
+
+def test_collections_get_their_own_settings(temp_dir):
+    provider = FakeEmbeddingProvider()
+    store = VectorStore(persist_directory=temp_dir, embedding_provider=provider, hnsw={"M": 32, "search_ef": 128})
+    cache = CodeCacheService(client=store.client, embedding_provider=provider, hnsw={"M": 12, "sync_threshold": 5000})
+
+    assert collection_hnsw(store.collection)["M"] == 32
+    assert collection_hnsw(store.collection)["search_ef"] == 128
+    assert collection_hnsw(cache.collection)["M"] == 12
+    assert collection_hnsw(cache.collection)["search_ef"] == CHROMA_DEFAULTS["search_ef"]
+    assert cache.get_stats()["index"]["hnsw"]["sync_threshold"] == 5000
+    assert not store.needs_rebuild and not cache.needs_rebuild
+
+
+def test_rebuild_with_new_settings(temp_dir):
+    provider = FakeEmbeddingProvider()
+    VectorStore(persist_directory=temp_dir, embedding_provider=provider, hnsw={"M": 16}).add_documents(DOCS)
+
+    store = VectorStore(persist_directory=temp_dir, embedding_provider=provider, hnsw={"M": 8, "search_ef": 50})
+    assert store.needs_rebuild
+    calls = len(provider.calls)
+
+    store.rebuild_collection()
+
+    assert provider.calls[calls:] == []
+    assert not store.needs_rebuild
+    assert collection_hnsw(store.collection)["M"] == 8
+    assert store.collection.count() == 3
+    assert [c.name for c in store.client.list_collections()] == ["nova_docs"]
+    assert store.query("open PDFs with fitz", top_k=1)[0]["source"] == "pymupdf"
+
+
+def test_sweep_and_choose():
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(20, 32))
+    vectors = centers[rng.integers(0, 20, 2000)] + rng.normal(scale=0.5, size=(2000, 32))
+
+    rows = sweep_hnsw(vectors, top_k=5, num_queries=50, m_values=[8], construction_ef_values=[50], search_ef_values=[5, 200])
+    assert [row["search_ef"] for row in rows] == [5, 200]
+    assert rows[1]["recall"] >= rows[0]["recall"]
+    assert rows[1]["recall"] > 0.9
+    assert all(row["index_bytes"] > 0 and row["p99_ms"] >= row["p50_ms"] for row in rows)
+
+    assert choose_hnsw(rows, target_recall=rows[1]["recall"]) is rows[1]
+    assert choose_hnsw(rows, target_recall=2.0) is rows[1]
@@ -0,0 +1,93 @@
+"""
+Tests for bulk ingestion
+
+Tests token-aware batching and failure handling:
+- Batches respect token and input budgets
+- Rate limits back off and succeed
+- Rejected batches are split down to the failing input
+- Fatal errors propagate
+"""
+
+import pytest
+
+from src.core.ingestion import BulkEmbedder, pack_batches
+from tests.conftest import FakeEmbeddingProvider
+
+
+class ProviderError(Exception):
+    """Stand-in for openai.APIStatusError."""
+
+    def __init__(self, status_code, message="error"):
+        super().__init__(message)
+        self.status_code = status_code
+        self.response = None
+
+
+def test_pack_batches_respects_budgets():
+    """No batch exceeds the token budget or input limit."""
+    texts = ["a" * 30, "b" * 30, "c" * 30, "d" * 300, "e" * 3]
+
+    batches = pack_batches(texts, lambda t: len(t), max_tokens=60, max_inputs=2)
+
+    assert batches == [[0, 1], [2], [3], [4]]
+
+
+def test_rate_limit_backoff_recovers():
+    """429s are retried after backoff and the load completes."""
+
+    class RateLimitedProvider(FakeEmbeddingProvider):
+        failures = 2
+
+        def embed(self, texts):
+            if self.failures:
+                self.failures -= 1
+                raise ProviderError(429, "rate limited")
+            return super().embed(texts)
+
+    provider = RateLimitedProvider()
+    embedder = BulkEmbedder(provider, max_in_flight=2, base_delay=0.001)
+
+    vectors = embedder.embed(["one", "two", "three"])
+
+    assert vectors[1] == provider._vector("two")
+    assert embedder.get_stats()["rate_limited"] == 2
+
+
+def test_rejected_batch_is_split():
+    """A 400 splits the batch until the bad input is isolated."""
+
+    class PickyProvider(FakeEmbeddingProvider):
+        def embed(self, texts):
+            if "poison" in texts and len(texts) > 1:
+                raise ProviderError(400, "too many tokens")
+            return super().embed(texts)
+
+    provider = PickyProvider()
+    embedder = BulkEmbedder(provider, base_delay=0.001)
+    done = []
+
+    vectors = embedder.embed(
+        ["a", "b", "poison", "c"],
+        on_batch=lambda texts, _: done.extend(texts)
+    )
+
+    assert len(vectors) == 4
+    assert sorted(done) == ["a", "b", "c", "poison"]
+    assert embedder.get_stats()["splits"] >= 1
+
+
+def test_fatal_error_propagates():
+    """Auth errors are not retried."""
+
+    class UnauthorizedProvider(FakeEmbeddingProvider):
+        def embed(self, texts):
+            raise ProviderError(401, "bad key")
+
+    embedder = BulkEmbedder(UnauthorizedProvider(), base_delay=0.001)
+
+    with pytest.raises(ProviderError, match="bad key"):
+        embedder.embed(["a"])
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
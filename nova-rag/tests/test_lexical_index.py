@@ -0,0 +1,115 @@
+"""
+Tests for the BM25 lexical index and hybrid documentation search
+
+Tests that identifier queries find the chunks that name them:
+- Dotted, snake_case and camelCase identifiers index their parts
+- BM25 ranks exact identifier matches first and honours row masks
+- Reciprocal rank fusion rewards items both rankings agree on
+- VectorStore lexical mode makes no embedding call; hybrid keeps cosine scores
+- Reader workers search BM25 over the mapped segment
+"""
+
+import numpy as np
+import pytest
+
+from src.core import segments
+from src.core.lexical_index import BM25Index, code_tokens, reciprocal_rank_fusion
+from src.core.segments import SegmentStore
+from src.core.vector_store import VectorStore
+from tests.conftest import FakeEmbeddingProvider
+
+
+DOCS = [
+    {"text": "PyMuPDF opens PDFs with fitz.open() and reads pages", "source": "pymupdf", "topic": "opening"},
+    {"text": "Open a PDF document and extract text from every page", "source": "pdfplumber", "topic": "text"},
+    {"text": "imaplib.IMAP4_SSL connects to the mail server", "source": "imaplib", "topic": "email"},
+    {"text": "openpyxl.load_workbook opens an Excel file", "source": "openpyxl", "topic": "opening"},
+    {"text": "psycopg2.connect opens a Postgres connection", "source": "psycopg2", "topic": "database"},
+]
+
+
+@pytest.fixture
+def store(temp_dir):
+    store = VectorStore(persist_directory=temp_dir, embedding_provider=FakeEmbeddingProvider())
+    store.add_documents(DOCS)
+    return store
+
+
+def test_code_tokens_expand_identifiers():
+    tokens = code_tokens("doc = fitz.open(stream=pdf_bytes); page.getText()")
+
+    assert {"fitz.open", "fitz", "open", "pdf_bytes", "pdf", "bytes", "gettext", "get", "text"} <= set(tokens)
+    assert {"imap4_ssl", "imap", "ssl"} <= set(code_tokens("IMAP4_SSL"))
+    assert code_tokens("psycopg2") == ["psycopg2", "psycopg"]
+
+
+def test_bm25_ranks_identifier_matches():
+    index = BM25Index([doc["text"] for doc in DOCS])
+
+    assert index.search("fitz.open", top_k=1)[0][0] == 0
+    assert index.search("psycopg2", top_k=5)[0][0] == 4
+    assert [row for row, _, _ in index.search("load_workbook", top_k=5)] == [3]
+    assert index.search("kubernetes", top_k=5) == []
+
+    row, score, coverage = index.search("IMAP4_SSL gmail", top_k=1)[0]
+    assert row == 2 and score > 0 and 0 < coverage < 1
+
+    mask = [doc["source"] != "pymupdf" for doc in DOCS]
+    assert 0 not in [row for row, _, _ in index.search("fitz.open pdf", top_k=5, candidates=np.array(mask))]
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]])
+
+    assert [item for item, _ in fused] == ["b", "a", "d", "c"]
+    assert fused[0][1] == pytest.approx(1 / 62 + 1 / 61)
+
+
+def test_lexical_mode_skips_embedding(store):
+    calls = len(store.embedding_provider.calls)
+
+    result = store.query_detailed("psycopg2", top_k=2, mode="lexical")
+
+    assert len(store.embedding_provider.calls) == calls
+    assert result["degraded"] is False
+    assert result["results"][0]["source"] == "psycopg2"
+    assert result["results"][0]["score"] == 1.0
+    assert store.query("fitz", top_k=1, mode="lexical", filter_source="pdfplumber") == []
+
+
+def test_hybrid_fuses_rankings_and_keeps_cosine_scores(store):
+    query = "openpyxl.load_workbook"
+    vector = {r["text"]: r["score"] for r in store.query(query, top_k=5, mode="vector")}
+    hybrid = store.query(query, top_k=5, mode="hybrid")
+
+    assert hybrid[0]["source"] == "openpyxl"
+    for result in hybrid:
+        assert result["score"] == pytest.approx(vector[result["text"]], abs=1e-5)
+    fused = [result["fused_score"] for result in hybrid]
+    assert fused == sorted(fused, reverse=True)
+
+    # Hybrid is opt-in: the default mode leaves results best-first by cosine score
+    default = store.query(query, top_k=5)
+    assert "fused_score" not in default[0]
+    assert [r["score"] for r in default] == sorted(vector.values(), reverse=True)
+
+    with pytest.raises(ValueError):
+        store.query(query, mode="fuzzy")
+
+
+def test_reader_searches_segment_bm25(temp_dir, monkeypatch):
+    monkeypatch.setattr(segments, "SEGMENT_REFRESH_SECONDS", 0.0)
+    segment_store = SegmentStore(f"{temp_dir}/segments")
+    writer = VectorStore(
+        persist_directory=f"{temp_dir}/db", embedding_provider=FakeEmbeddingProvider(), segment_store=segment_store
+    )
+    writer.add_documents(DOCS)
+
+    reader = VectorStore(
+        persist_directory=f"{temp_dir}/db",
+        embedding_provider=FakeEmbeddingProvider(),
+        collection=segment_store.collection("docs")
+    )
+
+    assert reader.query("imaplib", top_k=1, mode="lexical")[0]["source"] == "imaplib"
+    assert reader.query("imaplib", top_k=1, mode="hybrid")[0]["source"] == "imaplib"
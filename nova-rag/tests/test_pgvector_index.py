@@ -0,0 +1,205 @@
+"""
+Tests for the Postgres/pgvector code index backend
+
+Needs a Postgres with the pgvector extension, e.g.:
+    TEST_DATABASE_URL=postgresql://postgres@localhost/postgres pytest tests/test_pgvector_index.py
+
+Tests that the code cache can live in Postgres:
+- Nearest neighbours and squared L2 distances match Chroma's scale
+- workflow_id / node_action / JSONB metadata filters
+- A workflow whose entries are not among the global nearest still gets
+  its own nearest entries (filters apply inside the ANN scan)
+- CodeCacheService keeps its API on top of it (save, search, stats, clear)
+- Instances sharing a table follow each other's writes (exact matches,
+  strict required_keys filter)
+"""
+
+import os
+import uuid
+
+import numpy as np
+import pytest
+
+pytest.importorskip("psycopg2")
+
+DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+pytestmark = pytest.mark.skipif(not DATABASE_URL, reason="TEST_DATABASE_URL not set")
+
+from src.core import code_index
+from src.core.code_cache_service import CodeCacheService
+from src.core.code_index import PgVectorIndex
+from tests.conftest import FakeEmbeddingProvider
+
+
+DOCUMENT = {
+    "ai_description": "Extract text from PDF invoice",
+    "input_schema": {"pdf_data": "base64_large"},
+    "code": "import fitz\npdf = context['pdf_data']",
+    "node_action": "extract_pdf",
+    "node_description": "Extract text from invoice PDF",
+    "workflow_id": 7,
+    "metadata": {"required_keys": ["pdf_data"]}
+}
+
+
+@pytest.fixture
+def table():
+    """Unique table name, dropped after the test."""
+    name = f"test_code_{uuid.uuid4().hex[:12]}"
+    yield name
+
+    import psycopg2
+    conn = psycopg2.connect(DATABASE_URL)
+    with conn, conn.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {name}")
+        cur.execute(f"DROP TABLE IF EXISTS {name}_settings")
+        cur.execute(f"DROP TABLE IF EXISTS {name}_changes")
+    conn.close()
+
+
+def test_query_and_filters(table):
+    index = PgVectorIndex(DATABASE_URL, name=table, metadata={"embedding_dimensions": 16})
+    vectors = np.random.default_rng(0).normal(size=(50, 16)).astype(np.float32)
+    index.add(
+        ids=[f"id_{i}" for i in range(50)],
+        embeddings=vectors.tolist(),
+        documents=[f"code {i}" for i in range(50)],
+        metadatas=[{"workflow_id": i % 3, "node_action": f"action_{i % 2}", "tag": i % 5} for i in range(50)]
+    )
+
+    result = index.query([vectors[4].tolist()], n_results=3)
+    assert index.count() == 50
+    assert result['ids'][0][0] == "id_4"
+    assert result['distances'][0][0] == pytest.approx(0.0, abs=1e-5)
+    assert all(0.0 <= d <= 4.0 for d in result['distances'][0])
+
+    filtered = index.query([vectors[4].tolist()], n_results=10, where={"$and": [{"workflow_id": 1}, {"tag": 4}]})
+    assert filtered['ids'][0][0] == "id_4"
+    assert all(m["workflow_id"] == 1 and m["tag"] == 4 for m in filtered['metadatas'][0])
+
+    any_of = index.get(where={"$and": [{"workflow_id": {"$in": [0, 2]}}, {"tag": {"$in": [1, 3]}}]})
+    assert any_of['ids'] == [f"id_{i}" for i in range(50) if i % 3 in (0, 2) and i % 5 in (1, 3)]
+
+    page = index.get(where={"node_action": "action_0"}, include=['embeddings'], limit=5, offset=5)
+    assert page['ids'] == [f"id_{i}" for i in range(10, 20, 2)]
+    assert page['embeddings'].shape == (5, 16)
+
+    index.delete(ids=["id_4", "id_5"], where={"workflow_id": 1})
+    assert index.count() == 49
+    assert index.get(ids=["id_4", "id_5"], include=[])['ids'] == ["id_5"]
+
+    index.reset()
+    assert index.count() == 0
+    index.close()
+
+
+def test_filtered_query_finds_workflow_outside_global_nearest(table):
+    index = PgVectorIndex(DATABASE_URL, name=table, metadata={"embedding_dimensions": 16}, ef_search=40)
+    rng = np.random.default_rng(0)
+    query = np.eye(16, dtype=np.float32)[0]
+
+    # Workflows 0-3 sit around the query, workflow 9 points the other way:
+    # none of its entries is among the 40 candidates an unfiltered scan yields
+    near = query + rng.normal(scale=0.1, size=(1200, 16)).astype(np.float32)
+    far = -query + rng.normal(scale=0.1, size=(400, 16)).astype(np.float32)
+    vectors = np.vstack([near, far])
+    workflows = [i % 4 for i in range(1200)] + [9] * 400
+    index.add(
+        ids=[f"id_{i}" for i in range(len(vectors))],
+        embeddings=vectors.tolist(),
+        documents=[f"code {i}" for i in range(len(vectors))],
+        metadatas=[{"workflow_id": workflow_id, "side": "far" if workflow_id == 9 else "near"} for workflow_id in workflows]
+    )
+
+    expected = np.argsort(-(far / np.linalg.norm(far, axis=1, keepdims=True)) @ query)[:3]
+    for where in ({"workflow_id": 9}, {"side": "far"}):
+        result = index.query([query.tolist()], n_results=3, where=where)
+        assert result['ids'][0] == [f"id_{1200 + i}" for i in expected]
+        assert result['distances'][0] == sorted(result['distances'][0])
+    index.close()
+
+
+def test_code_cache_on_pgvector(table, temp_dir, monkeypatch):
+    monkeypatch.setattr(code_index, "DATABASE_URL", DATABASE_URL)
+    cache = CodeCacheService(
+        persist_directory=temp_dir,
+        collection_name=table,
+        embedding_provider=FakeEmbeddingProvider(),
+        index_backend="pgvector"
+    )
+    query = cache._build_searchable_text(DOCUMENT)
+
+    assert cache.save_code(DOCUMENT)["success"] is True
+    matches = cache.search_code(query, threshold=0.5, workflow_id=7)
+    assert [m["node_action"] for m in matches] == ["extract_pdf"]
+    assert matches[0]["score"] == pytest.approx(1.0)
+    assert matches[0]["metadata"]["required_keys"] == ["pdf_data"]
+    assert cache.search_code(query, threshold=0.5, workflow_id=8) == []
+    assert cache.collection.partition_count(7) == 1 and cache.collection.partition_count(8) == 0
+
+    stats = cache.get_stats()
+    assert stats["total_codes"] == 1
+    assert stats["index"]["backend"] == "pgvector"
+
+    cache.clear()
+    assert cache.get_stats()["total_codes"] == 0
+    cache.collection.close()
+
+
+def test_instances_follow_each_others_writes(table, temp_dir, monkeypatch):
+    monkeypatch.setattr(code_index, "DATABASE_URL", DATABASE_URL)
+    first, second = (
+        CodeCacheService(
+            persist_directory=f"{temp_dir}/{n}",
+            collection_name=table,
+            embedding_provider=FakeEmbeddingProvider(),
+            index_backend="pgvector"
+        )
+        for n in range(2)
+    )
+    query = first._build_searchable_text(DOCUMENT)
+    assert second.search_code_detailed(query, workflow_id=7)["matches"] == []
+
+    saved = first.save_code(DOCUMENT)["id"]
+    result = second.search_code_detailed(query, workflow_id=7)
+    assert result["exact_match"] is True
+    assert [m["id"] for m in result["matches"]] == [saved]
+
+    # Deleted by the other instance: no longer an exact match here
+    first.collection.delete(ids=[saved])
+    assert second.search_code_detailed(query, workflow_id=7)["exact_match"] is False
+
+    first.save_code(DOCUMENT)
+    assert second.search_code_detailed(query, workflow_id=7)["exact_match"] is True
+    first.clear()
+    assert second.search_code_detailed(query, workflow_id=7)["matches"] == []
+
+    first.collection.close()
+    second.collection.close()
+
+
+def test_strict_filter_follows_other_instances(table, temp_dir, monkeypatch):
+    monkeypatch.setattr(code_index, "DATABASE_URL", DATABASE_URL)
+    first, second = (
+        CodeCacheService(
+            persist_directory=f"{temp_dir}/{n}",
+            collection_name=table,
+            embedding_provider=FakeEmbeddingProvider(),
+            index_backend="pgvector"
+        )
+        for n in range(2)
+    )
+    query = "Extract text from the invoice PDF"
+    first.save_code({**DOCUMENT, "code": "import fitz\nhost = context['db_host']", "metadata": {}})
+    assert second.search_code(query, threshold=0.1, available_keys=["pdf_data"], key_filter="strict") == []
+
+    saved = first.save_code(DOCUMENT)["id"]
+    matches = second.search_code(query, threshold=0.1, available_keys=["pdf_data"], key_filter="strict")
+    assert [m["id"] for m in matches] == [saved]
+
+    first.collection.delete(ids=[saved])
+    second.search_code(query, threshold=0.1, available_keys=["pdf_data"], key_filter="strict")
+    assert second._required_keys.compatible(["pdf_data"]) == []
+
+    first.collection.close()
+    second.collection.close()
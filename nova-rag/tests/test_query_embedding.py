@@ -0,0 +1,87 @@
+"""
+Tests for client-supplied and returned query embeddings
+
+Tests that callers can embed once and reuse the vector:
+- A supplied query_embedding skips the provider entirely
+- Vectors with the wrong model or dimensions are rejected
+- The computed embedding is returned and can be replayed
+"""
+
+import asyncio
+
+import pytest
+
+from src.core.code_cache_service import CodeCacheService
+from src.core.vector_store import VectorStore
+from tests.conftest import FakeEmbeddingProvider
+
+
+DOCUMENT = {
+    "ai_description": "Extract text from PDF invoice",
+    "input_schema": {"pdf_data": "base64_large"},
+    "code": "import fitz",
+    "node_action": "extract_pdf",
+    "node_description": "Extract text from invoice PDF",
+    "metadata": {}
+}
+
+
+@pytest.fixture
+def cache(temp_dir):
+    # Exact repeats would be answered from the fingerprint map, without a vector
+    return CodeCacheService(
+        persist_directory=temp_dir, embedding_provider=FakeEmbeddingProvider(), exact_match=False
+    )
+
+
+def test_returned_embedding_can_be_replayed(cache):
+    """The vector from one search reproduces it without embedding again."""
+    cache.save_code(DOCUMENT)
+    query = cache._build_searchable_text(DOCUMENT)
+
+    first = cache.search_code_detailed(query, threshold=0.5)
+    calls = len(cache.embedding_provider.calls)
+
+    replay = cache.search_code_detailed(
+        "ignored", threshold=0.5,
+        query_embedding=first["query_embedding"],
+        embedding_model="fake-bow"
+    )
+
+    assert len(first["query_embedding"]) == 64
+    assert replay["matches"] == first["matches"]
+    assert len(cache.embedding_provider.calls) == calls
+
+
+def test_supplied_embedding_is_validated(cache):
+    """Wrong dimensions or model are rejected before searching."""
+    with pytest.raises(ValueError, match="dimensions"):
+        cache.search_code_detailed("q", query_embedding=[0.1] * 3)
+
+    with pytest.raises(ValueError, match="text-embedding-3-small"):
+        cache.search_code_detailed(
+            "q", query_embedding=[0.1] * 64, embedding_model="text-embedding-3-small"
+        )
+
+    with pytest.raises(ValueError, match="non-finite"):
+        cache.search_code_detailed("q", query_embedding=[float("nan")] * 64)
+
+
+def test_vector_store_accepts_supplied_embedding(temp_dir):
+    """One vector serves /rag/query as well, sync and async."""
+    provider = FakeEmbeddingProvider()
+    store = VectorStore(persist_directory=temp_dir, embedding_provider=provider)
+    store.add_documents([
+        {"text": "PyMuPDF opens PDFs with fitz.open()", "source": "pymupdf", "topic": "opening"},
+        {"text": "EasyOCR requires gpu=False on CPU", "source": "easyocr", "topic": "config"}
+    ])
+    vector = provider._vector("open PDFs with fitz")
+    calls = len(provider.calls)
+
+    result = store.query_detailed("unused", top_k=1, query_embedding=vector)
+    async_result = asyncio.run(store.aquery_detailed("unused", top_k=1, query_embedding=vector))
+
+    assert result["results"][0]["source"] == "pymupdf"
+    assert async_result["results"] == result["results"]
+    assert result["query_embedding"] == vector
+    assert len(provider.calls) == calls
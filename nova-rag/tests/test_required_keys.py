@@ -0,0 +1,207 @@
+"""
+Tests for required_keys compatibility filtering of the code cache
+
+Tests that available_keys can restrict or re-rank code cache matches:
+- The inverted index returns the required_keys sets covered by available_keys
+- "strict" searches only compatible entries, and skips embedding when none are
+- "penalty" lowers the score of code missing keys and re-ranks
+- "off" (default) keeps results unfiltered
+- The entry maps are resolved once per search stage, not per candidate
+- $in metadata filters work on every code cache backend
+"""
+
+import asyncio
+
+import pytest
+
+from src.core import segments
+from src.core.code_cache_service import CodeCacheService
+from src.core.required_keys import RequiredKeysIndex, resolve_key_filter
+from src.core.segments import SegmentStore
+from tests.conftest import FakeEmbeddingProvider
+
+
+def document(label, required_keys, workflow_id=5):
+    # Code reading its required keys (save_code parses them from the code)
+    code = "\n".join([label] + [f"{key} = context['{key}']" for key in required_keys])
+    return {
+        "ai_description": "Extract text from invoice PDF attachment",
+        "input_schema": {"invoice_pdf": "base64_large"},
+        "code": code,
+        "node_action": "extract_pdf",
+        "node_description": "Extract PDF text",
+        "workflow_id": workflow_id,
+        "metadata": {"required_keys": required_keys, "created_at": f"2025-11-23T10:00:0{len(code) % 10}"}
+    }
+
+
+QUERY = "Extract text from the invoice PDF attachment"
+
+
+def labels(matches):
+    return [m["code"].splitlines()[0] for m in matches]
+
+
+def scores(matches):
+    return dict(zip(labels(matches), (m["score"] for m in matches)))
+
+
+@pytest.fixture
+def cache(temp_dir):
+    cache = CodeCacheService(persist_directory=temp_dir, embedding_provider=FakeEmbeddingProvider())
+    cache.save_code(document("# pdf only", ["invoice_pdf"]))
+    cache.save_code(document("# pdf and mail", ["invoice_pdf", "email_user"]))
+    cache.save_code(document("# no keys", []))
+    return cache
+
+
+def test_index_returns_compatible_key_sets():
+    index = RequiredKeysIndex()
+    for value in ["invoice_pdf", "invoice_pdf,email_user", "", "invoice_pdf", "db_host"]:
+        index.add(value)
+
+    assert len(index) == 5
+    assert index.compatible(["invoice_pdf"]) == ["invoice_pdf", ""]
+    assert index.compatible(["invoice_pdf", "email_user", "extra"]) == ["invoice_pdf", "invoice_pdf,email_user", ""]
+    assert index.compatible([]) == [""]
+    assert index.missing_fraction("invoice_pdf,email_user", ["invoice_pdf"]) == 0.5
+    assert index.missing_fraction("unseen_a,unseen_b", ["unseen_a"]) == 0.5
+    assert index.get_stats() == {"keys": 3, "key_sets": 4}
+
+
+def test_index_follows_deleted_entries():
+    index = RequiredKeysIndex()
+    index.add("db_host", "a")
+    index.add("db_host", "b")
+    index.add("db_host", "b")
+
+    index.remove("a")
+    assert index.compatible(["db_host"]) == ["db_host"]
+    index.remove("b")
+    assert index.compatible(["db_host"]) == []
+    assert index.get_stats()["key_sets"] == 0
+
+    index.add("db_host", "c")
+    assert index.compatible(["db_host"]) == ["db_host"]
+
+
+def test_resolve_key_filter():
+    assert resolve_key_filter("STRICT", ["a"]) == "strict"
+    assert resolve_key_filter("strict", None) == "off"
+    with pytest.raises(ValueError):
+        resolve_key_filter("loose", ["a"])
+
+
+def test_off_returns_every_match(cache):
+    codes = set(labels(cache.search_code(QUERY, threshold=0.3, available_keys=["invoice_pdf"])))
+    assert codes == {"# pdf only", "# pdf and mail", "# no keys"}
+
+
+def test_strict_searches_only_compatible_entries(cache):
+    matches = cache.search_code(
+        QUERY, threshold=0.3, available_keys=["invoice_pdf"], workflow_id=5, key_filter="strict"
+    )
+    assert set(labels(matches)) == {"# pdf only", "# no keys"}
+
+    matches = asyncio.run(cache.asearch_code(
+        QUERY, threshold=0.3, available_keys=["invoice_pdf", "email_user"], key_filter="strict"
+    ))
+    assert len(matches) == 3
+    assert cache.get_stats()["index"]["required_keys"] == {"keys": 2, "key_sets": 3}
+
+
+def test_strict_without_compatible_entries_skips_embedding(temp_dir):
+    cache = CodeCacheService(persist_directory=temp_dir, embedding_provider=FakeEmbeddingProvider())
+    cache.save_code(document("# mail", ["email_user"]))
+    calls = len(cache.embedding_provider.calls)
+
+    result = cache.search_code_detailed(QUERY, threshold=0.1, available_keys=["db_host"], key_filter="strict")
+
+    assert result["matches"] == []
+    assert len(cache.embedding_provider.calls) == calls
+
+
+def test_strict_applies_to_exact_matches(cache):
+    query = cache._build_searchable_text(document("", []))
+
+    result = cache.search_code_detailed(query, available_keys=["invoice_pdf"], key_filter="strict")
+    assert result["exact_match"] is True
+    assert set(labels(result["matches"])) == {"# pdf only", "# no keys"}
+
+
+def test_penalty_lowers_scores_of_missing_keys(cache):
+    plain = scores(cache.search_code(QUERY, threshold=0.3))
+    penalized = cache.search_code(QUERY, threshold=0.3, available_keys=["email_user"], key_filter="penalty")
+    found = scores(penalized)
+
+    assert found["# no keys"] == pytest.approx(plain["# no keys"], abs=1e-4)
+    assert found["# pdf only"] == pytest.approx(plain["# pdf only"] - 0.1, abs=1e-4)
+    assert found["# pdf and mail"] == pytest.approx(plain["# pdf and mail"] - 0.05, abs=1e-4)
+    assert [m["score"] for m in penalized] == sorted(found.values(), reverse=True)
+
+    # The penalty can push a match under the threshold
+    threshold = plain["# pdf only"] - 0.05
+    matches = cache.search_code(QUERY, threshold=threshold, available_keys=["email_user"], key_filter="penalty")
+    assert "# pdf only" not in labels(matches)
+
+
+@pytest.mark.parametrize("key_filter", ["strict", "penalty"])
+def test_maps_resolved_once_per_search(cache, monkeypatch, key_filter):
+    calls = []
+    build = cache._build_entry_maps
+    monkeypatch.setattr(cache, "_build_entry_maps", lambda: calls.append(1) or build())
+
+    # One resolution for the exact-match lookup, one for the vector search
+    matches = cache.search_code(QUERY, threshold=0.3, available_keys=["invoice_pdf"], key_filter=key_filter)
+    assert len(matches) >= 2
+    assert len(calls) == 2
+
+    calls.clear()
+    asyncio.run(cache.asearch_code(QUERY, threshold=0.3, available_keys=["email_user"], key_filter=key_filter))
+    assert len(calls) <= 2
+
+
+def test_default_mode_from_environment(cache, monkeypatch):
+    from src.core import required_keys
+    monkeypatch.setattr(required_keys, "DEFAULT_KEY_FILTER", "strict")
+
+    matches = cache.search_code(QUERY, threshold=0.3, available_keys=["invoice_pdf"])
+    assert set(labels(matches)) == {"# pdf only", "# no keys"}
+
+
+def test_new_entries_update_the_index(cache):
+    cache.save_code(document("# db", ["db_host"]))
+
+    matches = cache.search_code(QUERY, threshold=0.3, available_keys=["db_host"], key_filter="strict")
+    assert set(labels(matches)) == {"# db", "# no keys"}
+
+
+@pytest.mark.parametrize("options", [
+    {"partitioned": False},
+    {"index_backend": "ivfpq"},
+    {"index_backend": "binary"},
+])
+def test_strict_filter_on_backends(temp_dir, options):
+    cache = CodeCacheService(persist_directory=temp_dir, embedding_provider=FakeEmbeddingProvider(), **options)
+    cache.save_code(document("# pdf only", ["invoice_pdf"]))
+    cache.save_code(document("# pdf and mail", ["invoice_pdf", "email_user"]))
+
+    matches = cache.search_code(
+        QUERY, threshold=0.3, available_keys=["invoice_pdf"], workflow_id=5, key_filter="strict"
+    )
+    assert labels(matches) == ["# pdf only"]
+
+
+def test_strict_filter_on_reader_segment(cache, temp_dir, monkeypatch):
+    monkeypatch.setattr(segments, "SEGMENT_REFRESH_SECONDS", 0.0)
+    store = SegmentStore(f"{temp_dir}/segments")
+    store.publish("code", cache.collection)
+
+    reader = CodeCacheService(
+        embedding_provider=cache.embedding_provider,
+        collection=store.collection("code", cache.embedding_provider.collection_metadata())
+    )
+    matches = reader.search_code(
+        QUERY, threshold=0.3, available_keys=["invoice_pdf"], workflow_id=5, key_filter="strict"
+    )
+    assert set(labels(matches)) == {"# pdf only", "# no keys"}
@@ -0,0 +1,192 @@
+"""
+Tests for deadline-aware, degraded search
+
+Tests that searches never hang on the embedding provider:
+- Circuit breaker opens after repeated failures and recovers via a trial call
+- Calls past the latency budget raise EmbeddingUnavailable("timeout")
+- CodeCacheService answers from fingerprint/lexical match and flags it
+- VectorStore ranks lexically when the provider fails
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.core.code_cache_service import CodeCacheService
+from src.core.resilience import CircuitBreaker, EmbeddingUnavailable, text_fingerprint
+from src.core.vector_store import VectorStore
+from tests.conftest import FakeEmbeddingProvider
+
+
+class SwitchableProvider(FakeEmbeddingProvider):
+    """Fake provider that can be made slow or failing."""
+
+    def __init__(self):
+        super().__init__()
+        self.delay = 0.0
+        self.fail = False
+
+    def embed(self, texts):
+        if self.fail:
+            raise RuntimeError("provider down")
+        if self.delay:
+            time.sleep(self.delay)
+        return super().embed(texts)
+
+
+DOCUMENT = {
+    "ai_description": "Extract text from PDF invoice",
+    "input_schema": {"pdf_data": "base64_large"},
+    "insights": [],
+    "config": {},
+    "code": "import fitz\nresult = fitz.open()",
+    "node_action": "extract_pdf",
+    "node_description": "Extract text from invoice PDF",
+    "metadata": {"libraries_used": ["fitz"]}
+}
+
+
+def _failing():
+    raise RuntimeError("boom")
+
+
+def test_breaker_opens_and_recovers():
+    """Consecutive failures open the breaker; a successful trial closes it."""
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=0.1)
+
+    for _ in range(2):
+        with pytest.raises(EmbeddingUnavailable) as exc:
+            breaker.call(_failing)
+        assert exc.value.reason == "error"
+
+    assert breaker.state == "open"
+    with pytest.raises(EmbeddingUnavailable) as exc:
+        breaker.call(lambda: "never called")
+    assert exc.value.reason == "circuit_open"
+
+    time.sleep(0.15)
+    assert breaker.state == "half_open"
+    assert breaker.call(lambda: "ok") == "ok"
+    assert breaker.state == "closed"
+
+
+def test_cancelled_trial_releases_half_open():
+    """A half-open trial cancelled by its caller lets the next call try again."""
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.05)
+    with pytest.raises(EmbeddingUnavailable):
+        breaker.call(_failing)
+    time.sleep(0.1)
+
+    async def slow():
+        await asyncio.sleep(0.5)
+        return "late"
+
+    async def fast():
+        return "ok"
+
+    async def run():
+        trial = asyncio.ensure_future(breaker.acall(slow))
+        await asyncio.sleep(0.01)
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+        return await breaker.acall(fast)
+
+    assert asyncio.run(run()) == "ok"
+    assert breaker.state == "closed"
+
+
+def test_deadline_exceeded_sync_and_async():
+    """Calls slower than the budget fail fast with reason 'timeout'."""
+    breaker = CircuitBreaker(failure_threshold=10)
+
+    started = time.monotonic()
+    with pytest.raises(EmbeddingUnavailable) as exc:
+        breaker.call(lambda: time.sleep(0.5), timeout=0.05)
+    assert exc.value.reason == "timeout"
+    assert time.monotonic() - started < 0.4
+
+    async def slow():
+        await asyncio.sleep(0.5)
+
+    async def run():
+        with pytest.raises(EmbeddingUnavailable) as exc:
+            await breaker.acall(slow, timeout=0.05)
+        return exc.value.reason
+
+    assert asyncio.run(run()) == "timeout"
+    assert breaker.get_stats()["timeouts"] == 2
+
+
+def test_code_search_degrades_to_fingerprint(temp_dir):
+    """A failing provider yields fingerprint matches flagged as degraded."""
+    provider = SwitchableProvider()
+    cache = CodeCacheService(persist_directory=temp_dir, embedding_provider=provider)
+    cache.save_code(DOCUMENT)
+
+    query = cache._build_searchable_text(DOCUMENT)
+    provider.fail = True
+
+    result = cache.search_code_detailed(query.replace("\n", "  \n"), threshold=0.85)
+
+    assert result["degraded"] is True
+    assert result["degraded_reason"] == "error"
+    assert len(result["matches"]) == 1
+    assert result["matches"][0]["score"] == 1.0
+    assert result["matches"][0]["node_action"] == "extract_pdf"
+
+
+def test_code_search_within_budget_is_not_degraded(temp_dir):
+    """Fast embeddings keep the normal semantic path."""
+    provider = SwitchableProvider()
+    cache = CodeCacheService(persist_directory=temp_dir, embedding_provider=provider)
+    cache.save_code(DOCUMENT)
+
+    result = cache.search_code_detailed(
+        cache._build_searchable_text(DOCUMENT), threshold=0.5, timeout_ms=2000
+    )
+
+    assert result["degraded"] is False
+    assert len(result["matches"]) == 1
+
+
+def test_async_code_search_times_out_to_lexical(temp_dir):
+    """A slow provider past timeout_ms answers lexically instead of waiting."""
+    provider = SwitchableProvider()
+    cache = CodeCacheService(persist_directory=temp_dir, embedding_provider=provider, exact_match=False)
+    cache.save_code(DOCUMENT)
+    provider.delay = 1.0
+
+    async def run():
+        started = time.monotonic()
+        result = await cache.asearch_code_detailed(
+            "Prompt: extract text from PDF invoice\n\nInput Schema:\n{\"pdf_data\": \"base64_large\"}",
+            threshold=0.5,
+            timeout_ms=50
+        )
+        return result, time.monotonic() - started
+
+    result, elapsed = asyncio.run(run())
+
+    assert elapsed < 0.8
+    assert result["degraded_reason"] == "timeout"
+    assert len(result["matches"]) == 1
+
+
+def test_vector_store_query_degrades_to_lexical(temp_dir):
+    """VectorStore ranks by query-term coverage when embeddings fail."""
+    provider = SwitchableProvider()
+    store = VectorStore(persist_directory=temp_dir, embedding_provider=provider)
+    store.add_documents([
+        {"text": "PyMuPDF opens PDFs with fitz.open()", "source": "pymupdf", "topic": "opening"},
+        {"text": "EasyOCR requires gpu=False on CPU", "source": "easyocr", "topic": "config"}
+    ])
+    provider.fail = True
+
+    result = store.query_detailed("how to open PDFs with fitz", top_k=2)
+
+    assert result["degraded"] is True
+    assert result["results"][0]["source"] == "pymupdf"
+    assert store.query("open PDFs fitz", filter_source="easyocr", filter_topic="config") == []
@@ -0,0 +1,161 @@
+"""
+Tests for memory-mapped segments (multi-worker mode)
+
+Tests that reader workers can serve from the writer's published segments:
+- Only one process holds the writer lock
+- Segment searches match Chroma and the vectors are memory-mapped
+- Readers pick up new generations as they are published
+- Reader saves go through the spool and appear after the writer applies them
+- Saves and deletions are published as deltas; readers map only the new ones
+"""
+
+import numpy as np
+import pytest
+
+from src.core import segments
+from src.core.code_cache_service import CodeCacheService
+from src.core.segments import SegmentStore
+from src.core.vector_store import VectorStore
+from tests.conftest import FakeEmbeddingProvider
+
+
+DOCUMENT = {
+    "ai_description": "Extract text from PDF invoice",
+    "input_schema": {"pdf_data": "base64_large"},
+    "code": "import fitz",
+    "node_action": "extract_pdf",
+    "node_description": "Extract text from invoice PDF",
+    "workflow_id": 7,
+    "metadata": {}
+}
+
+
+@pytest.fixture(autouse=True)
+def refresh_immediately(monkeypatch):
+    monkeypatch.setattr(segments, "SEGMENT_REFRESH_SECONDS", 0.0)
+
+
+@pytest.fixture
+def writer(temp_dir):
+    provider = FakeEmbeddingProvider()
+    store = SegmentStore(f"{temp_dir}/segments")
+    vector_store = VectorStore(persist_directory=f"{temp_dir}/db", embedding_provider=provider, segment_store=store)
+    code_cache = CodeCacheService(
+        client=vector_store.client,
+        embedding_cache=vector_store.embedding_cache,
+        embedding_provider=provider,
+        segment_store=store
+    )
+    return store, vector_store, code_cache
+
+
+def test_single_writer_lock(temp_dir):
+    first = SegmentStore(temp_dir)
+    second = SegmentStore(temp_dir)
+
+    assert first.try_acquire_writer() is True
+    assert second.try_acquire_writer() is False
+
+    first.release_writer()
+    assert second.try_acquire_writer() is True
+    second.release_writer()
+
+
+def test_segment_matches_chroma(writer):
+    store, vector_store, _ = writer
+    vector_store.add_documents([
+        {"text": "PyMuPDF opens PDFs with fitz.open()", "source": "pymupdf", "topic": "opening"},
+        {"text": "EasyOCR reads text from images", "source": "easyocr", "topic": "text"},
+    ])
+
+    docs = store.collection("docs")
+    query = vector_store.embedding_provider._vector("open PDFs")
+    expected = vector_store.collection.query(query_embeddings=[query], n_results=2)
+    actual = docs.query(query_embeddings=[query], n_results=2)
+
+    assert isinstance(store.open("docs").index.matrix, np.memmap)
+    assert actual['documents'] == expected['documents']
+    assert np.allclose(actual['distances'], expected['distances'], atol=1e-4)
+    assert docs.get(where={"source": "easyocr"})['documents'] == ["EasyOCR reads text from images"]
+    assert docs.metadata["embedding_model"] == "fake-bow"
+
+
+def test_reader_code_cache_round_trip(writer, temp_dir):
+    store, vector_store, code_cache = writer
+    code_cache.publish_segment(force=True)
+
+    provider = FakeEmbeddingProvider()
+    reader = CodeCacheService(
+        embedding_provider=provider,
+        collection=store.collection("code", provider.collection_metadata())
+    )
+    query = code_cache._build_searchable_text(DOCUMENT)
+
+    result = reader.save_code(DOCUMENT)
+    assert result["success"] is True and result["id"] is None
+    assert reader.search_code(query, threshold=0.5) == []
+
+    # Writer applies queued writes and republishes
+    for entry in store.drain():
+        code_cache.save_embedded_code(entry["document"], entry["embedding"])
+    code_cache.publish_segment()
+
+    matches = reader.search_code(query, threshold=0.5, workflow_id=7)
+    assert [m["node_action"] for m in matches] == ["extract_pdf"]
+    assert reader.search_code(query, threshold=0.5, workflow_id=8) == []
+    assert reader.get_stats()["total_codes"] == 1
+
+    reader.clear()
+    assert [entry["op"] for entry in store.drain()] == ["clear_code"]
+
+
+def test_reader_vector_store_is_read_only(writer):
+    store, vector_store, _ = writer
+    vector_store.add_documents([{"text": "fitz.open() opens PDFs", "source": "pymupdf", "topic": "opening"}])
+
+    reader = VectorStore(
+        persist_directory=f"{store.root}/../reader",
+        embedding_provider=FakeEmbeddingProvider(),
+        collection=store.collection("docs")
+    )
+
+    assert reader.query("open PDFs", top_k=1)[0]["source"] == "pymupdf"
+    with pytest.raises(RuntimeError):
+        reader.add_documents([{"text": "new", "source": "x"}])
+
+
+def test_changes_published_as_deltas(writer, monkeypatch):
+    store, _, code_cache = writer
+    code_cache.save_code(DOCUMENT)
+    code_cache.publish_segment(force=True)
+    base = store.current_generation("code")
+
+    provider = FakeEmbeddingProvider()
+    reader = CodeCacheService(embedding_provider=provider, collection=store.collection("code", provider.collection_metadata()))
+    query = code_cache._build_searchable_text(DOCUMENT)
+    assert len(reader.search_code(query, threshold=0.5)) == 1
+    first_part = reader.collection._segment.parts[0]
+
+    second = code_cache.save_code({**DOCUMENT, "code": "import pdfplumber", "workflow_id": 8})
+    code_cache.publish_segment()
+    assert store.current_generation("code") == f"{base}+1"
+
+    assert sorted(m["code"] for m in reader.search_code(query, threshold=0.5)) == ["import fitz", "import pdfplumber"]
+    assert reader.collection._segment.parts[0] is first_part
+    assert reader.collection.partition_count(8) == 1
+
+    # Deletions mask rows of earlier parts
+    code_cache.collection.delete(ids=[second["id"]])
+    code_cache._segment_deleted.append(second["id"])
+    code_cache.publish_segment()
+    assert store.current_generation("code") == f"{base}+2"
+    assert [m["code"] for m in reader.search_code(query, threshold=0.5)] == ["import fitz"]
+    assert reader.collection.count() == 1
+    assert reader.collection.get(include=['embeddings'])['embeddings'].shape[0] == 1
+
+    # Too many deltas: the next change is a full export
+    monkeypatch.setattr(segments, "SEGMENT_MAX_DELTAS", 2)
+    code_cache.save_code({**DOCUMENT, "code": "import pypdf"})
+    code_cache.publish_segment()
+    assert "+" not in store.current_generation("code")
+    assert reader.collection.count() == 2
@@ -0,0 +1,103 @@
+"""
+Tests for the shared similarity definition and threshold pushdown
+
+Tests that every search path reports the same score:
+- Distances convert exactly to cosine similarity in each space
+- New collections are created in cosine space; docs and code scores agree
+- Indexes drop entries below min_similarity while searching
+- Legacy L2 collections keep their scores and are rebuilt in cosine space
+"""
+
+import numpy as np
+import pytest
+
+from src.core.code_cache_service import CodeCacheService
+from src.core.code_index import BinaryIndex
+from src.core.exact_index import ExactIndex
+from src.core.similarity import collection_space, to_distance, to_similarity
+from src.core.vector_store import VectorStore
+from tests.conftest import FakeEmbeddingProvider
+
+
+DOCUMENT = {
+    "ai_description": "Extract text from PDF invoice",
+    "input_schema": {"pdf_data": "base64_large"},
+    "code": "import fitz",
+    "node_action": "extract_pdf",
+    "node_description": "Extract text from invoice PDF",
+    "workflow_id": 7,
+    "metadata": {}
+}
+
+
+def test_conversions_are_exact():
+    a, b = np.array([0.6, 0.8]), np.array([1.0, 0.0])
+    cosine = float(a @ b)
+    assert to_similarity(float(np.sum((a - b) ** 2)), "l2") == pytest.approx(cosine)
+    assert to_similarity(1.0 - cosine, "cosine") == pytest.approx(cosine)
+    for space in ("l2", "cosine", "ip"):
+        assert to_similarity(float(to_distance(0.3, space)), space) == pytest.approx(0.3)
+    # Opposite vectors clip at 0
+    assert to_similarity(4.0, "l2") == 0.0
+
+
+def test_docs_and_code_report_the_same_score(temp_dir):
+    provider = FakeEmbeddingProvider()
+    store = VectorStore(persist_directory=temp_dir, embedding_provider=provider)
+    cache = CodeCacheService(client=store.client, embedding_provider=provider)
+    assert collection_space(store.collection) == "cosine"
+    assert collection_space(cache.collection) == "cosine"
+
+    cache.save_code(DOCUMENT)
+    text = cache._build_searchable_text(DOCUMENT)
+    store.add_documents([{"text": text, "source": "invoices", "topic": "pdf"}])
+    query = "extract invoice text"
+
+    doc_score = store.query(query, top_k=1)[0]["score"]
+    code_score = cache.search_code(query, threshold=0.0)[0]["score"]
+    expected = float(np.dot(provider._vector(query), provider._vector(text)))
+    assert doc_score == pytest.approx(expected, abs=1e-4)
+    assert code_score == pytest.approx(expected, abs=1e-4)
+
+    # Same result through Chroma's HNSW instead of the exact snapshot
+    store._exact_index = None
+    assert store.query(query, top_k=1)[0]["score"] == pytest.approx(expected, abs=1e-4)
+
+
+def test_threshold_pushdown(temp_dir):
+    vectors = np.eye(4, dtype=np.float32)
+    vectors[1] = [0.8, 0.6, 0.0, 0.0]
+    metadatas = [{"workflow_id": 1}] * 4
+
+    exact = ExactIndex(vectors, ["a", "b", "c", "d"], metadatas, space="cosine")
+    hits = exact.search_rows([1.0, 0.0, 0.0, 0.0], top_k=4, min_similarity=0.5)
+    assert [row for row, _ in hits] == [0, 1]
+    assert exact.search_rows([0.0, 0.0, 0.0, 1.0], top_k=4, where={"workflow_id": 1}, min_similarity=1.5) == []
+
+    index = BinaryIndex(temp_dir)
+    index.add(["a", "b", "c", "d"], vectors, ["a", "b", "c", "d"], metadatas)
+    result = index.query([[1.0, 0.0, 0.0, 0.0]], n_results=4, min_similarity=0.7)
+    assert result['ids'] == [["a", "b"]]
+    assert to_similarity(result['distances'][0][1], index.space) == pytest.approx(0.8, abs=1e-3)
+
+
+def test_legacy_l2_collection_is_rebuilt(temp_dir):
+    provider = FakeEmbeddingProvider()
+    legacy = CodeCacheService(persist_directory=temp_dir, embedding_provider=provider)
+    # Recreate as a pre-cosine collection
+    legacy.client.delete_collection("cached_code")
+    legacy.collection = legacy.client.create_collection(
+        "cached_code", metadata={**legacy._collection_metadata(), "hnsw:space": "l2"}
+    )
+    legacy.save_code(DOCUMENT)
+    query = "extract invoice text"
+    before = legacy.search_code(query, threshold=0.1)
+
+    cache = CodeCacheService(persist_directory=temp_dir, embedding_provider=provider)
+    assert collection_space(cache.collection) == "l2" and cache.needs_rebuild
+    assert cache.search_code(query, threshold=0.1) == before
+
+    cache.rebuild_collection()
+    assert collection_space(cache.collection) == "cosine" and not cache.needs_rebuild
+    after = cache.search_code(query, threshold=0.1)
+    assert after[0]["score"] == pytest.approx(before[0]["score"], abs=1e-4)
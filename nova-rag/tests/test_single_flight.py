@@ -0,0 +1,124 @@
+"""
+Tests for single-flight coalescing
+
+Tests that identical concurrent requests share one execution:
+- Sync callers on threads
+- Async callers on the event loop
+- Errors reach every coalesced caller
+- CodeCacheService.asearch_code embeds once for identical searches
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.core.single_flight import SingleFlight
+from src.core.code_cache_service import CodeCacheService
+
+
+def test_sync_calls_coalesce():
+    """Only one thread runs the work for a shared key."""
+    flight = SingleFlight()
+    runs = []
+    barrier = threading.Barrier(5)
+    results = []
+
+    def work():
+        runs.append(1)
+        time.sleep(0.1)
+        return "value"
+
+    def caller():
+        barrier.wait()
+        results.append(flight.do("key", work))
+
+    threads = [threading.Thread(target=caller) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(runs) == 1
+    assert results == ["value"] * 5
+    assert flight.coalesced == 4
+    assert flight.in_flight == 0
+
+
+def test_async_calls_coalesce():
+    """Only one coroutine runs for a shared key; different keys run separately."""
+    flight = SingleFlight()
+    runs = []
+
+    async def work(value):
+        runs.append(value)
+        await asyncio.sleep(0.05)
+        return value
+
+    async def run():
+        return await asyncio.gather(
+            *[flight.ado("a", lambda: work("a")) for _ in range(4)],
+            flight.ado("b", lambda: work("b"))
+        )
+
+    results = asyncio.run(run())
+
+    assert sorted(runs) == ["a", "b"]
+    assert results == ["a", "a", "a", "a", "b"]
+
+
+def test_async_error_propagates():
+    """Every coalesced caller sees the leader's exception."""
+    flight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("provider down")
+
+    async def run():
+        return await asyncio.gather(
+            *[flight.ado("k", fail) for _ in range(3)],
+            return_exceptions=True
+        )
+
+    results = asyncio.run(run())
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_identical_searches_embed_once(temp_dir, fake_provider):
+    """Concurrent identical asearch_code calls share one embedding call."""
+    cache = CodeCacheService(
+        persist_directory=temp_dir,
+        collection_name="test_cached_code",
+        embedding_provider=fake_provider
+    )
+    cache.save_code({
+        "ai_description": "Extract text from PDF",
+        "input_schema": {"pdf_data": "base64_large"},
+        "code": "import fitz",
+        "node_action": "extract_pdf",
+        "node_description": "Extract PDF",
+        "workflow_id": 7,
+        "metadata": {}
+    })
+    fake_provider.calls.clear()
+
+    async def run():
+        return await asyncio.gather(*[
+            cache.asearch_code("Extract text from PDF", threshold=0.1, workflow_id=7)
+            for _ in range(5)
+        ])
+
+    results = asyncio.run(run())
+
+    assert fake_provider.calls == [["Extract text from PDF"]]
+    assert all(len(matches) == 1 for matches in results)
+    # Callers get independent copies
+    results[0][0]["code"] = "mutated"
+    assert results[1][0]["code"] == "import fitz"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
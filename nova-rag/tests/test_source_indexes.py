@@ -0,0 +1,155 @@
+"""
+Tests for the per-source documentation indexes
+
+Tests that the docs snapshot is split by source and searched as one corpus:
+- Filtered queries search only their source's index
+- Merged vector, BM25 and hybrid rankings equal a single corpus-wide index
+- Replacing one source rebuilds only its index and keeps the others' IDs
+- Large corpora fan out on threads with the same results
+"""
+
+import pytest
+
+from src.core import exact_index
+from src.core.exact_index import ExactIndex, SourceIndexes
+from src.core.vector_store import VectorStore
+from tests.conftest import FakeEmbeddingProvider
+
+
+DOCS = [
+    {"text": "PyMuPDF opens PDFs with fitz.open() and reads pages", "source": "pymupdf", "topic": "opening"},
+    {"text": "page.get_text() extracts plain text from a PDF page", "source": "pymupdf", "topic": "text"},
+    {"text": "Render a page to a pixmap image for OCR", "source": "pymupdf", "topic": "images"},
+    {"text": "imaplib.IMAP4_SSL connects to the mail server over SSL", "source": "imap", "topic": "opening"},
+    {"text": "Search unread mail and fetch message bodies", "source": "imap", "topic": "text"},
+    {"text": "openpyxl.load_workbook opens an Excel file", "source": "xlsx", "topic": "opening"},
+    {"text": "Read cell values from every row of a worksheet", "source": "xlsx", "topic": "text"},
+    {"text": "psycopg2.connect opens a Postgres connection", "source": "postgres", "topic": "opening"},
+]
+
+QUERIES = ["open a PDF file", "read text from every page", "psycopg2 connection", "mail server SSL"]
+
+
+@pytest.fixture
+def store(temp_dir):
+    store = VectorStore(persist_directory=temp_dir, embedding_provider=FakeEmbeddingProvider())
+    store.add_documents(DOCS)
+    return store
+
+
+def ranking(results):
+    # Equal scores may come back in either order; chunks sharing no word
+    # with the query all tie at 0
+    ordered = sorted((r for r in results if r["score"] > 0), key=lambda r: (-round(r["score"], 5), r["text"]))
+    return [(r["text"], pytest.approx(r["score"], abs=1e-5)) for r in ordered]
+
+
+def test_snapshot_has_one_index_per_source(store):
+    snapshot = store._exact_index
+
+    assert isinstance(snapshot, SourceIndexes)
+    assert snapshot.sources == ["imap", "postgres", "pymupdf", "xlsx"]
+    assert len(snapshot) == len(DOCS)
+    assert snapshot.count_where("source", "pymupdf") == 3
+    assert snapshot.count_where("topic", "opening") == 4
+
+
+def test_filtered_queries_touch_only_their_source(store, monkeypatch):
+    snapshot = store._exact_index
+    searched = []
+    original = ExactIndex.search_rows
+
+    def spy(index, *args, **kwargs):
+        searched.append(index.sources[0])
+        return original(index, *args, **kwargs)
+
+    monkeypatch.setattr(ExactIndex, "search_rows", spy)
+
+    results = store.query("open a PDF file", top_k=5, filter_source="imap", mode="vector")
+    assert {r["source"] for r in results} == {"imap"}
+    assert searched == ["imap"]
+
+    searched.clear()
+    store.query("open a PDF file", top_k=5, filter_source="imap", mode="hybrid")
+    assert searched == ["imap"]
+    assert snapshot.search(store._embed(["x"])[0], filter_source="missing") == []
+
+
+def test_merged_rankings_equal_single_index(store):
+    snapshot = store._exact_index
+    single = ExactIndex.from_collection(store.collection)
+
+    for query in QUERIES:
+        vector = store._embed([query])[0]
+        assert ranking(snapshot.search(vector, top_k=4)) == ranking(single.search(vector, top_k=4))
+        assert ranking(snapshot.search_lexical(query, top_k=4)) == ranking(single.search_lexical(query, top_k=4))
+        assert ranking(snapshot.search_hybrid(query, vector, top_k=4)) == ranking(single.search_hybrid(query, vector, top_k=4))
+        assert ranking(snapshot.search(vector, top_k=4, filter_topic="opening")) == ranking(
+            single.search(vector, top_k=4, filter_topic="opening")
+        )
+
+
+def test_bm25_scores_use_corpus_statistics(store):
+    snapshot = store._exact_index
+    single = ExactIndex.from_collection(store.collection)
+
+    pymupdf = snapshot.indexes["pymupdf"]
+    merged = pymupdf.lexical_rows("fitz.open page", top_k=3, stats=snapshot.lexical_stats)
+    corpus = {single.documents[row]: score for row, score, _ in single.lexical_rows("fitz.open page", top_k=8)}
+
+    assert merged
+    for row, score, _ in merged:
+        assert score == pytest.approx(corpus[pymupdf.documents[row]], rel=1e-5)
+
+
+def test_replace_source_rebuilds_only_that_source(store):
+    before = store._exact_index
+    calls = len(store.embedding_provider.calls)
+
+    count = store.replace_source("imap", [
+        {"text": "IMAP IDLE waits for new mail without polling", "topic": "push"}
+    ])
+
+    after = store._exact_index
+    assert count == 1
+    assert after is not before
+    for source in ("pymupdf", "xlsx", "postgres"):
+        assert after.indexes[source] is before.indexes[source]
+    assert len(after.indexes["imap"]) == 1
+    assert store.collection.count() == len(DOCS) - 1
+    assert len(store.embedding_provider.calls) == calls + 1
+
+    assert store.query("IDLE polling", top_k=1, filter_source="imap")[0]["topic"] == "push"
+    assert store.query("unread message bodies", top_k=5, filter_source="imap", mode="lexical") == []
+
+    # IDs are numbered per source, so other sources' chunks are never overwritten
+    ids = store.collection.get(include=[])["ids"]
+    assert len(ids) == len(set(ids))
+    assert "doc_imap_0" in ids and "doc_pymupdf_2" in ids
+
+
+def test_replace_source_with_no_documents_drops_it(store):
+    store.replace_source("postgres", [])
+
+    assert "postgres" not in store._exact_index.sources
+    assert store.query("psycopg2", top_k=5, filter_source="postgres") == []
+
+
+def test_full_reload_drops_removed_sources(store):
+    store.clear(keep_index=True)
+    assert store.query("psycopg2", top_k=1, mode="lexical")[0]["source"] == "postgres"
+
+    store.add_documents([doc for doc in DOCS if doc["source"] != "postgres"])
+
+    assert store._exact_index.sources == ["imap", "pymupdf", "xlsx"]
+
+
+def test_parallel_fan_out_gives_same_results(store, monkeypatch):
+    snapshot = store._exact_index
+    vector = store._embed(["open a PDF file"])[0]
+    sequential = ranking(snapshot.search_hybrid("open a PDF file", vector, top_k=5))
+
+    monkeypatch.setattr(exact_index, "PARALLEL_FANOUT_ROWS", 0)
+
+    assert ranking(snapshot.search_hybrid("open a PDF file", vector, top_k=5)) == sequential
+    assert exact_index._fanout_executor is not None